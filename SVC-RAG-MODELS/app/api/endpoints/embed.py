@@ -1,12 +1,15 @@
-import asyncio
 import logging
-from typing import List, Union
+import os
+from typing import List, Optional, Union
 
+import numpy as np
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 
 from app.dependencies.rag_models_handler import get_rag_models_handler
 from app.core.config import settings
+from app.services.embed_batcher import EmbedBatcher
+from app.services.token_batching import token_budget_batches
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
@@ -25,14 +28,59 @@ class EmbedRequest(BaseModel):
 class EmbedResponse(BaseModel):
     embeddings: List[List[float]]
     embedding_dim: int
+    # Модель, которая посчитала эти векторы (как path в /v1/models/current): по нему
+    # клиенты кэшируют векторы, даже если модель сменили между их проверкой и запросом
+    model: Optional[str] = None
+
+def _token_lengths(model, texts: List[str]) -> List[int]:
+    """Длины текстов в токенах модели (с обрезкой до max_seq_length, как при encode)."""
+    tokenizer = getattr(model, "tokenizer", None)
+    if tokenizer is None:
+        return [max(1, len(t) // 4) for t in texts]
+    max_len = getattr(model, "max_seq_length", None) or 512
+    enc = tokenizer(texts, add_special_tokens=True, truncation=True, max_length=max_len)
+    return [len(ids) for ids in enc["input_ids"]]
 
 def _encode_texts(model, texts: List[str], batch_size: int):
-    return model.encode(
-        texts,
-        convert_to_numpy=True,
-        batch_size=batch_size,
-        show_progress_bar=len(texts) > batch_size,
-    )
+    max_tokens = int(settings.rag_models.embed_max_batch_tokens)
+    if max_tokens <= 0 or len(texts) <= 1:
+        return model.encode(
+            texts,
+            convert_to_numpy=True,
+            batch_size=batch_size,
+            show_progress_bar=len(texts) > batch_size,
+        )
+    # Короткие и длинные чанки не делят один батч: паддинг — до длинного в своём батче,
+    # а размер батча подбирается под бюджет токенов. Порядок выхода = порядок входа.
+    batches = token_budget_batches(_token_lengths(model, texts), max_tokens)
+    out = None
+    for idx in batches:
+        part = model.encode(
+            [texts[i] for i in idx],
+            convert_to_numpy=True,
+            batch_size=len(idx),
+            show_progress_bar=False,
+        )
+        if out is None:
+            out = np.empty((len(texts), part.shape[1]), dtype=part.dtype)
+        out[idx] = part
+    if len(batches) > 1:
+        logger.info("Embed: %s текстов → %s батчей по бюджету %s токенов", len(texts), len(batches), max_tokens)
+    return out
+
+def _get_embed_batcher(handler: dict) -> EmbedBatcher:
+    """Один батчер на загруженную модель: живёт в handler и пропадает вместе с ним."""
+    batcher = handler.get("embed_batcher")
+    if batcher is None:
+        model = handler["embedding_model"]
+        batch_size = max(1, int(settings.rag_models.embed_batch_size))
+        batcher = EmbedBatcher(
+            lambda texts: _encode_texts(model, texts, batch_size),
+            max_items=settings.rag_models.embed_coalesce_max_items,
+            max_wait_ms=settings.rag_models.embed_coalesce_ms,
+        )
+        handler["embed_batcher"] = batcher
+    return batcher
 
 @router.post("/embed", response_model=EmbedResponse)
 async def embed_texts(request: EmbedRequest):
@@ -47,12 +95,12 @@ async def embed_texts(request: EmbedRequest):
     if handler is None:
         raise HTTPException(status_code=503, detail="Эмбеддинг-модель не загружена")
 
-    model = handler["embedding_model"]
-    batch_size = max(1, int(settings.rag_models.embed_batch_size))
     if len(texts) > 1:
-        logger.info("Embed: %s текстов, batch_size=%s", len(texts), batch_size)
+        logger.info(
+            "Embed: %s текстов, batch_size=%s", len(texts), settings.rag_models.embed_batch_size
+        )
 
-    embeddings = await asyncio.to_thread(_encode_texts, model, texts, batch_size)
+    embeddings = await _get_embed_batcher(handler).embed(texts)
     if hasattr(embeddings, "ndim") and embeddings.ndim == 1:
         embeddings = [embeddings.tolist()]
     else:
@@ -63,4 +111,6 @@ async def embed_texts(request: EmbedRequest):
         handler["embedding_dim"] = dim
     else:
         dim = handler.get("embedding_dim", 384)
-    return EmbedResponse(embeddings=embeddings, embedding_dim=int(dim))
\ No newline at end of file
+    path = handler.get("embedding_path")
+    model = f"local/{os.path.basename(os.path.normpath(path))}" if path else None
+    return EmbedResponse(embeddings=embeddings, embedding_dim=int(dim), model=model)
\ No newline at end of file
@@ -4,6 +4,7 @@ from typing import List
 
 from app.dependencies.rag_models_handler import get_rag_models_handler
 from app.core.config import settings
+from app.services.rerank_batcher import RerankBatcher
 
 router = APIRouter()
 
@@ -19,6 +20,23 @@ class RerankResponse(BaseModel):
     scores: List[float]
 
 
+def _get_rerank_batcher(handler: dict) -> RerankBatcher:
+    """Один батчер на загруженный реранкер: живёт в handler и пропадает вместе с ним."""
+    batcher = handler.get("rerank_batcher")
+    if batcher is None:
+        cfg = settings.rag_models
+        batcher = RerankBatcher(
+            handler["reranker_model"].predict,
+            model_id=str(handler.get("reranker_path") or ""),
+            threads=cfg.rerank_threads,
+            max_pairs=cfg.rerank_coalesce_max_pairs,
+            max_wait_ms=cfg.rerank_coalesce_ms,
+            cache_items=cfg.rerank_cache_items,
+        )
+        handler["rerank_batcher"] = batcher
+    return batcher
+
+
 @router.post("/rerank", response_model=RerankResponse)
 async def rerank_passages(request: RerankRequest):
     # Переранжируем по релевантности к запросу
@@ -30,13 +48,7 @@ async def rerank_passages(request: RerankRequest):
     handler = await get_rag_models_handler()
     if handler is None:
         raise HTTPException(status_code=503, detail="Реранкер не загружен")
-    model = handler["reranker_model"]
-    pairs = [[request.query, p] for p in request.passages]
-    scores = model.predict(pairs)
-    if hasattr(scores, "__len__") and len(scores) != len(request.passages):
-        scores = list(scores)
-    else:
-        scores = scores.tolist() if hasattr(scores, "tolist") else list(scores)
+    scores = await _get_rerank_batcher(handler).score(request.query, request.passages)
     top_k = min(request.top_k, len(scores))
     indexed = list(enumerate(scores))
     indexed.sort(key=lambda x: x[1], reverse=True)
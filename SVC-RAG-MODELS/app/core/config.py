@@ -85,6 +85,20 @@ class RagModelsConfig(BaseModel):
     embedding_dim: int = 384
     # Размер батча encode(); на CPU держите 8–16, на GPU можно 32–64
     embed_batch_size: int = int(os.environ.get("RAG_MODELS_EMBED_BATCH_SIZE", "16"))
+    # Батчи encode() по бюджету токенов (длина × число текстов с паддингом) вместо
+    # фиксированного embed_batch_size; тексты сортируются по длине. 0 = по embed_batch_size.
+    embed_max_batch_tokens: int = int(os.environ.get("RAG_MODELS_EMBED_MAX_BATCH_TOKENS", "8192"))
+    # Склейка конкурентных /embed: ждём до N мс или до M текстов и кодируем одним encode().
+    # 0 мс = выключено (каждый запрос — свой encode, как раньше).
+    embed_coalesce_ms: float = float(os.environ.get("RAG_MODELS_EMBED_COALESCE_MS", "5"))
+    embed_coalesce_max_items: int = int(os.environ.get("RAG_MODELS_EMBED_COALESCE_MAX_ITEMS", "64"))
+    # Реранк в отдельном пуле потоков (event loop не блокируется); конкурентные /rerank
+    # склеиваются в один predict() по окну в мс / лимиту пар. 0 мс = без склейки.
+    rerank_threads: int = int(os.environ.get("RAG_MODELS_RERANK_THREADS", "1"))
+    rerank_coalesce_ms: float = float(os.environ.get("RAG_MODELS_RERANK_COALESCE_MS", "5"))
+    rerank_coalesce_max_pairs: int = int(os.environ.get("RAG_MODELS_RERANK_COALESCE_MAX_PAIRS", "128"))
+    # LRU скоров (модель, запрос, пассаж); 0 = без кэша.
+    rerank_cache_items: int = int(os.environ.get("RAG_MODELS_RERANK_CACHE_ITEMS", "20000"))
 
 
 class Settings(BaseModel):
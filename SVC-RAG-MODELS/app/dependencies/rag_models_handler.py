@@ -319,6 +319,8 @@ async def get_rag_models_handler() -> Optional[dict]:
         _rag_models = {
             "embedding_model": embedding_model_obj,
             "reranker_model": reranker_model_obj,
+            "reranker_path": reranker_model,
+            "embedding_path": embedding_model,
             "device": device,
             "embedding_dim": detected_dim,
         }
@@ -339,5 +341,11 @@ async def cleanup_rag_models_handler() -> None:
     global _rag_models
     if _rag_models is not None:
         logger.info("Выгружаю RAG-модели")
+        batcher = _rag_models.get("embed_batcher")
+        if batcher is not None:
+            await batcher.close()
+        rerank_batcher = _rag_models.get("rerank_batcher")
+        if rerank_batcher is not None:
+            await rerank_batcher.close()
         _rag_models = None
     _free_model_memory()
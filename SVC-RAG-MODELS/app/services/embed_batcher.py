@@ -0,0 +1,96 @@
+# Склейка конкурентных /embed-запросов в один encode() (динамический micro-batching)
+import asyncio
+import logging
+from collections import deque
+from typing import Callable, Deque, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+EncodeFn = Callable[[List[str]], np.ndarray]
+
+
+class EmbedBatcher:
+    """Очередь эмбеддинг-запросов с одним воркером на модель.
+
+    Запросы копятся до ``max_wait_ms`` (или до ``max_items`` текстов), затем весь набор
+    уходит одним ``encode`` в отдельном потоке, а строки результата раздаются обратно
+    по запросам. Пока идёт encode, новые запросы копятся в очереди и забираются
+    следующим батчем целиком — под нагрузкой батчи растут сами. Сортировку по длине
+    внутри батча делает ``SentenceTransformer.encode``.
+
+    Запросы от ``max_items`` текстов (индексация документов) очередь не ждут.
+    """
+
+    def __init__(self, encode: EncodeFn, *, max_items: int = 64, max_wait_ms: float = 5.0):
+        self._encode = encode
+        self.max_items = max(1, int(max_items))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self._pending: Deque[Tuple[List[str], asyncio.Future]] = deque()
+        self._wakeup = asyncio.Event()
+        self._worker: Optional[asyncio.Task] = None
+        self.batches = 0
+        self.requests = 0
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        if self.max_wait <= 0 or len(texts) >= self.max_items:
+            return await asyncio.to_thread(self._encode, texts)
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+        fut = asyncio.get_running_loop().create_future()
+        self._pending.append((texts, fut))
+        self._wakeup.set()
+        return await fut
+
+    def _take_batch(self) -> List[Tuple[List[str], asyncio.Future]]:
+        batch: List[Tuple[List[str], asyncio.Future]] = []
+        n = 0
+        while self._pending and (not batch or n + len(self._pending[0][0]) <= self.max_items):
+            texts, fut = self._pending.popleft()
+            if fut.done():  # клиент отвалился, пока ждал
+                continue
+            batch.append((texts, fut))
+            n += len(texts)
+        if not self._pending:
+            self._wakeup.clear()
+        return batch
+
+    async def _run(self) -> None:
+        while True:
+            await self._wakeup.wait()
+            if sum(len(t) for t, _ in self._pending) < self.max_items:
+                await asyncio.sleep(self.max_wait)
+            batch = self._take_batch()
+            if not batch:
+                continue
+            flat = [t for texts, _ in batch for t in texts]
+            try:
+                out = await asyncio.to_thread(self._encode, flat)
+            except Exception as e:
+                for _, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+                continue
+            self.batches += 1
+            self.requests += len(batch)
+            if len(batch) > 1:
+                logger.debug("Embed batch: %s запросов, %s текстов", len(batch), len(flat))
+            pos = 0
+            for texts, fut in batch:
+                if not fut.done():
+                    fut.set_result(out[pos : pos + len(texts)])
+                pos += len(texts)
+
+    async def close(self) -> None:
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._worker = None
+        while self._pending:
+            _, fut = self._pending.popleft()
+            if not fut.done():
+                fut.set_exception(RuntimeError("Эмбеддинг-модель выгружена"))
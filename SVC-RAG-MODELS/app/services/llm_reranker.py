@@ -18,6 +18,8 @@ from typing import Any, List, Optional, Sequence, Union
 
 import numpy as np
 
+from app.services.token_batching import token_budget_batches
+
 logger = logging.getLogger(__name__)
 
 _LLM_RERANKER_NAME_HINTS = (
@@ -200,38 +202,66 @@ def _register_local_remote_code(model_path: str) -> None:
             logger.warning("LLM-реранкер: не удалось предзагрузить %s: %s", ref, e)
 
 
-def _build_inputs(pairs: Sequence[Sequence[str]], tokenizer, max_length: int = 1024):
-    prompt = _DEFAULT_PROMPT
-    sep = "\n"
+def _prompt_parts(tokenizer) -> tuple[List[int], List[int]]:
     prompt_inputs = tokenizer(
-        prompt, return_tensors=None, add_special_tokens=False
+        _DEFAULT_PROMPT, return_tensors=None, add_special_tokens=False
     )["input_ids"]
-    sep_inputs = tokenizer(sep, return_tensors=None, add_special_tokens=False)[
+    sep_inputs = tokenizer("\n", return_tensors=None, add_special_tokens=False)[
         "input_ids"
     ]
-    inputs = []
+    return prompt_inputs, sep_inputs
+
+
+def _query_ids(query: str, tokenizer, max_length: int) -> List[int]:
+    """Общий для всех пассажей префикс: [bos] A: query."""
+    q_ids = tokenizer(
+        f"A: {query}",
+        return_tensors=None,
+        add_special_tokens=False,
+        max_length=max_length * 3 // 4,
+        truncation=True,
+    )["input_ids"]
     bos = tokenizer.bos_token_id
+    return [bos] + q_ids if bos is not None else q_ids
+
+
+def _passage_ids(passage: str, tokenizer, max_length: int) -> List[int]:
+    return tokenizer(
+        f"B: {passage}",
+        return_tensors=None,
+        add_special_tokens=False,
+        max_length=max_length,
+        truncation=True,
+    )["input_ids"]
+
+
+def _encode_suffixes(
+    prefix_len: int, passages: Sequence[str], tokenizer, max_length: int = 1024
+) -> List[dict]:
+    """Хвосты после общего префикса: \n B: passage \n prompt.
+
+    Пассаж режется так же, как ``prepare_for_model(truncation="only_second")`` в
+    _encode_pairs: префикс + хвост дают ровно те же токены, что и полный промпт.
+    """
+    prompt_inputs, sep_inputs = _prompt_parts(tokenizer)
+    room = max(0, max_length - prefix_len)
+    items = []
+    for passage in passages:
+        ids = (sep_inputs + _passage_ids(passage, tokenizer, max_length))[:room]
+        ids = ids + sep_inputs + prompt_inputs
+        items.append({"input_ids": ids, "attention_mask": [1] * len(ids)})
+    return items
+
+
+def _encode_pairs(pairs: Sequence[Sequence[str]], tokenizer, max_length: int = 1024) -> List[dict]:
+    """Токенизация пар без паддинга: [bos] A: query \n B: passage \n prompt."""
+    prompt_inputs, sep_inputs = _prompt_parts(tokenizer)
+    inputs = []
     for query, passage in pairs:
-        query_inputs = tokenizer(
-            f"A: {query}",
-            return_tensors=None,
-            add_special_tokens=False,
-            max_length=max_length * 3 // 4,
-            truncation=True,
-        )
-        passage_inputs = tokenizer(
-            f"B: {passage}",
-            return_tensors=None,
-            add_special_tokens=False,
-            max_length=max_length,
-            truncation=True,
-        )
-        q_ids = query_inputs["input_ids"]
-        if bos is not None:
-            q_ids = [bos] + q_ids
+        q_ids = _query_ids(query, tokenizer, max_length)
         item = tokenizer.prepare_for_model(
             q_ids,
-            sep_inputs + passage_inputs["input_ids"],
+            sep_inputs + _passage_ids(passage, tokenizer, max_length),
             truncation="only_second",
             max_length=max_length,
             padding=False,
@@ -242,15 +272,39 @@ def _build_inputs(pairs: Sequence[Sequence[str]], tokenizer, max_length: int = 1
         item["input_ids"] = item["input_ids"] + sep_inputs + prompt_inputs
         item["attention_mask"] = [1] * len(item["input_ids"])
         inputs.append(item)
+    return inputs
+
+
+def _pad_items(items: List[dict], tokenizer):
     return tokenizer.pad(
-        inputs,
+        items,
         padding=True,
-        max_length=max_length + len(sep_inputs) + len(prompt_inputs),
         pad_to_multiple_of=8,
         return_tensors="pt",
     )
 
 
+def _batch_past(past, n: int):
+    """KV префикса для батча из n хвостов: свежий DynamicCache на каждый батч.
+
+    Модель дописывает в кэш KV хвоста (use_cache=True), поэтому общий префикс
+    не отдаётся ей напрямую. Без DynamicCache (старый transformers) — legacy-кортеж.
+    """
+    layers = [(k.expand(n, *k.shape[1:]), v.expand(n, *v.shape[1:])) for k, v in past]
+    try:
+        from transformers import DynamicCache
+    except ImportError:
+        return tuple(layers)
+    cache = DynamicCache()
+    for layer_idx, (k, v) in enumerate(layers):
+        cache.update(k, v, layer_idx)
+    return cache
+
+
+def _build_inputs(pairs: Sequence[Sequence[str]], tokenizer, max_length: int = 1024):
+    return _pad_items(_encode_pairs(pairs, tokenizer, max_length), tokenizer)
+
+
 class LlmReranker:
     """Обёртка с predict(pairs), как у CrossEncoder."""
 
@@ -261,6 +315,8 @@ class LlmReranker:
         cutoff_layers: Optional[List[int]] = None,
         max_length: int = 1024,
         batch_size: int = 2,
+        max_batch_tokens: int = 0,
+        prefix_cache: bool = True,
     ):
         import torch
         from transformers import AutoModelForCausalLM, AutoTokenizer
@@ -270,7 +326,14 @@ class LlmReranker:
         self.device = device
         self.max_length = max_length
         self.batch_size = max(1, batch_size)
+        # Бюджет токенов на батч (с паддингом); по умолчанию — прежний пик batch_size × max_length.
+        self.max_batch_tokens = int(max_batch_tokens) or self.batch_size * max_length
         self.cutoff_layers = cutoff_layers or [28]
+        # Префикс [bos] A: query считается один раз на запрос, его past_key_values
+        # переиспользуются всеми пассажами; при ошибке модели запрос считается полным промптом.
+        self.prefix_cache = prefix_cache
+        self._prefix_cache_failed = False
+        self.model_id = model_path
         self._layerwise = is_llm_reranker_path(model_path) and (
             "minicpm" in model_path.lower() or "layerwise" in model_path.lower()
         )
@@ -302,12 +365,99 @@ class LlmReranker:
         self.model.eval()
         self._yes_loc = self.tokenizer("Yes", add_special_tokens=False)["input_ids"][0]
         self._torch = torch
+        if self._layerwise:
+            self._apply_cutoff()
         logger.info(
-            "LLM-реранкер загружен (layerwise=%s, cutoff=%s)",
+            "LLM-реранкер загружен (layerwise=%s, cutoff=%s, prefix_cache=%s)",
             self._layerwise,
             self.cutoff_layers,
+            self.prefix_cache,
         )
 
+    def _apply_cutoff(self) -> None:
+        """Ранний выход: слои глубже max(cutoff_layers) скорам не нужны — отрезаем их.
+
+        Меньше cutoff — быстрее и грубее скор (MiniCPM layerwise обучен на слоях 8–40).
+        """
+        num_layers = int(getattr(self.model.config, "num_hidden_layers", 0) or 0)
+        if num_layers:
+            valid = [c for c in self.cutoff_layers if 1 <= c <= num_layers]
+            if valid != self.cutoff_layers:
+                logger.warning(
+                    "LLM-реранкер: cutoff_layers %s вне 1..%s, используем %s",
+                    self.cutoff_layers,
+                    num_layers,
+                    valid or [num_layers],
+                )
+            self.cutoff_layers = valid or [num_layers]
+        layers = getattr(getattr(self.model, "model", None), "layers", None)
+        keep = max(self.cutoff_layers)
+        if layers is not None and keep < len(layers):
+            self.model.model.layers = layers[:keep]
+            logger.info("LLM-реранкер: ранний выход после слоя %s из %s", keep, len(layers))
+
+    def _score(self, inputs: dict):
+        if self._layerwise:
+            out = self.model(
+                **inputs,
+                return_dict=True,
+                cutoff_layers=self.cutoff_layers,
+            )
+            # all_scores[0] — список тензоров по слоям; берём последний cutoff
+            layer_scores = out[0]
+            return layer_scores[-1][:, -1].view(-1).float()
+        logits = self.model(**inputs, return_dict=True).logits
+        return logits[:, -1, self._yes_loc].view(-1).float()
+
+    def _predict_full(self, pair_list: List[List[str]]) -> np.ndarray:
+        items = _encode_pairs(pair_list, self.tokenizer, self.max_length)
+        # Пары сортируются по длине и режутся по бюджету токенов: короткие пассажи
+        # не паддятся до самого длинного в запросе. Скоры возвращаются в исходном порядке.
+        batches = token_budget_batches([len(it["input_ids"]) for it in items], self.max_batch_tokens)
+        scores = np.zeros(len(items), dtype=np.float32)
+        for idx in batches:
+            inputs = _pad_items([items[i] for i in idx], self.tokenizer)
+            inputs = {k: v.to(self.device) for k, v in inputs.items()}
+            scores[idx] = self._score(inputs).cpu().numpy()
+        return scores
+
+    def _prefix_cache(self, prefix: List[int]):
+        torch = self._torch
+        ids = torch.tensor([prefix], dtype=torch.long, device=self.device)
+        out = self.model.model(input_ids=ids, attention_mask=torch.ones_like(ids), use_cache=True, return_dict=True)
+        past = out.past_key_values
+        if hasattr(past, "to_legacy_cache"):
+            past = past.to_legacy_cache()
+        return tuple((layer[0], layer[1]) for layer in past)
+
+    def _predict_query(self, query: str, passages: List[str]) -> np.ndarray:
+        """Скоры пассажей одного запроса: KV префикса + батчи хвостов."""
+        torch = self._torch
+        prefix = _query_ids(query, self.tokenizer, self.max_length)
+        past = self._prefix_cache(prefix)
+        items = _encode_suffixes(len(prefix), passages, self.tokenizer, self.max_length)
+        # Бюджет считаем по хвостам: префикс уже в кэше и повторно не считается.
+        batches = token_budget_batches([len(it["input_ids"]) for it in items], self.max_batch_tokens)
+        scores = np.zeros(len(items), dtype=np.float32)
+        for idx in batches:
+            suffix = _pad_items([items[i] for i in idx], self.tokenizer)
+            suffix = {k: v.to(self.device) for k, v in suffix.items()}
+            n = len(idx)
+            mask = suffix["attention_mask"]
+            # Позиции хвоста продолжают префикс; паддинг (слева) позиций не сдвигает.
+            position_ids = (len(prefix) + mask.long().cumsum(-1) - 1).clamp(min=len(prefix))
+            # use_cache=True обязателен: remote-code MiniCPM/Llama берут длину past
+            # только при включённом кэше, иначе маска префикс+хвост не совпадёт с входом.
+            inputs = {
+                "input_ids": suffix["input_ids"],
+                "attention_mask": torch.cat([mask.new_ones((n, len(prefix))), mask], dim=-1),
+                "position_ids": position_ids,
+                "past_key_values": _batch_past(past, n),
+                "use_cache": True,
+            }
+            scores[idx] = self._score(inputs).cpu().numpy()
+        return scores
+
     def predict(self, pairs: Union[List[List[str]], List[str]]) -> np.ndarray:
         if not pairs:
             return np.asarray([], dtype=np.float32)
@@ -317,28 +467,33 @@ class LlmReranker:
         else:
             pair_list = [list(p) for p in pairs]  # type: ignore[arg-type]
 
-        torch = self._torch
-        scores: List[float] = []
-        with torch.no_grad():
-            for i in range(0, len(pair_list), self.batch_size):
-                batch = pair_list[i : i + self.batch_size]
-                inputs = _build_inputs(batch, self.tokenizer, self.max_length)
-                inputs = {k: v.to(self.device) for k, v in inputs.items()}
-                if self._layerwise:
-                    out = self.model(
-                        **inputs,
-                        return_dict=True,
-                        cutoff_layers=self.cutoff_layers,
-                    )
-                    # all_scores[0] — список тензоров по слоям; берём последний cutoff
-                    layer_scores = out[0]
-                    chosen = layer_scores[-1][:, -1].view(-1).float()
-                    scores.extend(float(x) for x in chosen.cpu().tolist())
-                else:
-                    logits = self.model(**inputs, return_dict=True).logits
-                    chosen = logits[:, -1, self._yes_loc].view(-1).float()
-                    scores.extend(float(x) for x in chosen.cpu().tolist())
-        return np.asarray(scores, dtype=np.float32)
+        with self._torch.no_grad():
+            if self.prefix_cache:
+                try:
+                    return self._predict_grouped(pair_list)
+                except Exception as e:
+                    # Откат только для этого вызова: разовая ошибка не выключает режим навсегда.
+                    if not self._prefix_cache_failed:
+                        self._prefix_cache_failed = True
+                        logger.error(
+                            "LLM-реранкер %s: prefix-кэш не сработал, запрос считается полным промптом: %s",
+                            self.model_id,
+                            e,
+                            exc_info=True,
+                        )
+                    else:
+                        logger.debug("LLM-реранкер %s: prefix-кэш не сработал: %s", self.model_id, e)
+            return self._predict_full(pair_list)
+
+    def _predict_grouped(self, pair_list: List[List[str]]) -> np.ndarray:
+        # После склейки запросов в одном predict бывают пары разных запросов.
+        groups: dict = {}
+        for i, (query, _) in enumerate(pair_list):
+            groups.setdefault(query, []).append(i)
+        scores = np.zeros(len(pair_list), dtype=np.float32)
+        for query, idx in groups.items():
+            scores[idx] = self._predict_query(query, [pair_list[i][1] for i in idx])
+        return scores
 
 
 def load_llm_reranker(model_path: str, device: str) -> Any:
@@ -352,10 +507,14 @@ def load_llm_reranker(model_path: str, device: str) -> Any:
         cutoff_layers = [28]
     batch_size = int(os.environ.get("RAG_RERANKER_BATCH_SIZE", "2"))
     max_length = int(os.environ.get("RAG_RERANKER_MAX_LENGTH", "1024"))
+    max_batch_tokens = int(os.environ.get("RAG_RERANKER_MAX_BATCH_TOKENS", "0"))
+    prefix_cache = os.environ.get("RAG_RERANKER_PREFIX_CACHE", "true").strip().lower() in ("1", "true", "yes", "on")
     return LlmReranker(
         model_path,
         device=device,
         cutoff_layers=cutoff_layers,
         max_length=max_length,
         batch_size=batch_size,
+        max_batch_tokens=max_batch_tokens,
+        prefix_cache=prefix_cache,
     )
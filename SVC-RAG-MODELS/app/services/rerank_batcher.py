@@ -0,0 +1,150 @@
+# Реранк вне event loop: свой пул потоков, склейка конкурентных запросов и LRU скоров
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Deque, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+PredictFn = Callable[[List[List[str]]], Sequence[float]]
+_ScoreKey = Tuple[str, bytes, bytes]
+
+
+def _digest(text: str) -> bytes:
+    return hashlib.sha256((text or "").encode("utf-8")).digest()
+
+
+class RerankBatcher:
+    """Очередь реранк-запросов с одним воркером на модель.
+
+    ``predict`` выполняется в выделенном пуле потоков (``threads``), а не в общем
+    ``asyncio.to_thread``: долгий реранк не занимает потоки эмбеддингов, а event loop
+    продолжает отвечать на /embed и /health. Пары из запросов, пришедших за
+    ``max_wait_ms``, уходят одним ``predict`` (до ``max_pairs`` пар).
+
+    Скоры кэшируются по (модель, sha256 запроса, sha256 пассажа): повторные вопросы
+    в чате и варианты одного запроса не гоняют модель по тем же пассажам.
+    """
+
+    def __init__(
+        self,
+        predict: PredictFn,
+        *,
+        model_id: str = "",
+        threads: int = 1,
+        max_pairs: int = 128,
+        max_wait_ms: float = 5.0,
+        cache_items: int = 20000,
+    ):
+        self._predict = predict
+        self.model_id = model_id
+        self.max_pairs = max(1, int(max_pairs))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.cache_items = max(0, int(cache_items))
+        self._executor = ThreadPoolExecutor(max_workers=max(1, int(threads)), thread_name_prefix="rerank")
+        self._cache: "OrderedDict[_ScoreKey, float]" = OrderedDict()
+        self._pending: Deque[Tuple[List[List[str]], asyncio.Future]] = deque()
+        self._wakeup = asyncio.Event()
+        self._worker: Optional[asyncio.Task] = None
+        self.batches = 0
+        self.cache_hits = 0
+
+    async def score(self, query: str, passages: List[str]) -> List[float]:
+        """Скоры пассажей в исходном порядке."""
+        q = _digest(query)
+        keys = [(self.model_id, q, _digest(p)) for p in passages]
+        scores: List[Optional[float]] = [None] * len(passages)
+        missing: List[int] = []
+        for i, key in enumerate(keys):
+            cached = self._cache.get(key)
+            if cached is None:
+                missing.append(i)
+            else:
+                self._cache.move_to_end(key)
+                scores[i] = cached
+        self.cache_hits += len(passages) - len(missing)
+        if missing:
+            fresh = await self._predict_pairs([[query, passages[i]] for i in missing])
+            for i, s in zip(missing, fresh):
+                scores[i] = s
+                self._remember(keys[i], s)
+        return [float(s) for s in scores]
+
+    def _remember(self, key: _ScoreKey, score: float) -> None:
+        if self.cache_items <= 0:
+            return
+        self._cache[key] = score
+        while len(self._cache) > self.cache_items:
+            self._cache.popitem(last=False)
+
+    async def _run_predict(self, pairs: List[List[str]]) -> List[float]:
+        loop = asyncio.get_running_loop()
+        out = await loop.run_in_executor(self._executor, self._predict, pairs)
+        return np.asarray(out, dtype=np.float64).reshape(-1).tolist()
+
+    async def _predict_pairs(self, pairs: List[List[str]]) -> List[float]:
+        if self.max_wait <= 0 or len(pairs) >= self.max_pairs:
+            return await self._run_predict(pairs)
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+        fut = asyncio.get_running_loop().create_future()
+        self._pending.append((pairs, fut))
+        self._wakeup.set()
+        return await fut
+
+    def _take_batch(self) -> List[Tuple[List[List[str]], asyncio.Future]]:
+        batch: List[Tuple[List[List[str]], asyncio.Future]] = []
+        n = 0
+        while self._pending and (not batch or n + len(self._pending[0][0]) <= self.max_pairs):
+            pairs, fut = self._pending.popleft()
+            if fut.done():  # клиент отвалился, пока ждал
+                continue
+            batch.append((pairs, fut))
+            n += len(pairs)
+        if not self._pending:
+            self._wakeup.clear()
+        return batch
+
+    async def _run(self) -> None:
+        while True:
+            await self._wakeup.wait()
+            if sum(len(p) for p, _ in self._pending) < self.max_pairs:
+                await asyncio.sleep(self.max_wait)
+            batch = self._take_batch()
+            if not batch:
+                continue
+            flat = [pair for pairs, _ in batch for pair in pairs]
+            try:
+                out = await self._run_predict(flat)
+            except Exception as e:
+                for _, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+                continue
+            self.batches += 1
+            if len(batch) > 1:
+                logger.debug("Rerank batch: %s запросов, %s пар", len(batch), len(flat))
+            pos = 0
+            for pairs, fut in batch:
+                if not fut.done():
+                    fut.set_result(out[pos : pos + len(pairs)])
+                pos += len(pairs)
+
+    async def close(self) -> None:
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._worker = None
+        while self._pending:
+            _, fut = self._pending.popleft()
+            if not fut.done():
+                fut.set_exception(RuntimeError("Реранкер выгружен"))
+        self._cache.clear()
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,29 @@
+# Батчи по бюджету токенов: сортировка по длине, чтобы паддинг не раздувал короткие тексты
+from typing import List, Sequence
+
+
+def token_budget_batches(lengths: Sequence[int], max_tokens: int, max_items: int = 0) -> List[List[int]]:
+    """Разбить индексы входов на батчи по длине (в токенах).
+
+    Индексы сортируются по убыванию длины; батч закрывается, когда
+    ``число элементов × длина самого длинного`` (стоимость с паддингом) превысила бы
+    ``max_tokens`` или набралось ``max_items`` элементов (0 = без лимита).
+    Элемент длиннее бюджета уходит отдельным батчем. Возвращает индексы исходного
+    порядка — по ним результат раскладывается обратно.
+    """
+    order = sorted(range(len(lengths)), key=lambda i: -int(lengths[i]))
+    batches: List[List[int]] = []
+    current: List[int] = []
+    width = 0
+    for i in order:
+        n = max(1, int(lengths[i]))
+        # по убыванию: первый элемент батча — самый длинный
+        w = width or n
+        if current and ((len(current) + 1) * w > max_tokens or (max_items and len(current) >= max_items)):
+            batches.append(current)
+            current, w = [], n
+        current.append(i)
+        width = w
+    if current:
+        batches.append(current)
+    return batches
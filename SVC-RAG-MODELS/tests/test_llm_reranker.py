@@ -0,0 +1,127 @@
+import tempfile
+import unittest
+
+try:
+    import torch
+    from tokenizers import Tokenizer, models, pre_tokenizers, trainers
+    from transformers import LlamaConfig, LlamaForCausalLM, PreTrainedTokenizerFast
+except ImportError:  # pragma: no cover - тяжёлые зависимости есть только в образе сервиса
+    torch = None
+
+from app.services import llm_reranker
+from app.services.llm_reranker import LlmReranker
+
+_QUERIES = ["what is the capital of france", "how do rerankers score passages"]
+_PASSAGES = [
+    "paris is the capital of france",
+    "the eiffel tower is in paris and it is tall",
+    "bananas are yellow",
+    "a reranker scores each query passage pair with a model and sorts passages by score",
+    "no",
+]
+
+
+def _save_tiny_model(path: str) -> None:
+    """Крошечная Llama со словарём из слов тестовых строк — без сети и весов."""
+    tok = Tokenizer(models.WordLevel(unk_token="<unk>"))
+    tok.pre_tokenizer = pre_tokenizers.Whitespace()
+    corpus = [llm_reranker._DEFAULT_PROMPT, "A: B: Yes No"] + _QUERIES + _PASSAGES
+    tok.train_from_iterator(
+        corpus, trainers.WordLevelTrainer(special_tokens=["<unk>", "<pad>", "<s>"])
+    )
+    tokenizer = PreTrainedTokenizerFast(
+        tokenizer_object=tok,
+        unk_token="<unk>",
+        pad_token="<pad>",
+        bos_token="<s>",
+        padding_side="left",
+    )
+    tokenizer.save_pretrained(path)
+    torch.manual_seed(0)
+    config = LlamaConfig(
+        vocab_size=tok.get_vocab_size(),
+        hidden_size=32,
+        intermediate_size=64,
+        num_hidden_layers=2,
+        num_attention_heads=4,
+        num_key_value_heads=2,
+        max_position_embeddings=256,
+        pad_token_id=tokenizer.pad_token_id,
+        bos_token_id=tokenizer.bos_token_id,
+    )
+    LlamaForCausalLM(config).save_pretrained(path)
+
+
+@unittest.skipIf(torch is None, "torch/transformers не установлены")
+class TestLlmRerankerPrefixCache(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls._dir = tempfile.TemporaryDirectory()
+        _save_tiny_model(cls._dir.name)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls._dir.cleanup()
+
+    def _reranker(self, **kwargs):
+        # Маленький бюджет — несколько батчей хвостов разной длины, с паддингом
+        return LlmReranker(self._dir.name, max_batch_tokens=48, **kwargs)
+
+    def test_prefix_scores_match_full_prompt(self):
+        reranker = self._reranker()
+        pairs = [[q, p] for q in _QUERIES for p in _PASSAGES]
+
+        seen = []
+
+        def record(module, args, kwargs):
+            past = kwargs.get("past_key_values")
+            if past is not None:
+                seen.append((kwargs.get("use_cache"), past.get_seq_length()))
+
+        # Remote-code MiniCPM учитывает длину past только при use_cache=True
+        hook = reranker.model.register_forward_pre_hook(record, with_kwargs=True)
+        try:
+            with torch.no_grad():
+                full = reranker._predict_full(pairs)
+                grouped = reranker._predict_grouped(pairs)
+        finally:
+            hook.remove()
+
+        prefix_lens = {
+            len(llm_reranker._query_ids(q, reranker.tokenizer, reranker.max_length)) for q in _QUERIES
+        }
+        self.assertTrue(seen)
+        self.assertTrue(all(use_cache is True and n in prefix_lens for use_cache, n in seen), seen)
+        self.assertEqual(grouped.shape, (len(pairs),))
+        self.assertTrue(abs(grouped - full).max() < 1e-4, (grouped, full))
+        # Пассажи действительно различаются скором — сравнение не вырожденное
+        self.assertGreater(float(full.max() - full.min()), 1e-3)
+
+    def test_failure_falls_back_for_one_call_only(self):
+        reranker = self._reranker()
+        pairs = [[_QUERIES[0], p] for p in _PASSAGES]
+        with torch.no_grad():
+            expected = reranker._predict_full(pairs)
+        original = reranker._predict_query
+        calls = []
+
+        def broken_once(query, passages):
+            calls.append(query)
+            if len(calls) == 1:
+                raise RuntimeError("past_key_values not supported")
+            return original(query, passages)
+
+        reranker._predict_query = broken_once
+        with self.assertLogs(llm_reranker.logger, level="ERROR") as logs:
+            first = reranker.predict(pairs)
+        second = reranker.predict(pairs)
+
+        self.assertIn(self._dir.name, logs.output[0])
+        self.assertTrue(reranker.prefix_cache)
+        self.assertEqual(len(calls), 2)
+        self.assertTrue(abs(first - expected).max() < 1e-4)
+        self.assertTrue(abs(second - expected).max() < 1e-4)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -2,10 +2,13 @@
 # Контракт совпадает с RagModelsClient: embed, embed_single, rerank, health.
 import logging
 import os
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Dict, List, Optional, Tuple, TYPE_CHECKING
 
 import httpx
 
+if TYPE_CHECKING:
+    from app.services.embedding_cache import EmbeddingCache
+
 logger = logging.getLogger(__name__)
 
 class OpenAICompatModelsClient:
@@ -34,6 +37,7 @@ class OpenAICompatModelsClient:
         self.timeout = float(timeout)
         self.embed_batch_size = max(1, int(embed_batch_size or 24))
         self._logged_dim = False
+        self.embedding_cache: Optional["EmbeddingCache"] = None
 
     # ---------- инфраструктура ----------
 
@@ -159,13 +163,23 @@ class OpenAICompatModelsClient:
         return [list(it.get("embedding") or []) for it in ordered]
 
     async def embed(self, texts: List[str]) -> List[List[float]]:
-        """Эмбеддинги для списка текстов. Один текст — один вектор."""
+        """Эмбеддинги для списка текстов. Один текст — один вектор.
+
+        С кэшем в провайдер уходят только тексты, которых нет в кэше этой модели.
+        """
         if not texts:
             return []
         if not self.embedding_model:
             raise ValueError(
                 f"[{self.provider_id}] embedding_model не задан — выберите модель в UI"
             )
+        if self.embedding_cache is not None:
+            return await self.embedding_cache.embed(
+                f"{self.provider_id}:{self.embedding_model}", texts, self._embed_uncached
+            )
+        return await self._embed_uncached(texts)
+
+    async def _embed_uncached(self, texts: List[str]) -> List[List[float]]:
         url = f"{self.base_url}/v1/embeddings"
         all_embeddings: List[List[float]] = []
         batch_size = self.embed_batch_size
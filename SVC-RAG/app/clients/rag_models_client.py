@@ -1,11 +1,15 @@
 # Клиент к SVC-RAG-MODELS: эмбеддинги и реранкер по HTTP
 import logging
-from typing import List, Optional
+import time
+from typing import List, Optional, Tuple, TYPE_CHECKING
 
 import httpx
 
 from app.core.config import get_settings
 
+if TYPE_CHECKING:
+    from app.services.embedding_cache import EmbeddingCache
+
 logger = logging.getLogger(__name__)
 
 
@@ -19,6 +23,12 @@ class RagModelsClient:
         self.base_url = (base_url or cfg.base_url).rstrip("/")
         self.timeout = timeout if timeout is not None else cfg.timeout
         self.embed_batch_size = max(1, int(getattr(cfg, "embed_batch_size", 24) or 24))
+        # Подключается в dependencies; None — каждый embed идёт в модель.
+        self.embedding_cache: Optional["EmbeddingCache"] = None
+        self.model_id_ttl = max(0.0, float(getattr(cfg, "model_id_ttl_sec", 30.0) or 0.0))
+        self._model_id: Optional[str] = None
+        self._model_id_checked = 0.0
+        self._last_dim: Optional[int] = None
 
     async def _ensure_db_dim(self, dim: int) -> None:
         """Один раз на смену размерности — привести pgvector к модели."""
@@ -31,12 +41,73 @@ class RagModelsClient:
         await ensure_embedding_dim(dim)
         RagModelsClient._last_ensured_dim = dim
 
+    def invalidate_model_id(self) -> None:
+        """Забыть id модели: следующий embed спросит /v1/models/current заново."""
+        self._model_id = None
+        self._model_id_checked = 0.0
+
+    async def _current_embedding_path(self) -> str:
+        async with httpx.AsyncClient(timeout=10.0) as client:
+            r = await client.get(f"{self.base_url}/v1/models/current")
+            r.raise_for_status()
+            current = (r.json().get("current") or {}).get("embedding") or {}
+        return str(current.get("path") or current.get("name") or "").strip()
+
+    async def embedding_model_id(self) -> Optional[str]:
+        """Id загруженной эмбеддинг-модели (папка в RAG_MODELS_DIR) для ключа кэша.
+
+        Модель могут сменить мимо нас (/models/select в SVC-RAG-MODELS, другая реплика,
+        рестарт с другим конфигом), поэтому id перепроверяется раз в model_id_ttl секунд;
+        смена размерности эмбеддинга и переключение провайдера сбрасывают его сразу.
+        """
+        now = time.monotonic()
+        if self._model_id is not None and now - self._model_id_checked < self.model_id_ttl:
+            return self._model_id
+        try:
+            path = await self._current_embedding_path()
+        except Exception as e:
+            logger.warning("RAG-MODELS: не удалось узнать текущую модель (%s) — embed без кэша", e)
+            self.invalidate_model_id()
+            return None
+        if not path:
+            self.invalidate_model_id()
+            return None
+        return self._note_model_id(f"native:{path}", now)
+
+    def _note_model_id(self, model_id: str, checked: float) -> str:
+        if self._model_id is not None and model_id != self._model_id:
+            logger.info("RAG-MODELS: эмбеддинг-модель сменилась %s -> %s", self._model_id, model_id)
+            if self.embedding_cache is not None:
+                self.embedding_cache.invalidate()
+        self._model_id = model_id
+        self._model_id_checked = checked
+        return model_id
+
     async def embed(self, texts: List[str]) -> List[List[float]]:
-        """Получить эмбеддинги для списка текстов. Один текст — один вектор."""
+        """Получить эмбеддинги для списка текстов. Один текст — один вектор.
+
+        С кэшем в модель уходят только тексты, которых нет в кэше этой модели. Новые
+        векторы кэшируются под моделью из ответа /v1/embed, а не под id из проверки.
+        """
         if not texts:
             return []
+        if self.embedding_cache is not None:
+            model_id = await self.embedding_model_id()
+            if model_id:
+                return await self.embedding_cache.embed(
+                    model_id, texts, self._embed_with_model_id, with_model_id=True
+                )
+        return await self._embed_uncached(texts)
+
+    async def _embed_uncached(self, texts: List[str]) -> List[List[float]]:
+        vectors, _ = await self._embed_with_model_id(texts)
+        return vectors
+
+    async def _embed_with_model_id(self, texts: List[str]) -> Tuple[List[List[float]], Optional[str]]:
+        """Векторы и id модели, которая их посчитала (None — ответ без model или батчи разных моделей)."""
         url = f"{self.base_url}/v1/embed"
         all_embeddings: List[List[float]] = []
+        produced_by: set = set()
         batch_size = self.embed_batch_size
         async with httpx.AsyncClient(timeout=self.timeout) as client:
             for start in range(0, len(texts), batch_size):
@@ -52,12 +123,22 @@ class RagModelsClient:
                 resp.raise_for_status()
                 data = resp.json()
                 part = data.get("embeddings", [])
+                produced_by.add(str(data.get("model") or "").strip())
                 if len(part) != len(batch):
                     raise ValueError(f"Число эмбеддингов ({len(part)}) не совпадает с размером батча ({len(batch)})")
                 if part and part[0]:
-                    await self._ensure_db_dim(len(part[0]))
+                    dim = len(part[0])
+                    if self._last_dim is not None and dim != self._last_dim:
+                        # Другая размерность — точно другая модель: id для кэша узнаём заново
+                        self.invalidate_model_id()
+                    self._last_dim = dim
+                    await self._ensure_db_dim(dim)
                 all_embeddings.extend(part)
-        return all_embeddings
+        model = produced_by.pop() if len(produced_by) == 1 else ""
+        if not model:
+            return all_embeddings, None
+        # Ответ — самое свежее знание о модели: обновляет id без лишней проверки
+        return all_embeddings, self._note_model_id(f"native:{model}", time.monotonic())
 
     async def embed_single(self, text: str) -> List[float]:
         """Один текст — один вектор."""
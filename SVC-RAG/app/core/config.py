@@ -214,6 +214,8 @@ class RagModelsClientConfig(BaseModel):
     timeout: float = Field(...)
     # Сколько чанков отправлять за один POST /v1/embed (меньше → меньше пик RAM на svc-rag-models)
     embed_batch_size: int = int(os.environ.get("RAG_MODELS_CLIENT_EMBED_BATCH_SIZE", "24"))
+    # Как долго верить id эмбеддинг-модели (ключ кэша эмбеддингов) без повторного /v1/models/current
+    model_id_ttl_sec: float = float(os.environ.get("RAG_MODELS_CLIENT_MODEL_ID_TTL_SEC", "30"))
 
 
 class RagModelsProviderEntry(BaseModel):
@@ -270,6 +272,11 @@ class RagServiceConfig(BaseModel):
     # cosine-пороги (RRF и cosine имеют разные шкалы).
     hybrid_diversify_results: bool = os.environ.get("RAG_HYBRID_DIVERSIFY_RESULTS", "true").lower() == "true"
     hybrid_max_chunks_per_document: int = int(os.environ.get("RAG_HYBRID_MAX_CHUNKS_PER_DOCUMENT", "2"))
+    # Снапшот BM25 на диске (пусто = выключено): при старте индекс поднимается через mmap
+    # и догружает из БД только документы, изменённые после снапшота (журнал rag_bm25_changes).
+    bm25_snapshot_dir: str = os.environ.get("RAG_BM25_SNAPSHOT_DIR", "")
+    # Сколько дней хранить журнал изменений; снапшоты старше — полная пересборка.
+    bm25_changelog_retention_days: int = int(os.environ.get("RAG_BM25_CHANGELOG_RETENTION_DAYS", "14"))
 
     # Диверсификация чистого vector-поиска: максимум N чанков одного документа
     # в выдаче (0 = выключить и вернуть сырой top-k). Защита от «затопления»
@@ -308,6 +315,12 @@ class RagServiceConfig(BaseModel):
     intermediate_summary_chunks: int = int(os.environ.get("RAG_INTERMEDIATE_SUMMARY_CHUNKS", "8"))
     create_full_summary_via_llm: bool = os.environ.get("RAG_CREATE_FULL_SUMMARY_VIA_LLM", "false").lower() == "true"
     enable_graph_rag: bool = os.environ.get("RAG_ENABLE_GRAPH", "true").lower() == "true"
+    # LRU графов документов (CSR-смежность) для graph-стратегии; 0 = без кэша, каждый поиск читает БД.
+    graph_adjacency_cache_documents: int = int(os.environ.get("RAG_GRAPH_ADJACENCY_CACHE_DOCUMENTS", "256"))
+    # Кэш эмбеддингов по sha256 текста (таблица rag_embedding_cache): переиндексация и повторные
+    # загрузки эмбеддят только новые тексты. memory_items — LRU в памяти процесса поверх таблицы.
+    embedding_cache_enabled: bool = os.environ.get("RAG_EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+    embedding_cache_memory_items: int = int(os.environ.get("RAG_EMBEDDING_CACHE_MEMORY_ITEMS", "4096"))
     # Разрешить LLM-as-a-Judge в POST /search (доп. вызов llm-service; только при eval_llm_judge=true в теле)
     eval_llm_judge_allowed: bool = os.environ.get("RAG_EVAL_LLM_JUDGE_ALLOWED", "false").lower() == "true"
 
@@ -0,0 +1,181 @@
+# Журнал изменений чанков для догонки BM25-снапшотов (таблицы rag_bm25_changes, rag_bm25_state).
+import logging
+from datetime import datetime
+from typing import List, Optional, Tuple, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from app.database.connection import PostgreSQLConnection
+
+logger = logging.getLogger(__name__)
+
+# Таблицы чанков, по которым строится BM25. Триггеры пишут в журнал id затронутых документов.
+BM25_TABLES: Tuple[str, ...] = (
+    "document_vectors",
+    "kb_vectors",
+    "memory_rag_vectors",
+    "project_rag_vectors",
+)
+
+# Изменения, закоммиченные позже чтения головы журнала, могут получить id меньше неё
+# (порядок BIGSERIAL ≠ порядок коммитов) — при догонке дополнительно берём окно по времени.
+CHANGE_LOOKBACK_SECONDS = 600
+
+
+class Bm25ChangeLogRepository:
+    """Поколения таблиц чанков и журнал затронутых документов.
+
+    - ``rag_bm25_changes``: (id, table_name, document_id) — пишется statement-триггерами
+      на INSERT/DELETE, поэтому ловит и каскадные удаления, и иерархическую индексацию.
+    - ``rag_bm25_state``: epoch таблицы; растёт на TRUNCATE (миграция размерности),
+      после чего снапшоты этой таблицы недействительны.
+    - ``rag_bm25_changelog_state``: до какого id журнал уже подрезан.
+    """
+
+    def __init__(self, db: "PostgreSQLConnection"):
+        self.db = db
+
+    async def create_tables(self):
+        async with await self.db.acquire() as conn:
+            async with conn.transaction():
+                # Несколько реплик стартуют одновременно — создание триггеров сериализуем.
+                await conn.execute("SELECT pg_advisory_xact_lock(hashtext('rag_bm25_changes'))")
+                await conn.execute("""
+                    CREATE TABLE IF NOT EXISTS rag_bm25_changes (
+                        id BIGSERIAL PRIMARY KEY,
+                        table_name VARCHAR(64) NOT NULL,
+                        document_id INTEGER NOT NULL,
+                        changed_at TIMESTAMPTZ NOT NULL DEFAULT now()
+                    )
+                    """)
+                await conn.execute(
+                    "CREATE INDEX IF NOT EXISTS idx_rag_bm25_changes_table_id ON rag_bm25_changes(table_name, id)"
+                )
+                await conn.execute("""
+                    CREATE TABLE IF NOT EXISTS rag_bm25_state (
+                        table_name VARCHAR(64) PRIMARY KEY,
+                        epoch BIGINT NOT NULL DEFAULT 0
+                    )
+                    """)
+                await conn.execute("""
+                    CREATE TABLE IF NOT EXISTS rag_bm25_changelog_state (
+                        id INT PRIMARY KEY CHECK (id = 1),
+                        pruned_through BIGINT NOT NULL DEFAULT 0
+                    )
+                    """)
+                await conn.execute("""
+                    CREATE OR REPLACE FUNCTION rag_bm25_log_changes() RETURNS trigger AS $$
+                    BEGIN
+                        IF TG_OP = 'DELETE' THEN
+                            INSERT INTO rag_bm25_changes (table_name, document_id)
+                            SELECT DISTINCT TG_TABLE_NAME, document_id FROM old_rows;
+                        ELSE
+                            INSERT INTO rag_bm25_changes (table_name, document_id)
+                            SELECT DISTINCT TG_TABLE_NAME, document_id FROM new_rows;
+                        END IF;
+                        RETURN NULL;
+                    END
+                    $$ LANGUAGE plpgsql
+                    """)
+                await conn.execute("""
+                    CREATE OR REPLACE FUNCTION rag_bm25_bump_epoch() RETURNS trigger AS $$
+                    BEGIN
+                        INSERT INTO rag_bm25_state (table_name, epoch) VALUES (TG_TABLE_NAME, 1)
+                        ON CONFLICT (table_name) DO UPDATE SET epoch = rag_bm25_state.epoch + 1;
+                        RETURN NULL;
+                    END
+                    $$ LANGUAGE plpgsql
+                    """)
+                for table in BM25_TABLES:
+                    exists = await conn.fetchval("SELECT to_regclass($1) IS NOT NULL", f"public.{table}")
+                    if not exists:
+                        continue
+                    triggers = {
+                        f"trg_{table}_bm25_ins": (
+                            "AFTER INSERT", "REFERENCING NEW TABLE AS new_rows", "rag_bm25_log_changes"
+                        ),
+                        f"trg_{table}_bm25_del": (
+                            "AFTER DELETE", "REFERENCING OLD TABLE AS old_rows", "rag_bm25_log_changes"
+                        ),
+                        f"trg_{table}_bm25_trunc": ("AFTER TRUNCATE", "", "rag_bm25_bump_epoch"),
+                    }
+                    for name, (event, referencing, func) in triggers.items():
+                        present = await conn.fetchval(
+                            "SELECT 1 FROM pg_trigger WHERE tgname = $1 AND tgrelid = $2::regclass",
+                            name,
+                            table,
+                        )
+                        if present:
+                            continue
+                        await conn.execute(
+                            f"CREATE TRIGGER {name} {event} ON {table} {referencing} "
+                            f"FOR EACH STATEMENT EXECUTE FUNCTION {func}()"
+                        )
+        logger.info("Журнал изменений BM25 готов (таблицы: %s)", ", ".join(BM25_TABLES))
+
+    async def get_generation(self, table: str) -> Tuple[int, int, int]:
+        """(epoch таблицы, голова журнала, pruned_through)."""
+        async with await self.db.acquire() as conn:
+            row = await conn.fetchrow(
+                """
+                SELECT
+                    COALESCE((SELECT epoch FROM rag_bm25_state WHERE table_name = $1), 0) AS epoch,
+                    COALESCE((SELECT MAX(id) FROM rag_bm25_changes), 0) AS head,
+                    COALESCE((SELECT pruned_through FROM rag_bm25_changelog_state WHERE id = 1), 0)
+                        AS pruned_through
+                """,
+                table,
+            )
+        epoch, head, pruned = int(row["epoch"]), int(row["head"]), int(row["pruned_through"])
+        return epoch, max(head, pruned), pruned
+
+    async def get_changed_documents(
+        self,
+        table: str,
+        since_id: int,
+        since_time: Optional[datetime] = None,
+    ) -> List[int]:
+        """document_id, затронутые после ``since_id`` (и в окне ``since_time``, если задано)."""
+        async with await self.db.acquire() as conn:
+            if since_time is not None:
+                rows = await conn.fetch(
+                    """
+                    SELECT DISTINCT document_id FROM rag_bm25_changes
+                    WHERE table_name = $1 AND (id > $2 OR changed_at >= $3)
+                    """,
+                    table,
+                    since_id,
+                    since_time,
+                )
+            else:
+                rows = await conn.fetch(
+                    "SELECT DISTINCT document_id FROM rag_bm25_changes WHERE table_name = $1 AND id > $2",
+                    table,
+                    since_id,
+                )
+        return [int(r["document_id"]) for r in rows]
+
+    async def prune(self, retention_days: int) -> int:
+        """Подрезать журнал старше ``retention_days``; снапшоты старее границы пойдут в полную пересборку."""
+        if retention_days <= 0:
+            return 0
+        async with await self.db.acquire() as conn:
+            async with conn.transaction():
+                cutoff = await conn.fetchval(
+                    "SELECT MAX(id) FROM rag_bm25_changes WHERE changed_at < now() - make_interval(days => $1)",
+                    int(retention_days),
+                )
+                if not cutoff:
+                    return 0
+                result = await conn.execute("DELETE FROM rag_bm25_changes WHERE id <= $1", int(cutoff))
+                await conn.execute(
+                    """
+                    INSERT INTO rag_bm25_changelog_state (id, pruned_through) VALUES (1, $1)
+                    ON CONFLICT (id) DO UPDATE
+                    SET pruned_through = GREATEST(rag_bm25_changelog_state.pruned_through, EXCLUDED.pruned_through)
+                    """,
+                    int(cutoff),
+                )
+        try:
+            return int(str(result).split()[-1])
+        except (ValueError, IndexError):
+            return 0
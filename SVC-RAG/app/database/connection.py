@@ -5,6 +5,7 @@ import asyncpg
 from asyncpg import Pool, Connection
 
 from app.core.config import get_settings
+from app.database.vector_codec import register_vector_codec
 
 logger = logging.getLogger(__name__)
 
@@ -38,6 +39,19 @@ class PostgreSQLConnection:
 
     async def connect(self, min_size: int = 2, max_size: int = 10) -> bool:
         try:
+            # Расширение создаём до пула: init-колбэк регистрирует бинарный кодек типа vector,
+            # которого до CREATE EXTENSION в базе ещё нет.
+            conn = await asyncpg.connect(
+                host=self.host,
+                port=self.port,
+                database=self.database,
+                user=self.user,
+                password=self.password,
+            )
+            try:
+                await conn.execute("CREATE EXTENSION IF NOT EXISTS vector")
+            finally:
+                await conn.close()
             self.pool = await asyncpg.create_pool(
                 host=self.host,
                 port=self.port,
@@ -46,10 +60,10 @@ class PostgreSQLConnection:
                 password=self.password,
                 min_size=min_size,
                 max_size=max_size,
+                init=register_vector_codec,
             )
             async with self.pool.acquire() as conn:
                 await conn.execute("SELECT 1")
-                await conn.execute("CREATE EXTENSION IF NOT EXISTS vector")
             logger.info("PostgreSQL (SVC-RAG): подключено")
             return True
         except Exception as e:
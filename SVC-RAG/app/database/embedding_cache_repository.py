@@ -0,0 +1,68 @@
+# Постоянный кэш эмбеддингов (таблица rag_embedding_cache): ключ — модель, размерность, sha256 текста.
+import logging
+from typing import Dict, List, Sequence, Tuple, TYPE_CHECKING
+
+import numpy as np
+
+from app.database.vector_codec import to_pgvector
+
+if TYPE_CHECKING:
+    from app.database.connection import PostgreSQLConnection
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingCacheRepository:
+    """Эмбеддинги по адресу содержимого.
+
+    Колонка ``embedding`` — ``vector`` без фиксированной размерности: в одной таблице
+    живут векторы разных моделей, а миграция размерности таблиц чанков её не трогает.
+    """
+
+    def __init__(self, db: "PostgreSQLConnection"):
+        self.db = db
+
+    async def create_tables(self):
+        async with await self.db.acquire() as conn:
+            await conn.execute("""
+                CREATE TABLE IF NOT EXISTS rag_embedding_cache (
+                    model_id TEXT NOT NULL,
+                    dim INTEGER NOT NULL,
+                    text_sha256 BYTEA NOT NULL,
+                    embedding vector NOT NULL,
+                    created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                    PRIMARY KEY (model_id, dim, text_sha256)
+                )
+                """)
+
+    async def get_many(self, model_id: str, dim: int, digests: Sequence[bytes]) -> Dict[bytes, np.ndarray]:
+        """Найденные векторы по sha256; отсутствующих ключей в ответе нет."""
+        if not digests:
+            return {}
+        async with await self.db.acquire() as conn:
+            rows = await conn.fetch(
+                """
+                SELECT text_sha256, embedding FROM rag_embedding_cache
+                WHERE model_id = $1 AND dim = $2 AND text_sha256 = ANY($3::bytea[])
+                """,
+                model_id,
+                int(dim),
+                list(digests),
+            )
+        return {bytes(r["text_sha256"]): to_pgvector(r["embedding"]) for r in rows}
+
+    async def put_many(self, model_id: str, items: List[Tuple[bytes, List[float]]]) -> None:
+        """Сохранить векторы; уже записанные (гонка двух реплик) остаются как есть."""
+        if not items:
+            return
+        records = [(model_id, len(vec), digest, to_pgvector(vec)) for digest, vec in items if len(vec)]
+        async with await self.db.acquire() as conn:
+            await conn.executemany(
+                """
+                INSERT INTO rag_embedding_cache (model_id, dim, text_sha256, embedding)
+                VALUES ($1, $2, $3, $4)
+                ON CONFLICT (model_id, dim, text_sha256) DO NOTHING
+                """,
+                records,
+            )
+
@@ -1,7 +1,10 @@
 import json
 import math
 import re
-from typing import Any, Dict, List, Optional, Tuple, TYPE_CHECKING
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple, TYPE_CHECKING
+
+import numpy as np
 
 from app.text_sanitize import strip_null_bytes
 
@@ -23,11 +26,134 @@ def _jaccard(tokens_a: List[str], tokens_b: List[str]) -> float:
     return inter / union
 
 
+# Семантические рёбра: пары не дальше SEMANTIC_MAX_DISTANCE позиций, Jaccard ≥ порога,
+# не больше SEMANTIC_MAX_EDGES пар (в порядке обхода i < j) — равномерное покрытие длинных документов.
+SEMANTIC_MAX_DISTANCE = 30
+SEMANTIC_MAX_EDGES = 8000
+SEMANTIC_MIN_JACCARD = 0.18
+
+GraphEdge = Tuple[int, int, str, float, Dict[str, float]]
+
+
+def build_graph_edges(ordered: List[Tuple[int, str]]) -> List[GraphEdge]:
+    """Рёбра графа документа: (chunk_a, chunk_b, edge_type, weight, metadata), по одному на пару.
+
+    ``ordered`` — чанки, отсортированные по chunk_index. Jaccard считается точно, но
+    векторизованно: токены чанка — множество term id, ключ ``pos * V + term``; для каждого
+    сдвига d пересечения всех пар (pos, pos + d) находятся одним ``searchsorted``.
+    """
+    n = len(ordered)
+    edges: List[GraphEdge] = []
+    for pos in range(n - 1):
+        edges.append((ordered[pos][0], ordered[pos + 1][0], "adjacent", 1.0, {"distance": 1}))
+    if n < 2:
+        return edges
+
+    vocab: Dict[str, int] = {}
+    pos_parts: List[np.ndarray] = []
+    term_parts: List[np.ndarray] = []
+    sizes = np.zeros(n, dtype=np.int64)
+    for pos, (_idx, content) in enumerate(ordered):
+        ids = np.fromiter({vocab.setdefault(t, len(vocab)) for t in _tokenize(content)}, dtype=np.int64)
+        sizes[pos] = ids.shape[0]
+        pos_parts.append(np.full(ids.shape[0], pos, dtype=np.int64))
+        term_parts.append(ids)
+    n_terms = max(len(vocab), 1)
+    positions = np.concatenate(pos_parts)
+    keys = np.sort(positions * n_terms + np.concatenate(term_parts))
+    key_pos = keys // n_terms
+    key_term = keys - key_pos * n_terms
+    chunk_idx = np.array([idx for idx, _ in ordered], dtype=np.int64)
+
+    cand_a: List[np.ndarray] = []
+    cand_b: List[np.ndarray] = []
+    cand_s: List[np.ndarray] = []
+    for d in range(1, min(SEMANTIC_MAX_DISTANCE, n - 1) + 1):
+        mask = key_pos >= d
+        shifted = (key_pos[mask] - d) * n_terms + key_term[mask]
+        found = np.searchsorted(keys, shifted)
+        hit = found < keys.shape[0]
+        hit[hit] = keys[found[hit]] == shifted[hit]
+        inter = np.bincount(key_pos[mask][hit] - d, minlength=n - d)[: n - d].astype(np.float64)
+        union = sizes[: n - d] + sizes[d:] - inter
+        score = np.where(union > 0, inter / np.maximum(union, 1), 0.0)
+        a = np.flatnonzero(score >= SEMANTIC_MIN_JACCARD)
+        cand_a.append(a)
+        cand_b.append(a + d)
+        cand_s.append(score[a])
+    a_pos = np.concatenate(cand_a)
+    b_pos = np.concatenate(cand_b)
+    scores = np.concatenate(cand_s)
+    order = np.lexsort((b_pos, a_pos))[:SEMANTIC_MAX_EDGES]
+    for a, b, score in zip(a_pos[order].tolist(), b_pos[order].tolist(), scores[order].tolist()):
+        a_idx, b_idx = int(chunk_idx[a]), int(chunk_idx[b])
+        distance = abs(a_idx - b_idx)
+        weight = max(0.05, score * (1.0 / (1.0 + math.log1p(distance))))
+        edges.append((a_idx, b_idx, "semantic", weight, {"distance": distance, "jaccard": score}))
+    return edges
+
+
+# Сколько рёбер из узла смотрит BFS (сильнейшие по весу) и сколько графов документов держим в памяти.
+NEIGHBOR_FANOUT = 24
+ADJACENCY_CACHE_DOCUMENTS = 256
+
+
+class _DocumentAdjacency:
+    """CSR-смежность графа одного документа: рёбра узла ``i`` — ``to[off[i]:off[i+1]]``.
+
+    Узлы локально нумеруются по порядку ``node_ids``; рёбра каждого узла отсортированы
+    по весу (по убыванию) и обрезаны до ``NEIGHBOR_FANOUT``.
+    """
+
+    __slots__ = ("document_id", "node_ids", "chunk_index", "local", "off", "to", "weight")
+
+    def __init__(self, document_id: int, rows: List[Tuple[int, int, Optional[int], Optional[float]]]):
+        self.document_id = document_id
+        nodes = sorted({(node_id, chunk_idx) for node_id, chunk_idx, _to, _w in rows})
+        self.node_ids = np.array([n for n, _ in nodes], dtype=np.int64)
+        self.chunk_index = np.array([c for _, c in nodes], dtype=np.int64)
+        self.local: Dict[int, int] = {n: i for i, (n, _) in enumerate(nodes)}
+        edges = [
+            (self.local[src], self.local[dst], float(w))
+            for src, _c, dst, w in rows
+            if dst is not None and dst in self.local
+        ]
+        # по узлу-источнику, внутри — по убыванию веса
+        edges.sort(key=lambda e: (e[0], -e[2]))
+        src = np.array([e[0] for e in edges], dtype=np.int64)
+        counts = np.minimum(np.bincount(src, minlength=len(nodes)), NEIGHBOR_FANOUT)
+        keep = np.ones(len(edges), dtype=np.bool_)
+        if len(edges):
+            starts = np.searchsorted(src, np.arange(len(nodes)))
+            rank = np.arange(len(edges)) - starts[src]
+            keep = rank < NEIGHBOR_FANOUT
+        self.off = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+        self.to = np.array([e[1] for e in edges], dtype=np.int32)[keep]
+        self.weight = np.array([e[2] for e in edges], dtype=np.float64)[keep]
+
+    def neighbors(self, node_id: int) -> List[Tuple[int, float]]:
+        i = self.local.get(node_id)
+        if i is None:
+            return []
+        lo, hi = self.off[i], self.off[i + 1]
+        return list(zip(self.node_ids[self.to[lo:hi]].tolist(), self.weight[lo:hi].tolist()))
+
+
 class GraphRepository:
     """Граф связей чанков для разных RAG-хранилищ."""
 
-    def __init__(self, db: "PostgreSQLConnection"):
+    def __init__(self, db: "PostgreSQLConnection", adjacency_cache_size: int = ADJACENCY_CACHE_DOCUMENTS):
         self.db = db
+        # LRU (store_type, document_id) -> смежность; поколения защищают от записи в кэш
+        # графа, прочитанного до пересборки, но загруженного уже после инвалидации.
+        self._adjacency: "OrderedDict[Tuple[str, int], _DocumentAdjacency]" = OrderedDict()
+        self._adjacency_gen: Dict[Tuple[str, int], int] = {}
+        self._adjacency_cache_size = max(0, int(adjacency_cache_size))
+
+    def invalidate_document(self, store_type: str, document_id: int) -> None:
+        key = (store_type, int(document_id))
+        self._adjacency.pop(key, None)
+        self._adjacency_gen[key] = self._adjacency_gen.get(key, 0) + 1
 
     async def create_tables(self):
         async with await self.db.acquire() as conn:
@@ -67,81 +193,124 @@ class GraphRepository:
             )
 
     async def delete_document_graph(self, store_type: str, document_id: int) -> None:
+        self.invalidate_document(store_type, document_id)
         async with await self.db.acquire() as conn:
             await conn.execute(
                 "DELETE FROM rag_graph_nodes WHERE store_type = $1 AND document_id = $2",
                 store_type,
                 document_id,
             )
+        self.invalidate_document(store_type, document_id)
 
     async def rebuild_document_graph(self, store_type: str, document_id: int, chunks: List[Tuple[int, str]]) -> None:
         """Полная пересборка графа по документу.
 
         chunks: [(chunk_index, content), ...]
+
+        Узлы и рёбра считаются в памяти (``build_graph_edges``) и пишутся одной транзакцией:
+        узлы — одним ``INSERT ... SELECT unnest(...) RETURNING``, рёбра — COPY.
         """
-        await self.delete_document_graph(store_type, document_id)
-        if not chunks:
-            return
+        ordered = sorted(((int(idx), strip_null_bytes(content or "")) for idx, content in chunks), key=lambda x: x[0])
+        edges = build_graph_edges(ordered) if ordered else []
+
+        self.invalidate_document(store_type, document_id)
+        try:
+            await self._write_document_graph(store_type, document_id, ordered, edges)
+        finally:
+            self.invalidate_document(store_type, document_id)
 
+    async def _write_document_graph(
+        self,
+        store_type: str,
+        document_id: int,
+        ordered: List[Tuple[int, str]],
+        edges: List[GraphEdge],
+    ) -> None:
         async with await self.db.acquire() as conn:
-            node_ids: Dict[int, int] = {}
-            for chunk_index, content in chunks:
-                safe = strip_null_bytes(content or "")
-                row = await conn.fetchrow(
+            async with conn.transaction():
+                await conn.execute(
+                    "DELETE FROM rag_graph_nodes WHERE store_type = $1 AND document_id = $2",
+                    store_type,
+                    document_id,
+                )
+                if not ordered:
+                    return
+                rows = await conn.fetch(
                     """
                     INSERT INTO rag_graph_nodes (store_type, document_id, chunk_index, content, metadata)
-                    VALUES ($1, $2, $3, $4, $5::jsonb)
-                    RETURNING id
+                    SELECT $1, $2, t.chunk_index, t.content, jsonb_build_object('chunk_index', t.chunk_index)
+                    FROM unnest($3::int[], $4::text[]) AS t(chunk_index, content)
+                    RETURNING id, chunk_index
                     """,
                     store_type,
                     document_id,
-                    chunk_index,
-                    safe,
-                    json.dumps({"chunk_index": chunk_index}),
+                    [idx for idx, _ in ordered],
+                    [content for _, content in ordered],
                 )
-                if row:
-                    node_ids[chunk_index] = int(row["id"])
-
-            ordered = sorted(chunks, key=lambda x: x[0])
-            tokenized = {idx: _tokenize(strip_null_bytes(content or "")) for idx, content in ordered}
-
-            # adjacency edges (sequential chunks)
-            for i in range(len(ordered) - 1):
-                a_idx = ordered[i][0]
-                b_idx = ordered[i + 1][0]
-                a_id = node_ids.get(a_idx)
-                b_id = node_ids.get(b_idx)
-                if not a_id or not b_id:
-                    continue
-                await self._upsert_edge(conn, store_type, a_id, b_id, "adjacent", 1.0, {"distance": 1})
-                await self._upsert_edge(conn, store_type, b_id, a_id, "adjacent", 1.0, {"distance": 1})
-
-            # semantic edges — ограничиваем расстояние вместо числа пар,
-            # чтобы равномерно покрывать весь документ независимо от его длины
-            max_distance = 30
-            edge_count = 0
-            max_edges = 8000
-            for i in range(len(ordered)):
-                if edge_count >= max_edges:
-                    break
-                a_idx = ordered[i][0]
-                for j in range(i + 1, min(i + max_distance + 1, len(ordered))):
-                    if edge_count >= max_edges:
-                        break
-                    b_idx = ordered[j][0]
-                    score = _jaccard(tokenized.get(a_idx, []), tokenized.get(b_idx, []))
-                    if score < 0.18:
-                        continue
-                    distance = abs(a_idx - b_idx)
-                    weight = max(0.05, score * (1.0 / (1.0 + math.log1p(distance))))
+                node_ids: Dict[int, int] = {int(r["chunk_index"]): int(r["id"]) for r in rows}
+                records = []
+                for a_idx, b_idx, edge_type, weight, meta in edges:
                     a_id = node_ids.get(a_idx)
                     b_id = node_ids.get(b_idx)
                     if not a_id or not b_id:
                         continue
-                    meta = {"distance": distance, "jaccard": score}
-                    await self._upsert_edge(conn, store_type, a_id, b_id, "semantic", weight, meta)
-                    await self._upsert_edge(conn, store_type, b_id, a_id, "semantic", weight, meta)
-                    edge_count += 1
+                    meta_json = json.dumps(meta)
+                    records.append((store_type, a_id, b_id, edge_type, float(weight), meta_json))
+                    records.append((store_type, b_id, a_id, edge_type, float(weight), meta_json))
+                if records:
+                    await conn.copy_records_to_table(
+                        "rag_graph_edges",
+                        records=records,
+                        columns=["store_type", "from_node_id", "to_node_id", "edge_type", "weight", "metadata"],
+                    )
+
+    async def _load_adjacency(
+        self, conn, store_type: str, document_ids: List[int]
+    ) -> Dict[int, _DocumentAdjacency]:
+        """Смежность документов: из LRU, недостающие — одним запросом узлов с рёбрами."""
+        out: Dict[int, _DocumentAdjacency] = {}
+        missing: List[int] = []
+        for doc_id in document_ids:
+            key = (store_type, doc_id)
+            graph = self._adjacency.get(key)
+            if graph is None:
+                missing.append(doc_id)
+            else:
+                self._adjacency.move_to_end(key)
+                out[doc_id] = graph
+        if not missing:
+            return out
+        gens = {doc_id: self._adjacency_gen.get((store_type, doc_id), 0) for doc_id in missing}
+        rows = await conn.fetch(
+            """
+            SELECT n.document_id, n.id, n.chunk_index, e.to_node_id, e.weight
+            FROM rag_graph_nodes n
+            LEFT JOIN rag_graph_edges e ON e.from_node_id = n.id AND e.store_type = n.store_type
+            WHERE n.store_type = $1 AND n.document_id = ANY($2::int[])
+            """,
+            store_type,
+            missing,
+        )
+        by_doc: Dict[int, List[Tuple[int, int, Optional[int], Optional[float]]]] = {d: [] for d in missing}
+        for r in rows:
+            to_id = r["to_node_id"]
+            by_doc[int(r["document_id"])].append(
+                (
+                    int(r["id"]),
+                    int(r["chunk_index"]),
+                    int(to_id) if to_id is not None else None,
+                    float(r["weight"]) if r["weight"] is not None else None,
+                )
+            )
+        for doc_id, doc_rows in by_doc.items():
+            graph = _DocumentAdjacency(doc_id, doc_rows)
+            out[doc_id] = graph
+            key = (store_type, doc_id)
+            if self._adjacency_cache_size and self._adjacency_gen.get(key, 0) == gens[doc_id]:
+                self._adjacency[key] = graph
+                while len(self._adjacency) > self._adjacency_cache_size:
+                    self._adjacency.popitem(last=False)
+        return out
 
     async def expand_neighbors(
         self,
@@ -156,40 +325,30 @@ class GraphRepository:
 
         seed_doc_chunk_pairs: точные пары (doc_id, chunk_idx) для поиска seed-узлов без
         коллизий chunk_index между документами. Требуется при document_id=None.
+
+        Рёбра не выходят за пределы документа, поэтому BFS идёт по CSR-смежности
+        затронутых документов из LRU-кэша (см. ``_load_adjacency``), без запроса на каждый узел.
         """
         if not seed_chunk_indexes:
             return {}
 
         async with await self.db.acquire() as conn:
+            seeds: List[Tuple[int, int, int]] = []  # (node_id, doc_id, chunk_idx)
             if document_id is not None:
-                rows = await conn.fetch(
-                    """
-                    SELECT id, document_id, chunk_index
-                    FROM rag_graph_nodes
-                    WHERE store_type = $1 AND document_id = $2 AND chunk_index = ANY($3::int[])
-                    """,
-                    store_type,
-                    document_id,
-                    seed_chunk_indexes,
-                )
+                graphs = await self._load_adjacency(conn, store_type, [int(document_id)])
+                graph = graphs[int(document_id)]
+                wanted = {int(c) for c in seed_chunk_indexes}
+                for node_id, chunk_idx in zip(graph.node_ids.tolist(), graph.chunk_index.tolist()):
+                    if chunk_idx in wanted:
+                        seeds.append((node_id, int(document_id), chunk_idx))
             elif seed_doc_chunk_pairs:
                 # Точный поиск по (doc_id, chunk_idx) — без коллизий chunk_index разных документов
-                doc_ids = list({p[0] for p in seed_doc_chunk_pairs})
-                chunk_idxs = list({p[1] for p in seed_doc_chunk_pairs})
-                candidate_rows = await conn.fetch(
-                    """
-                    SELECT id, document_id, chunk_index
-                    FROM rag_graph_nodes
-                    WHERE store_type = $1
-                      AND document_id = ANY($2::int[])
-                      AND chunk_index = ANY($3::int[])
-                    """,
-                    store_type,
-                    doc_ids,
-                    chunk_idxs,
-                )
-                valid_pairs = set(seed_doc_chunk_pairs)
-                rows = [r for r in candidate_rows if (int(r["document_id"]), int(r["chunk_index"])) in valid_pairs]
+                valid_pairs = {(int(d), int(c)) for d, c in seed_doc_chunk_pairs}
+                graphs = await self._load_adjacency(conn, store_type, sorted({d for d, _ in valid_pairs}))
+                for doc_id, graph in graphs.items():
+                    for node_id, chunk_idx in zip(graph.node_ids.tolist(), graph.chunk_index.tolist()):
+                        if (doc_id, chunk_idx) in valid_pairs:
+                            seeds.append((node_id, doc_id, chunk_idx))
             else:
                 # Устаревший fallback — может смешивать документы
                 rows = await conn.fetch(
@@ -203,97 +362,50 @@ class GraphRepository:
                     store_type,
                     seed_chunk_indexes,
                 )
+                seeds = [(int(r["id"]), int(r["document_id"]), int(r["chunk_index"])) for r in rows]
+                graphs = await self._load_adjacency(conn, store_type, sorted({s[1] for s in seeds}))
+
+        # node_id -> граф документа; node id глобально уникальны
+        graph_by_node: Dict[int, _DocumentAdjacency] = {}
+        for graph in graphs.values():
+            for node_id in graph.local:
+                graph_by_node[node_id] = graph
+
+        frontier: List[Tuple[int, float, int]] = []
+        scores_by_node: Dict[int, float] = {}
+        for node_id, _doc_id, _chunk_idx in seeds:
+            scores_by_node[node_id] = 1.0
+            frontier.append((node_id, 1.0, 0))
 
-            frontier: List[Tuple[int, float, int]] = []
-            scores_by_node: Dict[int, float] = {}
-            # node_id -> (doc_id, chunk_idx)
-            chunk_by_node: Dict[int, Tuple[int, int]] = {}
-            for r in rows:
-                node_id = int(r["id"])
-                doc_id = int(r["document_id"])
-                chunk_idx = int(r["chunk_index"])
-                chunk_by_node[node_id] = (doc_id, chunk_idx)
-                scores_by_node[node_id] = 1.0
-                frontier.append((node_id, 1.0, 0))
-
-            cursor = 0
-            while cursor < len(frontier):
-                node_id, current_score, hop = frontier[cursor]
-                cursor += 1
-                if hop >= max_hops:
+        cursor = 0
+        while cursor < len(frontier):
+            node_id, current_score, hop = frontier[cursor]
+            cursor += 1
+            if hop >= max_hops:
+                continue
+            graph = graph_by_node.get(node_id)
+            if graph is None:
+                continue
+            for to_id, w in graph.neighbors(node_id):
+                propagated = current_score * (0.82 ** (hop + 1)) * w
+                if propagated < 0.03:
                     continue
-                edges = await conn.fetch(
-                    """
-                    SELECT to_node_id, weight
-                    FROM rag_graph_edges
-                    WHERE store_type = $1 AND from_node_id = $2
-                    ORDER BY weight DESC
-                    LIMIT 24
-                    """,
-                    store_type,
-                    node_id,
-                )
-                for edge in edges:
-                    to_id = int(edge["to_node_id"])
-                    w = float(edge["weight"])
-                    propagated = current_score * (0.82 ** (hop + 1)) * w
-                    if propagated < 0.03:
-                        continue
-                    prev = scores_by_node.get(to_id, 0.0)
-                    if propagated > prev:
-                        scores_by_node[to_id] = propagated
-                        frontier.append((to_id, propagated, hop + 1))
-                    if len(scores_by_node) >= max_nodes:
-                        break
+                prev = scores_by_node.get(to_id, 0.0)
+                if propagated > prev:
+                    scores_by_node[to_id] = propagated
+                    frontier.append((to_id, propagated, hop + 1))
                 if len(scores_by_node) >= max_nodes:
                     break
+            if len(scores_by_node) >= max_nodes:
+                break
 
-            # Загружаем (doc_id, chunk_idx) для всех найденных соседних узлов
-            if scores_by_node:
-                missing = [nid for nid in scores_by_node.keys() if nid not in chunk_by_node]
-                if missing:
-                    mrows = await conn.fetch(
-                        """
-                        SELECT id, document_id, chunk_index
-                        FROM rag_graph_nodes
-                        WHERE id = ANY($1::bigint[])
-                        """,
-                        missing,
-                    )
-                    for r in mrows:
-                        chunk_by_node[int(r["id"])] = (int(r["document_id"]), int(r["chunk_index"]))
-
-            # Итоговый словарь: (doc_id, chunk_idx) -> max_score
-            chunk_scores: Dict[Tuple[int, int], float] = {}
-            for node_id, score in scores_by_node.items():
-                key = chunk_by_node.get(node_id)
-                if key is None:
-                    continue
-                if score > chunk_scores.get(key, 0.0):
-                    chunk_scores[key] = score
-            return chunk_scores
-
-    async def _upsert_edge(
-        self,
-        conn: Any,
-        store_type: str,
-        from_node_id: int,
-        to_node_id: int,
-        edge_type: str,
-        weight: float,
-        metadata: Dict[str, float],
-    ) -> None:
-        await conn.execute(
-            """
-            INSERT INTO rag_graph_edges (store_type, from_node_id, to_node_id, edge_type, weight, metadata)
-            VALUES ($1, $2, $3, $4, $5, $6::jsonb)
-            ON CONFLICT (store_type, from_node_id, to_node_id, edge_type)
-            DO UPDATE SET weight = EXCLUDED.weight, metadata = EXCLUDED.metadata
-            """,
-            store_type,
-            from_node_id,
-            to_node_id,
-            edge_type,
-            float(weight),
-            json.dumps(metadata or {}),
-        )
+        # Итоговый словарь: (doc_id, chunk_idx) -> max_score
+        chunk_scores: Dict[Tuple[int, int], float] = {}
+        for node_id, score in scores_by_node.items():
+            graph = graph_by_node.get(node_id)
+            if graph is None:
+                continue
+            key = (graph.document_id, int(graph.chunk_index[graph.local[node_id]]))
+            if score > chunk_scores.get(key, 0.0):
+                chunk_scores[key] = score
+        return chunk_scores
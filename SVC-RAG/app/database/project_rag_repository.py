@@ -12,6 +12,8 @@ from app.database.fts import (
     query_has_searchable_content,
     substring_where_and_rank,
 )
+from app.database.vector_codec import embedding_column, row_embedding, to_pgvector
+from app.database.vector_ingest import copy_vectors
 from app.database.models import Document, DocumentVector
 from app.text_sanitize import strip_null_bytes
 from app.database.search_filters import DocumentVectorSearchFilters
@@ -184,28 +186,8 @@ class ProjectRagVectorRepository:
     async def create_vectors_batch(self, vectors: List[DocumentVector]) -> int:
         if not vectors:
             return 0
-        values = []
-        for v in vectors:
-            meta = json.dumps(v.metadata) if v.metadata else "{}"
-            chunk = strip_null_bytes(v.content)
-            values.append((v.document_id, v.chunk_index, str(v.embedding), chunk, meta))
-        placeholders = []
-        flat = []
-        for i, (doc_id, idx, emb, content, meta) in enumerate(values):
-            base = i * 5
-            placeholders.append(f"(${base+1}, ${base+2}, ${base+3}::vector, ${base+4}, ${base+5}::jsonb)")
-            flat.extend([doc_id, idx, emb, content, meta])
         async with await self.db.acquire() as conn:
-            await conn.execute(
-                f"""
-                INSERT INTO project_rag_vectors
-                    (document_id, chunk_index, embedding, content, metadata)
-                VALUES {", ".join(placeholders)}
-                ON CONFLICT (document_id, chunk_index) DO NOTHING
-                """,
-                *flat,
-            )
-        return len(vectors)
+            return await copy_vectors(conn, "project_rag_vectors", vectors, on_conflict_do_nothing=True)
 
     async def similarity_search(
         self,
@@ -214,14 +196,15 @@ class ProjectRagVectorRepository:
         project_id: Optional[str] = None,
         document_id: Optional[int] = None,
         filters: Optional[DocumentVectorSearchFilters] = None,
+        include_embedding: bool = False,
     ) -> List[Tuple[DocumentVector, float]]:
-        emb_str = str(query_embedding)
+        emb_param = to_pgvector(query_embedding)
         use_meta = filters is not None and filters.active()
         join_sql = ""
         if document_id is not None or project_id is not None or use_meta:
             join_sql = "JOIN project_rag_documents d ON d.id = v.document_id"
         clauses: List[str] = []
-        params: List[Any] = [emb_str]
+        params: List[Any] = [emb_param]
         pi = 2
         if document_id is not None:
             clauses.append(f"v.document_id = ${pi}")
@@ -247,8 +230,9 @@ class ProjectRagVectorRepository:
                 pi += 1
         where_sql = " AND ".join(clauses) if clauses else "TRUE"
         from_sql = f"project_rag_vectors v {join_sql}".strip()
+        emb_col = embedding_column("v", include_embedding)
         q = f"""
-            SELECT v.id, v.document_id, v.chunk_index, v.embedding::text, v.content, v.metadata,
+            SELECT v.id, v.document_id, v.chunk_index, {emb_col}, v.content, v.metadata,
                    1 - (v.embedding <=> $1::vector) as similarity
             FROM {from_sql}
             WHERE {where_sql}
@@ -267,6 +251,7 @@ class ProjectRagVectorRepository:
         project_id: Optional[str] = None,
         document_id: Optional[int] = None,
         filters: Optional[DocumentVectorSearchFilters] = None,
+        include_embedding: bool = False,
     ) -> List[Tuple[DocumentVector, float]]:
         """
         FTS-поиск по двум tsvector-колонкам (russian + simple) + GIN-индексы.
@@ -318,8 +303,9 @@ class ProjectRagVectorRepository:
         where_sql = " AND ".join(clauses)
         from_sql = f"project_rag_vectors v {join_sql}".strip()
         params.append(limit)
+        emb_col = embedding_column("v", include_embedding)
         q = f"""
-            SELECT v.id, v.document_id, v.chunk_index, v.embedding::text, v.content, v.metadata,
+            SELECT v.id, v.document_id, v.chunk_index, {emb_col}, v.content, v.metadata,
                    {rank_fts} AS lexical_score
             FROM {from_sql}
             WHERE {where_sql}
@@ -330,7 +316,7 @@ class ProjectRagVectorRepository:
             rows = await conn.fetch(q, *params)
         out: List[Tuple[DocumentVector, float]] = []
         for row in rows:
-            emb = [float(x.strip()) for x in row["embedding"].strip("[]").split(",")]
+            emb = row_embedding(row)
             meta = row["metadata"]
             if isinstance(meta, str):
                 meta = json.loads(meta) if meta else {}
@@ -355,6 +341,7 @@ class ProjectRagVectorRepository:
         limit: int = 32,
         project_id: Optional[str] = None,
         document_id: Optional[int] = None,
+        include_embedding: bool = False,
     ) -> List[Tuple[DocumentVector, float]]:
         """ILIKE-fallback: без токенизаторов, без tsvector, прямое подстрочное совпадение.
 
@@ -386,8 +373,9 @@ class ProjectRagVectorRepository:
         where_sql = " AND ".join(clauses)
         from_sql = f"project_rag_vectors v {join_sql}".strip()
         params.append(limit)
+        emb_col = embedding_column("v", include_embedding)
         q = f"""
-            SELECT v.id, v.document_id, v.chunk_index, v.embedding::text, v.content, v.metadata,
+            SELECT v.id, v.document_id, v.chunk_index, {emb_col}, v.content, v.metadata,
                    {rank_sub} AS lexical_score
             FROM {from_sql}
             WHERE {where_sql}
@@ -398,7 +386,7 @@ class ProjectRagVectorRepository:
             rows = await conn.fetch(q, *params)
         out: List[Tuple[DocumentVector, float]] = []
         for row in rows:
-            emb = [float(x.strip()) for x in row["embedding"].strip("[]").split(",")]
+            emb = row_embedding(row)
             meta = row["metadata"]
             if isinstance(meta, str):
                 meta = json.loads(meta) if meta else {}
@@ -418,7 +406,7 @@ class ProjectRagVectorRepository:
         return out
 
     def _row_to_dv(self, row) -> Tuple[DocumentVector, float]:
-        emb = [float(x.strip()) for x in row["embedding"].strip("[]").split(",")]
+        emb = row_embedding(row)
         meta = row["metadata"]
         if isinstance(meta, str):
             meta = json.loads(meta) if meta else {}
@@ -451,17 +439,20 @@ class ProjectRagVectorRepository:
             )
         return {int(r["chunk_index"]): r["content"] or "" for r in rows}
 
-    async def get_vectors_by_document(self, document_id: int) -> List[DocumentVector]:
+    async def get_vectors_by_document(
+        self, document_id: int, include_embedding: bool = False
+    ) -> List[DocumentVector]:
         """Все чанки документа по chunk_index. Нужен для parent-document expansion."""
+        emb_col = embedding_column("", include_embedding)
         async with await self.db.acquire() as conn:
             rows = await conn.fetch(
-                "SELECT id, document_id, chunk_index, embedding::text, content, metadata "
+                f"SELECT id, document_id, chunk_index, {emb_col}, content, metadata "
                 "FROM project_rag_vectors WHERE document_id = $1 ORDER BY chunk_index",
                 document_id,
             )
         out: List[DocumentVector] = []
         for row in rows:
-            emb = [float(x.strip()) for x in row["embedding"].strip("[]").split(",")]
+            emb = row_embedding(row)
             meta = row["metadata"]
             if isinstance(meta, str):
                 meta = json.loads(meta) if meta else {}
@@ -482,6 +473,11 @@ class ProjectRagVectorRepository:
             await conn.execute("DELETE FROM project_rag_vectors WHERE document_id = $1", document_id)
         return True
 
+    async def replace_vectors_by_document(self, document_id: int, vectors: List[DocumentVector]) -> int:
+        """Атомарно заменить чанки документа (DELETE + COPY в одной транзакции)."""
+        async with await self.db.acquire() as conn:
+            return await copy_vectors(conn, "project_rag_vectors", vectors, replace_document_id=document_id)
+
     async def get_all_document_ids(self, project_id: Optional[str] = None) -> List[int]:
         """Уникальные document_id в project RAG."""
         async with await self.db.acquire() as conn:
@@ -521,20 +517,57 @@ class ProjectRagVectorRepository:
                 )
         return [(r["document_id"], r["chunk_index"], r["content"]) for r in rows]
 
+    async def get_document_contents_for_bm25(self, document_id: int) -> List[Tuple[int, str]]:
+        """Возвращает (chunk_index, content) чанков одного документа проекта — для точечного обновления BM25."""
+        async with await self.db.acquire() as conn:
+            rows = await conn.fetch(
+                "SELECT chunk_index, content FROM project_rag_vectors WHERE document_id = $1 ORDER BY chunk_index",
+                document_id,
+            )
+        return [(r["chunk_index"], r["content"]) for r in rows]
+
+    async def get_contents_for_bm25_by_documents(
+        self, document_ids: List[int], project_id: Optional[str] = None
+    ) -> List[Tuple[int, int, str]]:
+        """Возвращает (document_id, chunk_index, content) чанков указанных документов (опционально в рамках project_id)."""
+        if not document_ids:
+            return []
+        async with await self.db.acquire() as conn:
+            if project_id is not None:
+                rows = await conn.fetch(
+                    """
+                    SELECT v.document_id, v.chunk_index, v.content
+                    FROM project_rag_vectors v
+                    JOIN project_rag_documents d ON d.id = v.document_id
+                    WHERE d.project_id = $1 AND v.document_id = ANY($2::int[])
+                    ORDER BY v.document_id, v.chunk_index
+                    """,
+                    project_id,
+                    list(document_ids),
+                )
+            else:
+                rows = await conn.fetch(
+                    "SELECT document_id, chunk_index, content FROM project_rag_vectors "
+                    "WHERE document_id = ANY($1::int[]) ORDER BY document_id, chunk_index",
+                    list(document_ids),
+                )
+        return [(r["document_id"], r["chunk_index"], r["content"]) for r in rows]
+
     async def get_vector_by_document_and_chunk(
-        self, document_id: int, chunk_index: int
+        self, document_id: int, chunk_index: int, include_embedding: bool = False
     ) -> Optional[Tuple["DocumentVector", float]]:
         """Точечный запрос одного вектора по (document_id, chunk_index)."""
+        emb_col = embedding_column("", include_embedding)
         async with await self.db.acquire() as conn:
             row = await conn.fetchrow(
-                "SELECT id, document_id, chunk_index, embedding::text, content, metadata "
+                f"SELECT id, document_id, chunk_index, {emb_col}, content, metadata "
                 "FROM project_rag_vectors WHERE document_id = $1 AND chunk_index = $2",
                 document_id,
                 chunk_index,
             )
         if not row:
             return None
-        emb = [float(x.strip()) for x in row["embedding"].strip("[]").split(",")]
+        emb = row_embedding(row)
         meta = row["metadata"]
         if isinstance(meta, str):
             meta = json.loads(meta) if meta else {}
@@ -11,6 +11,8 @@ from app.database.fts import (
     query_has_searchable_content,
     substring_where_and_rank,
 )
+from app.database.vector_codec import embedding_column, row_embedding, to_pgvector
+from app.database.vector_ingest import copy_vectors
 from app.database.models import Document, DocumentVector
 from app.text_sanitize import strip_null_bytes
 from app.database.search_filters import DocumentVectorSearchFilters
@@ -172,26 +174,8 @@ class VectorRepository:
     async def create_vectors_batch(self, vectors: List[DocumentVector]) -> int:
         if not vectors:
             return 0
-        values = []
-        for v in vectors:
-            meta = json.dumps(v.metadata) if v.metadata else "{}"
-            chunk = strip_null_bytes(v.content)
-            values.append((v.document_id, v.chunk_index, str(v.embedding), chunk, meta))
-        placeholders = []
-        flat = []
-        for i, (doc_id, idx, emb, content, meta) in enumerate(values):
-            base = i * 5
-            placeholders.append(f"(${base+1}, ${base+2}, ${base+3}, ${base+4}, ${base+5}::jsonb)")
-            flat.extend([doc_id, idx, emb, content, meta])
         async with await self.db.acquire() as conn:
-            await conn.execute(
-                f"""
-                INSERT INTO document_vectors (document_id, chunk_index, embedding, content, metadata)
-                VALUES {", ".join(placeholders)}
-                """,
-                *flat,
-            )
-        return len(vectors)
+            return await copy_vectors(conn, "document_vectors", vectors)
 
     async def similarity_search(
         self,
@@ -199,12 +183,13 @@ class VectorRepository:
         limit: int = 10,
         document_id: Optional[int] = None,
         filters: Optional[DocumentVectorSearchFilters] = None,
+        include_embedding: bool = False,
     ) -> List[Tuple[DocumentVector, float]]:
-        emb_str = str(query_embedding)
+        emb_param = to_pgvector(query_embedding)
         use_join = filters is not None and filters.active()
         join_sql = "JOIN documents d ON d.id = v.document_id" if use_join else ""
         clauses: List[str] = []
-        params: List[Any] = [emb_str]
+        params: List[Any] = [emb_param]
         pi = 2
         if document_id is not None:
             clauses.append(f"v.document_id = ${pi}")
@@ -226,8 +211,9 @@ class VectorRepository:
                 pi += 1
         where_sql = " AND ".join(clauses) if clauses else "TRUE"
         from_sql = f"document_vectors v {join_sql}".strip()
+        emb_col = embedding_column("v", include_embedding)
         q = f"""
-            SELECT v.id, v.document_id, v.chunk_index, v.embedding::text, v.content, v.metadata,
+            SELECT v.id, v.document_id, v.chunk_index, {emb_col}, v.content, v.metadata,
                    1 - (v.embedding <=> $1::vector) as similarity
             FROM {from_sql}
             WHERE {where_sql}
@@ -239,7 +225,7 @@ class VectorRepository:
             rows = await conn.fetch(q, *params)
         result = []
         for row in rows:
-            emb = [float(x.strip()) for x in row["embedding"].strip("[]").split(",")]
+            emb = row_embedding(row)
             meta = row["metadata"]
             if isinstance(meta, str):
                 meta = json.loads(meta) if meta else {}
@@ -264,6 +250,7 @@ class VectorRepository:
         limit: int = 20,
         document_id: Optional[int] = None,
         filters: Optional[DocumentVectorSearchFilters] = None,
+        include_embedding: bool = False,
     ) -> List[Tuple[DocumentVector, float]]:
         """FTS-поиск через OR-``to_tsquery`` (russian + simple). См. ``app.database.fts``."""
         q_text = (query_text or "").strip()
@@ -301,8 +288,9 @@ class VectorRepository:
         where_sql = " AND ".join(clauses)
         from_sql = f"document_vectors v {join_sql}".strip()
         params.append(limit)
+        emb_col = embedding_column("v", include_embedding)
         q = f"""
-            SELECT v.id, v.document_id, v.chunk_index, v.embedding::text, v.content, v.metadata,
+            SELECT v.id, v.document_id, v.chunk_index, {emb_col}, v.content, v.metadata,
                    {rank_fts} AS lexical_score
             FROM {from_sql}
             WHERE {where_sql}
@@ -313,7 +301,7 @@ class VectorRepository:
             rows = await conn.fetch(q, *params)
         out: List[Tuple[DocumentVector, float]] = []
         for row in rows:
-            emb = [float(x.strip()) for x in row["embedding"].strip("[]").split(",")]
+            emb = row_embedding(row)
             meta = row["metadata"]
             if isinstance(meta, str):
                 meta = json.loads(meta) if meta else {}
@@ -337,6 +325,7 @@ class VectorRepository:
         tokens: List[str],
         limit: int = 32,
         document_id: Optional[int] = None,
+        include_embedding: bool = False,
     ) -> List[Tuple[DocumentVector, float]]:
         """ILIKE-fallback на случай, когда FTS не сработал."""
         tokens = [t for t in (tokens or []) if t and isinstance(t, str)]
@@ -354,8 +343,9 @@ class VectorRepository:
             pi += 1
         where_sql = " AND ".join(clauses)
         params.append(limit)
+        emb_col = embedding_column("v", include_embedding)
         q = f"""
-            SELECT v.id, v.document_id, v.chunk_index, v.embedding::text, v.content, v.metadata,
+            SELECT v.id, v.document_id, v.chunk_index, {emb_col}, v.content, v.metadata,
                    {rank_sub} AS lexical_score
             FROM document_vectors v
             WHERE {where_sql}
@@ -366,7 +356,7 @@ class VectorRepository:
             rows = await conn.fetch(q, *params)
         out: List[Tuple[DocumentVector, float]] = []
         for row in rows:
-            emb = [float(x.strip()) for x in row["embedding"].strip("[]").split(",")]
+            emb = row_embedding(row)
             meta = row["metadata"]
             if isinstance(meta, str):
                 meta = json.loads(meta) if meta else {}
@@ -402,15 +392,18 @@ class VectorRepository:
             )
         return {int(r["chunk_index"]): r["content"] or "" for r in rows}
 
-    async def get_vectors_by_document(self, document_id: int) -> List[DocumentVector]:
+    async def get_vectors_by_document(
+        self, document_id: int, include_embedding: bool = False
+    ) -> List[DocumentVector]:
+        emb_col = embedding_column("", include_embedding)
         async with await self.db.acquire() as conn:
             rows = await conn.fetch(
-                "SELECT id, document_id, chunk_index, embedding::text, content, metadata FROM document_vectors WHERE document_id = $1 ORDER BY chunk_index",
+                f"SELECT id, document_id, chunk_index, {emb_col}, content, metadata FROM document_vectors WHERE document_id = $1 ORDER BY chunk_index",
                 document_id,
             )
         out = []
         for row in rows:
-            emb = [float(x.strip()) for x in row["embedding"].strip("[]").split(",")]
+            emb = row_embedding(row)
             meta = row["metadata"]
             if isinstance(meta, str):
                 meta = json.loads(meta) if meta else {}
@@ -431,6 +424,11 @@ class VectorRepository:
             await conn.execute("DELETE FROM document_vectors WHERE document_id = $1", document_id)
         return True
 
+    async def replace_vectors_by_document(self, document_id: int, vectors: List[DocumentVector]) -> int:
+        """Атомарно заменить чанки документа (DELETE + COPY в одной транзакции)."""
+        async with await self.db.acquire() as conn:
+            return await copy_vectors(conn, "document_vectors", vectors, replace_document_id=document_id)
+
     async def get_all_contents_for_bm25(self) -> List[Tuple[int, int, str]]:
         """Возвращает (document_id, chunk_index, content) для всех чанков - для построения BM25."""
         async with await self.db.acquire() as conn:
@@ -439,17 +437,41 @@ class VectorRepository:
             )
         return [(r["document_id"], r["chunk_index"], r["content"]) for r in rows]
 
+    async def get_document_contents_for_bm25(self, document_id: int) -> List[Tuple[int, str]]:
+        """Возвращает (chunk_index, content) чанков одного документа - для точечного обновления BM25."""
+        async with await self.db.acquire() as conn:
+            rows = await conn.fetch(
+                "SELECT chunk_index, content FROM document_vectors WHERE document_id = $1 ORDER BY chunk_index",
+                document_id,
+            )
+        return [(r["chunk_index"], r["content"]) for r in rows]
+
+    async def get_contents_for_bm25_by_documents(self, document_ids: List[int]) -> List[Tuple[int, int, str]]:
+        """Возвращает (document_id, chunk_index, content) чанков указанных документов - для догонки BM25-снапшота."""
+        if not document_ids:
+            return []
+        async with await self.db.acquire() as conn:
+            rows = await conn.fetch(
+                "SELECT document_id, chunk_index, content FROM document_vectors "
+                "WHERE document_id = ANY($1::int[]) ORDER BY document_id, chunk_index",
+                list(document_ids),
+            )
+        return [(r["document_id"], r["chunk_index"], r["content"]) for r in rows]
+
     async def get_all_document_ids(self) -> List[int]:
         """Уникальные document_id в хранилище."""
         async with await self.db.acquire() as conn:
             rows = await conn.fetch("SELECT DISTINCT document_id FROM document_vectors ORDER BY document_id")
         return [r["document_id"] for r in rows]
 
-    async def get_vector_by_document_and_chunk(self, document_id: int, chunk_index: int) -> Optional["DocumentVector"]:
+    async def get_vector_by_document_and_chunk(
+        self, document_id: int, chunk_index: int, include_embedding: bool = False
+    ) -> Optional["DocumentVector"]:
         """Точечный запрос одного вектора по (document_id, chunk_index) - для BM25-only хитов."""
+        emb_col = embedding_column("", include_embedding)
         async with await self.db.acquire() as conn:
             row = await conn.fetchrow(
-                "SELECT id, document_id, chunk_index, embedding::text, content, metadata "
+                f"SELECT id, document_id, chunk_index, {emb_col}, content, metadata "
                 "FROM document_vectors WHERE document_id = $1 AND chunk_index = $2",
                 document_id,
                 chunk_index,
@@ -458,7 +480,7 @@ class VectorRepository:
             return None
         import json as _json
 
-        emb = [float(x.strip()) for x in row["embedding"].strip("[]").split(",")]
+        emb = row_embedding(row)
         meta = row["metadata"]
         if isinstance(meta, str):
             meta = _json.loads(meta) if meta else {}
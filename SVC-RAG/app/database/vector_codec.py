@@ -0,0 +1,71 @@
+# Бинарный кодек pgvector <-> NumPy float32 для asyncpg (без текстового "[0.1, 0.2, ...]").
+import logging
+import struct
+from typing import Any, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Бинарный формат vector (pgvector vector_send/vector_recv):
+# int16 dim, int16 unused, затем dim × float32, всё в network byte order.
+_HEADER = struct.Struct(">HH")
+_BE_FLOAT32 = np.dtype(">f4")
+
+
+def to_pgvector(values: Any) -> np.ndarray:
+    """Привести эмбеддинг (list / ndarray) к плоскому float32 для передачи параметром."""
+    arr = np.asarray(values, dtype=np.float32)
+    if arr.ndim != 1:
+        raise ValueError(f"Эмбеддинг должен быть одномерным, получено shape={arr.shape}")
+    return arr
+
+
+def encode_vector(values: Any) -> bytes:
+    if isinstance(values, str):
+        # Совместимость со старыми вызовами, передающими str(list).
+        values = [float(x) for x in values.strip().strip("[]").split(",") if x.strip()]
+    arr = to_pgvector(values)
+    return _HEADER.pack(arr.shape[0], 0) + arr.astype(_BE_FLOAT32, copy=False).tobytes()
+
+
+def decode_vector(data: bytes) -> np.ndarray:
+    dim, _unused = _HEADER.unpack_from(data)
+    return np.frombuffer(data, dtype=_BE_FLOAT32, count=dim, offset=_HEADER.size).astype(np.float32)
+
+
+async def register_vector_codec(conn) -> bool:
+    """Зарегистрировать бинарный кодек ``vector`` на соединении (init-колбэк пула)."""
+    schema: Optional[str] = await conn.fetchval(
+        "SELECT n.nspname FROM pg_type t JOIN pg_namespace n ON n.oid = t.typnamespace "
+        "WHERE t.typname = 'vector' LIMIT 1"
+    )
+    if schema is None:
+        logger.warning("Тип vector не найден: бинарный кодек pgvector не зарегистрирован")
+        return False
+    await conn.set_type_codec(
+        "vector",
+        schema=schema,
+        encoder=encode_vector,
+        decoder=decode_vector,
+        format="binary",
+    )
+    return True
+
+
+def embedding_column(alias: str, include_embedding: bool) -> str:
+    """Колонка эмбеддинга для SELECT: сам вектор или NULL, если вызывающему он не нужен."""
+    prefix = f"{alias}." if alias else ""
+    return f"{prefix}embedding" if include_embedding else "NULL AS embedding"
+
+
+def row_embedding(row) -> List[float]:
+    """Эмбеддинг из строки выборки (пустой список, если колонку не выбирали)."""
+    value = row["embedding"]
+    if value is None:
+        return []
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, str):
+        return [float(x) for x in value.strip("[]").split(",") if x.strip()]
+    return list(value)
@@ -0,0 +1,79 @@
+# Bulk-запись чанков в таблицы *_vectors: binary COPY во временную staging-таблицу + INSERT ... SELECT.
+import json
+import logging
+from typing import Iterable, List, Optional, Tuple, TYPE_CHECKING
+
+import numpy as np
+
+from app.database.vector_codec import to_pgvector
+from app.text_sanitize import strip_null_bytes
+
+if TYPE_CHECKING:
+    from asyncpg import Connection
+
+    from app.database.models import DocumentVector
+
+logger = logging.getLogger(__name__)
+
+VECTOR_COLUMNS: Tuple[str, ...] = ("document_id", "chunk_index", "embedding", "content", "metadata")
+_STAGING_TABLE = "rag_vectors_staging"
+
+
+def _records(vectors: Iterable["DocumentVector"]) -> List[Tuple[int, int, np.ndarray, str, str]]:
+    return [
+        (
+            int(v.document_id),
+            int(v.chunk_index),
+            to_pgvector(v.embedding),
+            strip_null_bytes(v.content),
+            json.dumps(v.metadata) if v.metadata else "{}",
+        )
+        for v in vectors
+    ]
+
+
+async def copy_vectors(
+    conn: "Connection",
+    table: str,
+    vectors: List["DocumentVector"],
+    *,
+    replace_document_id: Optional[int] = None,
+    on_conflict_do_nothing: bool = False,
+) -> int:
+    """Записать чанки одной транзакцией через COPY; число параметров запроса не растёт с числом чанков.
+
+    Чанки сначала копируются (бинарный протокол, эмбеддинги — float32) во временную таблицу
+    сессии, затем переносятся в ``table`` одним ``INSERT ... SELECT`` — так на целевой таблице
+    срабатывают обычные INSERT-триггеры и generated-колонки FTS.
+
+    При ``replace_document_id`` в той же транзакции удаляются старые чанки документа:
+    читатели видят либо старую версию документа, либо новую, но не пустоту между ними.
+
+    ``on_conflict_do_nothing`` — пропускать чанки, уже лежащие в ``table`` по
+    (document_id, chunk_index) (дубликат, параллельная переиндексация), вместо отката
+    всей транзакции; возвращается число реально вставленных строк.
+    """
+    records = _records(vectors)
+    async with conn.transaction():
+        if replace_document_id is not None:
+            await conn.execute(f"DELETE FROM {table} WHERE document_id = $1", int(replace_document_id))
+        if not records:
+            return 0
+        await conn.execute(f"""
+            CREATE TEMP TABLE {_STAGING_TABLE} (
+                document_id INTEGER NOT NULL,
+                chunk_index INTEGER NOT NULL,
+                embedding vector NOT NULL,
+                content TEXT NOT NULL,
+                metadata JSONB
+            ) ON COMMIT DROP
+            """)
+        await conn.copy_records_to_table(_STAGING_TABLE, records=records, columns=list(VECTOR_COLUMNS))
+        cols = ", ".join(VECTOR_COLUMNS)
+        conflict = " ON CONFLICT (document_id, chunk_index) DO NOTHING" if on_conflict_do_nothing else ""
+        status = await conn.execute(f"INSERT INTO {table} ({cols}) SELECT {cols} FROM {_STAGING_TABLE}{conflict}")
+    inserted = len(records)
+    if on_conflict_do_nothing and isinstance(status, str) and status.startswith("INSERT"):
+        inserted = int(status.split()[-1])  # "INSERT 0 <n>"
+    logger.debug("COPY %s: %s чанков (дубликатов пропущено: %s)", table, inserted, len(records) - inserted)
+    return inserted
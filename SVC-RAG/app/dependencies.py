@@ -3,7 +3,9 @@ import logging
 from typing import Optional
 
 from app.clients.rag_models_client import RagModelsClient
+from app.database.bm25_changelog import Bm25ChangeLogRepository
 from app.database.connection import PostgreSQLConnection, get_postgres_connection
+from app.database.embedding_cache_repository import EmbeddingCacheRepository
 from app.database.kb_repository import KbDocumentRepository, KbVectorRepository
 from app.database.memory_rag_repository import (
     MemoryRagDocumentRepository,
@@ -15,6 +17,7 @@ from app.database.project_rag_repository import (
 )
 from app.database.graph_repository import GraphRepository
 from app.database.repository import DocumentRepository, VectorRepository
+from app.services.embedding_cache import EmbeddingCache
 from app.services.kb_service import KbService
 from app.services.memory_rag_service import MemoryRagService
 from app.services.project_rag_service import ProjectRagService
@@ -37,12 +40,14 @@ _proj_doc_repo: Optional[ProjectRagDocumentRepository] = None
 _proj_vector_repo: Optional[ProjectRagVectorRepository] = None
 _project_rag_service: Optional[ProjectRagService] = None
 _graph_repo: Optional[GraphRepository] = None
+_bm25_changelog: Optional[Bm25ChangeLogRepository] = None
+_embedding_cache: Optional[EmbeddingCache] = None
 
 async def get_db():
     """Подключение к PostgreSQL (один раз при старте)."""
     global _pg, _doc_repo, _vector_repo, _kb_doc_repo, _kb_vector_repo
     global _mem_doc_repo, _mem_vector_repo, _proj_doc_repo, _proj_vector_repo
-    global _graph_repo
+    global _graph_repo, _bm25_changelog, _embedding_cache
     if _pg is None:
         _pg = get_postgres_connection()
         ok = await _pg.connect()
@@ -59,7 +64,10 @@ async def get_db():
         _mem_vector_repo = MemoryRagVectorRepository(_pg, embedding_dim=dim)
         _proj_doc_repo = ProjectRagDocumentRepository(_pg)
         _proj_vector_repo = ProjectRagVectorRepository(_pg, embedding_dim=dim)
-        _graph_repo = GraphRepository(_pg)
+        _graph_repo = GraphRepository(
+            _pg, adjacency_cache_size=get_settings().rag.graph_adjacency_cache_documents
+        )
+        _bm25_changelog = Bm25ChangeLogRepository(_pg)
         await _doc_repo.create_tables()
         await _vector_repo.create_tables()
         await _kb_doc_repo.create_tables()
@@ -69,6 +77,13 @@ async def get_db():
         await _proj_doc_repo.create_tables()
         await _proj_vector_repo.create_tables()
         await _graph_repo.create_tables()
+        # После таблиц чанков: журнал вешает на них триггеры.
+        await _bm25_changelog.create_tables()
+        rag_cfg = get_settings().rag
+        if rag_cfg.embedding_cache_enabled:
+            cache_repo = EmbeddingCacheRepository(_pg)
+            await cache_repo.create_tables()
+            _embedding_cache = EmbeddingCache(cache_repo, memory_items=rag_cfg.embedding_cache_memory_items)
     return _pg
 
 # Текущий выбор источника моделей ПО ТИПАМ. provider=None - «ещё не
@@ -157,6 +172,13 @@ def _client_for(model_type: str):
         embed_batch_size=get_settings().rag_models_client.embed_batch_size,
     )
 
+def _with_embedding_cache(client):
+    """Подключить общий кэш эмбеддингов к embed-части клиента."""
+    embed_part = getattr(client, "embed_client", client)
+    if hasattr(embed_part, "embedding_cache"):
+        embed_part.embedding_cache = _embedding_cache
+    return client
+
 def _make_rag_client():
     """Клиент моделей RAG по текущему выбору (_model_choice).
 
@@ -168,7 +190,7 @@ def _make_rag_client():
     r_provider = (_model_choice["reranker"]["provider"] or "native").lower()
     if e_provider == "native" and r_provider == "native":
         logger.info("[RAG-MODELS] провайдер: native (svc-rag-models)")
-        return RagModelsClient()
+        return _with_embedding_cache(RagModelsClient())
     logger.info(
         "[RAG-MODELS] провайдеры: embedding=%s(%s) reranker=%s(%s)",
         _model_choice["embedding"]["provider"],
@@ -176,7 +198,7 @@ def _make_rag_client():
         _model_choice["reranker"]["provider"],
         _model_choice["reranker"]["model"],
     )
-    return SplitRagClient(_client_for("embedding"), _client_for("reranker"))
+    return _with_embedding_cache(SplitRagClient(_client_for("embedding"), _client_for("reranker")))
 
 async def get_rag_service() -> RagService:
     """Legacy global RagService (/v1/documents, /v1/search)."""
@@ -185,7 +207,7 @@ async def get_rag_service() -> RagService:
         await get_db()
         if _rag_client is None:
             _rag_client = _make_rag_client()
-        _rag_service = RagService(_doc_repo, _vector_repo, _rag_client, _graph_repo)
+        _rag_service = RagService(_doc_repo, _vector_repo, _rag_client, _graph_repo, _bm25_changelog)
     return _rag_service
 
 async def get_kb_service() -> KbService:
@@ -195,7 +217,7 @@ async def get_kb_service() -> KbService:
         await get_db()
         if _rag_client is None:
             _rag_client = _make_rag_client()
-        _kb_service = KbService(_kb_doc_repo, _kb_vector_repo, _rag_client, _graph_repo)
+        _kb_service = KbService(_kb_doc_repo, _kb_vector_repo, _rag_client, _graph_repo, _bm25_changelog)
     return _kb_service
 
 async def get_memory_rag_service() -> MemoryRagService:
@@ -205,7 +227,7 @@ async def get_memory_rag_service() -> MemoryRagService:
         if _rag_client is None:
             _rag_client = _make_rag_client()
         _memory_rag_service = MemoryRagService(
-            _mem_doc_repo, _mem_vector_repo, _rag_client, _graph_repo
+            _mem_doc_repo, _mem_vector_repo, _rag_client, _graph_repo, _bm25_changelog
         )
     return _memory_rag_service
 
@@ -216,7 +238,7 @@ async def get_project_rag_service() -> ProjectRagService:
         if _rag_client is None:
             _rag_client = _make_rag_client()
         _project_rag_service = ProjectRagService(
-            _proj_doc_repo, _proj_vector_repo, _rag_client, _graph_repo
+            _proj_doc_repo, _proj_vector_repo, _rag_client, _graph_repo, _bm25_changelog
         )
     return _project_rag_service
 
@@ -360,6 +382,14 @@ async def set_rag_models_provider(
         "model": (model or "").strip() or None,
     }
 
+    if mt == "embedding":
+        # Новый клиент заново узнает id модели; старый (ещё может быть в работе) — тоже
+        old_embed = getattr(_rag_client, "embed_client", _rag_client)
+        if hasattr(old_embed, "invalidate_model_id"):
+            old_embed.invalidate_model_id()
+        if _embedding_cache is not None:
+            # Горячий слой старой модели не нужен
+            _embedding_cache.invalidate()
     new_client = _make_rag_client()
     _rag_client = new_client
     replaced = 0
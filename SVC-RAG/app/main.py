@@ -1,3 +1,4 @@
+import asyncio
 import logging
 import uuid
 import uvicorn
@@ -18,6 +19,17 @@ configure_logging()
 settings = get_settings()
 logger = get_logger(__name__)
 
+async def _warm_up_services() -> None:
+    """Прогрев BM25-индексов в фоне: со снапшотом — mmap + догонка дельты, без него — полная загрузка."""
+    from app.dependencies import get_kb_service, get_memory_rag_service, get_rag_service
+
+    for getter in (get_rag_service, get_kb_service, get_memory_rag_service):
+        try:
+            svc = await getter()
+            await svc.warm_up()
+        except Exception:
+            logger.exception("SVC-RAG: прогрев %s не удался", getter.__name__)
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     try:
@@ -40,10 +52,13 @@ async def lifespan(app: FastAPI):
             await ensure_memory_chunk_consistency()
         except Exception:
             logger.exception("[MEMORY-CHUNK] проверка нарезки Библиотеки не удалась")
+        warm_up_task = asyncio.create_task(_warm_up_services())
     except Exception as e:
         logger.error("SVC-RAG: ошибка старта БД: %s", e, exc_info=True)
         raise
     yield
+    if not warm_up_task.done():
+        warm_up_task.cancel()
     logger.info("SVC-RAG: shutdown")
 
 def create_application() -> FastAPI:
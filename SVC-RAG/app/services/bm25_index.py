@@ -2,22 +2,46 @@
 
 from __future__ import annotations
 
+import asyncio
+import math
 import re
-from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+import time
+from array import array
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
 
-from rank_bm25 import BM25Okapi
+import numpy as np
 
 from app.core.logging import get_logger
+from app.database.bm25_changelog import CHANGE_LOOKBACK_SECONDS
 from app.database.models import DocumentVector
+from app.services.bm25_snapshot import (
+    SNAPSHOT_FORMAT_VERSION,
+    TOKENIZER_VERSION,
+    Bm25SnapshotSource,
+    read_snapshot,
+    read_snapshot_meta,
+    write_snapshot,
+)
 
 logger = get_logger(__name__)
 
 FetchContentsFn = Callable[[], Awaitable[List[Tuple[int, int, str]]]]
+FetchDocumentContentsFn = Callable[[int], Awaitable[List[Tuple[int, str]]]]
 FetchChunkFn = Callable[[int, int], Awaitable[Optional[DocumentVector]]]
 
 # Classic RRF constant (Cormack et al.). Не зависит от абсолютных шкал cosine/BM25.
 RRF_K = 60
 
+# Параметры Okapi BM25 (те же дефолты, что были у rank_bm25.BM25Okapi).
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# Начальная ёмкость массивов слотов и порог компактизации мёртвых слотов.
+_MIN_SLOTS = 1024
+_COMPACT_MIN_DEAD = 4096
+
 
 def tokenize_ru_en(text: str) -> List[str]:
     """Простая токенизация для BM25: по пробелам и пунктуации."""
@@ -30,75 +54,521 @@ def rrf_score(rank: int, rrf_k: int = RRF_K) -> float:
     return 1.0 / float(rrf_k + rank + 1)
 
 
+def _grow(arr: np.ndarray, size: int) -> np.ndarray:
+    """Расширить массив слотов (удвоением), сохранив содержимое."""
+    if size <= arr.shape[0]:
+        return arr
+    out = np.zeros(max(size, arr.shape[0] * 2, _MIN_SLOTS), dtype=arr.dtype)
+    out[: arr.shape[0]] = arr
+    return out
+
+
 class InMemoryBm25Index:
-    """BM25Okapi над чанками хранилища; пересобирается по флагу needs_rebuild."""
+    """Инкрементальный BM25 (Okapi) над чанками хранилища на массивах NumPy.
+
+    Каждый чанк занимает слот: ``(document_id, chunk_index)`` и длина лежат в
+    плоских int32/float32-массивах. Постинги хранятся в двух слоях:
+
+    - base — CSR (``post_off`` / ``post_slots`` / ``post_tf``) от полной загрузки,
+      компактизации или снапшота (в последнем случае — memory-mapped с диска);
+    - delta — компактные ``array('i')`` для чанков, добавленных после base.
+
+    ``add_document`` / ``remove_document`` трогают только свой документ; df и avgdl
+    живут как счётчики. Удалённые слоты помечаются мёртвыми и вычищаются
+    компактизацией (она же сливает delta в base), когда их доля велика.
+    Полная загрузка из БД (``fetch_contents``) — только при первом обращении
+    или после ``mark_dirty()``; при заданном ``snapshot`` сначала пробуем
+    поднять снапшот с диска и догнать его дельтой по журналу изменений.
+
+    Скоринг векторизован: по каждому терму запроса скоры прибавляются к
+    массиву слотов, top-k берётся через ``np.argpartition``.
 
-    def __init__(self, fetch_contents: FetchContentsFn):
+    IDF — ``log(1 + (N - df + 0.5) / (df + 0.5))`` (вариант Lucene): всегда
+    положителен и, в отличие от epsilon-пола ``BM25Okapi``, не зависит от
+    среднего IDF по всему словарю, поэтому считается за O(1) на терм.
+    """
+
+    def __init__(
+        self,
+        fetch_contents: FetchContentsFn,
+        fetch_document_contents: Optional[FetchDocumentContentsFn] = None,
+        *,
+        k1: float = BM25_K1,
+        b: float = BM25_B,
+        snapshot: Optional[Bm25SnapshotSource] = None,
+    ):
         self._fetch_contents = fetch_contents
-        self.index: Optional[BM25Okapi] = None
-        self.texts: List[str] = []
-        self.metadatas: List[Dict[str, Any]] = []
+        self._fetch_document_contents = fetch_document_contents
+        self._snapshot = snapshot
+        self.k1 = float(k1)
+        self.b = float(b)
+        self._loaded: bool = False
         self.needs_rebuild: bool = True
+        self._build_lock = asyncio.Lock()
+        # Пока идёт полная загрузка, мутации журналируются и переигрываются поверх неё.
+        self._pending: Optional[List[Tuple[int, Optional[List[Tuple[int, str]]]]]] = None
+        self._reset()
+
+    def _reset(self) -> None:
+        self._term_ids: Dict[str, int] = {}
+        self._df = np.zeros(0, dtype=np.int64)
+        # base-слой постингов (CSR по term id) и термов слотов (CSR по слоту)
+        self._bp_off = np.zeros(1, dtype=np.int64)
+        self._bp_slots = np.zeros(0, dtype=np.int32)
+        self._bp_tf = np.zeros(0, dtype=np.int32)
+        self._bst_off = np.zeros(1, dtype=np.int64)
+        self._bst = np.zeros(0, dtype=np.int32)
+        self._n_base_terms: int = 0
+        self._n_base_slots: int = 0
+        # delta-слой: term id -> (слоты, tf); термы delta-слотов (flat + offsets)
+        self._dp: Dict[int, Tuple[array, array]] = {}
+        self._dst = array("i")
+        self._dst_off = array("q", [0])
+        self._slot_doc = np.zeros(0, dtype=np.int32)
+        self._slot_chunk = np.zeros(0, dtype=np.int32)
+        self._slot_len = np.zeros(0, dtype=np.float32)
+        self._slot_alive = np.zeros(0, dtype=np.bool_)
+        self._n_slots: int = 0
+        self._n_alive: int = 0
+        self._total_len: int = 0
+        self._doc_slots: Dict[int, List[int]] = {}
+
+    def __len__(self) -> int:
+        return self._n_alive
 
     @property
     def ready(self) -> bool:
-        return self.index is not None and bool(self.texts)
+        return self._loaded and self._n_alive > 0
+
+    @property
+    def avgdl(self) -> float:
+        return (self._total_len / self._n_alive) if self._n_alive else 0.0
+
+    def document_frequency(self, term: str) -> int:
+        tid = self._term_ids.get(term)
+        return int(self._df[tid]) if tid is not None else 0
 
     def mark_dirty(self) -> None:
+        """Полная пересборка при следующем поиске (массовые изменения вне add/remove)."""
         self.needs_rebuild = True
 
     async def ensure_built(self) -> bool:
-        if self.needs_rebuild or not self.index:
-            await self.build()
+        if self.needs_rebuild or not self._loaded:
+            async with self._build_lock:
+                if self.needs_rebuild or not self._loaded:
+                    await self.build()
         return self.ready
 
+    # ─── Слоты и постинги ───────────────────────────────────────────────────────
+
+    def _term_id(self, term: str) -> int:
+        tid = self._term_ids.get(term)
+        if tid is None:
+            tid = len(self._term_ids)
+            self._term_ids[term] = tid
+            self._df = _grow(self._df, tid + 1)
+        return tid
+
+    def _slot_term_ids(self, slot: int):
+        if slot < self._n_base_slots:
+            return self._bst[self._bst_off[slot] : self._bst_off[slot + 1]].tolist()
+        i = slot - self._n_base_slots
+        return self._dst[self._dst_off[i] : self._dst_off[i + 1]]
+
+    def _add_chunk(self, document_id: int, chunk_index: int, content: str) -> None:
+        tokens = tokenize_ru_en(content)
+        slot = self._n_slots
+        self._n_slots += 1
+        if slot >= self._slot_doc.shape[0]:
+            self._slot_doc = _grow(self._slot_doc, slot + 1)
+            self._slot_chunk = _grow(self._slot_chunk, slot + 1)
+            self._slot_len = _grow(self._slot_len, slot + 1)
+            self._slot_alive = _grow(self._slot_alive, slot + 1)
+        self._slot_doc[slot] = document_id
+        self._slot_chunk[slot] = chunk_index
+        self._slot_len[slot] = len(tokens)
+        self._slot_alive[slot] = True
+        for term, cnt in Counter(tokens).items():
+            tid = self._term_id(term)
+            delta = self._dp.get(tid)
+            if delta is None:
+                delta = (array("i"), array("i"))
+                self._dp[tid] = delta
+            delta[0].append(slot)
+            delta[1].append(cnt)
+            self._df[tid] += 1
+            self._dst.append(tid)
+        self._dst_off.append(len(self._dst))
+        self._n_alive += 1
+        self._total_len += len(tokens)
+        self._doc_slots.setdefault(document_id, []).append(slot)
+
+    def _set_base(
+        self,
+        *,
+        slot_doc: np.ndarray,
+        slot_chunk: np.ndarray,
+        slot_len: np.ndarray,
+        df: np.ndarray,
+        post_off: np.ndarray,
+        post_slots: np.ndarray,
+        post_tf: np.ndarray,
+        slot_terms_off: np.ndarray,
+        slot_terms: np.ndarray,
+    ) -> None:
+        """Сделать переданные массивы base-слоем (delta пустеет, все слоты живые)."""
+        n = int(slot_doc.shape[0])
+        self._slot_doc = slot_doc
+        self._slot_chunk = slot_chunk
+        self._slot_len = slot_len
+        self._slot_alive = np.ones(n, dtype=np.bool_)
+        self._df = np.array(df, dtype=np.int64)
+        self._bp_off = post_off
+        self._bp_slots = post_slots
+        self._bp_tf = post_tf
+        self._bst_off = slot_terms_off
+        self._bst = slot_terms
+        self._n_base_terms = int(post_off.shape[0]) - 1
+        self._n_base_slots = n
+        self._dp = {}
+        self._dst = array("i")
+        self._dst_off = array("q", [0])
+        self._n_slots = self._n_alive = n
+        self._total_len = int(np.asarray(slot_len).sum(dtype=np.float64))
+        self._doc_slots = {}
+        for slot, doc_id in enumerate(np.asarray(slot_doc).tolist()):
+            self._doc_slots.setdefault(doc_id, []).append(slot)
+
+    def _load_rows(self, rows: Iterable[Tuple[int, int, str]]) -> None:
+        """Полная загрузка: токенизация в плоские массивы, постинги — одной сортировкой по term id."""
+        self._reset()
+        term_ids = self._term_ids
+        flat_tids = array("i")
+        flat_tf = array("i")
+        n_terms = array("i")
+        lengths = array("f")
+        docs = array("i")
+        chunks = array("i")
+        for document_id, chunk_index, content in rows:
+            tokens = tokenize_ru_en(content or "")
+            tf = Counter(tokens)
+            flat_tids.extend([term_ids.setdefault(t, len(term_ids)) for t in tf])
+            flat_tf.extend(tf.values())
+            n_terms.append(len(tf))
+            lengths.append(len(tokens))
+            docs.append(int(document_id))
+            chunks.append(int(chunk_index))
+        if not docs:
+            return
+        tids = np.array(flat_tids, dtype=np.int32)
+        per_slot = np.array(n_terms, dtype=np.int64)
+        order = np.argsort(tids, kind="stable")
+        counts = np.bincount(tids, minlength=len(term_ids))
+        self._set_base(
+            slot_doc=np.array(docs, dtype=np.int32),
+            slot_chunk=np.array(chunks, dtype=np.int32),
+            slot_len=np.array(lengths, dtype=np.float32),
+            df=counts,
+            post_off=np.concatenate(([0], np.cumsum(counts, dtype=np.int64))),
+            post_slots=np.repeat(np.arange(len(docs), dtype=np.int32), per_slot)[order],
+            post_tf=np.array(flat_tf, dtype=np.int32)[order],
+            slot_terms_off=np.concatenate(([0], np.cumsum(per_slot))),
+            slot_terms=tids,
+        )
+
+    def _apply_remove(self, document_id: int) -> None:
+        slots = self._doc_slots.pop(document_id, None)
+        if not slots:
+            return
+        for slot in slots:
+            if not self._slot_alive[slot]:
+                continue
+            self._slot_alive[slot] = False
+            for tid in self._slot_term_ids(slot):
+                self._df[tid] -= 1
+            self._total_len -= int(self._slot_len[slot])
+            self._n_alive -= 1
+        dead = self._n_slots - self._n_alive
+        if dead >= _COMPACT_MIN_DEAD and dead * 4 >= self._n_slots:
+            self._compact()
+
+    def _apply_add(self, document_id: int, chunks: List[Tuple[int, str]]) -> None:
+        self._apply_remove(document_id)
+        for chunk_index, content in chunks:
+            self._add_chunk(document_id, chunk_index, content)
+
+    def _compact(self) -> None:
+        """Слить delta в base и выкинуть мёртвые слоты, перенумеровав живые слоты и термы."""
+        n = self._n_slots
+        alive = self._slot_alive[:n]
+        keep = np.flatnonzero(alive)
+        slot_remap = np.cumsum(alive, dtype=np.int64) - 1
+
+        # Все постинги тройками (term id, слот, tf): base, затем delta.
+        p_tid = [np.repeat(np.arange(self._n_base_terms, dtype=np.int64), np.diff(self._bp_off))]
+        p_slot = [np.asarray(self._bp_slots, dtype=np.int64)]
+        p_tf = [np.asarray(self._bp_tf, dtype=np.int32)]
+        for tid, (d_slots, d_tf) in self._dp.items():
+            p_tid.append(np.full(len(d_slots), tid, dtype=np.int64))
+            p_slot.append(np.array(d_slots, dtype=np.int64))
+            p_tf.append(np.array(d_tf, dtype=np.int32))
+        all_tid = np.concatenate(p_tid)
+        all_slot = np.concatenate(p_slot)
+        all_tf = np.concatenate(p_tf)
+        mask = alive[all_slot]
+        all_tid, all_slot, all_tf = all_tid[mask], all_slot[mask], all_tf[mask]
+
+        # Термы без живых постингов выпадают из словаря.
+        n_terms = len(self._term_ids)
+        live_terms = self._df[:n_terms] > 0
+        term_remap = np.cumsum(live_terms, dtype=np.int64) - 1
+        self._term_ids = {t: int(term_remap[tid]) for t, tid in self._term_ids.items() if live_terms[tid]}
+        new_tid = term_remap[all_tid]
+        order = np.argsort(new_tid, kind="stable")
+        counts = np.bincount(new_tid, minlength=len(self._term_ids))
+
+        # Термы слотов: base CSR + delta flat, только живые слоты.
+        st_lens = np.concatenate(
+            (np.diff(self._bst_off), np.diff(np.array(self._dst_off, dtype=np.int64)))
+        )
+        st_flat = np.concatenate((np.asarray(self._bst, dtype=np.int64), np.array(self._dst, dtype=np.int64)))
+        st_keep = np.repeat(alive, st_lens)
+        per_slot = st_lens[keep]
+
+        self._set_base(
+            slot_doc=self._slot_doc[keep],
+            slot_chunk=self._slot_chunk[keep],
+            slot_len=self._slot_len[keep],
+            df=self._df[:n_terms][live_terms],
+            post_off=np.concatenate(([0], np.cumsum(counts, dtype=np.int64))),
+            post_slots=slot_remap[all_slot[order]].astype(np.int32),
+            post_tf=all_tf[order],
+            slot_terms_off=np.concatenate(([0], np.cumsum(per_slot, dtype=np.int64))),
+            slot_terms=term_remap[st_flat[st_keep]].astype(np.int32),
+        )
+        logger.info("BM25 компактизация: %s -> %s слотов, %s термов", n, self._n_slots, len(self._term_ids))
+
+    # ─── Публичные мутации ──────────────────────────────────────────────────────
+
+    def add_document(self, document_id: int, chunks: Iterable[Tuple[int, str]]) -> None:
+        """Добавить (или заменить) чанки документа: ``chunks`` — пары (chunk_index, content)."""
+        document_id = int(document_id)
+        chunk_list = [(int(ci), c or "") for ci, c in chunks]
+        if self._pending is not None:
+            self._pending.append((document_id, chunk_list))
+        elif not self._loaded:
+            # Индекс ещё не загружен — документ придёт вместе с полной загрузкой.
+            return
+        self._apply_add(document_id, chunk_list)
+
+    def remove_document(self, document_id: int) -> None:
+        """Убрать все чанки документа из постингов и статистик."""
+        document_id = int(document_id)
+        if self._pending is not None:
+            self._pending.append((document_id, None))
+        self._apply_remove(document_id)
+
+    async def refresh_document(self, document_id: int) -> None:
+        """Перечитать чанки одного документа из БД (когда тексты чанков не под рукой)."""
+        if not self._loaded and self._pending is None:
+            return
+        if self._fetch_document_contents is None:
+            self.mark_dirty()
+            return
+        try:
+            rows = await self._fetch_document_contents(int(document_id))
+        except Exception as e:
+            logger.warning("BM25: не удалось перечитать документ %s, полная пересборка: %s", document_id, e)
+            self.mark_dirty()
+            return
+        self.add_document(document_id, rows)
+
+    # ─── Загрузка и снапшот ─────────────────────────────────────────────────────
+
     async def build(self) -> None:
+        self._pending = []
+        source = self._snapshot
         try:
-            rows = await self._fetch_contents()
-            if not rows:
+            generation: Optional[Tuple[int, int]] = None
+            replayed: Optional[int] = None
+            if source is not None:
+                epoch, head, pruned = await source.changelog.get_generation(source.table)
+                generation = (epoch, head)
+                replayed = await self._load_snapshot(source, epoch, pruned)
+            if replayed is None:
+                rows = await self._fetch_contents()
+                self._load_rows(rows or [])
+            for document_id, chunk_list in self._pending:
+                if chunk_list is None:
+                    self._apply_remove(document_id)
+                else:
+                    self._apply_add(document_id, chunk_list)
+            if not self._n_alive:
                 logger.warning("Нет текстов для построения BM25 индекса")
-                self.index = None
-                self.texts = []
-                self.metadatas = []
-                self.needs_rebuild = False
-                return
-
-            texts: List[str] = []
-            metadatas: List[Dict[str, Any]] = []
-            for document_id, chunk_index, content in rows:
-                texts.append(content)
-                metadatas.append({"document_id": document_id, "chunk": chunk_index})
-
-            self.index = BM25Okapi([tokenize_ru_en(t) for t in texts])
-            self.texts = texts
-            self.metadatas = metadatas
-            self.needs_rebuild = False
-            logger.info("BM25 индекс построен: %s чанков", len(texts))
+            elif replayed is None:
+                logger.info("BM25 индекс построен: %s чанков, %s термов", self._n_alive, len(self._term_ids))
+            if source is not None and generation is not None and (replayed is None or replayed > 0):
+                await self.save_snapshot(*generation)
         except Exception as e:
             logger.error("Ошибка построения BM25 индекса: %s", e)
-            self.index = None
-            self.texts = []
-            self.metadatas = []
+            self._reset()
+        finally:
+            self._pending = None
+            self._loaded = True
             self.needs_rebuild = False
 
+    async def _load_snapshot(self, source: Bm25SnapshotSource, epoch: int, pruned: int) -> Optional[int]:
+        """Поднять снапшот и догнать дельту. Возвращает число переигранных документов или None."""
+        meta = await asyncio.to_thread(read_snapshot_meta, source.path)
+        if meta is None:
+            return None
+        if (
+            meta.get("table") != source.table
+            or meta.get("scope", "") != source.scope
+            or int(meta.get("epoch", -1)) != epoch
+            or int(meta.get("last_change_id", -1)) < pruned
+            or float(meta.get("k1", 0)) != self.k1
+            or float(meta.get("b", 0)) != self.b
+        ):
+            logger.info("BM25 снапшот %s устарел (epoch/журнал/параметры) — полная загрузка", source.path)
+            return None
+        try:
+            vocab, arrays = await asyncio.to_thread(read_snapshot, source.path)
+        except Exception as e:
+            logger.warning("BM25 снапшот %s не читается, полная загрузка: %s", source.path, e)
+            return None
+        taken_at = datetime.fromtimestamp(float(meta.get("created_at", 0)), tz=timezone.utc)
+        changed = await source.changelog.get_changed_documents(
+            source.table,
+            int(meta["last_change_id"]),
+            since_time=taken_at - timedelta(seconds=CHANGE_LOOKBACK_SECONDS),
+        )
+        rows = await source.fetch_documents_contents(changed) if changed else []
+
+        self._reset()
+        self._term_ids = {t: i for i, t in enumerate(vocab)}
+        self._set_base(**arrays)
+        by_doc: Dict[int, List[Tuple[int, str]]] = {}
+        for document_id, chunk_index, content in rows:
+            by_doc.setdefault(int(document_id), []).append((int(chunk_index), content or ""))
+        for document_id in changed:
+            self._apply_add(int(document_id), by_doc.get(int(document_id), []))
+        logger.info(
+            "BM25 индекс поднят из снапшота %s: %s чанков, %s термов, догружено документов=%s",
+            source.path,
+            self._n_alive,
+            len(self._term_ids),
+            len(changed),
+        )
+        return len(changed)
+
+    async def save_snapshot(self, epoch: int, last_change_id: int) -> bool:
+        """Сохранить текущее состояние на диск (после компактизации delta → base)."""
+        source = self._snapshot
+        if source is None:
+            return False
+        if self._dp or self._n_alive != self._n_slots:
+            self._compact()
+        n, n_terms = self._n_slots, len(self._term_ids)
+        vocab: List[str] = [""] * n_terms
+        for term, tid in self._term_ids.items():
+            vocab[tid] = term
+        # base-массивы после компактизации не мутируют на месте (рост — через копию),
+        # копируем только то, что меняется in-place: df и хвосты слотов.
+        arrays = {
+            "slot_doc": self._slot_doc[:n].copy(),
+            "slot_chunk": self._slot_chunk[:n].copy(),
+            "slot_len": self._slot_len[:n].copy(),
+            "df": self._df[:n_terms].copy(),
+            "post_off": self._bp_off,
+            "post_slots": self._bp_slots,
+            "post_tf": self._bp_tf,
+            "slot_terms_off": self._bst_off,
+            "slot_terms": self._bst,
+        }
+        meta = {
+            "format_version": SNAPSHOT_FORMAT_VERSION,
+            "tokenizer": TOKENIZER_VERSION,
+            "table": source.table,
+            "scope": source.scope,
+            "epoch": int(epoch),
+            "last_change_id": int(last_change_id),
+            "k1": self.k1,
+            "b": self.b,
+            "n_slots": n,
+            "n_terms": n_terms,
+            "created_at": time.time(),
+        }
+        try:
+            await asyncio.to_thread(write_snapshot, source.path, meta, vocab, arrays)
+        except Exception as e:
+            logger.warning("BM25 снапшот %s не записан: %s", source.path, e)
+            return False
+        logger.info("BM25 снапшот записан: %s (%s чанков, %s термов)", source.path, n, n_terms)
+        try:
+            await source.changelog.prune(source.retention_days)
+        except Exception as e:
+            logger.warning("Подрезка журнала BM25 не удалась: %s", e)
+        return True
+
+    # ─── Поиск ──────────────────────────────────────────────────────────────────
+
+    def score_slots(self, query: str) -> np.ndarray:
+        """BM25-скоры по всем слотам (float64, длиной в число слотов; мёртвые = 0)."""
+        n = self._n_slots
+        scores = np.zeros(n, dtype=np.float64)
+        avgdl = self.avgdl
+        if avgdl <= 0:
+            return scores
+        k1, b = self.k1, self.b
+        n_alive = self._n_alive
+        lengths = self._slot_len[:n]
+        for term in tokenize_ru_en(query):
+            tid = self._term_ids.get(term)
+            if tid is None or self._df[tid] <= 0:
+                continue
+            df = int(self._df[tid])
+            idf = math.log(1.0 + (n_alive - df + 0.5) / (df + 0.5))
+            parts = []
+            if tid < self._n_base_terms:
+                lo, hi = int(self._bp_off[tid]), int(self._bp_off[tid + 1])
+                parts.append((self._bp_slots[lo:hi], self._bp_tf[lo:hi]))
+            delta = self._dp.get(tid)
+            if delta is not None:
+                parts.append((np.frombuffer(delta[0], dtype=np.int32), np.frombuffer(delta[1], dtype=np.int32)))
+            for slots, tf_raw in parts:
+                tf = tf_raw.astype(np.float64)
+                denom = tf + k1 * (1.0 - b + b * lengths[slots] / avgdl)
+                # Слоты внутри постингов одного терма уникальны — fancy-index += безопасен.
+                scores[slots] += idf * tf * (k1 + 1.0) / denom
+            del parts
+        scores[~self._slot_alive[:n]] = 0.0
+        return scores
+
+    def top_k(self, scores: np.ndarray, k: int) -> List[Tuple[int, int, float]]:
+        """Top-k слотов с положительным скором: (document_id, chunk_index, score)."""
+        k = max(0, int(k))
+        cand = np.flatnonzero(scores > 0)
+        if not k or not cand.size:
+            return []
+        if cand.size > k:
+            part = np.argpartition(scores[cand], cand.size - k)[cand.size - k :]
+            cand = cand[part]
+        order = cand[np.argsort(-scores[cand], kind="stable")]
+        return list(
+            zip(
+                self._slot_doc[order].tolist(),
+                self._slot_chunk[order].tolist(),
+                scores[order].tolist(),
+            )
+        )
+
     async def search(self, query: str, k: int) -> List[Tuple[int, int, float]]:
         """Возвращает список (document_id, chunk_index, score)."""
-        if not await self.ensure_built() or not self.index:
+        if not await self.ensure_built():
             return []
         try:
-            q_tokens = tokenize_ru_en(query)
-            if not q_tokens:
-                return []
-            scores = self.index.get_scores(q_tokens)
-            top_indices = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)[:k]
-            results: List[Tuple[int, int, float]] = []
-            for idx in top_indices:
-                meta = self.metadatas[idx]
-                score = float(scores[idx])
-                if score <= 0:
-                    continue
-                results.append((meta["document_id"], meta["chunk"], score))
-            return results
+            return self.top_k(self.score_slots(query), k)
         except Exception as e:
             logger.error("Ошибка BM25 поиска: %s", e)
             return []
@@ -0,0 +1,136 @@
+"""Снапшот BM25-индекса на диске: тёплый старт SVC-RAG без полной выгрузки чанков из Postgres.
+
+Формат — каталог с ``meta.json``, ``vocab.txt`` (термы по term id, по одному в строке)
+и набором ``.npy`` (CSR постингов и массивы слотов). Массивы открываются через
+``np.load(mmap_mode="r")``: страницы подтягиваются с диска по мере поиска, а не
+читаются целиком на старте.
+
+Снапшот привязан к поколению таблицы (``rag_bm25_state.epoch``) и к id журнала
+``rag_bm25_changes``, на котором он снят; при старте из БД догружаются только
+документы, изменённые после него.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import shutil
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.core.config import get_settings
+from app.core.logging import get_logger
+
+if TYPE_CHECKING:
+    from app.database.bm25_changelog import Bm25ChangeLogRepository
+
+logger = get_logger(__name__)
+
+SNAPSHOT_FORMAT_VERSION = 1
+# Меняется вместе с tokenize_ru_en: старые снапшоты с другим разбиением не подхватываются.
+TOKENIZER_VERSION = "ru_en_word_v1"
+
+SNAPSHOT_ARRAYS: Tuple[str, ...] = (
+    "slot_doc",
+    "slot_chunk",
+    "slot_len",
+    "df",
+    "post_off",
+    "post_slots",
+    "post_tf",
+    "slot_terms_off",
+    "slot_terms",
+)
+
+FetchDocumentsContentsFn = Callable[[List[int]], Awaitable[List[Tuple[int, int, str]]]]
+
+
+@dataclass
+class Bm25SnapshotSource:
+    """Куда писать снапшот и как догнать его дельтой из БД."""
+
+    path: str
+    table: str
+    changelog: "Bm25ChangeLogRepository"
+    fetch_documents_contents: FetchDocumentsContentsFn
+    scope: str = ""
+    retention_days: int = 14
+
+
+def snapshot_path(base_dir: str, table: str, scope: str = "") -> str:
+    if not scope:
+        return os.path.join(base_dir, table)
+    digest = hashlib.sha1(scope.encode("utf-8")).hexdigest()[:16]
+    return os.path.join(base_dir, f"{table}-{digest}")
+
+
+def make_snapshot_source(
+    table: str,
+    changelog: Optional["Bm25ChangeLogRepository"],
+    fetch_documents_contents: FetchDocumentsContentsFn,
+    *,
+    scope: str = "",
+) -> Optional[Bm25SnapshotSource]:
+    """Источник снапшота или None, если ``rag.bm25_snapshot_dir`` не задан."""
+    cfg = get_settings().rag
+    base_dir = (getattr(cfg, "bm25_snapshot_dir", "") or "").strip()
+    if not base_dir or changelog is None:
+        return None
+    return Bm25SnapshotSource(
+        path=snapshot_path(base_dir, table, scope),
+        table=table,
+        changelog=changelog,
+        fetch_documents_contents=fetch_documents_contents,
+        scope=scope,
+        retention_days=int(getattr(cfg, "bm25_changelog_retention_days", 14) or 0),
+    )
+
+
+def read_snapshot_meta(path: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning("BM25 снапшот %s: meta.json не читается: %s", path, e)
+        return None
+    if meta.get("format_version") != SNAPSHOT_FORMAT_VERSION or meta.get("tokenizer") != TOKENIZER_VERSION:
+        logger.info("BM25 снапшот %s: устаревший формат (%s), игнорирую", path, meta.get("format_version"))
+        return None
+    return meta
+
+
+def read_snapshot(path: str) -> Tuple[List[str], Dict[str, np.ndarray]]:
+    """Словарь термов и memory-mapped массивы снапшота."""
+    arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r") for name in SNAPSHOT_ARRAYS}
+    with open(os.path.join(path, "vocab.txt"), "r", encoding="utf-8") as f:
+        raw = f.read()
+    vocab = raw.split("\n") if raw else []
+    return vocab, arrays
+
+
+def write_snapshot(path: str, meta: Dict[str, Any], vocab: List[str], arrays: Dict[str, np.ndarray]) -> None:
+    """Записать снапшот во временный каталог и подменить им текущий.
+
+    ``meta.json`` пишется последним: недописанный каталог при чтении не валиден.
+    """
+    parent = os.path.dirname(path) or "."
+    os.makedirs(parent, exist_ok=True)
+    tmp = f"{path}.tmp-{os.getpid()}"
+    old = f"{path}.old-{os.getpid()}"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    for name in SNAPSHOT_ARRAYS:
+        np.save(os.path.join(tmp, f"{name}.npy"), np.ascontiguousarray(arrays[name]))
+    with open(os.path.join(tmp, "vocab.txt"), "w", encoding="utf-8") as f:
+        f.write("\n".join(vocab))
+    with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+    if os.path.exists(path):
+        os.replace(path, old)
+    os.replace(tmp, path)
+    shutil.rmtree(old, ignore_errors=True)
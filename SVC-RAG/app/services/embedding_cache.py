@@ -0,0 +1,128 @@
+# Кэш эмбеддингов по содержимому: модель получает только тексты, которых ещё не видела.
+import hashlib
+import logging
+import unicodedata
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple, TYPE_CHECKING, Union
+
+if TYPE_CHECKING:
+    from app.database.embedding_cache_repository import EmbeddingCacheRepository
+
+logger = logging.getLogger(__name__)
+
+EmbedFn = Callable[[List[str]], Awaitable[List[List[float]]]]
+# Векторы и id модели, которая их посчитала (None — неизвестно, в кэш не пишем)
+EmbedWithModelFn = Callable[[List[str]], Awaitable[Tuple[List[List[float]], Optional[str]]]]
+_MemoryKey = Tuple[str, int, bytes]
+
+
+def normalize_text(text: str) -> str:
+    """Нормализация перед хешированием: NFC, переводы строк LF, без краевых пробелов."""
+    return unicodedata.normalize("NFC", text or "").replace("\r\n", "\n").strip()
+
+
+def text_digest(text: str) -> bytes:
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).digest()
+
+
+class EmbeddingCache:
+    """Два уровня: LRU в памяти процесса (частые запросы поиска) и таблица в Postgres (чанки).
+
+    Ключ — (id модели, размерность, sha256 нормализованного текста). Размерность для
+    поиска — текущая размерность схемы: векторы другой размерности в таблицы чанков
+    всё равно не лягут. Одинаковые тексты внутри одного вызова эмбеддятся один раз.
+    Ошибки кэша не валят эмбеддинг — вызов уходит в модель как без кэша.
+
+    id модели для поиска — проверка «до вызова»; если embed_fn сообщает, какая модель
+    на самом деле посчитала векторы (with_model_id), записи ложатся под этот id.
+    Иначе смена модели между проверкой и вызовом навсегда записала бы векторы новой
+    модели под id старой — таблица не истекает.
+    """
+
+    def __init__(self, repo: Optional["EmbeddingCacheRepository"], *, memory_items: int = 4096):
+        self.repo = repo
+        self.memory_items = max(0, int(memory_items))
+        self._memory: "OrderedDict[_MemoryKey, List[float]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def invalidate(self) -> None:
+        """Сбросить память процесса (смена модели). Записи в БД адресуются id модели и остаются."""
+        self._memory.clear()
+
+    def _remember(self, key: _MemoryKey, vector: List[float]) -> None:
+        if self.memory_items <= 0:
+            return
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    async def embed(
+        self,
+        model_id: str,
+        texts: List[str],
+        embed_fn: Union[EmbedFn, EmbedWithModelFn],
+        *,
+        with_model_id: bool = False,
+        _rekey: bool = True,
+    ) -> List[List[float]]:
+        from app.core.config import get_settings
+
+        dim = int(get_settings().postgresql.embedding_dim or 0)
+        digests = [text_digest(t) for t in texts]
+        found: Dict[bytes, List[float]] = {}
+        if dim > 0:
+            for d in digests:
+                vec = self._memory.get((model_id, dim, d))
+                if vec is not None:
+                    self._memory.move_to_end((model_id, dim, d))
+                    found[d] = vec
+            lookup = list({d for d in digests if d not in found})
+            if lookup and self.repo is not None:
+                try:
+                    stored = await self.repo.get_many(model_id, dim, lookup)
+                except Exception as e:
+                    logger.warning("Кэш эмбеддингов: чтение не удалось (%s) — эмбеддим без кэша", e)
+                    stored = {}
+                for d, arr in stored.items():
+                    vec = arr.tolist()
+                    found[d] = vec
+                    self._remember((model_id, dim, d), vec)
+
+        missing: Dict[bytes, str] = {}
+        for d, t in zip(digests, texts):
+            if d not in found and d not in missing:
+                missing[d] = t
+        hits = sum(1 for d in digests if d in found)
+        self.hits += hits
+        self.misses += len(texts) - hits
+        if missing:
+            result = await embed_fn(list(missing.values()))
+            vectors, produced_by = result if with_model_id else (result, model_id)
+            fresh = list(zip(missing.keys(), vectors))
+            for d, vec in fresh:
+                found[d] = vec
+                if produced_by:
+                    self._remember((produced_by, len(vec), d), vec)
+            if produced_by and self.repo is not None:
+                try:
+                    await self.repo.put_many(produced_by, fresh)
+                except Exception as e:
+                    logger.warning("Кэш эмбеддингов: запись не удалась: %s", e)
+            if produced_by and produced_by != model_id and hits:
+                # Модель сменилась после проверки id: найденное в кэше — векторы прежней
+                # модели, смешивать их с новыми нельзя. Свежие уже лежат под новым id.
+                logger.info("Кэш эмбеддингов: векторы посчитала %s, а не %s — пересчёт", produced_by, model_id)
+                if _rekey:
+                    return await self.embed(produced_by, texts, embed_fn, with_model_id=True, _rekey=False)
+                return (await embed_fn(texts))[0]
+        if len(texts) > 1 and hits:
+            logger.info(
+                "Кэш эмбеддингов [%s]: %s из %s текстов из кэша, в модель ушло %s",
+                model_id,
+                hits,
+                len(texts),
+                len(missing),
+            )
+        return [found[d] for d in digests]
@@ -9,8 +9,10 @@ from app.core.logging import get_logger
 from app.database.search_filters import DocumentVectorSearchFilters
 from app.database.kb_repository import KbDocumentRepository, KbVectorRepository
 from app.database.models import Document, DocumentVector
+from app.database.bm25_changelog import Bm25ChangeLogRepository
 from app.database.graph_repository import GraphRepository
 from app.services.bm25_index import InMemoryBm25Index
+from app.services.bm25_snapshot import make_snapshot_source
 from app.services.chunker import (
     describe_embed_client,
     normalize_chunking_strategy,
@@ -43,12 +45,29 @@ class KbService:
         vector_repo: KbVectorRepository,
         rag_models_client: RagModelsClient,
         graph_repo: Optional[GraphRepository] = None,
+        bm25_changelog: Optional[Bm25ChangeLogRepository] = None,
     ):
         self.doc_repo = doc_repo
         self.vector_repo = vector_repo
         self.rag_client = rag_models_client
         self.graph_repo = graph_repo
-        self._bm25 = InMemoryBm25Index(self.vector_repo.get_all_contents_for_bm25)
+        self._bm25 = InMemoryBm25Index(
+            self.vector_repo.get_all_contents_for_bm25,
+            self.vector_repo.get_document_contents_for_bm25,
+            snapshot=make_snapshot_source(
+                "kb_vectors", bm25_changelog, self.vector_repo.get_contents_for_bm25_by_documents
+            ),
+        )
+
+    async def warm_up(self) -> None:
+        """Поднять BM25-индекс на старте (из снапшота, если он настроен), а не на первом поиске."""
+        if not get_settings().rag.use_hybrid_search:
+            return
+        try:
+            await self._bm25.ensure_built()
+            logger.info("[KB] warm_up: BM25-индекс готов (chunks=%d)", len(self._bm25))
+        except Exception as e:
+            logger.warning("[KB] warm_up: BM25 не построен: %s", e)
 
     async def _rebuild_graph_for_document(self, document_id: int) -> None:
         if not self.graph_repo:
@@ -130,7 +149,7 @@ class KbService:
                     "error": f"Иерархическая индексация: {e}",
                     "document_id": None,
                 }
-            self._bm25.mark_dirty()
+            await self._bm25.refresh_document(doc_id)
             await self._rebuild_graph_for_document(doc_id)
             eff_size, eff_overlap = resolve_chunk_params(chunk_size, chunk_overlap)
             logger.info(
@@ -183,7 +202,7 @@ class KbService:
             )
 
         created = await self.vector_repo.create_vectors_batch(vectors)
-        self._bm25.mark_dirty()
+        self._bm25.add_document(doc_id, [(v.chunk_index, v.content) for v in vectors])
         if self.graph_repo:
             try:
                 await self.graph_repo.rebuild_document_graph(
@@ -228,9 +247,9 @@ class KbService:
         text = doc.content or ""
         if not text.strip():
             return 0
-        await self.vector_repo.delete_vectors_by_document(document_id)
         strategy = (chunking_strategy or "universal").strip().lower()
         if strategy == "hierarchical":
+            await self.vector_repo.delete_vectors_by_document(document_id)
             from app.services.hierarchical_indexing import index_document_hierarchically
 
             count = await index_document_hierarchically(
@@ -242,7 +261,7 @@ class KbService:
                 chunk_size=chunk_size,
                 chunk_overlap=chunk_overlap,
             )
-            self._bm25.mark_dirty()
+            await self._bm25.refresh_document(document_id)
             await self._rebuild_graph_for_document(document_id)
             return count
         chunks_with_meta = split_into_chunks_with_meta(
@@ -253,6 +272,8 @@ class KbService:
         )
         chunks = [c for c, _m in chunks_with_meta]
         if not chunks:
+            await self.vector_repo.delete_vectors_by_document(document_id)
+            self._bm25.remove_document(document_id)
             return 0
         embeddings = await self.rag_client.embed(chunks)
         vectors = []
@@ -268,8 +289,9 @@ class KbService:
                     metadata=meta,
                 )
             )
-        created = await self.vector_repo.create_vectors_batch(vectors)
-        self._bm25.mark_dirty()
+        # Старые чанки остаются доступны поиску, пока считаются эмбеддинги; замена — одной транзакцией.
+        created = await self.vector_repo.replace_vectors_by_document(document_id, vectors)
+        self._bm25.add_document(document_id, [(v.chunk_index, v.content) for v in vectors])
         if self.graph_repo:
             try:
                 await self.graph_repo.rebuild_document_graph(
@@ -421,7 +443,7 @@ class KbService:
                 pass
         await self.vector_repo.delete_vectors_by_document(document_id)
         await self.doc_repo.delete_document(document_id)
-        self._bm25.mark_dirty()
+        self._bm25.remove_document(document_id)
         logger.info("KB: удалён документ id=%s ('%s')", document_id, doc.filename)
         return {
             "ok": True,
@@ -12,8 +12,10 @@ from app.database.project_rag_repository import (
     ProjectRagVectorRepository,
 )
 from app.database.models import Document, DocumentVector
+from app.database.bm25_changelog import Bm25ChangeLogRepository
 from app.database.graph_repository import GraphRepository
 from app.services.bm25_index import InMemoryBm25Index
+from app.services.bm25_snapshot import make_snapshot_source
 from app.services.chunker import (
     describe_embed_client,
     normalize_chunking_strategy,
@@ -44,11 +46,13 @@ class ProjectRagService:
         vector_repo: ProjectRagVectorRepository,
         rag_models_client: RagModelsClient,
         graph_repo: Optional[GraphRepository] = None,
+        bm25_changelog: Optional[Bm25ChangeLogRepository] = None,
     ):
         self.doc_repo = doc_repo
         self.vector_repo = vector_repo
         self.rag_client = rag_models_client
         self.graph_repo = graph_repo
+        self._bm25_changelog = bm25_changelog
         # BM25 индексы по project_id (чтобы lexical/hybrid не тянули чужие проекты).
         self._bm25_by_project: Dict[str, InMemoryBm25Index] = {}
 
@@ -73,7 +77,18 @@ class ProjectRagService:
             async def _fetch():
                 return await self.vector_repo.get_all_contents_for_bm25(project_id=project_id)
 
-            idx = InMemoryBm25Index(_fetch)
+            async def _fetch_documents(document_ids: List[int]):
+                return await self.vector_repo.get_contents_for_bm25_by_documents(
+                    document_ids, project_id=project_id
+                )
+
+            idx = InMemoryBm25Index(
+                _fetch,
+                self.vector_repo.get_document_contents_for_bm25,
+                snapshot=make_snapshot_source(
+                    "project_rag_vectors", self._bm25_changelog, _fetch_documents, scope=project_id
+                ),
+            )
             self._bm25_by_project[project_id] = idx
         return idx
 
@@ -84,6 +99,32 @@ class ProjectRagService:
         for idx in self._bm25_by_project.values():
             idx.mark_dirty()
 
+    def _bm25_add_document(
+        self, project_id: Optional[str], document_id: int, chunks: List[Tuple[int, str]]
+    ) -> None:
+        """Точечно обновить BM25 проекта; индекс, который ещё не загружался, не трогаем."""
+        if not project_id:
+            self._mark_bm25_dirty()
+            return
+        idx = self._bm25_by_project.get(project_id)
+        if idx is not None:
+            idx.add_document(document_id, chunks)
+
+    async def _bm25_refresh_document(self, project_id: Optional[str], document_id: int) -> None:
+        if not project_id:
+            self._mark_bm25_dirty()
+            return
+        idx = self._bm25_by_project.get(project_id)
+        if idx is not None:
+            await idx.refresh_document(document_id)
+
+    def _bm25_remove_document(self, project_id: Optional[str], document_id: int) -> None:
+        if project_id and project_id in self._bm25_by_project:
+            self._bm25_by_project[project_id].remove_document(document_id)
+            return
+        for idx in self._bm25_by_project.values():
+            idx.remove_document(document_id)
+
     async def index_document(
         self,
         file_data: bytes,
@@ -150,7 +191,7 @@ class ProjectRagService:
                     "error": f"Иерархическая индексация: {e}",
                     "document_id": None,
                 }
-            self._mark_bm25_dirty(project_id)
+            await self._bm25_refresh_document(project_id, doc_id)
             await self._rebuild_graph_for_document(doc_id)
             eff_size, eff_overlap = resolve_chunk_params(chunk_size, chunk_overlap)
             logger.info(
@@ -206,7 +247,7 @@ class ProjectRagService:
             )
 
         created = await self.vector_repo.create_vectors_batch(vectors)
-        self._mark_bm25_dirty(project_id)
+        self._bm25_add_document(project_id, doc_id, [(v.chunk_index, v.content) for v in vectors])
         if self.graph_repo:
             try:
                 await self.graph_repo.rebuild_document_graph(
@@ -253,9 +294,9 @@ class ProjectRagService:
         text = document.get("content") or ""
         if not text.strip():
             return 0
-        await self.vector_repo.delete_vectors_by_document(document_id)
         strategy = (chunking_strategy or "universal").strip().lower()
         if strategy == "hierarchical":
+            await self.vector_repo.delete_vectors_by_document(document_id)
             from app.services.hierarchical_indexing import index_document_hierarchically
 
             count = await index_document_hierarchically(
@@ -267,7 +308,7 @@ class ProjectRagService:
                 chunk_size=chunk_size,
                 chunk_overlap=chunk_overlap,
             )
-            self._mark_bm25_dirty(project_id)
+            await self._bm25_refresh_document(project_id, document_id)
             await self._rebuild_graph_for_document(document_id)
             return count
         chunks_with_meta = split_into_chunks_with_meta(
@@ -278,6 +319,8 @@ class ProjectRagService:
         )
         chunks = [c for c, _m in chunks_with_meta]
         if not chunks:
+            await self.vector_repo.delete_vectors_by_document(document_id)
+            self._bm25_remove_document(project_id, document_id)
             return 0
         embeddings = await self.rag_client.embed(chunks)
         vectors = []
@@ -293,8 +336,8 @@ class ProjectRagService:
                     metadata=vmeta,
                 )
             )
-        created = await self.vector_repo.create_vectors_batch(vectors)
-        self._mark_bm25_dirty(project_id)
+        created = await self.vector_repo.replace_vectors_by_document(document_id, vectors)
+        self._bm25_add_document(project_id, document_id, [(v.chunk_index, v.content) for v in vectors])
         if self.graph_repo:
             try:
                 await self.graph_repo.rebuild_document_graph(
@@ -494,7 +537,7 @@ class ProjectRagService:
                 pass
         await self.vector_repo.delete_vectors_by_document(document_id)
         await self.doc_repo.delete_document(document_id)
-        self._mark_bm25_dirty(str(meta.get("project_id") or "") or None)
+        self._bm25_remove_document(str(meta.get("project_id") or "") or None, document_id)
         logger.info("project_rag: удалён документ id=%s", document_id)
         return {
             "ok": True,
@@ -5,13 +5,14 @@ from datetime import datetime
 from typing import Any, Dict, List, Optional, Tuple
 
 import httpx
-from rank_bm25 import BM25Okapi
 
 from app.clients.rag_models_client import RagModelsClient
 from app.core.config import get_settings
 from app.database.models import Document, DocumentVector
 from app.database.repository import DocumentRepository, VectorRepository
 from app.database.search_filters import DocumentVectorSearchFilters
+from app.services.bm25_index import InMemoryBm25Index
+from app.services.bm25_snapshot import make_snapshot_source
 from app.services.hit_postprocess import apply_rerank_min_and_window
 from app.services.retrieval_eval import log_retrieval_with_eval
 from app.services.rag_search_helpers import (
@@ -26,6 +27,7 @@ from app.services.rag_search_helpers import (
     vector_fetch_limit,
 )
 from app.database.fts import extract_filenames, extract_proper_nouns
+from app.database.bm25_changelog import Bm25ChangeLogRepository
 from app.database.graph_repository import GraphRepository
 from app.services.chunker import split_into_chunks, split_into_chunks_with_meta
 from app.services.document_parser import parse_document
@@ -35,14 +37,6 @@ from app.services.retrieval_pipeline import _is_enumeration_query
 logger = logging.getLogger(__name__)
 
 
-def _tokenize_ru_en(text: str) -> List[str]:
-    """Простая токенизация для BM25: по пробелам и пунктуации."""
-    import re
-
-    text = (text or "").lower()
-    return re.findall(r"\b\w+\b", text)
-
-
 class RagService:
     def __init__(
         self,
@@ -50,6 +44,7 @@ class RagService:
         vector_repo: VectorRepository,
         rag_models_client: RagModelsClient,
         graph_repo: Optional[GraphRepository] = None,
+        bm25_changelog: Optional[Bm25ChangeLogRepository] = None,
     ):
         self.document_repo = document_repo
         self.vector_repo = vector_repo
@@ -62,10 +57,13 @@ class RagService:
         # BM25 / гибридный поиск
         self.use_hybrid_search: bool = cfg.use_hybrid_search
         self.hybrid_bm25_weight: float = cfg.hybrid_bm25_weight
-        self.bm25_index: Optional[BM25Okapi] = None
-        self.bm25_texts: List[str] = []
-        self.bm25_metadatas: List[Dict[str, Any]] = []
-        self._bm25_needs_rebuild: bool = False
+        self._bm25 = InMemoryBm25Index(
+            self.vector_repo.get_all_contents_for_bm25,
+            self.vector_repo.get_document_contents_for_bm25,
+            snapshot=make_snapshot_source(
+                "document_vectors", bm25_changelog, self.vector_repo.get_contents_for_bm25_by_documents
+            ),
+        )
 
         # Иерархия: суммаризатор и оптимизированный индекс (при включённой настройке)
         self._summarizer: Optional[DocumentSummarizer] = None
@@ -106,14 +104,14 @@ class RagService:
 
         Сейчас собирает BM25-индекс один раз, чтобы первый гибридный/auto-запрос
         не висел 1-5 секунд на горячем построении индекса (особенно после рестарта).
-        Безопасно вызывать многократно: перестроит при ``_bm25_needs_rebuild=True``.
+        Дальше индекс обновляется инкрементально при индексации/удалении документов.
+        Безопасно вызывать многократно: повторная загрузка — только после ``mark_dirty()``.
         """
         if not self.use_hybrid_search:
             return
         try:
-            await self._build_bm25_index()
-            self._bm25_needs_rebuild = False
-            logger.info("[SVC-RAG] warm_up: BM25-индекс готов (chunks=%d)", len(self.bm25_texts))
+            await self._bm25.ensure_built()
+            logger.info("[SVC-RAG] warm_up: BM25-индекс готов (chunks=%d)", len(self._bm25))
         except Exception as e:
             logger.warning("[SVC-RAG] warm_up: BM25 не построен: %s", e)
 
@@ -216,7 +214,7 @@ class RagService:
                 await self.document_repo.delete_document(doc_id)
                 return {"ok": False, "error": "Ошибка иерархической индексации", "document_id": None}
             if self.use_hybrid_search:
-                self._bm25_needs_rebuild = True
+                await self._bm25.refresh_document(doc_id)
             return {
                 "ok": True,
                 "document_id": doc_id,
@@ -281,9 +279,9 @@ class RagService:
             except Exception as e:
                 logger.warning("Graph индекс не собран для документа %s: %s", doc_id, e)
 
-        # После добавления документа помечаем BM25 индекс на пересборку
+        # Новый документ точечно добавляется в BM25 без пересборки всего корпуса
         if self.use_hybrid_search:
-            self._bm25_needs_rebuild = True
+            self._bm25.add_document(doc_id, [(v.chunk_index, v.content) for v in vectors])
 
         return {
             "ok": True,
@@ -340,7 +338,7 @@ class RagService:
         original_strategy = user_strategy
         rerank_key = user_strategy
         if user_strategy == "auto":
-            hybrid_ok = bool(self.use_hybrid_search and self.bm25_index is not None)
+            hybrid_ok = bool(self.use_hybrid_search and self._bm25.ready)
             graph_ok = bool(self.graph_repo and self.graph_enabled)
             hier_ok = self._optimized_index is not None
             picked = resolve_auto_pipeline_strategy(
@@ -386,7 +384,7 @@ class RagService:
                 return final_h
             except Exception as e:
                 logger.warning("Иерархический поиск не удался, fallback на плоский: %s", e)
-                user_strategy = "hybrid" if (self.use_hybrid_search and self.bm25_index) else "standard"
+                user_strategy = "hybrid" if (self.use_hybrid_search and self._bm25.ready) else "standard"
                 logger.info("[SVC-RAG] после сбоя hierarchical используем pipeline=%s", user_strategy)
 
         if user_strategy == "graph":
@@ -722,7 +720,7 @@ class RagService:
             use_hybrid = self.use_hybrid_search and not document_id
 
         hybrid_applied = False
-        if use_hybrid and self.bm25_index:
+        if use_hybrid and self._bm25.ready:
             hybrid_results = await self._hybrid_combine(q_text, pairs, k=fetch_lim)
             pairs = [(v, score) for v, score in hybrid_results]
             hybrid_applied = True
@@ -1086,67 +1084,11 @@ class RagService:
         )
         return final_pairs
 
-    async def _build_bm25_index(self) -> None:
-        """Построение BM25 индекса из всех документов"""
-        if not self.use_hybrid_search:
-            return
-
-        try:
-            rows = await self.vector_repo.get_all_contents_for_bm25()
-            if not rows:
-                logger.warning("Нет текстов для построения BM25 индекса")
-                self.bm25_index = None
-                self.bm25_texts = []
-                self.bm25_metadatas = []
-                return
-
-            all_texts: List[str] = []
-            all_metadatas: List[Dict[str, Any]] = []
-            for document_id, chunk_index, content in rows:
-                all_texts.append(content)
-                all_metadatas.append(
-                    {
-                        "document_id": document_id,
-                        "chunk": chunk_index,
-                    }
-                )
-
-            tokenized_texts = [_tokenize_ru_en(t) for t in all_texts]
-            self.bm25_index = BM25Okapi(tokenized_texts)
-            self.bm25_texts = all_texts
-            self.bm25_metadatas = all_metadatas
-            logger.info("BM25 индекс построен: %s чанков", len(all_texts))
-        except Exception as e:
-            logger.error("Ошибка построения BM25 индекса: %s", e)
-            self.bm25_index = None
-            self.bm25_texts = []
-            self.bm25_metadatas = []
-
     async def _bm25_search(self, query: str, k: int) -> List[Tuple[int, int, float]]:
         """BM25 поиск: возвращает список (document_id, chunk_index, score)."""
         if not self.use_hybrid_search:
             return []
-
-        if self._bm25_needs_rebuild or not self.bm25_index:
-            logger.info("Пересоздание BM25 индекса перед поиском...")
-            await self._build_bm25_index()
-            self._bm25_needs_rebuild = False
-
-        if not self.bm25_index or not self.bm25_texts:
-            return []
-
-        try:
-            q_tokens = _tokenize_ru_en(query)
-            scores = self.bm25_index.get_scores(q_tokens)
-            top_indices = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)[:k]
-            results: List[Tuple[int, int, float]] = []
-            for idx in top_indices:
-                meta = self.bm25_metadatas[idx]
-                results.append((meta["document_id"], meta["chunk"], float(scores[idx])))
-            return results
-        except Exception as e:
-            logger.error("Ошибка BM25 поиска: %s", e)
-            return []
+        return await self._bm25.search(query, k)
 
     async def _hybrid_combine(
         self,
@@ -1374,7 +1316,7 @@ class RagService:
         await self.vector_repo.delete_vectors_by_document(document_id)
         await self.document_repo.delete_document(document_id)
         if self.use_hybrid_search:
-            self._bm25_needs_rebuild = True
+            self._bm25.remove_document(document_id)
         return True
 
     async def list_documents(self) -> List[Dict[str, Any]]:
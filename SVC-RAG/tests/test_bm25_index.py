@@ -0,0 +1,113 @@
+import asyncio
+import unittest
+from unittest.mock import patch
+
+from app.services import bm25_index
+from app.services.bm25_index import InMemoryBm25Index
+
+CORPUS = [
+    (1, 0, "Газпромбанк открыл новый офис в Москве"),
+    (1, 1, "Офис работает по будням"),
+    (2, 0, "МФТИ готовит инженеров и физиков"),
+    (2, 1, "Выпускники МФТИ работают в Тинькофф"),
+    (3, 0, "Тинькофф запустил новый продукт"),
+]
+
+
+def _index(rows):
+    async def _fetch():
+        return list(rows)
+
+    return InMemoryBm25Index(_fetch)
+
+
+class TestInMemoryBm25Index(unittest.TestCase):
+    def test_search_ranks_matching_chunks(self):
+        idx = _index(CORPUS)
+        hits = asyncio.run(idx.search("МФТИ инженеров", 3))
+        self.assertEqual((hits[0][0], hits[0][1]), (2, 0))
+        self.assertTrue(all(score > 0 for _, _, score in hits))
+
+    def test_incremental_add_matches_full_build(self):
+        full = _index(CORPUS)
+        partial = _index([r for r in CORPUS if r[0] != 3])
+
+        async def _run():
+            await partial.ensure_built()
+            partial.add_document(3, [(0, "Тинькофф запустил новый продукт")])
+            return await full.search("Тинькофф новый", 5), await partial.search("Тинькофф новый", 5)
+
+        expected, got = asyncio.run(_run())
+        self.assertEqual([h[:2] for h in got], [h[:2] for h in expected])
+        for (_, _, a), (_, _, b) in zip(got, expected):
+            self.assertAlmostEqual(a, b)
+        self.assertAlmostEqual(partial.avgdl, full.avgdl)
+
+    def test_remove_document_updates_stats(self):
+        idx = _index(CORPUS)
+
+        async def _run():
+            await idx.ensure_built()
+            self.assertEqual(idx.document_frequency("мфти"), 2)
+            idx.remove_document(2)
+            return await idx.search("МФТИ", 5)
+
+        self.assertEqual(asyncio.run(_run()), [])
+        self.assertEqual(idx.document_frequency("мфти"), 0)
+        self.assertEqual(len(idx), 3)
+
+    def test_add_before_first_load_is_left_to_full_build(self):
+        idx = _index(CORPUS)
+        idx.add_document(99, [(0, "лишний текст")])
+        self.assertEqual(len(idx), 0)
+        asyncio.run(idx.ensure_built())
+        self.assertEqual(len(idx), len(CORPUS))
+
+    def test_mutations_during_build_are_replayed(self):
+        gate = asyncio.Event()
+
+        async def _fetch():
+            await gate.wait()
+            return list(CORPUS)
+
+        idx = InMemoryBm25Index(_fetch)
+
+        async def _run():
+            task = asyncio.create_task(idx.ensure_built())
+            await asyncio.sleep(0)
+            idx.add_document(4, [(0, "Сбербанк и ВТБ")])
+            idx.remove_document(1)
+            gate.set()
+            await task
+            return await idx.search("Сбербанк Газпромбанк", 5)
+
+        hits = asyncio.run(_run())
+        self.assertEqual([h[:2] for h in hits], [(4, 0)])
+
+    def test_top_k_uses_partial_selection(self):
+        idx = _index([(i, 0, "слово " * (1 + i % 7)) for i in range(50)])
+        hits = asyncio.run(idx.search("слово", 5))
+        self.assertEqual(len(hits), 5)
+        scores = [s for _, _, s in hits]
+        self.assertEqual(scores, sorted(scores, reverse=True))
+
+    def test_compaction_keeps_results(self):
+        rows = [(d, c, f"общий терм уникальный{d}") for d in range(20) for c in range(3)]
+        idx = _index(rows)
+
+        async def _run():
+            await idx.ensure_built()
+            with patch.object(bm25_index, "_COMPACT_MIN_DEAD", 1):
+                for d in range(0, 20, 2):
+                    idx.remove_document(d)
+            return await idx.search("уникальный5", 5)
+
+        hits = asyncio.run(_run())
+        self.assertEqual(len(idx), 30)
+        self.assertLess(idx._n_slots, len(rows))
+        self.assertEqual(sorted(h[:2] for h in hits), [(5, 0), (5, 1), (5, 2)])
+        self.assertEqual(idx.document_frequency("общий"), 30)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,104 @@
+import asyncio
+import os
+import tempfile
+import unittest
+
+from app.services.bm25_index import InMemoryBm25Index
+from app.services.bm25_snapshot import Bm25SnapshotSource, read_snapshot_meta
+
+CORPUS = [
+    (1, 0, "Газпромбанк открыл новый офис в Москве"),
+    (1, 1, "Офис работает по будням"),
+    (2, 0, "МФТИ готовит инженеров и физиков"),
+    (3, 0, "Тинькофф запустил новый продукт"),
+]
+
+
+class _FakeChangeLog:
+    def __init__(self, epoch=0, head=10, pruned=0, changed=None):
+        self.epoch, self.head, self.pruned = epoch, head, pruned
+        self.changed = list(changed or [])
+        self.pruned_calls = 0
+
+    async def get_generation(self, table):
+        return self.epoch, self.head, self.pruned
+
+    async def get_changed_documents(self, table, since_id, since_time=None):
+        return list(self.changed)
+
+    async def prune(self, retention_days):
+        self.pruned_calls += 1
+        return 0
+
+
+def _index(rows, changelog, path, delta_rows=()):
+    calls = {"full": 0}
+
+    async def _fetch():
+        calls["full"] += 1
+        return list(rows)
+
+    async def _fetch_documents(document_ids):
+        return [r for r in delta_rows if r[0] in document_ids]
+
+    source = Bm25SnapshotSource(path=path, table="document_vectors", changelog=changelog,
+                                fetch_documents_contents=_fetch_documents)
+    return InMemoryBm25Index(_fetch, snapshot=source), calls
+
+
+class TestBm25Snapshot(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self._tmp.name, "document_vectors")
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def test_full_build_writes_snapshot(self):
+        changelog = _FakeChangeLog(head=7)
+        idx, calls = _index(CORPUS, changelog, self.path)
+        asyncio.run(idx.ensure_built())
+        meta = read_snapshot_meta(self.path)
+        self.assertEqual(calls["full"], 1)
+        self.assertEqual((meta["last_change_id"], meta["n_slots"]), (7, len(CORPUS)))
+        self.assertEqual(changelog.pruned_calls, 1)
+
+    def test_warm_start_replays_only_delta(self):
+        asyncio.run(_index(CORPUS, _FakeChangeLog(head=7), self.path)[0].ensure_built())
+
+        # Документ 2 переиндексирован, документ 3 удалён, документ 4 добавлен.
+        delta = [(2, 0, "Сбербанк готовит аналитиков"), (4, 0, "Новый офис ВТБ")]
+        changelog = _FakeChangeLog(head=12, changed=[2, 3, 4])
+        warm, calls = _index([], changelog, self.path, delta_rows=delta)
+        reference, _ = _index([r for r in CORPUS if r[0] not in (2, 3)] + delta, _FakeChangeLog(), self.path + "-ref")
+
+        async def _run():
+            await warm.ensure_built()
+            await reference.ensure_built()
+            query = "новый офис Сбербанк МФТИ"
+            return await warm.search(query, 10), await reference.search(query, 10)
+
+        got, expected = asyncio.run(_run())
+        self.assertEqual(calls["full"], 0)
+        self.assertEqual(sorted(h[:2] for h in got), sorted(h[:2] for h in expected))
+        for (_, _, a), (_, _, b) in zip(sorted(got), sorted(expected)):
+            self.assertAlmostEqual(a, b)
+        self.assertEqual(warm.document_frequency("мфти"), 0)
+        self.assertEqual(read_snapshot_meta(self.path)["last_change_id"], 12)
+
+    def test_epoch_change_forces_full_build(self):
+        asyncio.run(_index(CORPUS, _FakeChangeLog(epoch=0), self.path)[0].ensure_built())
+        idx, calls = _index(CORPUS[:1], _FakeChangeLog(epoch=1), self.path)
+        asyncio.run(idx.ensure_built())
+        self.assertEqual(calls["full"], 1)
+        self.assertEqual(len(idx), 1)
+
+    def test_pruned_changelog_forces_full_build(self):
+        asyncio.run(_index(CORPUS, _FakeChangeLog(head=5), self.path)[0].ensure_built())
+        idx, calls = _index(CORPUS, _FakeChangeLog(head=50, pruned=20), self.path)
+        asyncio.run(idx.ensure_built())
+        self.assertEqual(calls["full"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
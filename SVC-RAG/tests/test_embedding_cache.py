@@ -0,0 +1,66 @@
+import asyncio
+import unittest
+
+import numpy as np
+
+from app.core.config import get_settings
+from app.services.embedding_cache import EmbeddingCache, text_digest
+
+
+class _FakeRepo:
+    def __init__(self):
+        self.rows = {}
+
+    async def get_many(self, model_id, dim, digests):
+        return {d: np.asarray(self.rows[(model_id, dim, d)], dtype=np.float32) for d in digests if (model_id, dim, d) in self.rows}
+
+    async def put_many(self, model_id, items):
+        for d, vec in items:
+            self.rows[(model_id, len(vec), d)] = list(vec)
+
+
+class TestEmbeddingCache(unittest.TestCase):
+    def setUp(self):
+        self.settings = get_settings().postgresql
+        self._dim = self.settings.embedding_dim
+        self.settings.embedding_dim = 2
+        self.calls = []
+
+    def tearDown(self):
+        self.settings.embedding_dim = self._dim
+
+    async def _model(self, texts):
+        self.calls.append(list(texts))
+        return [[float(len(t)), 1.0] for t in texts]
+
+    def test_only_new_texts_reach_model(self):
+        repo = _FakeRepo()
+        cache = EmbeddingCache(repo, memory_items=0)
+        first = asyncio.run(cache.embed("m", ["aa", "bbb", "aa"], self._model))
+        self.assertEqual(first, [[2.0, 1.0], [3.0, 1.0], [2.0, 1.0]])
+        self.assertEqual(self.calls, [["aa", "bbb"]])
+
+        second = asyncio.run(cache.embed("m", ["bbb", "  aa\r\n", "cccc"], self._model))
+        self.assertEqual(second, [[3.0, 1.0], [2.0, 1.0], [4.0, 1.0]])
+        self.assertEqual(self.calls[-1], ["cccc"])
+
+    def test_model_id_separates_entries(self):
+        repo = _FakeRepo()
+        cache = EmbeddingCache(repo)
+        asyncio.run(cache.embed("m1", ["x"], self._model))
+        asyncio.run(cache.embed("m2", ["x"], self._model))
+        self.assertEqual(len(self.calls), 2)
+        self.assertIn(("m1", 2, text_digest("x")), repo.rows)
+
+    def test_invalidate_drops_memory_layer(self):
+        cache = EmbeddingCache(None, memory_items=8)
+        asyncio.run(cache.embed("m", ["x"], self._model))
+        asyncio.run(cache.embed("m", ["x"], self._model))
+        self.assertEqual(len(self.calls), 1)
+        cache.invalidate()
+        asyncio.run(cache.embed("m", ["x"], self._model))
+        self.assertEqual(len(self.calls), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,6 +1,30 @@
+import asyncio
 import unittest
+from contextlib import asynccontextmanager
 
-from app.database.graph_repository import _jaccard, _tokenize
+from app.database.graph_repository import GraphRepository, _jaccard, _tokenize, build_graph_edges
+
+
+class _FakeGraphDb:
+    """Документ 1: узлы 10-12 (чанки 0-2), цепочка 10<->11<->12."""
+
+    def __init__(self):
+        self.fetches = 0
+        edges = [(10, 11, 1.0), (11, 10, 1.0), (11, 12, 0.5), (12, 11, 0.5)]
+        self.rows = [
+            {"document_id": 1, "id": a, "chunk_index": a - 10, "to_node_id": b, "weight": w} for a, b, w in edges
+        ]
+
+    async def fetch(self, sql, *args):
+        self.fetches += 1
+        return self.rows
+
+    async def acquire(self):
+        @asynccontextmanager
+        async def _cm():
+            yield self
+
+        return _cm()
 
 
 class TestGraphRepositoryUtils(unittest.TestCase):
@@ -15,6 +39,38 @@ class TestGraphRepositoryUtils(unittest.TestCase):
         b = ["rag", "search", "context"]
         self.assertGreater(_jaccard(a, b), 0.0)
 
+    def test_build_graph_edges_matches_pairwise_jaccard(self):
+        ordered = [
+            (0, "graph rag search"),
+            (1, "rag search context"),
+            (2, "unrelated words only"),
+            (3, "graph rag search context"),
+        ]
+        edges = build_graph_edges(ordered)
+        adjacent = [(a, b) for a, b, kind, _w, _m in edges if kind == "adjacent"]
+        self.assertEqual(adjacent, [(0, 1), (1, 2), (2, 3)])
+        semantic = {(a, b): m["jaccard"] for a, b, kind, _w, m in edges if kind == "semantic"}
+        self.assertEqual(set(semantic), {(0, 1), (0, 3), (1, 3)})
+        for (a, b), score in semantic.items():
+            self.assertAlmostEqual(score, _jaccard(_tokenize(ordered[a][1]), _tokenize(ordered[b][1])))
+
+    def test_expand_neighbors_uses_cached_adjacency(self):
+        db = _FakeGraphDb()
+        repo = GraphRepository(db)
+
+        async def _expand():
+            return await repo.expand_neighbors("kb", 1, [0], max_hops=2)
+
+        scores = asyncio.run(_expand())
+        self.assertEqual(scores[(1, 0)], 1.0)
+        self.assertAlmostEqual(scores[(1, 1)], 0.82)
+        self.assertAlmostEqual(scores[(1, 2)], 0.82 * 0.82**2 * 0.5)
+        asyncio.run(_expand())
+        self.assertEqual(db.fetches, 1)
+        repo.invalidate_document("kb", 1)
+        asyncio.run(_expand())
+        self.assertEqual(db.fetches, 2)
+
 
 if __name__ == "__main__":
     unittest.main()
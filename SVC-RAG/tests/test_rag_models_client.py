@@ -0,0 +1,138 @@
+import asyncio
+import functools
+import json
+import unittest
+from unittest import mock
+
+import httpx
+import numpy as np
+
+from app.clients.rag_models_client import RagModelsClient
+from app.core.config import get_settings
+from app.services.embedding_cache import EmbeddingCache, text_digest
+
+
+class _SwitchableModels(RagModelsClient):
+    """Текущая модель SVC-RAG-MODELS подменяется полем path вместо HTTP."""
+
+    def __init__(self, path, ttl):
+        super().__init__(base_url="http://rag-models")
+        self.model_id_ttl = ttl
+        self.path = path
+        self.requests = 0
+
+    async def _current_embedding_path(self):
+        self.requests += 1
+        return self.path
+
+
+class _FakeCache:
+    def __init__(self):
+        self.invalidated = 0
+
+    def invalidate(self):
+        self.invalidated += 1
+
+
+class TestEmbeddingModelId(unittest.TestCase):
+    def test_key_changes_after_model_switch(self):
+        client = _SwitchableModels("local/e5-small", ttl=0)
+        client.embedding_cache = _FakeCache()
+
+        self.assertEqual(asyncio.run(client.embedding_model_id()), "native:local/e5-small")
+        client.path = "local/bge-m3"
+        self.assertEqual(asyncio.run(client.embedding_model_id()), "native:local/bge-m3")
+        self.assertEqual(client.embedding_cache.invalidated, 1)
+
+    def test_id_cached_within_ttl_until_invalidated(self):
+        client = _SwitchableModels("local/e5-small", ttl=3600)
+        asyncio.run(client.embedding_model_id())
+        client.path = "local/bge-m3"
+
+        self.assertEqual(asyncio.run(client.embedding_model_id()), "native:local/e5-small")
+        self.assertEqual(client.requests, 1)
+
+        client.invalidate_model_id()
+        self.assertEqual(asyncio.run(client.embedding_model_id()), "native:local/bge-m3")
+
+    def test_unknown_model_disables_cache_key(self):
+        client = _SwitchableModels("local/e5-small", ttl=0)
+        asyncio.run(client.embedding_model_id())
+        client.path = ""
+        self.assertIsNone(asyncio.run(client.embedding_model_id()))
+
+
+class _Repo:
+    def __init__(self):
+        self.rows = {}
+
+    async def get_many(self, model_id, dim, digests):
+        return {
+            d: np.asarray(self.rows[(model_id, dim, d)], dtype=np.float32)
+            for d in digests
+            if (model_id, dim, d) in self.rows
+        }
+
+    async def put_many(self, model_id, items):
+        for d, vec in items:
+            self.rows[(model_id, len(vec), d)] = list(vec)
+
+
+class TestEmbedCacheKeyedByProducingModel(unittest.TestCase):
+    """Модель сменили внутри model_id_ttl на модель той же размерности."""
+
+    def setUp(self):
+        self.settings = get_settings().postgresql
+        self._dim = self.settings.embedding_dim
+        self.settings.embedding_dim = 2
+        self._ensured = RagModelsClient._last_ensured_dim
+        RagModelsClient._last_ensured_dim = 2
+        self.server_model = "local/e5-small"
+        self.vectors = {"local/e5-small": [1.0, 0.0], "local/bge-m3": [0.0, 1.0]}
+        transport = httpx.MockTransport(self._handle)
+        patcher = mock.patch.object(httpx, "AsyncClient", functools.partial(httpx.AsyncClient, transport=transport))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.settings.embedding_dim = self._dim
+        RagModelsClient._last_ensured_dim = self._ensured
+
+    def _handle(self, request):
+        texts = json.loads(request.content)["texts"]
+        vec = self.vectors[self.server_model]
+        return httpx.Response(
+            200, json={"embeddings": [vec for _ in texts], "embedding_dim": 2, "model": self.server_model}
+        )
+
+    def test_switch_inside_ttl_does_not_poison_cache(self):
+        repo = _Repo()
+        client = _SwitchableModels("local/e5-small", ttl=3600)
+        client.embedding_cache = EmbeddingCache(repo, memory_items=0)
+        self.assertEqual(asyncio.run(client.embed(["a"])), [[1.0, 0.0]])
+
+        # Проверка id ещё в пределах TTL и говорит «e5», а считает уже bge-m3
+        self.server_model = "local/bge-m3"
+        client.path = "local/bge-m3"
+        vectors = asyncio.run(client.embed(["a", "b"]))
+
+        self.assertEqual(vectors, [[0.0, 1.0], [0.0, 1.0]])
+        self.assertEqual(client.requests, 1)
+        self.assertNotIn(("native:local/e5-small", 2, text_digest("b")), repo.rows)
+        self.assertEqual(repo.rows[("native:local/bge-m3", 2, text_digest("a"))], [0.0, 1.0])
+        self.assertEqual(repo.rows[("native:local/e5-small", 2, text_digest("a"))], [1.0, 0.0])
+        self.assertEqual(asyncio.run(client.embedding_model_id()), "native:local/bge-m3")
+
+    def test_response_without_model_is_not_cached(self):
+        repo = _Repo()
+        client = _SwitchableModels("local/e5-small", ttl=3600)
+        client.embedding_cache = EmbeddingCache(repo, memory_items=0)
+        self.server_model = ""
+        self.vectors[""] = [1.0, 1.0]
+
+        self.assertEqual(asyncio.run(client.embed(["a"])), [[1.0, 1.0]])
+        self.assertEqual(repo.rows, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
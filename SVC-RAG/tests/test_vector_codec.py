@@ -0,0 +1,30 @@
+import struct
+import unittest
+
+import numpy as np
+
+from app.database.vector_codec import decode_vector, embedding_column, encode_vector, row_embedding
+
+
+class TestVectorCodec(unittest.TestCase):
+    def test_binary_roundtrip(self):
+        vec = np.array([0.25, -1.5, 3.0], dtype=np.float32)
+        data = encode_vector(vec)
+        self.assertEqual(struct.unpack(">HH", data[:4]), (3, 0))
+        self.assertEqual(len(data), 4 + 3 * 4)
+        out = decode_vector(data)
+        self.assertEqual(out.dtype, np.float32)
+        np.testing.assert_array_equal(out, vec)
+
+    def test_encode_accepts_list_and_text(self):
+        self.assertEqual(encode_vector([1.0, 2.0]), encode_vector("[1.0, 2.0]"))
+
+    def test_embedding_column_skipped_by_default(self):
+        self.assertEqual(embedding_column("v", False), "NULL AS embedding")
+        self.assertEqual(embedding_column("v", True), "v.embedding")
+        self.assertEqual(row_embedding({"embedding": None}), [])
+        self.assertEqual(row_embedding({"embedding": np.array([1.0], dtype=np.float32)}), [1.0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+import asyncio
+import unittest
+from contextlib import asynccontextmanager
+
+import numpy as np
+
+from app.database.models import DocumentVector
+from app.database.vector_ingest import copy_vectors
+
+
+class _FakeConn:
+    def __init__(self):
+        self.calls = []
+
+    @asynccontextmanager
+    async def _tx(self):
+        self.calls.append(("begin",))
+        yield
+        self.calls.append(("commit",))
+
+    def transaction(self):
+        return self._tx()
+
+    async def execute(self, sql, *args):
+        sql = " ".join(sql.split())
+        self.calls.append(("execute", sql[:40], args, sql))
+        if sql.startswith("INSERT") and "ON CONFLICT" in sql:
+            return "INSERT 0 1"
+        return "OK"
+
+    async def copy_records_to_table(self, table, *, records, columns):
+        self.calls.append(("copy", table, list(records), tuple(columns)))
+
+
+class TestCopyVectors(unittest.TestCase):
+    def test_replace_deletes_and_copies_in_one_transaction(self):
+        conn = _FakeConn()
+        vectors = [
+            DocumentVector(document_id=7, chunk_index=i, embedding=[0.5, 1.0], content=f"t\x00{i}", metadata={"i": i})
+            for i in range(3)
+        ]
+        n = asyncio.run(copy_vectors(conn, "kb_vectors", vectors, replace_document_id=7))
+        self.assertEqual(n, 3)
+        kinds = [c[0] for c in conn.calls]
+        self.assertEqual(kinds, ["begin", "execute", "execute", "copy", "execute", "commit"])
+        self.assertTrue(conn.calls[1][1].startswith("DELETE FROM kb_vectors"))
+        self.assertTrue(conn.calls[4][1].startswith("INSERT INTO kb_vectors"))
+        record = conn.calls[3][2][0]
+        self.assertEqual(record[:2], (7, 0))
+        self.assertEqual(record[2].dtype, np.float32)
+        self.assertEqual(record[3], "t0")
+
+    def test_empty_replace_only_deletes(self):
+        conn = _FakeConn()
+        self.assertEqual(asyncio.run(copy_vectors(conn, "kb_vectors", [], replace_document_id=7)), 0)
+        self.assertEqual([c[0] for c in conn.calls], ["begin", "execute", "commit"])
+
+    def test_on_conflict_do_nothing_counts_inserted_rows(self):
+        conn = _FakeConn()
+        vectors = [DocumentVector(document_id=7, chunk_index=0, embedding=[0.5], content="t") for _ in range(2)]
+        n = asyncio.run(copy_vectors(conn, "project_rag_vectors", vectors, on_conflict_do_nothing=True))
+        self.assertEqual(n, 1)
+        self.assertTrue(conn.calls[-2][3].endswith("ON CONFLICT (document_id, chunk_index) DO NOTHING"))
+
+    def test_plain_insert_has_no_conflict_clause(self):
+        conn = _FakeConn()
+        vectors = [DocumentVector(document_id=7, chunk_index=0, embedding=[0.5], content="t")]
+        asyncio.run(copy_vectors(conn, "kb_vectors", vectors))
+        self.assertNotIn("ON CONFLICT", conn.calls[-2][3])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -34,6 +34,8 @@ try:
     from backend.context_prompts import context_prompt_manager, merge_context_prompt_into_system
     from backend.llm_client import (
         ask_agent_llm_svc,
+        ask_agent_llm_svc_async,
+        LLM_SVC_CALL_TIMEOUT,
         get_llm_service,
         resolve_llm_svc_model_id_for_request,
         resolve_llm_host_and_model_for_svc,
@@ -44,6 +46,8 @@ except ImportError:
     from context_prompts import context_prompt_manager, merge_context_prompt_into_system
     from llm_client import (
         ask_agent_llm_svc,
+        ask_agent_llm_svc_async,
+        LLM_SVC_CALL_TIMEOUT,
         get_llm_service,
         resolve_llm_svc_model_id_for_request,
         resolve_llm_host_and_model_for_svc,
@@ -554,6 +558,93 @@ def ask_agent(
         logger.warning("llm-svc недоступен, используется fallback режим")
         return "llm-svc недоступен. Пожалуйста, запустите llm-svc сервис."
 
+async def ask_agent_async(
+    prompt,
+    history=None,
+    max_tokens=None,
+    streaming=False,
+    stream_callback=None,
+    model_path=None,
+    custom_prompt_id=None,
+    images=None,
+    system_prompt=None,
+    temperature=None,
+    enable_thinking=None,
+):
+    """
+    Асинхронный вариант ``ask_agent`` для socket-обработчиков.
+
+    Маршрутизация та же, но всё выполняется в текущем event loop: без пула потоков
+    и своего asyncio.run на сообщение. ``stream_callback`` вызывается в этом loop.
+    """
+    from backend.llm_providers.routing import (
+        registry_response_usable,
+        should_use_llm_svc_direct,
+    )
+
+    eff_max_tokens = max_tokens or (model_settings.get("output_tokens") if model_settings else 1024)
+    eff_temperature = float(temperature if temperature is not None else (model_settings.get("temperature") or 0.7))
+    eff_system_prompt = merge_context_prompt_into_system(
+        system_prompt, model_path=model_path, custom_prompt_id=custom_prompt_id
+    )
+
+    if not should_use_llm_svc_direct(model_path=model_path, images=images):
+        try:
+            from backend.mcp.orchestrator_bridge import chat_via_registry
+
+            registry_response = await chat_via_registry(
+                prompt,
+                history=history,
+                model_path=model_path,
+                streaming=streaming,
+                stream_callback=stream_callback,
+                max_tokens=eff_max_tokens,
+                temperature=eff_temperature,
+                system_prompt=eff_system_prompt,
+                enable_thinking=bool(enable_thinking),
+            )
+            if registry_response_usable(registry_response):
+                logger.debug("ask_agent_async: ProviderRegistry model_path=%s", model_path)
+                return registry_response
+        except Exception as exc:
+            logger.debug("ask_agent_async: ProviderRegistry failed, fallback llm-svc: %s", exc)
+
+    if not USE_LLM_SVC:
+        logger.warning("llm-svc недоступен, используется fallback режим")
+        return "llm-svc недоступен. Пожалуйста, запустите llm-svc сервис."
+
+    logger.info("ask_agent_async: llm-svc path model_path=%s images=%s", model_path, bool(images))
+    if max_tokens is None:
+        max_tokens = model_settings.get("output_tokens")
+    if temperature is None:
+        temperature = float(model_settings.get("temperature") or 0.7)
+    try:
+        return await asyncio.wait_for(
+            ask_agent_llm_svc_async(
+                prompt=prompt,
+                history=history,
+                max_tokens=max_tokens,
+                streaming=streaming,
+                stream_callback=stream_callback,
+                model_path=model_path,
+                custom_prompt_id=custom_prompt_id,
+                images=images,
+                system_prompt=eff_system_prompt,
+                temperature=temperature,
+                enable_thinking=enable_thinking,
+            ),
+            timeout=LLM_SVC_CALL_TIMEOUT,
+        )
+    except asyncio.CancelledError:
+        logger.warning("Генерация была отменена (asyncio.CancelledError)")
+        raise
+    except asyncio.TimeoutError:
+        logger.error("Генерация через llm-svc не уложилась в %s с", LLM_SVC_CALL_TIMEOUT)
+        return "Ошибка при обращении к модели."
+    except Exception as e:
+        logger.error(f"Ошибка генерации через llm-svc: {e}")
+        return f"Извините, произошла ошибка при генерации ответа: {str(e)}"
+
 # Инициализация НЕ происходит автоматически при импорте модуля!
 # Это позволяет избежать двойной загрузки модели.
 # Инициализация будет выполнена явно из main.py при первом использовании.
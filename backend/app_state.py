@@ -17,6 +17,7 @@ logger = get_logger(__name__)
 try:
     from backend.agent_llm_svc import (
         ask_agent,
+        ask_agent_async,
         get_model_info,
         initialize_model,
         model_settings,
@@ -29,6 +30,7 @@ try:
 except Exception:
     logger.exception("Ошибка импорта agent_llm_svc")
     ask_agent = None
+    ask_agent_async = None
     model_settings = None
     update_model_settings = None
     reload_model_by_path = None
@@ -3,8 +3,12 @@
 Файловый режим отключен - используется только MongoDB
 """
 
+import os
 import re
+import threading
+import time
 import uuid
+from collections import OrderedDict
 from datetime import datetime
 from typing import Any, Dict, List, Optional
 
@@ -51,6 +55,7 @@ def _check_mongodb_available() -> bool:
         return False
     try:
         conversation_repo = get_conversation_repository()
+        conversation_repo.add_change_listener(_on_conversation_changed)
         mongodb_available = True
         logger.debug("MongoDB доступен - репозиторий получен успешно")
         return True
@@ -68,6 +73,129 @@ def _check_mongodb_available() -> bool:
         return False
 
 
+def _history_entry(role: str, content: str, timestamp: Optional[datetime]) -> Dict[str, Any]:
+    if timestamp is not None:
+        # MongoDB хранит миллисекунды — обрезаем, чтобы запись из кэша совпадала с прочитанной из базы
+        timestamp = timestamp.replace(microsecond=timestamp.microsecond // 1000 * 1000)
+    return {
+        "role": role,
+        "content": _strip_reasoning_from_history_content(content),
+        "timestamp": timestamp.isoformat() if timestamp else None,
+    }
+
+
+class _RecentHistoryCache:
+    """
+    Очищенная от reasoning история по диалогам: хвост сообщений + признак «загружена целиком».
+
+    Пополняется при записи (add_message дописывает сообщение в хвост), любое другое
+    изменение сообщений сбрасывает запись. Версия диалога защищает от гонки «чтение из
+    базы началось до записи, а закончилось после»: такой результат в кэш не кладётся.
+
+    DIALOG_HISTORY_CACHE_ITEMS        — сколько диалогов держать (256, 0 — кэш выключен);
+    DIALOG_HISTORY_CACHE_MAX_MESSAGES — длина хвоста на диалог (200);
+    DIALOG_HISTORY_CACHE_TTL_SEC      — время жизни записи (300).
+
+    Кэш локальный для процесса: изменения, сделанные другой репликой бэкенда, он не видит,
+    и TTL — единственная граница устаревания. Без sticky-сессий TTL стоит уменьшить
+    или выключить кэш (см. MAIN.env).
+    """
+
+    def __init__(self):
+        self.max_items = max(0, int(os.getenv("DIALOG_HISTORY_CACHE_ITEMS", "256")))
+        self.max_messages = max(1, int(os.getenv("DIALOG_HISTORY_CACHE_MAX_MESSAGES", "200")))
+        self.ttl = float(os.getenv("DIALOG_HISTORY_CACHE_TTL_SEC", "300"))
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._versions: Dict[str, int] = {}
+        self._epoch = 0
+        self._lock = threading.Lock()
+
+    def version(self, conversation_id: str) -> tuple:
+        with self._lock:
+            return (self._epoch, self._versions.get(conversation_id, 0))
+
+    def get(self, conversation_id: str, limit: Optional[int]) -> Optional[List[Dict[str, Any]]]:
+        if not self.max_items:
+            return None
+        with self._lock:
+            entry = self._entries.get(conversation_id)
+            if entry is None:
+                return None
+            if time.monotonic() - entry["stored_at"] > self.ttl:
+                del self._entries[conversation_id]
+                return None
+            history = entry["history"]
+            if limit is None:
+                if not entry["complete"]:
+                    return None
+            elif len(history) < limit and not entry["complete"]:
+                return None
+            self._entries.move_to_end(conversation_id)
+            window = history if limit is None else history[-limit:]
+            return [dict(item) for item in window]
+
+    def put(self, conversation_id: str, history: List[Dict[str, Any]], complete: bool, version: tuple) -> None:
+        if not self.max_items:
+            return
+        with self._lock:
+            if version != (self._epoch, self._versions.get(conversation_id, 0)):
+                return
+            if len(history) > self.max_messages:
+                history, complete = history[-self.max_messages:], False
+            self._entries[conversation_id] = {
+                "history": [dict(item) for item in history],
+                "complete": complete,
+                "stored_at": time.monotonic(),
+            }
+            self._entries.move_to_end(conversation_id)
+            while len(self._entries) > self.max_items:
+                self._entries.popitem(last=False)
+
+    def _bump(self, conversation_id: str) -> None:
+        if len(self._versions) > 4 * max(self.max_items, 256):
+            # счётчики версий не копим бесконечно: смена эпохи отбраковывает все чтения «в полёте»
+            self._versions.clear()
+            self._epoch += 1
+        self._versions[conversation_id] = self._versions.get(conversation_id, 0) + 1
+
+    def append(self, conversation_id: str, item: Dict[str, Any]) -> None:
+        with self._lock:
+            self._bump(conversation_id)
+            entry = self._entries.get(conversation_id)
+            if entry is None:
+                return
+            entry["history"].append(item)
+            if len(entry["history"]) > self.max_messages:
+                del entry["history"][0]
+                entry["complete"] = False
+
+    def invalidate(self, conversation_id: Optional[str] = None) -> None:
+        with self._lock:
+            if conversation_id is None:
+                self._entries.clear()
+                self._versions.clear()
+                self._epoch += 1
+                return
+            self._bump(conversation_id)
+            self._entries.pop(conversation_id, None)
+
+
+_history_cache = _RecentHistoryCache()
+
+
+def _on_conversation_changed(conversation_id: Optional[str], message: Optional[Any] = None) -> None:
+    """Подписчик репозитория: дописанное сообщение — в хвост кэша, иначе сброс."""
+    if conversation_id is not None and message is not None:
+        _history_cache.append(conversation_id, _history_entry(message.role, message.content, message.timestamp))
+    else:
+        _history_cache.invalidate(conversation_id)
+
+
+def invalidate_dialog_history_cache(conversation_id: Optional[str] = None) -> None:
+    """Сбросить кэш истории диалога (None — всех диалогов)."""
+    _history_cache.invalidate(conversation_id)
+
+
 current_conversation_id = None
 
 
@@ -361,17 +489,7 @@ async def load_dialog_history_mongodb(conversation_id: Optional[str] = None) ->
         conversation = await conversation_repo.get_conversation(conversation_id)
         if conversation is None:
             return []
-        history = []
-        for message in conversation.messages:
-            cleaned_content = _strip_reasoning_from_history_content(message.content)
-            history.append(
-                {
-                    "role": message.role,
-                    "content": cleaned_content,
-                    "timestamp": message.timestamp.isoformat() if message.timestamp else None,
-                }
-            )
-        return history
+        return [_history_entry(m.role, m.content, m.timestamp) for m in conversation.messages]
     except RuntimeError as e:
         logger.warning(f"MongoDB не инициализирован: {e}")
         return []
@@ -400,6 +518,9 @@ async def get_recent_dialog_history_mongodb(
     """
     Получение последних N сообщений из MongoDB
 
+    Из базы читается только хвост диалога ($slice), очищенная история кэшируется
+    по диалогу и пополняется при записи новых сообщений.
+
     Args:
         max_entries: Максимальное количество сообщений. Если None, возвращает всю историю (неограниченная память)
         conversation_id: ID диалога (если None, используется текущий)
@@ -408,10 +529,25 @@ async def get_recent_dialog_history_mongodb(
         Список последних сообщений
     """
     try:
-        history = await load_dialog_history_mongodb(conversation_id)
-        if max_entries is None:
-            return history
-        return history[-max_entries:] if len(history) > max_entries else history
+        global conversation_repo
+        if not _check_mongodb_available():
+            logger.warning("MongoDB не инициализирован. Не удалось загрузить историю.")
+            return []
+        if conversation_repo is None:
+            conversation_repo = get_conversation_repository()
+        if conversation_id is None:
+            conversation_id = get_or_create_conversation_id()
+        limit = max_entries if max_entries is not None and max_entries > 0 else None
+        cached = _history_cache.get(conversation_id, limit)
+        if cached is not None:
+            return cached
+        version = _history_cache.version(conversation_id)
+        messages = await conversation_repo.get_recent_messages(conversation_id, limit)
+        if messages is None:
+            return []
+        history = [_history_entry(m.role, m.content, m.timestamp) for m in messages]
+        _history_cache.put(conversation_id, history, limit is None or len(history) < limit, version)
+        return history
     except Exception:
         logger.exception("Ошибка при получении последних сообщений из MongoDB")
         return []
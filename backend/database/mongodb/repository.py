@@ -1,4 +1,4 @@
-from typing import Optional, List, Dict, Any
+from typing import Callable, Optional, List, Dict, Any
 from datetime import datetime, timedelta
 from motor.motor_asyncio import AsyncIOMotorCollection
 from bson import ObjectId
@@ -9,6 +9,10 @@ from backend.settings.logging import get_logger
 
 logger = get_logger(__name__)
 
+# (conversation_id, добавленное сообщение | None). conversation_id=None — изменились
+# неизвестные диалоги (массовое удаление); message=None — диалог изменён не дописыванием.
+ConversationChangeListener = Callable[[Optional[str], Optional[Message]], None]
+
 
 class ConversationRepository:
     """Репозиторий для работы с диалогами"""
@@ -22,11 +26,24 @@ class ConversationRepository:
         """
         self.db_connection = db_connection
         self.collection_name = "conversations"
+        self._change_listeners: List[ConversationChangeListener] = []
 
     def _get_collection(self) -> AsyncIOMotorCollection:
         """Получение коллекции диалогов"""
         return self.db_connection.get_collection(self.collection_name)
 
+    def add_change_listener(self, listener: ConversationChangeListener) -> None:
+        """Подписка на изменения сообщений (кэши истории); повторная подписка игнорируется."""
+        if listener not in self._change_listeners:
+            self._change_listeners.append(listener)
+
+    def _notify_change(self, conversation_id: Optional[str], message: Optional[Message] = None) -> None:
+        for listener in self._change_listeners:
+            try:
+                listener(conversation_id, message)
+            except Exception as e:
+                logger.warning(f"Ошибка в подписчике изменений диалогов: {e}")
+
     async def create_indexes(self):
         """Создание индексов для оптимизации поиска"""
         collection = self._get_collection()
@@ -71,6 +88,7 @@ class ConversationRepository:
             conversation_dict["_id"] = ObjectId()
 
             result = await collection.insert_one(conversation_dict)
+            self._notify_change(conversation.conversation_id)
             logger.info(f"Создан диалог: {conversation.conversation_id}")
             return str(result.inserted_id)
 
@@ -101,6 +119,36 @@ class ConversationRepository:
             logger.error(f"Ошибка при получении диалога: {e}")
             return None
 
+    async def get_recent_messages(
+        self,
+        conversation_id: str,
+        limit: Optional[int] = None
+    ) -> Optional[List[Message]]:
+        """
+        Последние сообщения диалога без загрузки всего документа
+
+        Args:
+            conversation_id: ID диалога
+            limit: Сколько последних сообщений вернуть (None — все)
+
+        Returns:
+            Список сообщений (от старых к новым) или None, если диалог не найден
+        """
+        try:
+            collection = self._get_collection()
+            messages_projection: Any = 1 if limit is None else {"$slice": -max(1, int(limit))}
+            result = await collection.find_one(
+                {"conversation_id": conversation_id},
+                {"_id": 0, "conversation_id": 1, "messages": messages_projection}
+            )
+            if result is None:
+                return None
+            return [Message(**m) for m in result.get("messages") or []]
+
+        except Exception as e:
+            logger.error(f"Ошибка при получении последних сообщений диалога: {e}")
+            return None
+
     async def add_message(
         self, 
         conversation_id: str, 
@@ -126,6 +174,7 @@ class ConversationRepository:
                     "$set": {"updated_at": datetime.utcnow()}
                 }
             )
+            self._notify_change(conversation_id, message)
 
             logger.debug(f"Добавлено сообщение в диалог: {conversation_id}")
             return True
@@ -171,6 +220,7 @@ class ConversationRepository:
             )
 
             if result.modified_count > 0:
+                self._notify_change(conversation_id)
                 logger.debug(f"Обновлено сообщение {message_id} в диалоге: {conversation_id}")
                 return True
 
@@ -191,6 +241,7 @@ class ConversationRepository:
                 )
 
                 if result.modified_count > 0:
+                    self._notify_change(conversation_id)
                     logger.debug(f"Обновлено сообщение по старому содержимому в диалоге: {conversation_id}")
                     return True
 
@@ -289,6 +340,8 @@ class ConversationRepository:
                 {"conversation_id": conversation_id, "messages.message_id": message_id},
                 {"$set": set_fields},
             )
+            if content is not None and result.modified_count > 0:
+                self._notify_change(conversation_id)
             return result.modified_count > 0
         except Exception as e:
             logger.error(f"Ошибка при обновлении metadata сообщения: {e}")
@@ -389,6 +442,8 @@ class ConversationRepository:
                 {"conversation_id": conversation_id},
                 {"$set": updates}
             )
+            if "messages" in updates:
+                self._notify_change(conversation_id)
 
             logger.debug(f"Обновлен диалог: {conversation_id}")
             return True
@@ -410,6 +465,7 @@ class ConversationRepository:
         try:
             collection = self._get_collection()
             await collection.delete_one({"conversation_id": conversation_id})
+            self._notify_change(conversation_id)
 
             logger.info(f"Удален диалог: {conversation_id}")
             return True
@@ -423,6 +479,7 @@ class ConversationRepository:
         try:
             collection = self._get_collection()
             result = await collection.delete_many({"user_id": user_id})
+            self._notify_change(None)
             logger.info(f"Удалено {result.deleted_count} диалогов пользователя {user_id}")
             return result.deleted_count
         except Exception as e:
@@ -501,6 +558,7 @@ class ConversationRepository:
         try:
             collection = self._get_collection()
             result = await collection.delete_many({"project_id": project_id})
+            self._notify_change(None)
             deleted = result.deleted_count
             logger.info(f"Удалено {deleted} диалогов проекта {project_id}")
             return deleted
@@ -575,6 +633,7 @@ class ConversationRepository:
                 )
                 logger.info(f"Удалено последнее сообщение из диалога {conversation_id}")
 
+            self._notify_change(conversation_id)
             return True
             
         except Exception as e:
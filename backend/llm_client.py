@@ -17,6 +17,13 @@ from backend.settings.cef_logger.cef_logger import (
     log_cef_int006_llm_api_failure,
 )
 from backend.settings.logging import get_logger
+from backend.utils.http_clients import pooled_client
+from backend.utils.llm_priority import (
+    LLM_PRIORITY_HEADER,
+    LLM_QUEUE_TIMEOUT_HEADER,
+    current_llm_priority,
+    llm_queue_timeout,
+)
 
 
 def _invoke_stream_callback_safe(
@@ -365,6 +372,9 @@ class LLMClient:
         headers = {"Content-Type": "application/json", "Accept": "application/json"}
         if self.api_key:
             headers["X-API-Key"] = self.api_key
+        headers[LLM_PRIORITY_HEADER] = current_llm_priority()
+        # Дедлайн очереди llm-svc короче нашего таймаута (учитывается только chat/completions)
+        headers[LLM_QUEUE_TIMEOUT_HEADER] = llm_queue_timeout(self.timeout)
         return headers
     def _url_for_llm_host(self, host_id: Optional[str] = None) -> str:
         hid = host_id if host_id and host_id in self.llm_hosts else self.default_llm_host
@@ -418,7 +428,7 @@ class LLMClient:
             logger.debug("ProviderRegistry health_check fallback to legacy HTTP: %s", e)
         base = self._url_for_llm_host(host_id)
         try:
-            async with httpx.AsyncClient(verify=self._verify, timeout=10.0) as client:
+            async with pooled_client(verify=self._verify, timeout=10.0) as client:
                 for path in ("/v1/health", "/health", "/v1/models"):
                     response = await client.get(f"{base}{path}", headers=self._get_headers())
                     if not response.is_success:
@@ -469,7 +479,7 @@ class LLMClient:
             logger.debug("ProviderRegistry get_models fallback to legacy HTTP: %s", e)
         base = self._url_for_llm_host(host_id)
         try:
-            async with httpx.AsyncClient(verify=self._verify, timeout=10.0) as client:
+            async with pooled_client(verify=self._verify, timeout=10.0) as client:
                 response = await client.get(f"{base}/v1/models", headers=self._get_headers())
                 response.raise_for_status()
                 data, parse_error = self._parse_json_or_log(
@@ -512,7 +522,7 @@ class LLMClient:
         base = self._url_for_llm_host(host_id)
         load_timeout = httpx.Timeout(1200.0, connect=10.0, read=1200.0, write=30.0)
         try:
-            async with httpx.AsyncClient(verify=self._verify, timeout=load_timeout) as client:
+            async with pooled_client(verify=self._verify, timeout=load_timeout) as client:
                 response = await client.post(
                     f"{base}/v1/models/load",
                     headers=self._get_headers(),
@@ -548,7 +558,7 @@ class LLMClient:
         for hid in targets:
             base = self._url_for_llm_host(hid)
             try:
-                async with httpx.AsyncClient(verify=self._verify, timeout=t) as client:
+                async with pooled_client(verify=self._verify, timeout=t) as client:
                     response = await client.post(
                         f"{base}/v1/models/unload-excess",
                         headers=self._get_headers(),
@@ -596,7 +606,7 @@ class LLMClient:
         )
         try:
             request_timeout = httpx.Timeout(self.timeout, connect=10.0, read=self.timeout, write=10.0)
-            async with httpx.AsyncClient(verify=self._verify, timeout=request_timeout) as client:
+            async with pooled_client(verify=self._verify, timeout=request_timeout) as client:
                 response = await client.post(
 f"{base}/v1/chat/completions",
                     headers=self._get_headers(),
@@ -610,7 +620,7 @@ f"{base}/v1/chat/completions",
     async def get_transcription_health(self) -> Dict[str, Any]:
         """Проверка состояния STT (WhisperX)"""
         try:
-            async with httpx.AsyncClient(verify=self._verify, timeout=5.0) as client:
+            async with pooled_client(verify=self._verify, timeout=5.0) as client:
                 response = await client.get(f"{self.stt_url}/v1/whisperx/health")
                 if response.status_code == 200:
                     return response.json()
@@ -620,7 +630,7 @@ f"{base}/v1/chat/completions",
     async def get_tts_health(self) -> Dict[str, Any]:
         """Проверка состояния TTS сервиса"""
         try:
-            async with httpx.AsyncClient(verify=self._verify, timeout=5.0) as client:
+            async with pooled_client(verify=self._verify, timeout=5.0) as client:
                 response = await client.get(f"{self.tts_url}/v1/health")
                 if response.status_code == 200:
                     return response.json()
@@ -655,7 +665,7 @@ f"{base}/v1/chat/completions",
                 "word_timestamps": str(word_timestamps).lower(),
             }
             whisperx_timeout = httpx.Timeout(18000.0, connect=10.0, read=18000.0, write=60.0)
-            async with httpx.AsyncClient(verify=self._verify, timeout=whisperx_timeout) as client:
+            async with pooled_client(verify=self._verify, timeout=whisperx_timeout) as client:
                 response = await client.post(
                     f"{self.stt_url}/v1/whisperx/transcribe",
                     files=files,
@@ -670,7 +680,7 @@ f"{base}/v1/chat/completions",
     async def reload_whisperx_models(self) -> Dict[str, Any]:
         """Принудительная перезагрузка моделей WhisperX"""
         try:
-            async with httpx.AsyncClient(verify=self._verify, timeout=60.0) as client:
+            async with pooled_client(verify=self._verify, timeout=60.0) as client:
                 response = await client.post(
                     f"{self.stt_url}/v1/whisperx/reload",
                     headers={"Accept": "application/json"},
@@ -700,7 +710,7 @@ f"{base}/v1/chat/completions",
                 "sample_rate": sample_rate,
                 "speech_rate": speech_rate,
             }
-            async with httpx.AsyncClient(verify=self._verify, timeout=300.0) as client:
+            async with pooled_client(verify=self._verify, timeout=300.0) as client:
                 response = await client.post(
                     f"{self.tts_url}/v1/synthesize",
                     data=data,
@@ -731,7 +741,7 @@ f"{base}/v1/chat/completions",
                 "min_duration": min_duration,
             }
             diarize_timeout = httpx.Timeout(18000.0, connect=10.0, read=18000.0, write=60.0)
-            async with httpx.AsyncClient(verify=self._verify, timeout=diarize_timeout) as client:
+            async with pooled_client(verify=self._verify, timeout=diarize_timeout) as client:
                 response = await client.post(
                     f"{self.diarization_url}/v1/diarize",
                     files=files,
@@ -923,7 +933,7 @@ f"{base}/v1/chat/completions",
                 mime = "image/png"
             files = {"file": (filename, io.BytesIO(image_file), mime)}
             data = {"languages": languages}
-            async with httpx.AsyncClient(verify=self._verify, timeout=300.0) as client:
+            async with pooled_client(verify=self._verify, timeout=300.0) as client:
                 response = await client.post(
                     f"{self.ocr_url}/v1/ocr",
                     files=files,
@@ -1334,7 +1344,7 @@ class LLMService:
             headers = {**self.client._get_headers(), "Accept": "text/event-stream"}
             stream_read_timeout = 300.0
             request_timeout = httpx.Timeout(stream_read_timeout, connect=10.0, read=stream_read_timeout, write=10.0)
-            async with httpx.AsyncClient(verify=self.client._verify, timeout=request_timeout) as client:
+            async with pooled_client(verify=self.client._verify, timeout=request_timeout) as client:
                 async with client.stream(
                     "POST",
                     f"{base}/v1/chat/completions",
@@ -1464,7 +1474,26 @@ async def get_llm_service() -> LLMService:
         llm_service = LLMService()
         await llm_service.initialize()
     return llm_service
-def ask_agent_llm_svc(
+_LLM_SVC_BUSY_MESSAGE = "Сервис модели занят или перезагружается. Повторите запрос через несколько секунд."
+# Тексты, которые ask_agent/ask_agent_async отдают вместо ответа модели при сбое
+_LLM_ERROR_REPLY_PREFIXES = (
+    _LLM_SVC_BUSY_MESSAGE,
+    "Ошибка при обращении к модели.",
+    "Извините, произошла ошибка",
+    "llm-svc недоступен.",
+    "Ошибка генерации ответа",
+    "Ошибка потока:",
+)
+
+
+def is_llm_error_reply(text: Optional[str]) -> bool:
+    """True, если строка — сообщение об ошибке обёртки, а не ответ модели."""
+    return bool(text) and str(text).strip().startswith(_LLM_ERROR_REPLY_PREFIXES)
+# Потолок на один вызов модели из socket-обработчиков (как было у обёртки с пулом потоков).
+LLM_SVC_CALL_TIMEOUT = 120.0
+
+
+async def ask_agent_llm_svc_async(
     prompt: str,
     history: Optional[List[Dict[str, str]]] = None,
     max_tokens: Optional[int] = None,
@@ -1477,36 +1506,70 @@ def ask_agent_llm_svc(
     temperature: Optional[float] = None,
     enable_thinking: Optional[bool] = None,
 ) -> str:
-    """Синхронная обертка с защитой event loop"""
+    """Генерация в текущем event loop: без пулов потоков и вложенных asyncio.run.
+
+    stream_callback вызывается в этом же loop — эмитить из него можно без
+    run_coroutine_threadsafe; contextvars (cef_audit_*) не теряются.
+    """
     logger.info(f"[ask_agent_llm_svc] Called with prompt len: {len(prompt)}, streaming: {streaming}")
-    async def _async_generate():
-        logger.info("[ask_agent_llm_svc] _async_generate started")
-        try:
-            service = await get_llm_service()
-            logger.info("[ask_agent_llm_svc] Service obtained")
-            result = await service.generate_response(
-                prompt=prompt,
-                history=history,
-                max_tokens=max_tokens or 1024,
-                streaming=streaming,
-                stream_callback=stream_callback,
-                images=images,
-                model_path=model_path,
-                system_prompt=system_prompt,
-                enable_thinking=enable_thinking,
-                temperature=temperature if temperature is not None else 0.7,
-            )
-            logger.info("[ask_agent_llm_svc] generate_response completed")
-            return result
-        except httpx.HTTPStatusError as e:
-            if e.response.status_code == 503:
-                logger.warning("[ask_agent_llm_svc] LLM service busy or reinitializing (503)")
-                return "Сервис модели занят или перезагружается. Повторите запрос через несколько секунд."
-            logger.error(f"[ask_agent_llm_svc] HTTP error: {e}")
-            raise
-        except Exception as e:
-            logger.error(f"[ask_agent_llm_svc] Error in _async_generate: {e}")
-            raise
+    try:
+        service = await get_llm_service()
+        result = await service.generate_response(
+            prompt=prompt,
+            history=history,
+            max_tokens=max_tokens or 1024,
+            streaming=streaming,
+            stream_callback=stream_callback,
+            images=images,
+            model_path=model_path,
+            system_prompt=system_prompt,
+            enable_thinking=enable_thinking,
+            temperature=temperature if temperature is not None else 0.7,
+        )
+        logger.info("[ask_agent_llm_svc] generate_response completed")
+        return result
+    except httpx.HTTPStatusError as e:
+        if e.response.status_code == 503:
+            logger.warning("[ask_agent_llm_svc] LLM service busy or reinitializing (503)")
+            return _LLM_SVC_BUSY_MESSAGE
+        logger.error(f"[ask_agent_llm_svc] HTTP error: {e}")
+        raise
+    except Exception as e:
+        logger.error(f"[ask_agent_llm_svc] Error in _async_generate: {e}")
+        raise
+
+
+def ask_agent_llm_svc(
+    prompt: str,
+    history: Optional[List[Dict[str, str]]] = None,
+    max_tokens: Optional[int] = None,
+    streaming: bool = False,
+    stream_callback: Optional[Callable[..., bool]] = None,
+    model_path: Optional[str] = None,
+    custom_prompt_id: Optional[str] = None,
+    images: Optional[List[str]] = None,
+    system_prompt: Optional[str] = None,
+    temperature: Optional[float] = None,
+    enable_thinking: Optional[bool] = None,
+) -> str:
+    """Синхронная обертка с защитой event loop (для legacy-вызовов из потоков).
+
+    Из async-кода вызывайте ask_agent_llm_svc_async напрямую.
+    """
+    def _async_generate():
+        return ask_agent_llm_svc_async(
+            prompt,
+            history=history,
+            max_tokens=max_tokens,
+            streaming=streaming,
+            stream_callback=stream_callback,
+            model_path=model_path,
+            custom_prompt_id=custom_prompt_id,
+            images=images,
+            system_prompt=system_prompt,
+            temperature=temperature,
+            enable_thinking=enable_thinking,
+        )
     try:
         asyncio.get_running_loop()
         # Уже внутри запущенного event loop — выполняем в потоке (иначе contextvars с cef_audit_* теряются)
@@ -1520,10 +1583,10 @@ def ask_agent_llm_svc(
         with concurrent.futures.ThreadPoolExecutor() as executor:
             future = executor.submit(_cef_ctx.run, _run_async_generate_in_ctx)
             try:
-                return future.result(timeout=120)
+                return future.result(timeout=LLM_SVC_CALL_TIMEOUT)
             except httpx.HTTPStatusError as e:
                 if e.response.status_code == 503:
-                    return "Сервис модели занят или перезагружается. Повторите запрос через несколько секунд."
+                    return _LLM_SVC_BUSY_MESSAGE
                 raise
             except Exception as e:
                 logger.error(f"[ask_agent_llm_svc] Error in executor: {e}")
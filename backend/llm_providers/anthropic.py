@@ -30,6 +30,7 @@ from .base import (
     StreamCallback,
 )
 from backend.settings.logging import get_logger
+from backend.utils.http_clients import pooled_client
 
 logger = get_logger(__name__)
 
@@ -97,7 +98,7 @@ class AnthropicProvider(LLMProvider):
         if not self.has_api_key():
             return ProviderHealth(healthy=False, error="API-ключ не задан")
         try:
-            async with httpx.AsyncClient(timeout=self._timeout(read=10.0)) as client:
+            async with pooled_client(timeout=self._timeout(read=10.0)) as client:
                 response = await client.get(
                     f"{self.base_url}/v1/models", headers=self._headers(),
                 )
@@ -114,7 +115,7 @@ class AnthropicProvider(LLMProvider):
         if not self.has_api_key():
             return []
         try:
-            async with httpx.AsyncClient(timeout=self._timeout(read=10.0)) as client:
+            async with pooled_client(timeout=self._timeout(read=10.0)) as client:
                 response = await client.get(f"{self.base_url}/v1/models", headers=self._headers())
                 response.raise_for_status()
                 data = response.json()
@@ -180,7 +181,7 @@ class AnthropicProvider(LLMProvider):
         _ = request_extra
         payload = self._build_payload(messages, model, temperature, max_tokens, stream=False)
         logger.info("[%s:anthropic] POST /v1/messages model=%r", self.id, model)
-        async with httpx.AsyncClient(timeout=self._timeout()) as client:
+        async with pooled_client(timeout=self._timeout()) as client:
             response = await client.post(
                 f"{self.base_url}/v1/messages",
                 headers=self._headers(),
@@ -211,7 +212,7 @@ class AnthropicProvider(LLMProvider):
         accumulated = ""
         try:
             timeout = httpx.Timeout(300.0, connect=10.0, read=300.0, write=10.0)
-            async with httpx.AsyncClient(timeout=timeout) as client:
+            async with pooled_client(timeout=timeout) as client:
                 async with client.stream(
                     "POST", f"{self.base_url}/v1/messages",
                     headers={**self._headers(), "Accept": "text/event-stream"},
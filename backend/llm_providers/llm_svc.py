@@ -20,6 +20,13 @@ import httpx
 from .base import LLMProviderConfig, ProviderCapabilities, ProviderHealth
 from .openai_compat import OpenAICompatProvider
 from backend.settings.logging import get_logger
+from backend.utils.http_clients import pooled_client
+from backend.utils.llm_priority import (
+    LLM_PRIORITY_HEADER,
+    LLM_QUEUE_TIMEOUT_HEADER,
+    current_llm_priority,
+    llm_queue_timeout,
+)
 
 logger = get_logger(__name__)
 
@@ -73,6 +80,15 @@ class LlmSvcProvider(OpenAICompatProvider):
 
     # ---- internal helpers -------------------------------------------------
 
+    def _headers(self, *, accept_sse: bool = False) -> Dict[str, str]:
+        headers = super()._headers(accept_sse=accept_sse)
+        # Класс приоритета в очереди llm-svc: фоновые вызовы уступают чату
+        headers[LLM_PRIORITY_HEADER] = current_llm_priority()
+        # Ожидание в очереди llm-svc — не дольше доли нашего read-timeout: брошенный
+        # нами запрос не должен потом занимать дорожку
+        headers[LLM_QUEUE_TIMEOUT_HEADER] = llm_queue_timeout(self._timeout_read)
+        return headers
+
     async def _load_timeout(self) -> httpx.Timeout:
         # Загрузка модели в llm-svc может занять до ~20 минут.
         return httpx.Timeout(1200.0, connect=10.0, read=1200.0, write=30.0)
@@ -80,7 +96,7 @@ class LlmSvcProvider(OpenAICompatProvider):
     async def _post_load_model(self, model_name: str) -> bool:
         """POST /v1/models/load — реально переключает веса."""
         try:
-            async with httpx.AsyncClient(timeout=await self._load_timeout()) as client:
+            async with pooled_client(timeout=await self._load_timeout()) as client:
                 response = await client.post(
                     f"{self.base_url}/v1/models/load",
                     headers=self._headers(),
@@ -134,7 +150,7 @@ class LlmSvcProvider(OpenAICompatProvider):
         """Оставить в llm-svc только default-модель из конфига сервиса."""
         t = httpx.Timeout(1200.0, connect=10.0, read=1200.0, write=60.0)
         try:
-            async with httpx.AsyncClient(timeout=t) as client:
+            async with pooled_client(timeout=t) as client:
                 response = await client.post(
                     f"{self.base_url}/v1/models/unload-excess",
                     headers=self._headers(),
@@ -17,11 +17,10 @@ from __future__ import annotations
 
 from typing import List
 
-import httpx
-
 from .base import LLMProviderConfig, ModelInfo, ProviderCapabilities, ProviderHealth
 from .openai_compat import OpenAICompatProvider
 from backend.settings.logging import get_logger
+from backend.utils.http_clients import pooled_client
 
 logger = get_logger(__name__)
 
@@ -43,7 +42,7 @@ class OllamaProvider(OpenAICompatProvider):
     async def health(self) -> ProviderHealth:
         """``GET /api/version`` → ``{"version": "..."}``."""
         try:
-            async with httpx.AsyncClient(timeout=self._short_timeout()) as client:
+            async with pooled_client(timeout=self._short_timeout()) as client:
                 response = await client.get(
                     f"{self.base_url}{self.HEALTH_PATH}",
                     headers=self._headers(),
@@ -66,7 +65,7 @@ class OllamaProvider(OpenAICompatProvider):
     async def list_models(self) -> List[ModelInfo]:
         """``GET /api/tags`` — нативный список моделей Ollama."""
         try:
-            async with httpx.AsyncClient(timeout=self._short_timeout()) as client:
+            async with pooled_client(timeout=self._short_timeout()) as client:
                 response = await client.get(f"{self.base_url}/api/tags", headers=self._headers())
                 if response.status_code != 200:
                     logger.warning(
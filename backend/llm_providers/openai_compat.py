@@ -43,6 +43,7 @@ from .base import (
     ToolCall,
 )
 from backend.settings.logging import get_logger
+from backend.utils.http_clients import PooledHttpClient, pooled_client
 
 logger = get_logger(__name__)
 
@@ -307,7 +308,7 @@ class OpenAICompatProvider(LLMProvider):
         url = f"{self.base_url}{self.HEALTH_PATH}"
         headers = self._headers()
         try:
-            async with httpx.AsyncClient(timeout=self._short_timeout(), verify=self._http_verify()) as client:
+            async with pooled_client(timeout=self._short_timeout(), verify=self._http_verify()) as client:
                 response = await client.get(
                     url,
                     headers=headers,
@@ -347,7 +348,7 @@ class OpenAICompatProvider(LLMProvider):
         healthy = (not status) or status in ("ok", "healthy", "up", "ready")
         return ProviderHealth(healthy=healthy, loaded_models=loaded, raw=payload)
 
-    async def _health_via_models(self, client: httpx.AsyncClient) -> ProviderHealth:
+    async def _health_via_models(self, client: PooledHttpClient) -> ProviderHealth:
         try:
             response = await client.get(f"{self.base_url}/v1/models", headers=self._headers())
             if response.status_code == 200:
@@ -364,7 +365,7 @@ class OpenAICompatProvider(LLMProvider):
         url = f"{self.base_url}/v1/models"
         headers = self._headers()
         try:
-            async with httpx.AsyncClient(timeout=self._short_timeout(), verify=self._http_verify()) as client:
+            async with pooled_client(timeout=self._short_timeout(), verify=self._http_verify()) as client:
                 response = await client.get(url, headers=headers)
                 response.raise_for_status()
                 data = response.json()
@@ -558,7 +559,7 @@ class OpenAICompatProvider(LLMProvider):
             model=model,
             request_uuid=cef_rid,
         )
-        async with httpx.AsyncClient(timeout=self._request_timeout(), verify=self._http_verify()) as client:
+        async with pooled_client(timeout=self._request_timeout(), verify=self._http_verify()) as client:
             try:
                 response = await client.post(
                     f"{self.base_url}/v1/chat/completions",
@@ -671,7 +672,7 @@ class OpenAICompatProvider(LLMProvider):
             request_uuid=cef_rid,
         )
         try:
-            async with httpx.AsyncClient(timeout=stream_timeout, verify=self._http_verify()) as client:
+            async with pooled_client(timeout=stream_timeout, verify=self._http_verify()) as client:
                 async with client.stream(
                     "POST",
                     f"{self.base_url}/v1/chat/completions",
@@ -16,11 +16,10 @@ from __future__ import annotations
 
 from typing import List, Optional
 
-import httpx
-
 from .base import LLMProviderConfig, ModelInfo, ProviderCapabilities, ProviderHealth
 from .openai_compat import OpenAICompatProvider
 from backend.settings.logging import get_logger
+from backend.utils.http_clients import PooledHttpClient, pooled_client
 
 logger = get_logger(__name__)
 
@@ -42,7 +41,7 @@ class VLLMProvider(OpenAICompatProvider):
     async def health(self) -> ProviderHealth:
         """vLLM /health возвращает 200 без JSON → маппим в healthy=True."""
         try:
-            async with httpx.AsyncClient(timeout=self._short_timeout()) as client:
+            async with pooled_client(timeout=self._short_timeout()) as client:
                 response = await client.get(
                     f"{self.base_url}{self.HEALTH_PATH}",
                     headers=self._headers(),
@@ -60,7 +59,7 @@ class VLLMProvider(OpenAICompatProvider):
         except Exception as e:
             return ProviderHealth(healthy=False, error=str(e))
 
-    async def _loaded_model_ids(self, client: httpx.AsyncClient) -> List[str]:
+    async def _loaded_model_ids(self, client: PooledHttpClient) -> List[str]:
         """Список моделей, реально обслуживаемых этой vLLM-инстанцией."""
         try:
             response = await client.get(f"{self.base_url}/v1/models", headers=self._headers())
@@ -171,6 +171,11 @@ async def startup_event():
             logger.info("MCP platform инициализирована")
         except Exception as e:
             logger.error(f"Ошибка инициализации MCP platform: {e}")
+    try:
+        from backend.rag_query.semantic_cache import start_semantic_cache
+        await start_semantic_cache()
+    except Exception as e:
+        logger.warning(f"RAG cache backend: {e}")
     # очистка памяти при рестарте
     if state.memory_clear_on_restart and clear_dialog_history:
         try:
@@ -191,6 +196,16 @@ async def shutdown_event():
             await platform.shutdown()
     except Exception as e:
         logger.warning(f"MCP platform shutdown: {e}")
+    try:
+        from backend.rag_query.semantic_cache import close_semantic_cache
+        await close_semantic_cache()
+    except Exception as e:
+        logger.warning(f"RAG cache backend shutdown: {e}")
+    try:
+        from backend.utils.http_clients import aclose_http_clients
+        await aclose_http_clients()
+    except Exception as e:
+        logger.warning(f"HTTP pool shutdown: {e}")
     if close_databases and database_available:
         try:
             await close_databases()
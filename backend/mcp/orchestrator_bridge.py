@@ -4,6 +4,7 @@ from __future__ import annotations
 
 import asyncio
 import concurrent.futures
+import contextvars
 from typing import Any, Callable, Dict, List, Optional
 
 from backend.llm_providers.routing import build_chat_messages
@@ -16,14 +17,16 @@ def _run_async(coro):
     try:
         loop = asyncio.get_event_loop()
         if loop.is_running():
+            # copy_context: приоритет llm-svc и cef_audit_* не теряются в потоке
+            ctx = contextvars.copy_context()
             with concurrent.futures.ThreadPoolExecutor(max_workers=1) as pool:
-                return pool.submit(asyncio.run, coro).result()
+                return pool.submit(ctx.run, asyncio.run, coro).result()
         return loop.run_until_complete(coro)
     except RuntimeError:
         return asyncio.run(coro)
 
 
-def sync_chat_via_registry(
+async def chat_via_registry(
     prompt: str,
     *,
     history: Optional[List[Dict[str, Any]]] = None,
@@ -35,55 +38,78 @@ def sync_chat_via_registry(
     system_prompt: Optional[str] = None,
     enable_thinking: bool = False,
 ) -> Optional[str]:
-    """Синхронный LLM-вызов через ProviderRegistry (planner / aggregator)."""
+    """LLM-вызов через ProviderRegistry в текущем event loop.
 
-    async def _call():
-        from backend.llm_providers import get_registry
+    ``stream_callback(chunk, accumulated[, stream_role]) -> bool`` вызывается
+    провайдером на каждом токене, ``False`` прерывает поток.
+    """
+    from backend.llm_providers import get_registry
 
-        try:
-            from backend.app_state import get_current_model_path
-        except Exception:
-            get_current_model_path = lambda: None  # type: ignore
-
-        registry = await get_registry()
-        effective_path = (model_path or get_current_model_path() or "").strip()
-        provider, model_id = registry.resolve(effective_path)
-        if not model_id:
-            models = await provider.list_models()
-            model_id = models[0].model_id if models else ""
-        if not model_id:
-            return None
+    try:
+        from backend.app_state import get_current_model_path
+    except Exception:
+        get_current_model_path = lambda: None  # type: ignore
+
+    registry = await get_registry()
+    effective_path = (model_path or get_current_model_path() or "").strip()
+    provider, model_id = registry.resolve(effective_path)
+    if not model_id:
+        models = await provider.list_models()
+        model_id = models[0].model_id if models else ""
+    if not model_id:
+        return None
 
-        messages = build_chat_messages(prompt, history=history, system_prompt=system_prompt)
+    messages = build_chat_messages(prompt, history=history, system_prompt=system_prompt)
 
-        req_extra = {"enable_thinking": enable_thinking} if enable_thinking else None
+    req_extra = {"enable_thinking": enable_thinking} if enable_thinking else None
 
-        if streaming and stream_callback:
-            acc = ""
-            async for chunk in provider.stream_chat(
-                messages,
-                model_id,
-                temperature=temperature,
-                max_tokens=max_tokens,
-                request_extra=req_extra,
-            ):
-                if chunk:
-                    acc += chunk
-                    cont = stream_callback(chunk, acc, "content")
-                    if cont is False:
-                        return acc or None
-            return acc or None
-
-        return await provider.chat(
+    if streaming and stream_callback:
+        acc = await provider.stream_chat(
             messages,
             model_id,
+            stream_callback,
             temperature=temperature,
             max_tokens=max_tokens,
             request_extra=req_extra,
         )
+        return acc or None
 
+    return await provider.chat(
+        messages,
+        model_id,
+        temperature=temperature,
+        max_tokens=max_tokens,
+        request_extra=req_extra,
+    )
+
+
+def sync_chat_via_registry(
+    prompt: str,
+    *,
+    history: Optional[List[Dict[str, Any]]] = None,
+    model_path: Optional[str] = None,
+    streaming: bool = False,
+    stream_callback: Optional[Callable] = None,
+    max_tokens: int = 1024,
+    temperature: float = 0.7,
+    system_prompt: Optional[str] = None,
+    enable_thinking: bool = False,
+) -> Optional[str]:
+    """Синхронный LLM-вызов через ProviderRegistry (planner / aggregator)."""
     try:
-        return _run_async(_call())
+        return _run_async(
+            chat_via_registry(
+                prompt,
+                history=history,
+                model_path=model_path,
+                streaming=streaming,
+                stream_callback=stream_callback,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                system_prompt=system_prompt,
+                enable_thinking=enable_thinking,
+            )
+        )
     except Exception as exc:
         log.error("sync_chat_via_registry failed: %s", exc, exc_info=True)
         return None
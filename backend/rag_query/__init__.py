@@ -2,7 +2,11 @@
 
 from backend.rag_query.pipeline import ProcessedQuery, process_user_query
 from backend.rag_query.preprocess import normalize_query
-from backend.rag_query.semantic_cache import bump_rag_semantic_cache, semantic_cache_enabled
+from backend.rag_query.semantic_cache import (
+    bump_rag_semantic_cache,
+    semantic_cache_enabled,
+    semantic_cache_stats,
+)
 
 __all__ = [
     "ProcessedQuery",
@@ -10,4 +14,5 @@ __all__ = [
     "normalize_query",
     "bump_rag_semantic_cache",
     "semantic_cache_enabled",
+    "semantic_cache_stats",
 ]
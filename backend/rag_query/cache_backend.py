@@ -0,0 +1,242 @@
+"""Бэкенд кэша результатов RAG: поколения областей, общие записи, канал инвалидации.
+
+Semantic cache (``semantic_cache.py``) держит матрицу эмбеддингов в памяти процесса, а
+через бэкенд:
+
+* читает поколения областей (``all``, ``kb``, ``project:<id>``, ``...:doc:<id>``) —
+  они входят в ключ партиции, поэтому запись со старым поколением не найдётся ни на
+  одной реплике;
+* делит записи между репликами: партиция, которой ещё нет в памяти реплики,
+  подгружается из общего хранилища;
+* рассылает инвалидацию (pub/sub), чтобы реплики сразу освобождали память.
+
+RAG_CACHE_BACKEND=memory (по умолчанию) — всё в процессе, как раньше.
+RAG_CACHE_BACKEND=redis — Redis по RAG_CACHE_REDIS_URL (нужен пакет ``redis``;
+любой сервер с протоколом Redis, для проверок подойдёт fakeredis/miniredis).
+RAG_CACHE_REDIS_PARTITION_MAX_ENTRIES — сколько записей держать в одной общей партиции (512).
+"""
+
+from __future__ import annotations
+
+import abc
+import asyncio
+import json
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from backend.settings.logging import get_logger
+
+logger = get_logger(__name__)
+
+# {имя области: новое поколение}; None — поколение неизвестно, сбросить безусловно
+InvalidateCallback = Callable[[Dict[str, Optional[int]]], None]
+
+_KEY_PREFIX = "astrachat:rag-cache:"
+_CHANNEL = _KEY_PREFIX + "invalidate"
+
+
+class RagCacheBackend(abc.ABC):
+    """Интерфейс бэкенда. Ошибки наружу не бросает: кэш не должен валить поиск."""
+
+    name = "base"
+
+    @abc.abstractmethod
+    async def get_generations(self, names: List[str]) -> Optional[List[int]]:
+        """Текущие поколения; None — бэкенд недоступен (кэш пропускается)."""
+
+    @abc.abstractmethod
+    async def bump_generations(self, names: List[str]) -> Dict[str, Optional[int]]:
+        """Увеличить поколения и оповестить остальные реплики; вернуть новые значения."""
+
+    async def load_partition(self, partition: str) -> Dict[str, bytes]:
+        return {}
+
+    async def store_entry(self, partition: str, field: str, payload: bytes, ttl: float) -> None:
+        return None
+
+    async def start(self, on_invalidate: InvalidateCallback) -> None:
+        return None
+
+    async def aclose(self) -> None:
+        return None
+
+
+class InProcessCacheBackend(RagCacheBackend):
+    """Одна реплика: поколения в dict, записи живут только в semantic cache процесса."""
+
+    name = "memory"
+
+    def __init__(self):
+        self._generations: Dict[str, int] = {}
+
+    async def get_generations(self, names: List[str]) -> Optional[List[int]]:
+        return [self._generations.get(n, 0) for n in names]
+
+    async def bump_generations(self, names: List[str]) -> Dict[str, Optional[int]]:
+        for n in names:
+            self._generations[n] = self._generations.get(n, 0) + 1
+        return {n: self._generations[n] for n in names}
+
+
+class RedisCacheBackend(RagCacheBackend):
+    """Общий кэш реплик поверх протокола Redis.
+
+    Поколения — ``INCR``/``MGET``, записи партиции — hash (``HSET``/``HGETALL``),
+    инвалидация — ``PUBLISH`` в канал, который слушает фоновая задача каждой реплики.
+    Срок жизни каждой записи — в sorted set рядом с hash (score = время истечения):
+    при записи истёкшие поля удаляются, а сверх ``max_entries`` — самые старые.
+    """
+
+    name = "redis"
+
+    def __init__(self, url: str, *, client: Any = None, max_entries: Optional[int] = None):
+        if client is None:
+            import redis.asyncio as aioredis
+
+            client = aioredis.from_url(url, socket_timeout=1.0, socket_connect_timeout=1.0)
+        self.url = url
+        self._redis = client
+        if max_entries is None:
+            max_entries = int(os.getenv("RAG_CACHE_REDIS_PARTITION_MAX_ENTRIES", "512"))
+        self.max_entries = max(1, max_entries)
+        self._listener: Optional[asyncio.Task] = None
+        self._on_invalidate: Optional[InvalidateCallback] = None
+
+    async def _safe(self, what: str, op: Callable[[], Awaitable[Any]], default: Any) -> Any:
+        try:
+            return await op()
+        except Exception as e:
+            logger.warning("[RAG cache/redis] %s: %s", what, e)
+            return default
+
+    async def get_generations(self, names: List[str]) -> Optional[List[int]]:
+        if not names:
+            return []
+        raw = await self._safe("MGET", lambda: self._redis.mget([_KEY_PREFIX + "gen:" + n for n in names]), None)
+        if raw is None:
+            return None
+        return [int(v) if v is not None else 0 for v in raw]
+
+    async def bump_generations(self, names: List[str]) -> Dict[str, Optional[int]]:
+        async def _bump() -> Dict[str, Optional[int]]:
+            pipe = self._redis.pipeline()
+            for n in names:
+                pipe.incr(_KEY_PREFIX + "gen:" + n)
+            values = await pipe.execute()
+            bumped = {n: int(v) for n, v in zip(names, values)}
+            await self._redis.publish(_CHANNEL, json.dumps(bumped))
+            return bumped
+
+        return await self._safe("INCR/PUBLISH", _bump, {n: None for n in names})
+
+    async def load_partition(self, partition: str) -> Dict[str, bytes]:
+        raw = await self._safe("HGETALL", lambda: self._redis.hgetall(_KEY_PREFIX + "part:" + partition), None)
+        if not raw:
+            return {}
+        return {(k.decode("utf-8") if isinstance(k, bytes) else str(k)): v for k, v in raw.items()}
+
+    async def store_entry(self, partition: str, field: str, payload: bytes, ttl: float) -> None:
+        key = _KEY_PREFIX + "part:" + partition
+        expiry_key = _KEY_PREFIX + "exp:" + partition
+
+        async def _store():
+            now = time.time()
+            keep = max(1, int(ttl))
+            pipe = self._redis.pipeline()
+            pipe.hset(key, field, payload)
+            pipe.zadd(expiry_key, {field: now + ttl})
+            pipe.zrangebyscore(expiry_key, "-inf", now)
+            pipe.zcard(expiry_key)
+            # Ключи целиком живут до истечения самой свежей записи
+            pipe.expire(key, keep)
+            pipe.expire(expiry_key, keep)
+            _, _, expired, total, _, _ = await pipe.execute()
+            drop = list(expired)
+            over = total - len(drop) - self.max_entries
+            if over > 0:
+                # Сразу за истёкшими в sorted set идут самые старые живые записи
+                drop += await self._redis.zrange(expiry_key, len(drop), len(drop) + over - 1)
+            if drop:
+                pipe = self._redis.pipeline()
+                pipe.hdel(key, *drop)
+                pipe.zrem(expiry_key, *drop)
+                await pipe.execute()
+
+        await self._safe("HSET", _store, None)
+
+    async def start(self, on_invalidate: InvalidateCallback) -> None:
+        self._on_invalidate = on_invalidate
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.create_task(self._listen())
+
+    async def _listen(self) -> None:
+        while True:
+            pubsub = self._redis.pubsub()
+            try:
+                await pubsub.subscribe(_CHANNEL)
+                async for message in pubsub.listen():
+                    if message.get("type") != "message":
+                        continue
+                    try:
+                        bumped = json.loads(message.get("data") or "{}")
+                    except (TypeError, ValueError):
+                        continue
+                    if self._on_invalidate is not None and isinstance(bumped, dict):
+                        self._on_invalidate({str(n): int(g) for n, g in bumped.items()})
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("[RAG cache/redis] канал инвалидации: %s — переподключение", e)
+                await asyncio.sleep(2.0)
+            finally:
+                try:
+                    await pubsub.aclose()
+                except Exception:
+                    pass
+
+    async def aclose(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._listener = None
+        try:
+            await self._redis.aclose()
+        except Exception as e:
+            logger.debug("[RAG cache/redis] close: %s", e)
+
+
+_backend: Optional[RagCacheBackend] = None
+
+
+def _make_backend() -> RagCacheBackend:
+    kind = os.getenv("RAG_CACHE_BACKEND", "memory").strip().lower()
+    if kind == "redis":
+        url = os.getenv("RAG_CACHE_REDIS_URL", "redis://localhost:6379/0").strip()
+        try:
+            backend = RedisCacheBackend(url)
+            logger.info("[RAG cache] общий бэкенд Redis: %s", url.split("@")[-1])
+            return backend
+        except ImportError:
+            logger.warning("[RAG cache] RAG_CACHE_BACKEND=redis, но пакет redis не установлен — кэш в процессе")
+        except Exception as e:
+            logger.warning("[RAG cache] Redis недоступен (%s) — кэш в процессе", e)
+    elif kind not in ("", "memory"):
+        logger.warning("[RAG cache] неизвестный RAG_CACHE_BACKEND=%r — кэш в процессе", kind)
+    return InProcessCacheBackend()
+
+
+def get_rag_cache_backend() -> RagCacheBackend:
+    global _backend
+    if _backend is None:
+        _backend = _make_backend()
+    return _backend
+
+
+def set_rag_cache_backend(backend: Optional[RagCacheBackend]) -> None:
+    """Подменить бэкенд (тесты, ручная конфигурация). None — пересоздать из env."""
+    global _backend
+    _backend = backend
@@ -13,6 +13,7 @@ import re
 from typing import List, Optional, Tuple
 
 from backend.settings.logging import get_logger
+from backend.utils.llm_priority import PRIORITY_BACKGROUND, llm_request_priority
 
 logger = get_logger(__name__)
 
@@ -49,16 +50,18 @@ async def _judge_llm(prompt: str) -> str:
     loop = asyncio.get_running_loop()
 
     def _call() -> str:
-        return (
-            ask_agent(
-                prompt,
-                history=[],
-                streaming=False,
-                max_tokens=512,
-                temperature=0.0,
+        # Судья — фоновый вызов: в очереди llm-svc уступает интерактивному чату
+        with llm_request_priority(PRIORITY_BACKGROUND):
+            return (
+                ask_agent(
+                    prompt,
+                    history=[],
+                    streaming=False,
+                    max_tokens=512,
+                    temperature=0.0,
+                )
+                or ""
             )
-            or ""
-        )
 
     with concurrent.futures.ThreadPoolExecutor(max_workers=1) as ex:
         return await loop.run_in_executor(ex, _call)
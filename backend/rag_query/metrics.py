@@ -24,6 +24,7 @@ import re
 from typing import Any, Dict, List, Optional, Sequence, Tuple
 
 from backend.settings.logging import get_logger
+from backend.utils.llm_priority import PRIORITY_BACKGROUND, llm_request_priority
 
 logger = get_logger(__name__)
 
@@ -71,17 +72,18 @@ async def _ask_judge(prompt: str, *, system: str, max_tokens: int = 512) -> str:
     loop = asyncio.get_running_loop()
 
     def _call() -> str:
-        return (
-            ask_agent(
-                prompt,
-                history=[],
-                streaming=False,
-                system_prompt=system,
-                max_tokens=max_tokens,
-                temperature=0.0,
+        with llm_request_priority(PRIORITY_BACKGROUND):
+            return (
+                ask_agent(
+                    prompt,
+                    history=[],
+                    streaming=False,
+                    system_prompt=system,
+                    max_tokens=max_tokens,
+                    temperature=0.0,
+                )
+                or ""
             )
-            or ""
-        )
 
     with concurrent.futures.ThreadPoolExecutor(max_workers=1) as ex:
         return await loop.run_in_executor(ex, _call)
@@ -3,12 +3,13 @@
 from __future__ import annotations
 
 import asyncio
-import concurrent.futures
 import json
 import os
 import re
-from dataclasses import dataclass
-from typing import Any, Dict, List, Optional
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, replace
+from typing import Any, Dict, List, Optional, Tuple
 
 from backend.rag_query.metadata_filters import extract_filters_from_query
 from backend.rag_query.preprocess import normalize_query
@@ -34,70 +35,173 @@ def _hyde_max_chars() -> int:
         return 2000
 
 
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+def _speculative_enabled() -> bool:
+    return os.getenv("RAG_PREP_SPECULATIVE", "1").strip().lower() not in ("0", "false", "no")
+
+
+# Кэш препроцесса: (нормализованный запрос, флаги) -> (время, результат).
+# Повторные и одинаковые запросы не гоняют LLM заново (RAG_PREP_CACHE_ITEMS=0 — выключить).
+_prep_cache: "OrderedDict[Tuple[str, bool, bool, bool], Tuple[float, ProcessedQuery]]" = OrderedDict()
+
+
+def _prep_cache_get(key) -> Optional[ProcessedQuery]:
+    entry = _prep_cache.get(key)
+    if entry is None:
+        return None
+    ts, value = entry
+    if time.monotonic() - ts > _env_int("RAG_PREP_CACHE_TTL_SEC", 600):
+        _prep_cache.pop(key, None)
+        return None
+    _prep_cache.move_to_end(key)
+    return value
+
+
+def _prep_cache_set(key, value: ProcessedQuery) -> None:
+    limit = _env_int("RAG_PREP_CACHE_ITEMS", 512)
+    if limit <= 0:
+        return
+    _prep_cache[key] = (time.monotonic(), value)
+    _prep_cache.move_to_end(key)
+    while len(_prep_cache) > limit:
+        _prep_cache.popitem(last=False)
+
+
+class _LLMStepFailed(Exception):
+    """LLM-шаг препроцесса не дал ответа: исключение, None или текст ошибки обёртки."""
+
+
 async def _llm_short(prompt: str, system: str, max_tokens: int = 512) -> str:
-    from backend.agent_llm_svc import ask_agent
+    from backend.agent_llm_svc import ask_agent_async
+    from backend.llm_client import is_llm_error_reply
+
+    reply = await ask_agent_async(prompt, history=[], streaming=False, system_prompt=system, max_tokens=max_tokens)
+    if reply is None or is_llm_error_reply(reply):
+        raise _LLMStepFailed((reply or "нет ответа")[:120])
+    return reply
+
+
+async def _fix_typos(q: str) -> Tuple[str, bool]:
+    """(запрос, ok): при сбое LLM или негодном ответе — исходный запрос и ok=False."""
+    try:
+        fixed = await _llm_short(
+            "Исправь опечатки, не меняй смысл. Верни только исправленный текст запроса, одной строкой, без комментариев:\n\n"
+            + q,
+            "Ты нормализуешь пользовательский поисковый запрос.",
+            max_tokens=256,
+        )
+        fixed = (fixed or "").strip().split("\n")[0].strip()
+        if 2 < len(fixed) < len(q) * 3 and len(fixed) < 2000:
+            return fixed, True
+    except _LLMStepFailed as e:
+        logger.warning("RAG_QUERY_FIX_TYPOS: LLM недоступна (%s), запрос без исправления", e)
+    except Exception:
+        logger.exception("RAG_QUERY_FIX_TYPOS")
+    return q, False
+
+
+async def _multi_variants(q: str) -> Optional[List[str]]:
+    try:
+        raw = await _llm_short(
+            'Сгенерируй 3–5 коротких альтернативных формулировок для поиска по базе (тот же смысл и язык, что у запроса). Верни только JSON вида {"variants":["..."]} без markdown.\n\nЗапрос:\n'
+            + q,
+            "Отвечай только компактным JSON.",
+            max_tokens=400,
+        )
+        m = re.search("\\{[\\s\\S]*\\}", raw or "")
+        if m:
+            data = json.loads(m.group())
+            vars_ = data.get("variants") or []
+            if isinstance(vars_, list) and vars_:
+                return [str(x).strip() for x in vars_[:6] if str(x).strip()]
+    except _LLMStepFailed as e:
+        logger.warning("RAG_MULTI_QUERY_ENABLED: LLM недоступна (%s)", e)
+    except Exception:
+        logger.exception("RAG_MULTI_QUERY_ENABLED")
+    return None
+
+
+async def _hyde_vector_query(q: str) -> Optional[str]:
+    try:
+        hyde = await _llm_short(
+            "Напиши 1–3 коротких абзаца гипотетического ответа на запрос (как если бы ты знал тему). Не ссылайся на реальные документы, законы или источники по названию.\n\nЗапрос:\n"
+            + q,
+            "HyDE: гипотетический текст для плотного поиска.",
+            max_tokens=400,
+        )
+        hyde = (hyde or "").strip()
+        if len(hyde) > 30:
+            return f"{q}\n\n{hyde[:_hyde_max_chars()]}"
+    except _LLMStepFailed as e:
+        logger.warning("RAG_HYDE_ENABLED: LLM недоступна (%s)", e)
+    except Exception:
+        logger.exception("RAG_HYDE_ENABLED")
+    return None
 
-    loop = asyncio.get_running_loop()
 
-    def _call() -> str:
-        return ask_agent(prompt, history=[], streaming=False, system_prompt=system, max_tokens=max_tokens)
+async def _expand(q: str, multi_query: bool, hyde: bool) -> Tuple[Optional[List[str]], Optional[str], bool]:
+    """Multi-query и HyDE не зависят друг от друга — параллельно. Третий элемент — оба шага удались."""
 
-    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as ex:
-        return await loop.run_in_executor(ex, _call)
+    async def _none():
+        return None
+
+    variants, vector_query = await asyncio.gather(
+        _multi_variants(q) if multi_query else _none(),
+        _hyde_vector_query(q) if hyde else _none(),
+    )
+    ok = (not multi_query or variants is not None) and (not hyde or vector_query is not None)
+    return variants, vector_query, ok
 
 
 async def process_user_query(
     user_text: str, *, fix_typos: bool = False, multi_query: bool = False, hyde: bool = False
 ) -> ProcessedQuery:
+    """Шаги препроцесса как граф: опечатки -> (multi-query || HyDE).
+
+    Multi-query и HyDE зависят от исправленного запроса, поэтому при RAG_PREP_SPECULATIVE=1
+    они стартуют сразу по нормализованному запросу вместе с исправлением опечаток; если
+    исправление текст изменило — спекулятивный результат отбрасывается и шаги
+    перезапускаются по исправленному. В частом случае (опечаток нет) время = самый
+    долгий шаг, а не сумма трёх вызовов LLM.
+    """
     original = user_text or ""
     normalized = normalize_query(original)
+    cache_key = (normalized, bool(fix_typos), bool(multi_query), bool(hyde))
+    cached = _prep_cache_get(cache_key)
+    if cached is not None:
+        logger.debug("[RAG-PREP] препроцесс из кэша: %s", normalized[:80])
+        return replace(cached, original=original)
+
     q = normalized
-    if fix_typos:
-        try:
-            fixed = await _llm_short(
-                "Исправь опечатки, не меняй смысл. Верни только исправленный текст запроса, одной строкой, без комментариев:\n\n"
-                + q,
-                "Ты нормализуешь пользовательский поисковый запрос.",
-                max_tokens=256,
-            )
-            fixed = (fixed or "").strip().split("\n")[0].strip()
-            if 2 < len(fixed) < len(q) * 3 and len(fixed) < 2000:
-                q = fixed
-        except Exception:
-            logger.exception("RAG_QUERY_FIX_TYPOS")
-    filters = extract_filters_from_query(q)
     vector_query: Optional[str] = None
     multi_variants: Optional[List[str]] = None
-    if multi_query:
+    # Шаг, упавший или откатившийся к запасному значению, не кэшируем: сбой LLM временный
+    typos_ok = expand_ok = True
+    expand = multi_query or hyde
+    if fix_typos and expand and _speculative_enabled():
+        speculative = asyncio.create_task(_expand(normalized, multi_query, hyde))
         try:
-            raw = await _llm_short(
-                'Сгенерируй 3–5 коротких альтернативных формулировок для поиска по базе (тот же смысл и язык, что у запроса). Верни только JSON вида {"variants":["..."]} без markdown.\n\nЗапрос:\n'
-                + q,
-                "Отвечай только компактным JSON.",
-                max_tokens=400,
-            )
-            m = re.search("\\{[\\s\\S]*\\}", raw or "")
-            if m:
-                data = json.loads(m.group())
-                vars_ = data.get("variants") or []
-                if isinstance(vars_, list) and vars_:
-                    multi_variants = [str(x).strip() for x in vars_[:6] if str(x).strip()]
-        except Exception:
-            logger.exception("RAG_MULTI_QUERY_ENABLED")
-    if hyde:
-        try:
-            hyde = await _llm_short(
-                "Напиши 1–3 коротких абзаца гипотетического ответа на запрос (как если бы ты знал тему). Не ссылайся на реальные документы, законы или источники по названию.\n\nЗапрос:\n"
-                + q,
-                "HyDE: гипотетический текст для плотного поиска.",
-                max_tokens=400,
-            )
-            hyde = (hyde or "").strip()
-            if len(hyde) > 30:
-                cap = _hyde_max_chars()
-                vector_query = f"{q}\n\n{hyde[:cap]}"
-        except Exception:
-            logger.exception("RAG_HYDE_ENABLED")
+            q, typos_ok = await _fix_typos(normalized)
+        except BaseException:
+            speculative.cancel()
+            raise
+        if q == normalized:
+            multi_variants, vector_query, expand_ok = await speculative
+        else:
+            speculative.cancel()
+            multi_variants, vector_query, expand_ok = await _expand(q, multi_query, hyde)
+    else:
+        if fix_typos:
+            q, typos_ok = await _fix_typos(normalized)
+        if expand:
+            multi_variants, vector_query, expand_ok = await _expand(q, multi_query, hyde)
+    filters = extract_filters_from_query(q)
     logger.debug(
         "[RAG-PREP] итог препроцесса: fix_typos=%s, multi_query=%s (вариантов=%s), "
         "HyDE(vector_query=%s), filters=%s, query_for_search=%s",
@@ -108,7 +212,7 @@ async def process_user_query(
         bool(filters),
         q,
     )
-    return ProcessedQuery(
+    result = ProcessedQuery(
         original=original,
         normalized=normalized,
         query_for_search=q,
@@ -116,3 +220,8 @@ async def process_user_query(
         multi_variants=multi_variants,
         filters=filters,
     )
+    if typos_ok and expand_ok:
+        _prep_cache_set(cache_key, result)
+    else:
+        logger.debug("[RAG-PREP] шаг LLM не удался — результат не кэшируется: %s", normalized[:80])
+    return result
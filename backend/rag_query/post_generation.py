@@ -8,6 +8,7 @@ import os
 import re
 
 from backend.settings.logging import get_logger
+from backend.utils.llm_priority import PRIORITY_BACKGROUND, llm_request_priority
 
 logger = get_logger(__name__)
 
@@ -75,13 +76,14 @@ async def verify_answer_grounded(context_excerpt: str, answer: str) -> bool:
     loop = asyncio.get_running_loop()
 
     def _call() -> str:
-        return ask_agent(
-            prompt,
-            history=[],
-            streaming=False,
-            system_prompt="Ты строгий аудитор: отвечай только «да» или «нет».",
-            max_tokens=8,
-        )
+        with llm_request_priority(PRIORITY_BACKGROUND):
+            return ask_agent(
+                prompt,
+                history=[],
+                streaming=False,
+                system_prompt="Ты строгий аудитор: отвечай только «да» или «нет».",
+                max_tokens=8,
+            )
 
     try:
         with concurrent.futures.ThreadPoolExecutor(max_workers=1) as ex:
@@ -1,21 +1,167 @@
-"""In-process semantic cache для ответов поиска RAG (ключ: нормализованный запрос + параметры + версия индекса)."""
+"""Semantic cache для ответов поиска RAG.
+
+Запись = эмбеддинг нормализованного запроса + найденные фрагменты. Поиск в кэше:
+сначала точное совпадение текста, затем ближайший сосед по косинусу среди записей
+той же области (матрица float32) — перефразированный повтор вопроса не идёт ни в
+препроцесс (LLM), ни в SVC-RAG.
+
+Область (``CacheScope``) — хранилище / проект / документ: загрузка в KB сбрасывает
+только записи KB, удаление документа — записи этого документа и поиски по всему
+хранилищу. Параметры поиска (k, стратегия, реранк, фильтры, числа в запросе) должны
+совпадать точно: «отчёт за 2023» и «отчёт за 2024» близки по эмбеддингу, но
+разделены ключом.
+
+Инвалидация — через поколения областей в бэкенде (``cache_backend.py``): поколения
+входят в ключ партиции, поэтому после загрузки на одной реплике старые записи не
+находятся ни на одной. С RAG_CACHE_BACKEND=redis записи общие для реплик.
+
+Переменные окружения:
+    RAG_SEMANTIC_CACHE            — включить кэш (по умолчанию выключен);
+    RAG_SEMANTIC_CACHE_TTL        — время жизни записи, с (300);
+    RAG_SEMANTIC_CACHE_THRESHOLD  — минимальный косинус для попадания (0.95);
+    RAG_SEMANTIC_CACHE_MAX_BYTES  — бюджет памяти, вытеснение LRU (64 МБ).
+Если эмбеддинг запроса недоступен (нет модели в SVC-RAG-MODELS) — работает только
+точное совпадение.
+"""
 
 from __future__ import annotations
 
+import base64
 import hashlib
 import json
 import os
+import re
 import threading
 import time
+from collections import OrderedDict
+from dataclasses import dataclass
 from typing import Any, Dict, List, Optional, Tuple
 
+import numpy as np
+
+from backend.rag_query.cache_backend import get_rag_cache_backend
 from backend.settings.logging import get_logger
 
 logger = get_logger(__name__)
 
+Hit = Tuple[str, float, Optional[int], Optional[int]]
+
+
+@dataclass(frozen=True)
+class CacheScope:
+    """Область инвалидации: ``store`` — global / kb / memory / project."""
+
+    store: str
+    project_id: Optional[str] = None
+    document_id: Optional[int] = None
+
+    def generation_names(self) -> List[str]:
+        """Имена поколений, от которых зависят записи области (от общего к частному)."""
+        base = f"{self.store}:{self.project_id}" if self.project_id is not None else self.store
+        names = ["all", self.store]
+        if base != self.store:
+            names.append(base)
+        names.append(f"{base}:doc:{self.document_id}" if self.document_id is not None else f"{base}:wide")
+        return names
+
+
+@dataclass(frozen=True)
+class CacheLookup:
+    """Что запомнить между cache_get и cache_set: эмбеддинг и поколения на момент поиска.
+
+    Запись ложится под поколения, прочитанные ДО поиска: если пока шёл поиск загрузили
+    документ, результат по старому индексу не попадёт под новое поколение.
+    """
+
+    generations: Tuple[int, ...]
+    vector: Optional[np.ndarray] = None
+
+
+def _bump_names(store: Optional[str], project_id: Optional[str], document_id: Optional[int]) -> List[str]:
+    if store is None:
+        return ["all"]
+    base = f"{store}:{project_id}" if project_id is not None else store
+    if document_id is not None:
+        return [f"{base}:doc:{int(document_id)}", f"{base}:wide"]
+    return [base]
+
+
+class _Entry:
+    __slots__ = ("query", "hits", "expires", "nbytes", "partition", "row")
+
+    def __init__(self, query: str, hits: List[Hit], expires: float, nbytes: int, partition: "_Partition"):
+        self.query = query
+        self.hits = hits
+        self.expires = expires
+        self.nbytes = nbytes
+        self.partition = partition
+        self.row = -1  # строка в partition.matrix; -1 — без эмбеддинга
+
+
+_PartitionKey = Tuple[CacheScope, str, Tuple[int, ...]]
+
+
+class _Partition:
+    """Записи одной (область, параметры, поколения): точный индекс и матрица эмбеддингов."""
+
+    def __init__(self, key: _PartitionKey):
+        self.key = key
+        self.names = key[0].generation_names()
+        self.shared_id = hashlib.sha256(
+            json.dumps([self.names, list(key[2]), key[1]], default=str).encode("utf-8")
+        ).hexdigest()
+        self.exact: Dict[str, _Entry] = {}
+        self.matrix: Optional[np.ndarray] = None
+        self.rows: List[_Entry] = []
+
+    def add(self, entry: _Entry, vector: Optional[np.ndarray]) -> None:
+        self.exact[entry.query] = entry
+        if vector is None:
+            return
+        if self.matrix is not None and self.matrix.shape[1] != vector.shape[0]:
+            # другая размерность — сменилась модель эмбеддингов; старые векторы бесполезны
+            for old in self.rows:
+                old.row = -1
+            self.rows, self.matrix = [], None
+        if self.matrix is None:
+            self.matrix = np.empty((8, vector.shape[0]), dtype=np.float32)
+        elif len(self.rows) == self.matrix.shape[0]:
+            grown = np.empty((self.matrix.shape[0] * 2, self.matrix.shape[1]), dtype=np.float32)
+            grown[: len(self.rows)] = self.matrix[: len(self.rows)]
+            self.matrix = grown
+        entry.row = len(self.rows)
+        self.matrix[entry.row] = vector
+        self.rows.append(entry)
+
+    def remove(self, entry: _Entry) -> None:
+        if self.exact.get(entry.query) is entry:
+            del self.exact[entry.query]
+        if entry.row < 0 or self.matrix is None:
+            return
+        last = self.rows.pop()
+        if last is not entry:
+            self.matrix[entry.row] = self.matrix[last.row]
+            last.row = entry.row
+            self.rows[entry.row] = last
+        entry.row = -1
+
+    def nearest(self, vector: np.ndarray, threshold: float) -> Tuple[Optional[_Entry], float]:
+        if not self.rows or self.matrix is None or self.matrix.shape[1] != vector.shape[0]:
+            return None, 0.0
+        sims = self.matrix[: len(self.rows)] @ vector
+        best = int(np.argmax(sims))
+        score = float(sims[best])
+        return (self.rows[best], score) if score >= threshold else (None, score)
+
+    def __len__(self) -> int:
+        return len(self.exact)
+
+
 _lock = threading.Lock()
-_store: Dict[str, Tuple[float, List[Tuple[str, float, Optional[int], Optional[int]]]]] = {}
-_index_version = 0
+_partitions: Dict[_PartitionKey, _Partition] = {}
+_lru: "OrderedDict[int, _Entry]" = OrderedDict()
+_bytes = 0
+_stats = {"exact_hits": 0, "semantic_hits": 0, "shared_loaded": 0, "misses": 0, "evictions": 0}
 
 
 def _env_bool(name: str) -> bool:
@@ -27,15 +173,6 @@ def semantic_cache_enabled() -> bool:
     return _env_bool("RAG_SEMANTIC_CACHE")
 
 
-def bump_rag_semantic_cache() -> None:
-    """Сброс кэша при загрузке/удалении документов (новая версия индекса)."""
-    global _index_version
-    with _lock:
-        _index_version += 1
-        _store.clear()
-    logger.debug("[RAG cache] bump: version=%s", _index_version)
-
-
 def _ttl_seconds() -> float:
     try:
         return max(30.0, float(os.getenv("RAG_SEMANTIC_CACHE_TTL", "300")))
@@ -43,30 +180,40 @@ def _ttl_seconds() -> float:
         return 300.0
 
 
-def make_cache_key(
+def _threshold() -> float:
+    try:
+        return min(1.0, max(0.5, float(os.getenv("RAG_SEMANTIC_CACHE_THRESHOLD", "0.95"))))
+    except ValueError:
+        return 0.95
+
+
+def _max_bytes() -> int:
+    try:
+        return max(1 << 20, int(os.getenv("RAG_SEMANTIC_CACHE_MAX_BYTES", str(64 << 20))))
+    except ValueError:
+        return 64 << 20
+
+
+def make_params_key(
     path: str,
     normalized_query: str,
     k: int,
     strategy: Optional[str],
-    document_id: Optional[int],
     use_reranking: Optional[bool],
     filters: Optional[Dict[str, Any]],
-    project_id: Optional[str],
     *,
     rag_fix_typos: bool = False,
     rag_multi_query: bool = False,
     rag_hyde: bool = False,
 ) -> str:
+    """Всё, кроме текста запроса, что влияет на ответ поиска. Числа из запроса — тоже сюда."""
     payload = {
-        "v": _index_version,
         "path": path,
-        "q": normalized_query,
         "k": k,
         "strategy": strategy,
-        "document_id": document_id,
         "use_reranking": use_reranking,
         "filters": filters or {},
-        "project_id": project_id,
+        "numbers": sorted(set(re.findall(r"\d+", normalized_query or ""))),
         "rag_fix_typos": rag_fix_typos,
         "rag_multi_query": rag_multi_query,
         "rag_hyde": rag_hyde,
@@ -75,31 +222,225 @@ def make_cache_key(
     return hashlib.sha256(raw.encode("utf-8")).hexdigest()
 
 
-def cache_get(key: str) -> Optional[List[Tuple[str, float, Optional[int], Optional[int]]]]:
-    if not semantic_cache_enabled():
+def _entry_bytes(query: str, hits: List[Hit], dim: int) -> int:
+    return 200 + len(query) * 2 + dim * 4 + sum(96 + len(h[0] or "") * 2 for h in hits)
+
+
+def _drop(entry: _Entry) -> None:
+    global _bytes
+    if _lru.pop(id(entry), None) is None:
+        return
+    _bytes -= entry.nbytes
+    part = entry.partition
+    part.remove(entry)
+    if not len(part):
+        _partitions.pop(part.key, None)
+
+
+async def embed_query(text: str) -> Optional[np.ndarray]:
+    """Нормированный эмбеддинг запроса через SVC-RAG-MODELS; None — кэш работает только по точному тексту."""
+    try:
+        from backend.settings.rag_models_client import get_rag_models_client
+
+        vectors = await get_rag_models_client().embed([text])
+        vec = np.asarray(vectors[0], dtype=np.float32).reshape(-1)
+    except Exception as e:
+        logger.debug("[RAG cache] эмбеддинг запроса недоступен: %s", e)
         return None
+    norm = float(np.linalg.norm(vec))
+    return vec / norm if norm > 0 else None
+
+
+def _encode_entry(entry: _Entry, vector: Optional[np.ndarray]) -> bytes:
+    return json.dumps(
+        {
+            "q": entry.query,
+            "hits": entry.hits,
+            "vec": base64.b64encode(vector.astype(np.float32).tobytes()).decode("ascii") if vector is not None else None,
+            "exp": time.time() + (entry.expires - time.monotonic()),
+        },
+        ensure_ascii=False,
+    ).encode("utf-8")
+
+
+def _add_entry(part: _Partition, query: str, hits: List[Hit], ttl: float, vector: Optional[np.ndarray]) -> _Entry:
+    global _bytes
+    old = part.exact.get(query)
+    if old is not None:
+        _drop(old)
+        _partitions.setdefault(part.key, part)
+    entry = _Entry(
+        query,
+        list(hits),
+        time.monotonic() + ttl,
+        _entry_bytes(query, hits, 0 if vector is None else vector.shape[0]),
+        part,
+    )
+    part.add(entry, vector)
+    _lru[id(entry)] = entry
+    _bytes += entry.nbytes
+    budget = _max_bytes()
+    while _bytes > budget and len(_lru) > 1:
+        _, victim = next(iter(_lru.items()))
+        _drop(victim)
+        _stats["evictions"] += 1
+    return entry
+
+
+def _load_shared(key: _PartitionKey, rows: Dict[str, bytes]) -> _Partition:
+    """Партиция, которой нет в памяти реплики, из записей общего бэкенда."""
+    part = _partitions.get(key)
+    if part is None:
+        part = _partitions[key] = _Partition(key)
+    now = time.time()
+    for raw in rows.values():
+        try:
+            item = json.loads(raw)
+            ttl = float(item.get("exp") or 0) - now
+            query = str(item["q"])
+            if ttl <= 0 or query in part.exact:
+                continue
+            vec = np.frombuffer(base64.b64decode(item["vec"]), dtype=np.float32).copy() if item.get("vec") else None
+            hits = [tuple(h) for h in item.get("hits") or []]
+        except (KeyError, TypeError, ValueError) as e:
+            logger.debug("[RAG cache] битая общая запись: %s", e)
+            continue
+        _add_entry(part, query, hits, ttl, vec)
+        _stats["shared_loaded"] += 1
+    if not len(part):
+        _partitions.pop(key, None)
+    return part
+
+
+async def cache_get(
+    scope: CacheScope, params_key: str, normalized_query: str
+) -> Tuple[Optional[List[Hit]], Optional[CacheLookup]]:
+    """(фрагменты или None, CacheLookup для последующего cache_set; None — кэш недоступен)."""
+    if not semantic_cache_enabled():
+        return None, None
+    backend = get_rag_cache_backend()
+    generations = await backend.get_generations(scope.generation_names())
+    if generations is None:
+        return None, None
+    key = (scope, params_key, tuple(generations))
+    with _lock:
+        part = _partitions.get(key)
+    if part is None:
+        rows = await backend.load_partition(_Partition(key).shared_id)
+        if rows:
+            with _lock:
+                _load_shared(key, rows)
     now = time.monotonic()
     with _lock:
-        item = _store.get(key)
-        if not item:
-            return None
-        exp, val = item
-        if exp < now:
-            del _store[key]
-            return None
-        return list(val)
-
-
-def cache_set(
-    key: str,
-    hits: List[Tuple[str, float, Optional[int], Optional[int]]],
+        part = _partitions.get(key)
+        entry = part.exact.get(normalized_query) if part else None
+        if entry is not None and entry.expires < now:
+            _drop(entry)
+            entry = None
+        if entry is not None:
+            _lru.move_to_end(id(entry))
+            _stats["exact_hits"] += 1
+            return list(entry.hits), None
+        if part is None:
+            _stats["misses"] += 1
+            return None, CacheLookup(tuple(generations))
+    vector = await embed_query(normalized_query)
+    lookup = CacheLookup(tuple(generations), vector)
+    if vector is None:
+        with _lock:
+            _stats["misses"] += 1
+        return None, lookup
+    with _lock:
+        part = _partitions.get(key)
+        entry, score = part.nearest(vector, _threshold()) if part else (None, 0.0)
+        if entry is not None and entry.expires < time.monotonic():
+            _drop(entry)
+            entry = None
+        if entry is None:
+            _stats["misses"] += 1
+            return None, lookup
+        _lru.move_to_end(id(entry))
+        _stats["semantic_hits"] += 1
+        logger.debug("[RAG cache] semantic hit %.3f: %r ~ %r", score, normalized_query[:80], entry.query[:80])
+        return list(entry.hits), lookup
+
+
+async def cache_set(
+    scope: CacheScope,
+    params_key: str,
+    normalized_query: str,
+    hits: List[Hit],
+    lookup: Optional[CacheLookup],
 ) -> None:
-    if not semantic_cache_enabled():
+    """Запомнить результат поиска под поколения из ``lookup`` (из cache_get того же запроса)."""
+    if not semantic_cache_enabled() or lookup is None:
         return
+    vector = lookup.vector
+    if vector is None:
+        vector = await embed_query(normalized_query)
     ttl = _ttl_seconds()
-    exp = time.monotonic() + ttl
+    key = (scope, params_key, lookup.generations)
+    with _lock:
+        part = _partitions.get(key)
+        if part is None:
+            part = _partitions[key] = _Partition(key)
+        entry = _add_entry(part, normalized_query, hits, ttl, vector)
+        payload = _encode_entry(entry, vector)
+        shared_id = part.shared_id
+    await get_rag_cache_backend().store_entry(shared_id, hashlib.sha256(normalized_query.encode("utf-8")).hexdigest(), payload, ttl)
+
+
+def _invalidate_local(bumped: Dict[str, Optional[int]]) -> int:
+    """Сбросить партиции, чьё поколение по какому-либо из имён устарело (или неизвестно)."""
+    dropped = 0
+    with _lock:
+        for part in list(_partitions.values()):
+            stale = False
+            for name, gen in zip(part.names, part.key[2]):
+                if name in bumped and (bumped[name] is None or gen < bumped[name]):
+                    stale = True
+                    break
+            if not stale:
+                continue
+            for entry in list(part.exact.values()):
+                _drop(entry)
+                dropped += 1
+    return dropped
+
+
+async def bump_rag_semantic_cache(
+    store: Optional[str] = None,
+    *,
+    project_id: Optional[str] = None,
+    document_id: Optional[int] = None,
+) -> None:
+    """Инвалидация после изменения индекса (на всех репликах через бэкенд).
+
+    Без аргументов — весь кэш (смена модели, настроек). ``store`` — одно хранилище;
+    ``project_id`` — один проект; ``document_id`` — поиски по этому документу и поиски
+    по всему хранилищу (проекту), где он мог участвовать.
+    """
+    names = _bump_names(store, str(project_id) if project_id is not None else None, document_id)
+    bumped = await get_rag_cache_backend().bump_generations(names)
+    dropped = _invalidate_local(bumped)
+    logger.debug("[RAG cache] bump %s -> %s: удалено записей %s", names, bumped, dropped)
+
+
+async def start_semantic_cache() -> None:
+    """Подписка на инвалидацию от других реплик (startup приложения)."""
+    await get_rag_cache_backend().start(_invalidate_local)
+
+
+async def close_semantic_cache() -> None:
+    await get_rag_cache_backend().aclose()
+
+
+def semantic_cache_stats() -> Dict[str, Any]:
     with _lock:
-        _store[key] = (exp, list(hits))
-        if len(_store) > 2000:
-            for k in list(_store.keys())[:500]:
-                _store.pop(k, None)
+        return {
+            **_stats,
+            "entries": len(_lru),
+            "bytes": _bytes,
+            "partitions": len(_partitions),
+            "backend": get_rag_cache_backend().name,
+        }
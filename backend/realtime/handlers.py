@@ -16,6 +16,7 @@ from backend.settings.rag_client import RagReindexInProgress
 import backend.app_state as state
 from backend.app_state import (
     ask_agent,
+    ask_agent_async,
     context_prompt_manager,
     get_agent_orchestrator,
     get_current_model_path,
@@ -64,6 +65,14 @@ from backend.realtime.rag_evidence import (
     rag_reindex_blocks_active_sources,
     resolve_active_rag_sources,
 )
+from backend.realtime.rag_fanout import gather_rag_stores
+from backend.realtime.stream_protocol import (
+    ChatStreamWriter,
+    drop_socket_streams,
+    negotiate_stream_protocol,
+    resync_payload,
+    socket_stream_protocol,
+)
 from backend.settings.cef_logger.cef_audit_context import cef_socket_remote_from_environ
 from backend.settings.logging import get_logger
 from backend.settings.logging.errors import logged_suppress
@@ -461,6 +470,8 @@ def register_handlers(sio):
         }
         if _cef_remote:
             _sess["cef_remote"] = _cef_remote
+        stream_protocol = negotiate_stream_protocol(auth)
+        _sess["stream_protocol"] = stream_protocol
         await sio.save_session(sid, _sess)
         logger.info(
             "Socket.IO client connected: sid=%s user_id=%s session_id=%s",
@@ -469,12 +480,26 @@ def register_handlers(sio):
             user_data.get("session_id"),
         )
         stop_generation_flags[sid] = False
-        await sio.emit("connected", {"data": "Connected to astrachat"}, room=sid)
+        await sio.emit(
+            "connected", {"data": "Connected to astrachat", "stream_protocol": stream_protocol}, room=sid
+        )
 
     @sio.event
     async def disconnect(sid):
         logger.debug(f"Socket.IO client disconnected: {sid}")
         stop_generation_flags.pop(sid, None)
+        drop_socket_streams(sid)
+
+    @sio.event
+    async def chat_resync(sid, data):
+        """Полный текст текущего стрима (протокол 2: клиент пропустил кадр по seq)."""
+        stream_key = str((data or {}).get("model") or "") if isinstance(data, dict) else ""
+        payload = resync_payload(sid, stream_key)
+        if payload is None:
+            payload = {"seq": 0, "accumulated": "", "thinking": "", "active": False}
+            if stream_key:
+                payload["model"] = stream_key
+        await sio.emit("chat_resync", payload, room=sid)
 
     @sio.event
     async def ping(sid, data):
@@ -507,7 +532,7 @@ def register_handlers(sio):
 
     @sio.event
     async def chat_message(sid, data):
-        if not ask_agent or not save_dialog_entry:
+        if not ask_agent or not ask_agent_async or not save_dialog_entry:
             await sio.emit("chat_error", {"error": "AI services not available"}, room=sid)
             return
         rag_runtime_token = None
@@ -669,25 +694,8 @@ def register_handlers(sio):
                 project_id,
             )
 
-            async def async_stream_cb(chunk, acc, stream_role="content"):
-                with logged_suppress(logger):
-                    if stream_role == "reasoning":
-                        await sio.emit(
-                            "chat_thinking",
-                            {"chunk": chunk, "accumulated": acc, "thinking": chunk, "stream_role": "reasoning"},
-                            room=sid,
-                        )
-                    else:
-                        await sio.emit("chat_chunk", {"chunk": chunk, "accumulated": acc}, room=sid)
-
             loop = asyncio.get_event_loop()
 
-            def sync_stream_cb(chunk, acc, stream_role="content"):
-                if stop_generation_flags.get(sid, False):
-                    return False
-                asyncio.run_coroutine_threadsafe(async_stream_cb(chunk, acc, stream_role), loop)
-                return True
-
             if use_multi_llm_mode:
                 slot = str(data.get("multi_llm_slot_regenerate") or "").strip()
                 models_subset = [slot] if bool(data.get("regenerate")) and slot else None
@@ -749,7 +757,6 @@ def register_handlers(sio):
                 use_kb_rag,
                 use_memory_library_rag,
                 agent_profile,
-                sync_stream_cb,
                 loop,
                 use_agent_scoped_kb,
                 agent_kb_doc_ids,
@@ -1022,11 +1029,26 @@ async def _handle_multi_llm(
         data.get("max_tokens") if data.get("max_tokens") is not None else (_ap.get("max_tokens") or 1024)
     )
 
+    stream_protocol = await socket_stream_protocol(sio, sid)
+
     async def _gen_one(model_name: str):
         idx = multi_llm_models.index(model_name)
         eff_system_prompt = _system_prompt_for_model(model_name)
+        writer = None
+        if streaming:
+            writer = ChatStreamWriter(
+                sio,
+                sid,
+                protocol=stream_protocol,
+                event="multi_llm_chunk",
+                thinking_event=None,
+                stream_key=model_name,
+                extra={"model": model_name},
+            )
 
         async def _emit_complete(res: dict) -> dict:
+            if writer is not None:
+                await writer.aclose()
             await sio.emit(
                 "multi_llm_complete",
                 {
@@ -1073,10 +1095,8 @@ async def _handle_multi_llm(
                     )
                     if mcp_result is not None:
                         resp = mcp_result.content or ""
-                        if streaming and resp:
-                            await sio.emit(
-                                "multi_llm_chunk", {"model": model_name, "chunk": resp, "accumulated": resp}, room=sid
-                            )
+                        if writer is not None:
+                            writer.push(resp, resp)
                         if context_added and resp.strip():
                             resp = await maybe_replace_ungrounded(
                                 final_user_message[:20000], resp, RAG_STRICT_NOT_FOUND_MESSAGE
@@ -1103,10 +1123,7 @@ async def _handle_multi_llm(
             def _model_stream_cb(chunk, acc):
                 if stop_generation_flags.get(sid, False):
                     return False
-                asyncio.run_coroutine_threadsafe(
-                    sio.emit("multi_llm_chunk", {"model": model_name, "chunk": chunk, "accumulated": acc}, room=sid),
-                    loop,
-                )
+                loop.call_soon_threadsafe(writer.push, chunk, acc)
                 return True
 
             with concurrent.futures.ThreadPoolExecutor() as ex:
@@ -1134,6 +1151,10 @@ async def _handle_multi_llm(
         except Exception as e:
             logger.exception("Ошибка операции")
             return await _emit_complete({"model": model_name, "response": f"Ошибка: {e}", "error": True})
+        finally:
+            # Отмена / BaseException минуют _emit_complete — без этого задача writer'а ждёт вечно
+            if writer is not None:
+                await writer.aclose()
 
     results: list = await asyncio.gather(*[_gen_one(m) for m in multi_llm_models], return_exceptions=True)
     for i, result in enumerate(results):
@@ -1250,6 +1271,7 @@ async def _handle_agent_mode(
     ap = agent_profile or {}
     eff_model_path = ap.get("model_path") or get_current_model_path()
     reasoning_trace_accumulated = ""
+    writer = None
 
     async def agent_stream_cb(chunk, acc, stream_role="content"):
         nonlocal reasoning_trace_accumulated
@@ -1260,13 +1282,7 @@ async def _handle_agent_mode(
                 reasoning_trace_accumulated = acc
             elif isinstance(chunk, str) and chunk:
                 reasoning_trace_accumulated += chunk
-            await sio.emit(
-                "chat_thinking",
-                {"chunk": chunk, "accumulated": acc, "thinking": chunk, "stream_role": "reasoning"},
-                room=sid,
-            )
-        else:
-            await sio.emit("chat_chunk", {"chunk": chunk, "accumulated": acc}, room=sid)
+        writer.push(chunk, acc, stream_role)
         return True
 
     context = {
@@ -1420,8 +1436,14 @@ async def _handle_agent_mode(
         extra_line="Базовая модель на сервере - та, что ниже; оркестратор может дергать LLM несколько раз.",
         enable_thinking=enable_thinking,
     )
+    if streaming:
+        writer = ChatStreamWriter(sio, sid, protocol=await socket_stream_protocol(sio, sid))
     try:
-        response = await orchestrator.process_message(effective_message, history=history, context=context)
+        try:
+            response = await orchestrator.process_message(effective_message, history=history, context=context)
+        finally:
+            if writer is not None:
+                await writer.aclose()
         if stop_generation_flags.get(sid, False):
             stop_generation_flags[sid] = False
             await sio.emit("generation_stopped", {"message": "Генерация остановлена"}, room=sid)
@@ -1467,7 +1489,6 @@ async def _handle_direct(
     use_kb_rag,
     use_memory_library_rag,
     agent_profile,
-    sync_stream_cb,
     loop,
     use_agent_scoped_kb=False,
     agent_kb_doc_ids=None,
@@ -1497,66 +1518,78 @@ async def _handle_direct(
     final_message = user_message
     images = list(inline_images) if inline_images else None
     proj_hits_for_trace = []
-    proj_id_name: dict = {}
-    if rag_client and sources.project:
-        with logged_suppress(logger):
-            proj_rows = list(await rag_client.project_rag_list_documents(project_id) or [])
-            proj_id_name = build_rag_id_to_filename(proj_rows)
-    if rag_client and sources.project:
-        try:
-            proj_hits = await rag_client.project_rag_search(
-                user_message, project_id=project_id, k=get_rag_chat_top_k(), strategy=rag_strategy
+    top_k = get_rag_chat_top_k()
+
+    async def _project_search():
+        hits = await rag_client.project_rag_search(
+            user_message, project_id=project_id, k=top_k, strategy=rag_strategy
+        )
+        hits = filter_rag_hits_by_score(hits, min_sim)
+        if hits and _is_structure_query(user_message):
+            doc_ids = list({d for _, _, d, _ in hits if d is not None})
+            starts = await asyncio.gather(
+                *(rag_client.get_document_start_chunks(doc_id, max_chunks=2) for doc_id in doc_ids),
+                return_exceptions=True,
             )
-            proj_hits = filter_rag_hits_by_score(proj_hits, min_sim)
-            if proj_hits:
-                if _is_structure_query(user_message):
-                    seen = {(d, i) for _, _, d, i in proj_hits}
-                    for doc_id in {d for _, _, d, _ in proj_hits if d is not None}:
-                        with logged_suppress(logger):
-                            for c, sc, did, idx in await rag_client.get_document_start_chunks(doc_id, max_chunks=2):
-                                if (did, idx) not in seen:
-                                    proj_hits = [(c, sc, did, idx)] + proj_hits
-                                    seen.add((did, idx))
-                parts, _m = format_rag_fragments(
-                    proj_hits, proj_id_name, max_chars=12000, store_label="project (direct)"
-                )
-                proj_context = "\n".join(parts)
-                final_message = f"""Документы проекта (RAG):
+            seen = {(d, i) for _, _, d, i in hits}
+            for doc_start in starts:
+                if isinstance(doc_start, BaseException):
+                    logger.warning("[direct project_rag] начальные чанки документа: %s", doc_start)
+                    continue
+                for c, sc, did, idx in doc_start:
+                    if (did, idx) not in seen:
+                        hits = [(c, sc, did, idx)] + hits
+                        seen.add((did, idx))
+        return hits
+
+    # Все активные источники и их списки файлов — одной пачкой с дедлайнами по хранилищам.
+    store_jobs: dict = {}
+    if rag_client and sources.project:
+        store_jobs["project_docs"] = lambda: rag_client.project_rag_list_documents(project_id)
+        store_jobs["project"] = _project_search
+    if rag_client and sources.agent_kb:
+        store_jobs["kb_docs"] = rag_client.kb_list_documents
+        store_jobs["kb"] = lambda: kb_search_agent_documents(
+            rag_client, user_message, agent_kb_doc_ids or [], k=top_k, strategy=rag_strategy
+        )
+    if rag_client and sources.memory:
+        store_jobs["memory_docs"] = rag_client.memory_rag_list_documents
+        store_jobs["memory"] = lambda: rag_client.memory_rag_search(user_message, k=top_k, strategy=rag_strategy)
+    try:
+        store_results = await gather_rag_stores(store_jobs)
+    except RagReindexInProgress:
+        await _notify_reindex_wait(sio, sid)
+        await _abort_chat_reindex(
+            sio, sid, conversation_id, project_id, current_user
+        )
+        return
+    proj_id_name = build_rag_id_to_filename(list(store_results.get("project_docs") or []))
+    proj_hits = list(store_results.get("project") or [])
+    if proj_hits:
+        parts, _m = format_rag_fragments(
+            proj_hits, proj_id_name, max_chars=12000, store_label="project (direct)"
+        )
+        proj_context = "\n".join(parts)
+        final_message = f"""Документы проекта (RAG):
 {proj_context}
 Вопрос: {user_message}
 Ответь на основе этих документов. Перечисляй только то, что явно есть в фрагментах."""
-                proj_hits_for_trace = proj_hits
-                context_added = True
-                logger.info(f"[direct project_rag] {len(proj_hits)} фрагментов, project={project_id}")
-        except RagReindexInProgress:
-            await _notify_reindex_wait(sio, sid)
-            await _abort_chat_reindex(
-                sio, sid, conversation_id, project_id, current_user
-            )
-            return
-        except Exception:
-            logger.exception("Direct project RAG error")
+        proj_hits_for_trace = proj_hits
+        context_added = True
+        logger.info(f"[direct project_rag] {len(proj_hits)} фрагментов, project={project_id}")
     # «Библиотека» не вызывает global /search — только KB + memory ниже.
     document_search_trace = None
-    kb_hits, mem_hits = ([], [])
-    kb_id_name: dict = {}
-    mem_id_name: dict = {}
-    if proj_hits_for_trace and rag_client:
-        trace_proj_map = proj_id_name
-        if not trace_proj_map:
-            try:
-                trace_proj_map = build_rag_id_to_filename(
-                    list(await rag_client.project_rag_list_documents(project_id) or [])
-                )
-            except Exception:
-                logger.exception("Ошибка операции")
-                trace_proj_map = {}
+    kb_hits = filter_rag_hits_by_score(list(store_results.get("kb") or []), min_sim)
+    mem_hits = filter_rag_hits_by_score(list(store_results.get("memory") or []), min_sim)
+    kb_id_name = build_rag_id_to_filename(list(store_results.get("kb_docs") or []))
+    mem_id_name = build_rag_id_to_filename(list(store_results.get("memory_docs") or []))
+    if proj_hits_for_trace:
         hits_out, files_used = ([], set())
         for content, score, doc_id, chunk_idx in proj_hits_for_trace:
             if doc_id is None:
                 continue
             try:
-                fn = trace_proj_map.get(int(doc_id))
+                fn = proj_id_name.get(int(doc_id))
             except (TypeError, ValueError):
                 fn = None
             if not fn:
@@ -1581,60 +1614,6 @@ async def _handle_direct(
                 "hits": hits_out,
             }
     if rag_client and (sources.agent_kb or sources.memory):
-        kb_rows: list = []
-        mem_rows: list = []
-        kb_hits: list = []
-        mem_hits: list = []
-        if sources.agent_kb:
-            try:
-                kb_rows = list(await rag_client.kb_list_documents() or [])
-            except Exception:
-                logger.exception("Ошибка операции")
-                kb_rows = []
-        if sources.memory:
-            try:
-                mem_rows = list(await rag_client.memory_rag_list_documents() or [])
-            except Exception:
-                logger.exception("Ошибка операции")
-                mem_rows = []
-        if sources.agent_kb:
-            try:
-                kb_hits = list(
-                    await kb_search_agent_documents(
-                        rag_client,
-                        user_message,
-                        agent_kb_doc_ids or [],
-                        k=get_rag_chat_top_k(),
-                        strategy=rag_strategy,
-                    )
-                    or []
-                )
-            except RagReindexInProgress:
-                await _notify_reindex_wait(sio, sid)
-                await _abort_chat_reindex(
-                    sio, sid, conversation_id, project_id, current_user
-                )
-                return
-            except Exception:
-                logger.exception("KB search error")
-            kb_hits = filter_rag_hits_by_score(kb_hits, min_sim)
-        if sources.memory:
-            try:
-                mem_hits = list(
-                    await rag_client.memory_rag_search(user_message, k=get_rag_chat_top_k(), strategy=rag_strategy)
-                    or []
-                )
-            except RagReindexInProgress:
-                await _notify_reindex_wait(sio, sid)
-                await _abort_chat_reindex(
-                    sio, sid, conversation_id, project_id, current_user
-                )
-                return
-            except Exception:
-                logger.exception("memory_rag search error")
-            mem_hits = filter_rag_hits_by_score(mem_hits, min_sim)
-        kb_id_name = build_rag_id_to_filename(kb_rows)
-        mem_id_name = build_rag_id_to_filename(mem_rows)
         hits_out = document_search_trace["hits"] if document_search_trace else []
         files_used = set(document_search_trace["sourceFiles"]) if document_search_trace else set()
         for content, score, doc_id, chunk_idx in kb_hits:
@@ -1791,18 +1770,24 @@ async def _handle_direct(
         except Exception:
             logger.exception("MCP agent loop error")
     reasoning_trace_accumulated = ""
+    writer = None
+    if streaming:
+        writer = ChatStreamWriter(sio, sid, protocol=await socket_stream_protocol(sio, sid))
 
     def _direct_stream_cb(chunk, acc, stream_role="content"):
         nonlocal reasoning_trace_accumulated
+        if stop_generation_flags.get(sid, False):
+            return False
         if stream_role == "reasoning":
             if isinstance(acc, str) and acc:
                 reasoning_trace_accumulated = acc
             elif isinstance(chunk, str) and chunk:
                 reasoning_trace_accumulated += chunk
-        return sync_stream_cb(chunk, acc, stream_role)
+        writer.push(chunk, acc, stream_role)
+        return True
 
-    def _run_ask(stream, cb):
-        return ask_agent(
+    async def _run_ask(stream, cb):
+        return await ask_agent_async(
             final_message,
             history=history,
             max_tokens=agent_profile["max_tokens"],
@@ -1818,12 +1803,14 @@ async def _handle_direct(
 
     if canned:
         response = canned
-        if streaming:
-            await sio.emit("chat_chunk", {"chunk": canned, "accumulated": canned}, room=sid)
+        if writer is not None:
+            writer.push(canned, canned)
+            await writer.aclose()
     elif mcp_result is not None:
         response = mcp_result.content
-        if streaming and response:
-            await sio.emit("chat_chunk", {"chunk": response, "accumulated": response}, room=sid)
+        if writer is not None:
+            writer.push(response or "", response)
+            await writer.aclose()
         logger.info(
             "MCP agent loop: mode=%s tools=%s iterations=%s",
             mcp_result.mode,
@@ -1831,19 +1818,16 @@ async def _handle_direct(
             mcp_result.iterations,
         )
     elif streaming:
-        with concurrent.futures.ThreadPoolExecutor() as ex:
-            response = await asyncio.get_event_loop().run_in_executor(
-                ex, _make_ctx_runner(lambda: _run_ask(True, _direct_stream_cb))
-            )
+        try:
+            response = await _run_ask(True, _direct_stream_cb)
+        finally:
+            await writer.aclose()
         if response is None or stop_generation_flags.get(sid, False):
             stop_generation_flags[sid] = False
             await sio.emit("generation_stopped", {"message": "Генерация остановлена"}, room=sid)
             return
     else:
-        with concurrent.futures.ThreadPoolExecutor() as ex:
-            response = await asyncio.get_event_loop().run_in_executor(
-                ex, _make_ctx_runner(lambda: _run_ask(False, None))
-            )
+        response = await _run_ask(False, None)
     if context_added and (not canned) and response:
         response = await maybe_replace_ungrounded(final_message[:20000], response, RAG_STRICT_NOT_FOUND_MESSAGE)
     if stop_generation_flags.get(sid, False):
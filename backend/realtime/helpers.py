@@ -2,6 +2,7 @@
 socket_helpers.py - утилиты, общие для socket_handlers и роутеров
 """
 
+import asyncio
 import json
 from typing import Any, List, Optional, Tuple
 
@@ -108,20 +109,19 @@ async def kb_search_agent_documents(
     if not rag_client or not kb_doc_ids:
         return []
     hits_out: List[Tuple[str, float, Optional[int], Optional[int]]] = []
-    for doc_id in kb_doc_ids:
-        try:
-            hits = await rag_client.kb_search(
-                query,
-                k=max(1, k),
-                document_id=int(doc_id),
-                strategy=strategy,
-            )
-            if hits:
-                hits_out.extend(hits)
-        except RagReindexInProgress:
-            raise
-        except Exception:
-            logger.exception("KB search по doc_id=")
+    # Документы агента ищем параллельно: время = самый медленный документ, а не сумма.
+    async def _search_doc(doc_id):
+        return await rag_client.kb_search(query, k=max(1, k), document_id=int(doc_id), strategy=strategy)
+
+    results = await asyncio.gather(*(_search_doc(d) for d in kb_doc_ids), return_exceptions=True)
+    for doc_id, hits in zip(kb_doc_ids, results):
+        if isinstance(hits, RagReindexInProgress):
+            raise hits
+        if isinstance(hits, BaseException):
+            logger.error("KB search по doc_id=%s", doc_id, exc_info=hits)
+            continue
+        if hits:
+            hits_out.extend(hits)
     hits_out.sort(key=lambda h: float(h[1]) if h and len(h) > 1 else 0.0, reverse=True)
     return hits_out[:k]
 
@@ -0,0 +1,89 @@
+"""
+Параллельный опрос RAG-хранилищ перед генерацией (проект / KB агента / библиотека памяти).
+
+Поиски и списки документов (id -> имя файла) всех активных источников запускаются
+одной пачкой, у каждого хранилища свой дедлайн. Источник, не уложившийся в дедлайн
+или упавший, просто выпадает из контекста — ответ строится по остальным, а время до
+первого токена ограничено самым медленным хранилищем, а не суммой.
+
+Дедлайны (секунды, 0 — без ограничения):
+    RAG_STORE_DEADLINE_SEC            — общий (15);
+    RAG_STORE_DEADLINE_<STORE>_SEC    — для одного хранилища: PROJECT, KB, MEMORY.
+
+``RagReindexInProgress`` не глотается: вызывающий код прерывает чат целиком.
+"""
+
+import asyncio
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from backend.settings.rag_client import RagReindexInProgress
+from backend.settings.logging import get_logger
+
+logger = get_logger(__name__)
+
+StoreJob = Callable[[], Awaitable[Any]]
+
+
+def _env_seconds(name: str) -> Optional[float]:
+    raw = os.getenv(name, "").strip()
+    if not raw:
+        return None
+    try:
+        return max(0.0, float(raw))
+    except ValueError:
+        logger.warning("[RAG fanout] %s=%r — не число, игнорируем", name, raw)
+        return None
+
+
+def rag_store_deadline(store: str) -> Optional[float]:
+    """Дедлайн хранилища; задачи ``<store>_docs`` (списки файлов) живут по дедлайну своего хранилища."""
+    base = store.split("_", 1)[0].upper()
+    value = _env_seconds(f"RAG_STORE_DEADLINE_{base}_SEC")
+    if value is None:
+        value = _env_seconds("RAG_STORE_DEADLINE_SEC")
+    if value is None:
+        value = 15.0
+    return value or None
+
+
+async def gather_rag_stores(jobs: Dict[str, StoreJob]) -> Dict[str, Any]:
+    """Запустить все задачи разом; вернуть результаты успевших (ключ -> значение).
+
+    Упавшие и не уложившиеся в дедлайн задачи в результат не попадают (пишем в лог).
+    """
+    if not jobs:
+        return {}
+
+    async def _run(name: str, job: StoreJob) -> Any:
+        deadline = rag_store_deadline(name)
+        if deadline is None:
+            return await job()
+        return await asyncio.wait_for(job(), deadline)
+
+    started = time.monotonic()
+    names = list(jobs)
+    outcomes = await asyncio.gather(*(_run(n, jobs[n]) for n in names), return_exceptions=True)
+    results: Dict[str, Any] = {}
+    reindex: Optional[RagReindexInProgress] = None
+    for name, outcome in zip(names, outcomes):
+        if isinstance(outcome, RagReindexInProgress):
+            reindex = reindex or outcome
+        elif isinstance(outcome, asyncio.TimeoutError):
+            logger.warning("[RAG fanout] %s: дедлайн %.1fs истёк — источник пропущен", name, rag_store_deadline(name))
+        elif isinstance(outcome, BaseException):
+            if isinstance(outcome, asyncio.CancelledError):
+                raise outcome
+            logger.error("[RAG fanout] %s: ошибка — источник пропущен", name, exc_info=outcome)
+        else:
+            results[name] = outcome
+    if reindex is not None:
+        raise reindex
+    logger.info(
+        "[RAG fanout] %s за %.0f мс (готово: %s)",
+        ", ".join(names),
+        (time.monotonic() - started) * 1000,
+        ", ".join(results) or "—",
+    )
+    return results
@@ -0,0 +1,202 @@
+"""
+Протокол стриминга ответа в Socket.IO (chat_chunk / chat_thinking / multi_llm_chunk).
+
+Версии согласуются при connect (``auth.stream_protocol``):
+    1 — legacy: каждый кадр несёт ``chunk`` и полный ``accumulated``;
+    2 — только дельты: ``{"delta": ..., "seq": n}``; полный текст — в chat_complete
+        или по запросу ``chat_resync`` (клиент заметил пропуск seq).
+
+В обеих версиях токены склеиваются в кадры: раз в CHAT_STREAM_FLUSH_MS мс
+или по накоплении CHAT_STREAM_FLUSH_BYTES символов.
+"""
+
+import asyncio
+import os
+from typing import Any, Dict, List, Optional
+
+from backend.settings.logging import get_logger
+from backend.settings.logging.errors import logged_suppress
+
+logger = get_logger(__name__)
+
+STREAM_PROTOCOL_LEGACY = 1
+STREAM_PROTOCOL_DELTA = 2
+SUPPORTED_STREAM_PROTOCOLS = (STREAM_PROTOCOL_LEGACY, STREAM_PROTOCOL_DELTA)
+
+# sid -> {ключ потока (имя модели или "") -> writer}; нужен для ответа на chat_resync.
+_active_streams: Dict[str, Dict[str, "ChatStreamWriter"]] = {}
+
+
+def negotiate_stream_protocol(auth: Any) -> int:
+    """Версия протокола из handshake: максимальная поддерживаемая не выше запрошенной."""
+    requested = auth.get("stream_protocol") if isinstance(auth, dict) else None
+    try:
+        version = int(requested)
+    except (TypeError, ValueError):
+        return STREAM_PROTOCOL_LEGACY
+    supported = [v for v in SUPPORTED_STREAM_PROTOCOLS if v <= version]
+    return max(supported) if supported else STREAM_PROTOCOL_LEGACY
+
+
+def stream_flush_env() -> tuple:
+    """(интервал склейки в секундах, порог в символах)."""
+    try:
+        flush_ms = float(os.getenv("CHAT_STREAM_FLUSH_MS", "40"))
+    except ValueError:
+        flush_ms = 40.0
+    try:
+        flush_chars = int(os.getenv("CHAT_STREAM_FLUSH_BYTES", "512"))
+    except ValueError:
+        flush_chars = 512
+    return max(0.0, flush_ms) / 1000.0, max(1, flush_chars)
+
+
+async def socket_stream_protocol(sio, sid) -> int:
+    try:
+        session = await sio.get_session(sid)
+    except Exception:
+        return STREAM_PROTOCOL_LEGACY
+    return int((session or {}).get("stream_protocol") or STREAM_PROTOCOL_LEGACY)
+
+
+def resync_payload(sid: str, stream_key: str = "") -> Optional[Dict[str, Any]]:
+    writer = _active_streams.get(sid, {}).get(stream_key)
+    return writer.resync_payload() if writer is not None else None
+
+
+def drop_socket_streams(sid: str) -> None:
+    """Сокет закрыт: остановить задачи его writer'ов — досылать кадры уже некуда."""
+    for writer in (_active_streams.pop(sid, None) or {}).values():
+        writer.cancel()
+
+
+class ChatStreamWriter:
+    """Склейка токенов в кадры и отправка их по порядку одной задачей.
+
+    ``push`` синхронный и вызывается в event loop (stream_callback провайдера);
+    из потоков — через ``loop.call_soon_threadsafe(writer.push, ...)``.
+    ``seq`` общий для content и reasoning: клиент по нему видит пропуски.
+    """
+
+    def __init__(
+        self,
+        sio,
+        sid: str,
+        *,
+        protocol: int = STREAM_PROTOCOL_LEGACY,
+        event: str = "chat_chunk",
+        thinking_event: str = "chat_thinking",
+        stream_key: str = "",
+        extra: Optional[Dict[str, Any]] = None,
+        flush_interval: Optional[float] = None,
+        flush_chars: Optional[int] = None,
+    ):
+        env_interval, env_chars = stream_flush_env()
+        self.sio = sio
+        self.sid = sid
+        self.protocol = protocol
+        self.event = event
+        self.thinking_event = thinking_event
+        self.stream_key = stream_key
+        self.extra = dict(extra or {})
+        self.flush_interval = env_interval if flush_interval is None else flush_interval
+        self.flush_chars = env_chars if flush_chars is None else max(1, int(flush_chars))
+        self.seq = 0
+        # Полный текст по ролям: принятый от модели и уже отправленный клиенту.
+        self._text = {"content": "", "reasoning": ""}
+        self._sent = {"content": "", "reasoning": ""}
+        # [роль, склеенный текст, accumulated после последнего куска]
+        self._pending: List[List[str]] = []
+        self._pending_chars = 0
+        self._closing = False
+        self._ready = asyncio.Event()
+        self._full = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+        _active_streams.setdefault(sid, {})[stream_key] = self
+
+    @property
+    def text(self) -> str:
+        return self._text["content"]
+
+    @property
+    def reasoning(self) -> str:
+        return self._text["reasoning"]
+
+    def push(self, chunk: str, acc: Optional[str] = None, stream_role: str = "content") -> None:
+        if not chunk:
+            return
+        role = "reasoning" if stream_role == "reasoning" else "content"
+        if isinstance(acc, str) and acc:
+            self._text[role] = acc
+        else:
+            self._text[role] += chunk
+        if self._pending and self._pending[-1][0] == role:
+            self._pending[-1][1] += chunk
+            self._pending[-1][2] = self._text[role]
+        else:
+            self._pending.append([role, chunk, self._text[role]])
+        self._pending_chars += len(chunk)
+        self._ready.set()
+        if self._pending_chars >= self.flush_chars:
+            self._full.set()
+
+    async def _run(self) -> None:
+        while True:
+            await self._ready.wait()
+            if not self._closing and self._pending_chars < self.flush_chars and self.flush_interval > 0:
+                try:
+                    await asyncio.wait_for(self._full.wait(), self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+            segments, self._pending, self._pending_chars = self._pending, [], 0
+            self._full.clear()
+            if not self._closing:
+                self._ready.clear()
+            for role, text, acc in segments:
+                with logged_suppress(logger):
+                    await self._emit(role, text, acc)
+            if self._closing and not self._pending:
+                return
+
+    async def _emit(self, role: str, text: str, acc: str) -> None:
+        self.seq += 1
+        self._sent[role] = acc
+        if self.protocol >= STREAM_PROTOCOL_DELTA:
+            payload: Dict[str, Any] = {**self.extra, "delta": text, "seq": self.seq}
+            if role == "reasoning":
+                payload["stream_role"] = "reasoning"
+        elif role == "reasoning":
+            payload = {**self.extra, "chunk": text, "accumulated": acc, "thinking": text, "stream_role": "reasoning"}
+        else:
+            payload = {**self.extra, "chunk": text, "accumulated": acc}
+        event = self.thinking_event if role == "reasoning" and self.thinking_event else self.event
+        await self.sio.emit(event, payload, room=self.sid)
+
+    def resync_payload(self) -> Dict[str, Any]:
+        """Полный отправленный текст на момент последнего кадра (seq)."""
+        return {
+            **self.extra,
+            "seq": self.seq,
+            "accumulated": self._sent["content"],
+            "thinking": self._sent["reasoning"],
+        }
+
+    def cancel(self) -> None:
+        """Остановить отправку без досылки остатка."""
+        self._closing = True
+        self._task.cancel()
+
+    async def aclose(self) -> None:
+        """Отправить остаток и дождаться последнего кадра (вызывать до chat_complete)."""
+        self._closing = True
+        self._ready.set()
+        self._full.set()
+        # wait, а не await: задачу мог отменить drop_socket_streams — это не отмена вызывающего
+        await asyncio.wait({self._task})
+        if not self._task.cancelled() and self._task.exception() is not None:
+            logger.debug("Подавлено исключение", exc_info=self._task.exception())
+        streams = _active_streams.get(self.sid)
+        if streams and streams.get(self.stream_key) is self:
+            streams.pop(self.stream_key, None)
+            if not streams:
+                _active_streams.pop(self.sid, None)
@@ -572,7 +572,7 @@ async def upload_document(request: Request, file: Annotated[UploadFile, File(...
                 with logged_suppress(logger):
                     minio_client.delete_file(file_object_name, bucket_name=documents_bucket)
             raise HTTPException(status_code=400, detail=rag_result.get("error", "Ошибка индексации"))
-        bump_rag_semantic_cache()
+        await bump_rag_semantic_cache("global")
         result = {
             "message": "Документ успешно загружен",
             "filename": file.filename,
@@ -676,7 +676,7 @@ async def delete_document(filename: str, request: Request):
         except Exception as e:
             logger.exception("Ошибка операции")
             raise HTTPException(status_code=502, detail=f"Ошибка RAG-сервиса: {e}") from e
-        bump_rag_semantic_cache()
+        await bump_rag_semantic_cache("global")
         new_docs = await rag_client.list_documents()
         _fsize = 0
         _oid = None
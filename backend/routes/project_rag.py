@@ -112,7 +112,7 @@ async def project_rag_upload(
                     _delete_rag_source_file(file_object_name, project_bucket)
             logger.exception("SVC-RAG project-rag индексация")
             raise HTTPException(status_code=422, detail=str(e)) from e
-        bump_rag_semantic_cache()
+        await bump_rag_semantic_cache("project", project_id=project_id)
         return result
     except HTTPException:
         raise
@@ -146,7 +146,7 @@ async def project_rag_delete_document(project_id: str, document_id: int):
         if not out.get("ok"):
             raise HTTPException(status_code=404, detail="Документ не найден")
         _delete_rag_source_file(out.get("minio_object"), out.get("minio_bucket"))
-        bump_rag_semantic_cache()
+        await bump_rag_semantic_cache("project", project_id=project_id, document_id=document_id)
         return {"ok": True, "document_id": document_id}
     except HTTPException:
         raise
@@ -198,7 +198,7 @@ async def delete_project(project_id: str):
                 for key_info in minio_keys:
                     _delete_rag_source_file(key_info.get("minio_object"), key_info.get("minio_bucket"))
             logger.info(f"project_id={project_id}: удалено RAG-документов: {rag_out.get('deleted_count', 0)}")
-            bump_rag_semantic_cache()
+            await bump_rag_semantic_cache("project", project_id=project_id)
         except Exception as e:
             logger.exception("Ошибка удаления RAG проекта")
             errors.append(f"RAG: {e}")
@@ -263,7 +263,7 @@ async def reset_rag_settings(current_user: Annotated[dict, Depends(get_current_u
             }
         )
         merged = await save_user_rag_settings(user_id, defaults)
-        bump_rag_semantic_cache()
+        await bump_rag_semantic_cache()
         return {"message": "Настройки RAG сброшены", "success": True, **settings_response_dict(merged)}
     except HTTPException:
         raise
@@ -456,7 +456,7 @@ async def update_rag_settings(
         merged = await save_user_rag_settings(user_id, updates)
 
         if "rag_chat_top_k" in updates or "rag_rerank_top_n" in updates:
-            bump_rag_semantic_cache()
+            await bump_rag_semantic_cache()
 
         _chunk_after = (
             str(merged.get("rag_chunking_strategy") or ""),
@@ -660,7 +660,7 @@ async def _select_phoenix_rag_model(model_type: str, model_path: str, user_id: s
     state_attr = path_key
     setattr(state, state_attr, model_path)
     save_app_settings({path_key: model_path})
-    bump_rag_semantic_cache()
+    await bump_rag_semantic_cache()
     if isinstance(result, dict):
         result = {
             **result,
@@ -764,7 +764,7 @@ async def select_rag_model(
         await save_user_rag_settings(user_id, {path_key: model_path})
         setattr(state, path_key, model_path)
         save_app_settings({path_key: model_path})
-        bump_rag_semantic_cache()
+        await bump_rag_semantic_cache()
         if isinstance(result, dict):
             result = {
                 **result,
@@ -847,7 +847,7 @@ async def kb_upload_document(
                 with logged_suppress(logger):
                     _delete_rag_source_file(file_object_name, file_bucket)
             raise
-        bump_rag_semantic_cache()
+        await bump_rag_semantic_cache("kb")
         return out
     except HTTPException:
         raise
@@ -880,7 +880,7 @@ async def kb_delete_document(document_id: int):
             raise HTTPException(status_code=404, detail="Документ не найден")
         if isinstance(out, dict):
             _delete_rag_source_file(out.get("minio_object"), out.get("minio_bucket"))
-        bump_rag_semantic_cache()
+        await bump_rag_semantic_cache("kb", document_id=document_id)
         return {"ok": True, "document_id": document_id}
     except HTTPException:
         raise
@@ -960,7 +960,7 @@ async def memory_rag_upload(
                     detail="Таймаут ответа SVC-RAG при индексации (большой файл или медленный embed). Увеличьте SVC_RAG_INDEX_READ_TIMEOUT (секунды) для backend, по умолчанию 900.",
                 ) from e
             raise HTTPException(status_code=502, detail=str(e)) from e
-        bump_rag_semantic_cache()
+        await bump_rag_semantic_cache("memory")
         return result
     except HTTPException:
         raise
@@ -992,7 +992,7 @@ async def memory_rag_delete(document_id: int):
         if not out.get("ok"):
             raise HTTPException(status_code=404, detail="Документ не найден")
         _delete_rag_source_file(out.get("minio_object"), out.get("minio_bucket"))
-        bump_rag_semantic_cache()
+        await bump_rag_semantic_cache("memory", document_id=document_id)
         return {"ok": True, "document_id": document_id}
     except HTTPException:
         raise
@@ -16,6 +16,8 @@ from backend.app_state import (
 )
 import backend.app_state as state
 from backend.settings.logging import get_logger
+from backend.rag_query.semantic_cache import semantic_cache_stats
+from backend.utils.http_clients import http_pool_metrics
 
 router = APIRouter(tags=["system"])
 logger = get_logger(__name__)
@@ -93,6 +95,8 @@ async def health_check():
                 "transcriber": UniversalTranscriber is not None,
                 "mcp": mcp_status,
             },
+            "http_pools": http_pool_metrics(),
+            "rag_semantic_cache": semantic_cache_stats(),
         }
     except Exception as e:
         return {"status": "unhealthy", "error": str(e), "timestamp": datetime.now().isoformat()}
@@ -8,6 +8,7 @@ import re
 from typing import Any
 
 from backend.settings.logging import get_logger
+from backend.utils.llm_priority import PRIORITY_BACKGROUND, llm_request_priority
 
 logger = get_logger(__name__)
 
@@ -122,16 +123,18 @@ def _generate_sync(
         f"{dialogue}"
     )
 
-    response = ask_agent(
-        prompt,
-        history=None,
-        max_tokens=256,
-        streaming=False,
-        model_path=model_path,
-        system_prompt=FOLLOW_UP_SYSTEM_PROMPT,
-        temperature=0.6,
-        enable_thinking=False,
-    )
+    # Подсказки не блокируют ответ пользователю — фоновый класс в очереди llm-svc
+    with llm_request_priority(PRIORITY_BACKGROUND):
+        response = ask_agent(
+            prompt,
+            history=None,
+            max_tokens=256,
+            streaming=False,
+            model_path=model_path,
+            system_prompt=FOLLOW_UP_SYSTEM_PROMPT,
+            temperature=0.6,
+            enable_thinking=False,
+        )
     if not response:
         return []
     return _parse_suggestions(str(response))
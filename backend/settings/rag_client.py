@@ -2,6 +2,7 @@
 Тонкий async-клиент для SVC-RAG.
 """
 
+import asyncio
 import os
 import uuid
 from typing import Any, Dict, List, Optional, Tuple, Union
@@ -11,6 +12,7 @@ import httpx
 
 from backend.settings.config import get_settings
 from backend.settings.logging import get_logger
+from backend.utils.http_clients import pooled_client
 from backend.settings.logging.errors import logged_suppress
 from backend.rag_query.llm_judge import judge_and_filter_hits
 
@@ -105,6 +107,18 @@ def _log_backend_rag_strategy_banner(
     logger.debug(bar)
 
 
+def _search_store(path: str) -> str:
+    """Хранилище по пути поиска SVC-RAG — область инвалидации semantic cache."""
+    p = path.strip("/")
+    if p.startswith("kb/"):
+        return "kb"
+    if p.startswith("memory-rag/"):
+        return "memory"
+    if p.startswith("project-rag/"):
+        return "project"
+    return "global"
+
+
 class RagClient:
     """
     Тонкий async‑клиент для SVC-RAG.
@@ -156,7 +170,7 @@ class RagClient:
         _cef_rid = uuid.uuid4().hex
         _cef_skip = path.rstrip("/") in ("/health",)
         try:
-            async with httpx.AsyncClient(timeout=client_timeout) as client:
+            async with pooled_client(timeout=client_timeout) as client:
                 resp = await client.request(method=method, url=url, json=json, files=files, data=data, params=params)
                 resp.raise_for_status()
                 result = resp.json()
@@ -229,11 +243,15 @@ class RagClient:
             if t and t not in order_q:
                 order_q.append(t)
         vq = base_body.get("vector_query")
+        bodies = []
         for idx, qtext in enumerate(order_q):
             body = {**base_body, "query": qtext}
             if idx > 0 or not vq:
                 body.pop("vector_query", None)
-            resp = await self._request("POST", path, json=body)
+            bodies.append(body)
+        # Варианты ищутся параллельно; слияние — в исходном порядке запросов.
+        responses = await asyncio.gather(*(self._request("POST", path, json=b) for b in bodies))
+        for resp in responses:
             for tup in self._parse_hits(resp):
                 key = (tup[2], tup[3])
                 prev = merged.get(key)
@@ -256,7 +274,15 @@ class RagClient:
     ) -> List[Tuple[str, float, Optional[int], Optional[int]]]:
         from backend.rag_query.pipeline import process_user_query
         from backend.rag_query.postprocess import dedupe_rag_hits
-        from backend.rag_query.semantic_cache import cache_get, cache_set, make_cache_key, semantic_cache_enabled
+        from backend.rag_query.metadata_filters import extract_filters_from_query
+        from backend.rag_query.preprocess import normalize_query
+        from backend.rag_query.semantic_cache import (
+            CacheScope,
+            cache_get,
+            cache_set,
+            make_params_key,
+            semantic_cache_enabled,
+        )
         from backend.services.user_rag_settings import get_runtime_rag_settings
 
         st = (strategy or "").strip().lower()
@@ -283,10 +309,6 @@ class RagClient:
         _fix = bool(user_rag.get("rag_query_fix_typos", False))
         _multi = bool(user_rag.get("rag_multi_query_enabled", False))
         _hyde = bool(user_rag.get("rag_hyde_enabled", False))
-        pq = await process_user_query(query, fix_typos=_fix, multi_query=_multi, hyde=_hyde)
-        body: Dict[str, Any] = {"query": pq.query_for_search, "k": k}
-        if document_id is not None:
-            body["document_id"] = document_id
         _rr_enabled = bool(user_rag.get("rag_reranking_enabled", False))
         effective_reranking = bool(use_reranking) if use_reranking is not None else _rr_enabled
         if strategy and str(strategy).strip().lower() == "lexical":
@@ -296,56 +318,67 @@ class RagClient:
         except (TypeError, ValueError):
             rerank_top_n = 0
         rerank_top_n = max(0, min(rerank_top_n, 64))
-        body["use_reranking"] = effective_reranking
-        logger.debug(
-            "[RAG-SEARCH] mode=%s strategy=%s k=%s reranking=%s rerank_top_n=%s"
-            " fix_typos=%s multi_query=%s hyde=%s document_id=%s project_id=%s",
-            path,
-            strategy,
-            k,
-            effective_reranking,
-            rerank_top_n,
-            _fix,
-            _multi,
-            _hyde,
-            document_id,
-            project_id,
+        # Кэш смотрим до препроцесса: попадание экономит и вызовы LLM (опечатки/HyDE), и поиск.
+        use_cache = semantic_cache_enabled()
+        cache_query = normalize_query(query)
+        cache_scope = CacheScope(
+            store=_search_store(path),
+            project_id=str(project_id) if project_id is not None else None,
+            document_id=int(document_id) if document_id is not None else None,
         )
-        if strategy is not None:
-            body["strategy"] = strategy
-        if pq.vector_query:
-            body["vector_query"] = pq.vector_query
-        if pq.filters:
-            body["filters"] = pq.filters
-        cache_key = make_cache_key(
+        cache_params = make_params_key(
             path,
-            pq.normalized,
+            cache_query,
             k,
             f"{strategy}|topn={rerank_top_n if effective_reranking else 0}",
-            document_id,
             effective_reranking,
-            pq.filters,
-            project_id,
+            extract_filters_from_query(cache_query),
             rag_fix_typos=_fix,
             rag_multi_query=_multi,
             rag_hyde=_hyde,
         )
-        if semantic_cache_enabled():
-            cached = cache_get(cache_key)
+        cache_lookup = None
+        if use_cache:
+            cached, cache_lookup = await cache_get(cache_scope, cache_params, cache_query)
             if cached is not None:
                 hits_cached = dedupe_rag_hits(cached, jaccard_threshold=_dedupe_jaccard_threshold())
                 _log_backend_rag_strategy_banner(
                     path=path,
-                    strategy=body.get("strategy"),
+                    strategy=strategy,
                     k=k,
                     document_id=document_id,
                     use_reranking=use_reranking,
                     hits=len(hits_cached),
-                    query_preview=_rag_query_preview(pq.query_for_search),
+                    query_preview=_rag_query_preview(cache_query),
                     prep_suffix="",
                     from_cache=True,
                 )
                 return hits_cached
+        pq = await process_user_query(query, fix_typos=_fix, multi_query=_multi, hyde=_hyde)
+        body: Dict[str, Any] = {"query": pq.query_for_search, "k": k}
+        if document_id is not None:
+            body["document_id"] = document_id
+        body["use_reranking"] = effective_reranking
+        logger.debug(
+            "[RAG-SEARCH] mode=%s strategy=%s k=%s reranking=%s rerank_top_n=%s"
+            " fix_typos=%s multi_query=%s hyde=%s document_id=%s project_id=%s",
+            path,
+            strategy,
+            k,
+            effective_reranking,
+            rerank_top_n,
+            _fix,
+            _multi,
+            _hyde,
+            document_id,
+            project_id,
+        )
+        if strategy is not None:
+            body["strategy"] = strategy
+        if pq.vector_query:
+            body["vector_query"] = pq.vector_query
+        if pq.filters:
+            body["filters"] = pq.filters
         if pq.multi_variants:
             hits = await self._merge_variant_searches(path, body, pq.multi_variants, k)
         else:
@@ -356,8 +389,8 @@ class RagClient:
             if rerank_top_n > 0:
                 hits = hits[: max(1, min(rerank_top_n, k))]
         hits = await judge_and_filter_hits(pq.query_for_search, hits)
-        if semantic_cache_enabled():
-            cache_set(cache_key, hits)
+        if use_cache:
+            await cache_set(cache_scope, cache_params, cache_query, hits, cache_lookup)
         prep_bits: List[str] = []
         if pq.multi_variants:
             prep_bits.append("multi-query")
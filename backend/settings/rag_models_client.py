@@ -5,12 +5,13 @@
 from __future__ import annotations
 
 import os
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional
 
 import httpx
 
 from backend.settings.config import get_settings
 from backend.settings.logging import get_logger
+from backend.utils.http_clients import pooled_client
 
 logger = get_logger(__name__)
 
@@ -51,7 +52,7 @@ class RagModelsClient:
         params: Optional[Dict[str, Any]] = None,
     ) -> Any:
         url = _rag_models_request_url(self.base_url, path)
-        async with httpx.AsyncClient(timeout=self.timeout) as client:
+        async with pooled_client(timeout=self.timeout) as client:
             resp = await client.request(method=method, url=url, json=json, params=params)
             if resp.is_error:
                 detail = None
@@ -85,6 +86,10 @@ class RagModelsClient:
     async def health(self) -> Dict[str, Any]:
         return await self._request("GET", "/health")
 
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        data = await self._request("POST", "/embed", json={"texts": list(texts)})
+        return data.get("embeddings") or []
+
 
 _rag_models_client_singleton: Optional[RagModelsClient] = None
 
@@ -0,0 +1,101 @@
+import asyncio
+import unittest
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from unittest import mock
+
+import pytest
+
+try:
+    from backend.database import memory_service
+except Exception as e:  # noqa: BLE001
+    pytest.skip(f"backend runtime deps unavailable: {e}", allow_module_level=True)
+
+CID = "conv_test"
+_T0 = datetime(2024, 1, 1, 12, 0, 0)
+
+
+def _message(i, role="user"):
+    return SimpleNamespace(role=role, content=f"m{i}", timestamp=_T0 + timedelta(seconds=i))
+
+
+class _FakeRepo:
+    """get_recent_messages по списку сообщений; считает обращения к «базе»."""
+
+    def __init__(self, messages):
+        self.messages = list(messages)
+        self.reads = 0
+        self.during_read = None
+
+    async def get_recent_messages(self, conversation_id, limit):
+        self.reads += 1
+        if self.during_read is not None:
+            self.during_read()
+        return self.messages if limit is None else self.messages[-limit:]
+
+
+class TestRecentHistoryCache(unittest.TestCase):
+    def setUp(self):
+        self.repo = _FakeRepo(_message(i) for i in range(10))
+        for target, value in (
+            ("_history_cache", memory_service._RecentHistoryCache()),
+            ("conversation_repo", self.repo),
+            ("_check_mongodb_available", lambda: True),
+        ):
+            patcher = mock.patch.object(memory_service, target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _history(self, max_entries):
+        return asyncio.run(memory_service.get_recent_dialog_history_mongodb(max_entries, CID))
+
+    def _contents(self, max_entries):
+        return [item["content"] for item in self._history(max_entries)]
+
+    def test_cached_tail_serves_smaller_limit(self):
+        self.assertEqual(self._contents(8), [f"m{i}" for i in range(2, 10)])
+        self.assertEqual(self._contents(3), ["m7", "m8", "m9"])
+        self.assertEqual(self.repo.reads, 1)
+        # Хвоста из 8 не хватает на 9 сообщений и на всю историю
+        self.assertEqual(len(self._history(9)), 9)
+        self.assertEqual(len(self._history(None)), 10)
+        self.assertEqual(self.repo.reads, 3)
+        # Вся история загружена — любой лимит из кэша
+        self.assertEqual(len(self._history(20)), 10)
+        self.assertEqual(self.repo.reads, 3)
+
+    def test_add_message_appends_to_cached_tail(self):
+        self._history(5)
+        new = _message(10, role="assistant")
+        self.repo.messages.append(new)
+        memory_service._on_conversation_changed(CID, new)
+
+        expected = [memory_service._history_entry(m.role, m.content, m.timestamp) for m in self.repo.messages[-6:]]
+        self.assertEqual(self._history(6), expected)
+        self.assertEqual(self.repo.reads, 1)
+
+    def test_edit_and_removal_invalidate(self):
+        self._history(5)
+        self.repo.messages[-1] = SimpleNamespace(role="user", content="edited", timestamp=_T0)
+        memory_service._on_conversation_changed(CID)
+        self.assertEqual(self._contents(5)[-1], "edited")
+        self.assertEqual(self.repo.reads, 2)
+
+        self.repo.messages = []
+        memory_service.invalidate_dialog_history_cache()  # удаление всех диалогов пользователя
+        self.assertEqual(self._history(5), [])
+        self.assertEqual(self.repo.reads, 3)
+
+    def test_read_overlapping_write_is_not_stored(self):
+        # Запись пришла, пока чтение из базы было «в полёте»: его результат устарел
+        self.repo.during_read = lambda: memory_service._on_conversation_changed(CID)
+        self._history(5)
+        self.repo.during_read = None
+        self._history(5)
+        self.assertEqual(self.repo.reads, 2)
+        self._history(5)
+        self.assertEqual(self.repo.reads, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+import asyncio
+import gc
+import threading
+import unittest
+
+import httpx
+
+import pytest
+
+try:
+    from backend.utils.http_clients import HttpClientRegistry, PooledHttpClient
+except Exception as e:  # noqa: BLE001
+    pytest.skip(f"backend runtime deps unavailable: {e}", allow_module_level=True)
+
+
+class TestHttpClientRegistryLoops(unittest.TestCase):
+    def test_asyncio_run_cycles_leave_no_clients(self):
+        registry = HttpClientRegistry()
+        clients = []
+
+        async def call():
+            clients.append(registry.client_for("http://llm-svc:8000/v1/health"))
+            clients.append(registry.client_for("http://svc-rag:8001/search"))
+
+        for _ in range(20):
+            asyncio.run(call())
+        gc.collect()
+
+        self.assertEqual(registry.clients_created, 40)
+        self.assertEqual(registry._clients, {})
+        self.assertEqual(registry._guards, {})
+        self.assertTrue(all(c.is_closed for c in clients))
+        loops = [o for o in gc.get_objects() if isinstance(o, asyncio.AbstractEventLoop) and o.is_closed()]
+        self.assertEqual(loops, [])
+
+    def test_client_reused_within_loop(self):
+        registry = HttpClientRegistry()
+
+        async def call():
+            a = registry.client_for("http://llm-svc:8000/a")
+            b = registry.client_for("http://llm-svc:8000/b")
+            return a is b
+
+        self.assertTrue(asyncio.run(call()))
+        self.assertEqual(registry.clients_created, 1)
+
+    def test_loop_closed_without_shutdown_is_forgotten(self):
+        registry = HttpClientRegistry()
+
+        async def call():
+            registry.client_for("http://llm-svc:8000/v1/health")
+
+        loop = asyncio.new_event_loop()
+        loop.run_until_complete(call())
+        loop.close()
+        asyncio.run(call())
+
+        self.assertNotIn(loop, registry._clients)
+        self.assertEqual(registry._clients, {})
+
+    def test_aclose_closes_current_loop_clients(self):
+        registry = HttpClientRegistry()
+
+        async def call():
+            client = registry.client_for("http://llm-svc:8000/v1/health")
+            await registry.aclose()
+            return client
+
+        client = asyncio.run(call())
+        self.assertTrue(client.is_closed)
+        self.assertEqual(registry._clients, {})
+
+
+class TestHttpClientRegistryThreads(unittest.TestCase):
+    def test_asyncio_run_threads_share_registry(self):
+        registry = HttpClientRegistry()
+        transport = httpx.MockTransport(lambda request: httpx.Response(200))
+        errors = []
+        start = threading.Barrier(8)
+
+        async def call(n):
+            pooled = PooledHttpClient(registry)
+            for i in range(6):
+                client = registry.client_for(f"http://host-{n}-{i}:8000/")
+                # Соединений не открываем: транспорт-заглушка вместо сети
+                client._transport = transport
+                await pooled.get(f"http://host-{n}-{i}:8000/")
+                registry.get_metrics()
+
+        def worker(n):
+            start.wait()
+            for _ in range(3):
+                try:
+                    asyncio.run(call(n))
+                except Exception as e:  # noqa: BLE001
+                    errors.append(e)
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(registry._clients, {})
+        self.assertEqual(registry.clients_created, 8 * 3 * 6)
+        hosts = registry.get_metrics()["hosts"]
+        self.assertEqual(sum(h["requests"] for h in hosts.values()), 8 * 3 * 6)
+        self.assertTrue(all(h["in_flight"] == 0 and h["errors"] == 0 for h in hosts.values()))
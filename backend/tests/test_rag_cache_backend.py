@@ -0,0 +1,77 @@
+import asyncio
+import time
+import unittest
+
+import pytest
+
+try:
+    from backend.rag_query.cache_backend import InProcessCacheBackend, RagCacheBackend, RedisCacheBackend
+except Exception as e:  # noqa: BLE001
+    pytest.skip(f"backend runtime deps unavailable: {e}", allow_module_level=True)
+
+fakeredis = pytest.importorskip("fakeredis")
+
+
+class TestRagCacheBackendInterface(unittest.TestCase):
+    def test_base_is_abstract(self):
+        with self.assertRaises(TypeError):
+            RagCacheBackend()
+
+    def test_in_process_generations(self):
+        backend = InProcessCacheBackend()
+        self.assertEqual(asyncio.run(backend.bump_generations(["kb"])), {"kb": 1})
+        self.assertEqual(asyncio.run(backend.get_generations(["kb", "all"])), [1, 0])
+
+
+class TestRedisCacheBackend(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.server = fakeredis.FakeServer()
+        self.backends = []
+
+    async def asyncTearDown(self):
+        for backend in self.backends:
+            await backend.aclose()
+
+    def _backend(self, **kwargs):
+        backend = RedisCacheBackend("redis://fake", client=fakeredis.FakeAsyncRedis(server=self.server), **kwargs)
+        self.backends.append(backend)
+        return backend
+
+    async def test_generation_bump_visible_to_other_replica(self):
+        a, b = self._backend(), self._backend()
+        self.assertEqual(await b.get_generations(["all", "project:7"]), [0, 0])
+
+        self.assertEqual(await a.bump_generations(["project:7"]), {"project:7": 1})
+        await a.bump_generations(["project:7"])
+
+        self.assertEqual(await b.get_generations(["all", "project:7"]), [0, 2])
+
+    async def test_pubsub_invalidation_reaches_other_replica(self):
+        a, b = self._backend(), self._backend()
+        received = asyncio.Event()
+        seen = []
+
+        def on_invalidate(bumped):
+            seen.append(bumped)
+            received.set()
+
+        await b.start(on_invalidate)
+        await asyncio.sleep(0.05)  # подписка успевает встать
+        await a.bump_generations(["kb"])
+
+        await asyncio.wait_for(received.wait(), 2.0)
+        self.assertEqual(seen, [{"kb": 1}])
+
+    async def test_entries_shared_between_replicas(self):
+        a, b = self._backend(), self._backend()
+        await a.store_entry("p1", "q1", b"payload", ttl=60)
+        self.assertEqual(await b.load_partition("p1"), {"q1": b"payload"})
+
+    async def test_expired_and_excess_entries_pruned(self):
+        backend = self._backend(max_entries=3)
+        await backend.store_entry("p1", "old", b"x", ttl=0.01)
+        time.sleep(0.02)
+        for i in range(5):
+            await backend.store_entry("p1", f"q{i}", b"x", ttl=60)
+
+        self.assertEqual(set(await backend.load_partition("p1")), {"q2", "q3", "q4"})
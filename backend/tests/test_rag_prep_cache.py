@@ -0,0 +1,49 @@
+import sys
+import types
+import unittest
+from unittest import mock
+
+import pytest
+
+try:
+    from backend.rag_query import pipeline
+except Exception as e:  # noqa: BLE001
+    pytest.skip(f"backend runtime deps unavailable: {e}", allow_module_level=True)
+
+
+def _fake_agent(reply):
+    async def ask_agent_async(prompt, **kwargs):
+        return reply
+
+    module = types.ModuleType("backend.agent_llm_svc")
+    module.ask_agent_async = ask_agent_async
+    return mock.patch.dict(sys.modules, {"backend.agent_llm_svc": module})
+
+
+class TestPrepCacheSkipsLLMFailures(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        pipeline._prep_cache.clear()
+
+    async def test_error_reply_is_not_used_nor_cached(self):
+        with _fake_agent("Ошибка при обращении к модели."):
+            result = await pipeline.process_user_query("договор поставки", fix_typos=True)
+
+        self.assertEqual(result.query_for_search, "договор поставки")
+        self.assertEqual(len(pipeline._prep_cache), 0)
+
+    async def test_busy_reply_with_expansion_is_not_cached(self):
+        from backend.llm_client import _LLM_SVC_BUSY_MESSAGE
+
+        with _fake_agent(_LLM_SVC_BUSY_MESSAGE):
+            result = await pipeline.process_user_query("договор поставки", multi_query=True, hyde=True)
+
+        self.assertIsNone(result.multi_variants)
+        self.assertIsNone(result.vector_query)
+        self.assertEqual(len(pipeline._prep_cache), 0)
+
+    async def test_successful_steps_are_cached(self):
+        with _fake_agent("договор поставки товара"):
+            result = await pipeline.process_user_query("договор поставки", fix_typos=True)
+
+        self.assertEqual(result.query_for_search, "договор поставки товара")
+        self.assertEqual(len(pipeline._prep_cache), 1)
@@ -0,0 +1,134 @@
+import os
+import unittest
+from collections import OrderedDict
+from unittest import mock
+
+import pytest
+
+try:
+    import numpy as np
+
+    from backend.rag_query import semantic_cache
+    from backend.rag_query.cache_backend import InProcessCacheBackend, set_rag_cache_backend
+    from backend.rag_query.semantic_cache import (
+        CacheScope,
+        bump_rag_semantic_cache,
+        cache_get,
+        cache_set,
+        make_params_key,
+    )
+except Exception as e:  # noqa: BLE001
+    pytest.skip(f"backend runtime deps unavailable: {e}", allow_module_level=True)
+
+
+def _unit(*values):
+    vec = np.asarray(values, dtype=np.float32)
+    return vec / np.linalg.norm(vec)
+
+
+KB = CacheScope("kb")
+PROJECT = CacheScope("project", project_id="7")
+
+
+class TestSemanticCache(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.vectors = {}
+        env = mock.patch.dict(os.environ, {"RAG_SEMANTIC_CACHE": "1", "RAG_SEMANTIC_CACHE_THRESHOLD": "0.95"})
+        env.start()
+        self.addCleanup(env.stop)
+
+        async def fake_embed(text):
+            return self.vectors.get(text)
+
+        embed = mock.patch.object(semantic_cache, "embed_query", fake_embed)
+        embed.start()
+        self.addCleanup(embed.stop)
+        for name, value in {
+            "_partitions": {},
+            "_lru": OrderedDict(),
+            "_bytes": 0,
+            "_stats": dict.fromkeys(semantic_cache._stats, 0),
+        }.items():
+            patcher = mock.patch.object(semantic_cache, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        set_rag_cache_backend(InProcessCacheBackend())
+        self.addCleanup(set_rag_cache_backend, None)
+
+    @staticmethod
+    def _params(query):
+        return make_params_key("/search", query, 5, "hybrid", True, None)
+
+    async def _remember(self, scope, query, hits, params=None):
+        params = params or self._params(query)
+        found, lookup = await cache_get(scope, params, query)
+        self.assertIsNone(found)
+        await cache_set(scope, params, query, hits, lookup)
+
+    async def test_semantic_hit_only_above_threshold(self):
+        self.vectors = {
+            "capital of france": _unit(1, 0, 0, 0),
+            "france capital": _unit(1, 0.1, 0, 0),  # cos ≈ 0.995
+            "france cuisine": _unit(1, 0.75, 0, 0),  # cos = 0.8
+        }
+        hits = [("Paris is the capital", 0.9, 1, 0)]
+        await self._remember(KB, "capital of france", hits)
+
+        found, _ = await cache_get(KB, self._params("france capital"), "france capital")
+        self.assertEqual(found, hits)
+        found, _ = await cache_get(KB, self._params("france cuisine"), "france cuisine")
+        self.assertIsNone(found)
+        stats = semantic_cache.semantic_cache_stats()
+        self.assertEqual((stats["semantic_hits"], stats["exact_hits"]), (1, 0))
+
+    async def test_numbers_in_query_separate_entries(self):
+        # Эмбеддинги совпадают — разделяет только ключ параметров
+        self.vectors = {"report for 2023": _unit(1, 0, 0, 0), "report for 2024": _unit(1, 0, 0, 0)}
+        await self._remember(KB, "report for 2023", [("2023 revenue", 0.8, 1, 0)])
+
+        self.assertNotEqual(self._params("report for 2023"), self._params("report for 2024"))
+        found, _ = await cache_get(KB, self._params("report for 2024"), "report for 2024")
+        self.assertIsNone(found)
+        found, _ = await cache_get(KB, self._params("report for 2023"), "report for 2023")
+        self.assertEqual(found, [("2023 revenue", 0.8, 1, 0)])
+
+    async def test_kb_bump_leaves_project_entries(self):
+        self.vectors = {"vacation policy": _unit(0, 1, 0, 0)}
+        params = self._params("vacation policy")
+        await self._remember(KB, "vacation policy", [("kb doc", 0.7, 3, 0)], params)
+        await self._remember(PROJECT, "vacation policy", [("project doc", 0.7, 9, 0)], params)
+
+        await bump_rag_semantic_cache("kb", document_id=3)
+
+        found, _ = await cache_get(KB, params, "vacation policy")
+        self.assertIsNone(found)
+        found, _ = await cache_get(PROJECT, params, "vacation policy")
+        self.assertEqual(found, [("project doc", 0.7, 9, 0)])
+
+    async def test_eviction_keeps_bytes_under_budget(self):
+        budget = 1 << 20
+        os.environ["RAG_SEMANTIC_CACHE_MAX_BYTES"] = str(budget)
+        text = "x" * 100_000  # ≈ 200 КБ на запись — в бюджет помещается пять
+        queries = [f"query {chr(ord('a') + i)}" for i in range(6)]
+        self.vectors = {q: _unit(*[1.0 if j == i else 0.0 for j in range(8)]) for i, q in enumerate(queries)}
+        for q in queries[:5]:
+            await self._remember(KB, q, [(text, 0.5, 1, 0)])
+        # Обращение к первой записи переносит её в конец LRU
+        found, _ = await cache_get(KB, self._params(queries[0]), queries[0])
+        self.assertIsNotNone(found)
+
+        await self._remember(KB, queries[5], [(text, 0.5, 1, 0)])
+
+        stats = semantic_cache.semantic_cache_stats()
+        self.assertEqual(stats["evictions"], 1)
+        self.assertLessEqual(stats["bytes"], budget)
+        self.assertEqual(stats["entries"], 5)
+        found, _ = await cache_get(KB, self._params(queries[1]), queries[1])
+        self.assertIsNone(found)
+        for q in (queries[0], queries[5]):
+            found, _ = await cache_get(KB, self._params(q), q)
+            self.assertIsNotNone(found, q)
+
+
+if __name__ == "__main__":
+    unittest.main()
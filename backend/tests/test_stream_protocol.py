@@ -0,0 +1,121 @@
+import asyncio
+import unittest
+
+import pytest
+
+try:
+    from backend.realtime import stream_protocol
+    from backend.realtime.stream_protocol import (
+        STREAM_PROTOCOL_DELTA,
+        STREAM_PROTOCOL_LEGACY,
+        ChatStreamWriter,
+        drop_socket_streams,
+        resync_payload,
+    )
+except Exception as e:  # noqa: BLE001
+    pytest.skip(f"backend runtime deps unavailable: {e}", allow_module_level=True)
+
+
+class _FakeSio:
+    def __init__(self):
+        self.frames = []
+        self.emitted = asyncio.Event()
+
+    async def emit(self, event, payload, room=None):
+        self.frames.append((event, payload, room))
+        self.emitted.set()
+
+
+class TestChatStreamWriter(unittest.TestCase):
+    def tearDown(self):
+        stream_protocol._active_streams.clear()
+
+    def test_legacy_frames_carry_accumulated(self):
+        async def run():
+            sio = _FakeSio()
+            writer = ChatStreamWriter(sio, "s1", protocol=STREAM_PROTOCOL_LEGACY, flush_interval=0)
+            writer.push("Hel")
+            await asyncio.sleep(0)
+            writer.push("lo", "Hello")
+            writer.push("hmm", stream_role="reasoning")
+            await writer.aclose()
+            return sio.frames
+
+        frames = asyncio.run(run())
+        self.assertEqual(frames[0], ("chat_chunk", {"chunk": "Hel", "accumulated": "Hel"}, "s1"))
+        self.assertEqual(frames[1], ("chat_chunk", {"chunk": "lo", "accumulated": "Hello"}, "s1"))
+        event, payload, _ = frames[2]
+        self.assertEqual(event, "chat_thinking")
+        self.assertEqual(payload["accumulated"], "hmm")
+        self.assertEqual(payload["stream_role"], "reasoning")
+
+    def test_delta_frames_have_continuous_seq(self):
+        async def run():
+            sio = _FakeSio()
+            writer = ChatStreamWriter(
+                sio, "s1", protocol=STREAM_PROTOCOL_DELTA, extra={"model": "m"}, flush_interval=0
+            )
+            for chunk, role in [("a", "content"), ("b", "reasoning"), ("c", "content")]:
+                writer.push(chunk, stream_role=role)
+                await asyncio.sleep(0)
+            await writer.aclose()
+            return sio.frames
+
+        frames = asyncio.run(run())
+        payloads = [p for _, p, _ in frames]
+        self.assertEqual([p["seq"] for p in payloads], [1, 2, 3])
+        self.assertEqual([p["delta"] for p in payloads], ["a", "b", "c"])
+        self.assertTrue(all("accumulated" not in p and p["model"] == "m" for p in payloads))
+        self.assertEqual(payloads[1]["stream_role"], "reasoning")
+
+    def test_flush_by_chars_before_interval(self):
+        async def run():
+            sio = _FakeSio()
+            writer = ChatStreamWriter(sio, "s1", protocol=STREAM_PROTOCOL_DELTA, flush_interval=60, flush_chars=4)
+            writer.push("ab")
+            await asyncio.sleep(0.01)
+            early = list(sio.frames)
+            writer.push("cd")
+            await asyncio.wait_for(sio.emitted.wait(), 1)
+            flushed = list(sio.frames)
+            await writer.aclose()
+            return early, flushed
+
+        early, flushed = asyncio.run(run())
+        self.assertEqual(early, [])
+        self.assertEqual([p["delta"] for _, p, _ in flushed], ["abcd"])
+
+    def test_resync_after_gap_returns_sent_text(self):
+        async def run():
+            sio = _FakeSio()
+            writer = ChatStreamWriter(sio, "s1", protocol=STREAM_PROTOCOL_DELTA, flush_interval=0)
+            writer.push("one ")
+            await asyncio.sleep(0)
+            writer.push("two", "one two")
+            await asyncio.sleep(0)
+            # Клиент получил только seq=2 — просит полный текст
+            payload = resync_payload("s1")
+            await writer.aclose()
+            return payload, resync_payload("s1")
+
+        payload, after_close = asyncio.run(run())
+        self.assertEqual(payload["seq"], 2)
+        self.assertEqual(payload["accumulated"], "one two")
+        self.assertEqual(payload["thinking"], "")
+        self.assertIsNone(after_close)
+
+    def test_drop_socket_streams_cancels_writer(self):
+        async def run():
+            writer = ChatStreamWriter(_FakeSio(), "s1", protocol=STREAM_PROTOCOL_DELTA, flush_interval=60)
+            writer.push("pending")
+            drop_socket_streams("s1")
+            await asyncio.wait_for(writer.aclose(), 1)
+            return writer
+
+        writer = asyncio.run(run())
+        self.assertTrue(writer._task.cancelled())
+        self.assertEqual(stream_protocol._active_streams, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,302 @@
+"""
+Общий реестр долгоживущих httpx.AsyncClient для исходящих HTTP-вызовов.
+
+Раньше каждый вызов (health, поиск RAG, completion) открывал свой
+``httpx.AsyncClient`` — новый пул соединений и TLS-handshake на запрос.
+Теперь клиент один на (event loop, origin, verify) и живёт до shutdown:
+
+    async with pooled_client(timeout=10.0, verify=self._verify) as client:
+        response = await client.get(url, headers=...)
+
+``client`` — тонкая обёртка: по URL выбирает пул нужного хоста и подставляет
+timeout вызова. Закрывать ничего не нужно; пулы закрывает ``aclose_http_clients``
+в shutdown приложения.
+
+Переменные окружения:
+    HTTP_POOL_MAX_CONNECTIONS_PER_HOST — лимит соединений к одному хосту (32);
+    HTTP_POOL_MAX_KEEPALIVE            — сколько idle-соединений держать (16);
+    HTTP_POOL_KEEPALIVE_EXPIRY         — сколько секунд держать idle-соединение (30);
+    HTTP_CLIENT_HTTP2                  — включить HTTP/2 (нужен пакет ``h2``).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import threading
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+
+from backend.settings.logging import get_logger
+
+logger = get_logger(__name__)
+
+DEFAULT_TIMEOUT = httpx.Timeout(5.0)
+
+_ClientKey = Tuple[str, Any]
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+def _http2_enabled() -> bool:
+    if os.getenv("HTTP_CLIENT_HTTP2", "").strip().lower() not in ("1", "true", "yes"):
+        return False
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        logger.warning("HTTP_CLIENT_HTTP2 включён, но пакет h2 не установлен — используем HTTP/1.1")
+        return False
+    return True
+
+
+def _origin(url: str) -> str:
+    parts = urlsplit(str(url))
+    return f"{parts.scheme}://{parts.netloc}".lower()
+
+
+def _verify_key(verify: Any) -> Any:
+    # bool и путь к CA bundle сравниваются по значению, SSLContext — по объекту
+    return verify if isinstance(verify, (bool, str)) else id(verify)
+
+
+class _HostStats:
+    __slots__ = ("requests", "errors", "in_flight")
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.in_flight = 0
+
+
+class HttpClientRegistry:
+    """Пулы соединений по (event loop, origin, verify).
+
+    Клиент httpx привязан к event loop, в котором открыты его соединения; sync-обёртки
+    (``asyncio.run`` в отдельном потоке) получают свои пулы. Они закрываются, когда
+    loop завершается: ``asyncio.run`` перед закрытием вызывает ``shutdown_asyncgens``,
+    и страж-генератор этого loop (``_loop_guard``) закрывает и забывает его клиентов.
+    Клиенты loop, закрытых без этого шага, выбрасываются при следующем ``client_for``.
+
+    Реестр общий для основного loop и потоков с ``asyncio.run`` (sync-обёртки, executors
+    judge/metrics): словари и счётчики меняются и обходятся только под ``_lock``.
+    """
+
+    def __init__(self):
+        self.limits = httpx.Limits(
+            max_connections=max(1, _env_int("HTTP_POOL_MAX_CONNECTIONS_PER_HOST", 32)),
+            max_keepalive_connections=max(0, _env_int("HTTP_POOL_MAX_KEEPALIVE", 16)),
+            keepalive_expiry=max(0.0, _env_float("HTTP_POOL_KEEPALIVE_EXPIRY", 30.0)),
+        )
+        self.http2 = _http2_enabled()
+        self._clients: Dict[asyncio.AbstractEventLoop, Dict[_ClientKey, httpx.AsyncClient]] = {}
+        # Сильные ссылки на стражей: loop хранит свои async-генераторы в WeakSet
+        self._guards: Dict[asyncio.AbstractEventLoop, Any] = {}
+        self._stats: Dict[str, _HostStats] = {}
+        self.clients_created = 0
+        self._lock = threading.Lock()
+
+    def client_for(self, url: str, verify: Any = True) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        key = (_origin(url), _verify_key(verify))
+        with self._lock:
+            clients = self._clients.get(loop)
+            if clients is None:
+                self._forget_closed_loops()
+                clients = self._clients[loop] = {}
+                self._watch_loop(loop)
+            client = clients.get(key)
+            if client is None or client.is_closed:
+                client = httpx.AsyncClient(
+                    verify=verify, limits=self.limits, http2=self.http2, timeout=DEFAULT_TIMEOUT
+                )
+                clients[key] = client
+                self.clients_created += 1
+                logger.debug("HTTP pool: новый клиент для %s", key[0])
+        return client
+
+    def _watch_loop(self, loop: asyncio.AbstractEventLoop) -> None:
+        guard = self._loop_guard(loop)
+        try:
+            # Первый шаг генератора: регистрирует его в loop (firstiter hook) и доходит до yield
+            guard.asend(None).send(None)
+        except StopIteration:
+            pass
+        self._guards[loop] = guard
+
+    async def _loop_guard(self, loop: asyncio.AbstractEventLoop) -> AsyncIterator[None]:
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._guards.pop(loop, None)
+                clients = self._clients.pop(loop, {})
+            await self._aclose_clients(clients)
+
+    def _forget_closed_loops(self) -> None:
+        """Вызывать под ``_lock``."""
+        for loop in [lp for lp in self._clients if lp.is_closed()]:
+            # Закрыть клиентов в закрытом loop уже нельзя — сокеты освободит сборщик
+            self._clients.pop(loop, None)
+            self._guards.pop(loop, None)
+
+    @staticmethod
+    async def _aclose_clients(clients: Dict[_ClientKey, httpx.AsyncClient]) -> None:
+        for client in clients.values():
+            try:
+                await client.aclose()
+            except Exception as e:
+                logger.warning("HTTP pool: ошибка закрытия клиента: %s", e)
+
+    def request_started(self, url: str) -> _HostStats:
+        origin = _origin(url)
+        with self._lock:
+            stats = self._stats.get(origin)
+            if stats is None:
+                stats = self._stats[origin] = _HostStats()
+            stats.requests += 1
+            stats.in_flight += 1
+        return stats
+
+    def request_finished(self, stats: _HostStats, failed: bool) -> None:
+        with self._lock:
+            stats.in_flight -= 1
+            if failed:
+                stats.errors += 1
+
+    def get_metrics(self) -> Dict[str, Any]:
+        hosts: Dict[str, Dict[str, Any]] = {}
+        with self._lock:
+            for origin, stats in self._stats.items():
+                hosts[origin] = {
+                    "requests": stats.requests,
+                    "errors": stats.errors,
+                    "in_flight": stats.in_flight,
+                    "connections": 0,
+                    "idle_connections": 0,
+                }
+            snapshot = [list(clients.items()) for clients in self._clients.values()]
+            clients_created = self.clients_created
+        for items in snapshot:
+            for (origin, _), client in items:
+                # httpx не отдаёт состояние пула публично — читаем httpcore-пул транспорта
+                pool = getattr(getattr(client, "_transport", None), "_pool", None)
+                connections = list(getattr(pool, "connections", None) or [])
+                entry = hosts.setdefault(
+                    origin,
+                    {"requests": 0, "errors": 0, "in_flight": 0, "connections": 0, "idle_connections": 0},
+                )
+                entry["connections"] += len(connections)
+                entry["idle_connections"] += sum(1 for c in connections if getattr(c, "is_idle", lambda: False)())
+        return {
+            "clients_created": clients_created,
+            "http2": self.http2,
+            "max_connections_per_host": self.limits.max_connections,
+            "max_keepalive_connections": self.limits.max_keepalive_connections,
+            "keepalive_expiry": self.limits.keepalive_expiry,
+            "hosts": hosts,
+        }
+
+    async def aclose(self) -> None:
+        """Закрыть пулы текущего loop; пулы остальных loop закроют их стражи."""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            guard = self._guards.pop(loop, None)
+            clients = self._clients.pop(loop, {})
+            self._forget_closed_loops()
+        await self._aclose_clients(clients)
+        if guard is not None:
+            await guard.aclose()
+
+
+class PooledHttpClient:
+    """Интерфейс httpx.AsyncClient (request/get/post/put/delete/stream) поверх реестра."""
+
+    def __init__(self, registry: HttpClientRegistry, *, timeout: Any = DEFAULT_TIMEOUT, verify: Any = True):
+        self._registry = registry
+        self.timeout = timeout
+        self.verify = verify
+
+    async def request(self, method: str, url: str, **kwargs: Any) -> httpx.Response:
+        kwargs.setdefault("timeout", self.timeout)
+        client = self._registry.client_for(url, self.verify)
+        stats = self._registry.request_started(url)
+        failed = False
+        try:
+            return await client.request(method, url, **kwargs)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            self._registry.request_finished(stats, failed)
+
+    async def get(self, url: str, **kwargs: Any) -> httpx.Response:
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs: Any) -> httpx.Response:
+        return await self.request("POST", url, **kwargs)
+
+    async def put(self, url: str, **kwargs: Any) -> httpx.Response:
+        return await self.request("PUT", url, **kwargs)
+
+    async def delete(self, url: str, **kwargs: Any) -> httpx.Response:
+        return await self.request("DELETE", url, **kwargs)
+
+    @asynccontextmanager
+    async def stream(self, method: str, url: str, **kwargs: Any) -> AsyncIterator[httpx.Response]:
+        kwargs.setdefault("timeout", self.timeout)
+        client = self._registry.client_for(url, self.verify)
+        stats = self._registry.request_started(url)
+        failed = False
+        try:
+            async with client.stream(method, url, **kwargs) as response:
+                yield response
+        except Exception:
+            failed = True
+            raise
+        finally:
+            self._registry.request_finished(stats, failed)
+
+
+_registry: Optional[HttpClientRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_http_registry() -> HttpClientRegistry:
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = HttpClientRegistry()
+    return _registry
+
+
+@asynccontextmanager
+async def pooled_client(*, timeout: Any = DEFAULT_TIMEOUT, verify: Any = True) -> AsyncIterator[PooledHttpClient]:
+    """Замена ``async with httpx.AsyncClient(timeout=..., verify=...)`` без нового пула на вызов."""
+    yield PooledHttpClient(get_http_registry(), timeout=timeout, verify=verify)
+
+
+def http_pool_metrics() -> Dict[str, Any]:
+    if _registry is None:
+        return {"clients_created": 0, "hosts": {}}
+    return _registry.get_metrics()
+
+
+async def aclose_http_clients() -> None:
+    if _registry is not None:
+        await _registry.aclose()
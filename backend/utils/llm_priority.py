@@ -0,0 +1,49 @@
+"""
+Класс приоритета запросов к llm-svc (очередь ожидания свободного контекста модели).
+
+Интерактивный чат — ``interactive`` (по умолчанию). Фоновые вызовы (LLM-judge, метрики,
+проверка обоснованности, подсказки follow-up) помечаются ``background``: в очереди
+llm-svc они уступают чату, но не голодают бесконечно. Приоритет передаётся заголовком
+``X-LLM-Priority``; значение берётся из contextvar, поэтому достаточно обернуть вызов
+в ``llm_request_priority("background")`` — провайдеры и LLMClient подставят заголовок сами.
+
+Заголовок ``X-LLM-Queue-Timeout`` — сколько секунд запрос может ждать в очереди llm-svc.
+Он меньше read-timeout вызывающего: иначе llm-svc допустит к модели запрос, который
+бэкенд уже бросил, и дорожка будет генерировать ответ, который никто не прочитает.
+"""
+
+from __future__ import annotations
+
+import os
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator
+
+LLM_PRIORITY_HEADER = "X-LLM-Priority"
+LLM_QUEUE_TIMEOUT_HEADER = "X-LLM-Queue-Timeout"
+PRIORITY_INTERACTIVE = "interactive"
+PRIORITY_BACKGROUND = "background"
+
+# Доля таймаута вызова, которую запрос может простоять в очереди (остаток — на генерацию)
+LLM_QUEUE_TIMEOUT_SHARE = min(1.0, max(0.05, float(os.getenv("LLM_QUEUE_TIMEOUT_SHARE", "0.5"))))
+
+_llm_priority: ContextVar[str] = ContextVar("llm_priority", default=PRIORITY_INTERACTIVE)
+
+
+def current_llm_priority() -> str:
+    return _llm_priority.get()
+
+
+@contextmanager
+def llm_request_priority(priority: str) -> Iterator[None]:
+    """Все запросы к LLM внутри блока (включая asyncio.run в этом потоке) идут с ``priority``."""
+    token = _llm_priority.set(priority)
+    try:
+        yield
+    finally:
+        _llm_priority.reset(token)
+
+
+def llm_queue_timeout(call_timeout: float) -> str:
+    """Значение ``X-LLM-Queue-Timeout`` для вызова с таймаутом ``call_timeout`` секунд."""
+    return f"{max(1.0, float(call_timeout) * LLM_QUEUE_TIMEOUT_SHARE):g}"
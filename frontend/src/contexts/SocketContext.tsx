@@ -22,6 +22,7 @@ import type { McpToolCallRecord } from '../mcp/types';
 import { getApiUrl } from '../config/api';
 import { isLikelyImageGenerationPrompt } from '../utils/imageGenerationPrompt';
 import { readSelectedImageGenPresetId } from '../utils/imageGenerationPresets';
+import { DeltaStreamAssembler, STREAM_PROTOCOL_VERSION } from '../utils/streamProtocol';
 
 function dispatchMcpToolActivity(record: McpToolCallRecord, phase: 'start' | 'end') {
   window.dispatchEvent(new CustomEvent('astrachatMcpToolActivity', { detail: { record, phase } }));
@@ -154,6 +155,7 @@ export function SocketProvider({ children }: { children: ReactNode }) {
   const socketRecreateIntentRef = useRef(false);
   const reconnectScheduleRef = useRef<ReturnType<typeof setTimeout> | null>(null);
   const pendingSendRef = useRef<PendingSendPayload | null>(null);
+  const streamAssemblerRef = useRef(new DeltaStreamAssembler());
   const hasEverConnectedRef = useRef<boolean>(false);
   tokenRef.current = token;
 
@@ -320,6 +322,7 @@ export function SocketProvider({ children }: { children: ReactNode }) {
       forceNew: true, // Принудительно создаем новое соединение
       auth: {
         token: tokenRef.current,
+        stream_protocol: STREAM_PROTOCOL_VERSION,
       },
     });
 
@@ -385,14 +388,47 @@ export function SocketProvider({ children }: { children: ReactNode }) {
       scheduleReconnect(1000);
     });
 
+    // Протокол v2: сервер шлёт только дельты с seq — собираем accumulated здесь,
+    // чтобы handleServerMessage работал как с legacy-кадрами.
+    const streamAssembler = streamAssemblerRef.current;
+    streamAssembler.reset();
+    const assembleFrame = (data: any) => {
+      if (typeof data?.delta !== 'string') return data;
+      const model = typeof data.model === 'string' ? data.model : '';
+      const frame = streamAssembler.apply(model, data, () => {
+        newSocket.emit('chat_resync', model ? { model } : {});
+      });
+      return frame ? { ...data, ...frame } : null;
+    };
+
     // Обработка событий Socket.IO
     newSocket.on('chat_thinking', (data) => {
-      
-      handleServerMessage({ type: 'thinking', ...data });
+      const frame = assembleFrame(data);
+      if (frame) handleServerMessage({ type: 'thinking', ...frame });
     });
 
     newSocket.on('chat_chunk', (data) => {
-      handleServerMessage({ type: 'chunk', ...data });
+      const frame = assembleFrame(data);
+      if (!frame) return;
+      handleServerMessage(
+        frame.stream_role === 'reasoning' ? { type: 'thinking', ...frame } : { type: 'chunk', ...frame },
+      );
+    });
+
+    // Ответ на chat_resync: полный отправленный текст после пропуска кадров
+    newSocket.on('chat_resync', (data) => {
+      const model = typeof data?.model === 'string' ? data.model : '';
+      const state = streamAssembler.resync(model, data || {});
+      if (model) {
+        handleServerMessage({ type: 'multi_llm_chunk', model, chunk: '', accumulated: state.content });
+        return;
+      }
+      if (state.thinking) {
+        handleServerMessage({ type: 'thinking', chunk: '', accumulated: state.thinking });
+      }
+      if (state.content) {
+        handleServerMessage({ type: 'chunk', chunk: '', accumulated: state.content });
+      }
     });
 
     newSocket.on('chat_complete', (data) => {
@@ -414,7 +450,8 @@ export function SocketProvider({ children }: { children: ReactNode }) {
     });
 
     newSocket.on('multi_llm_chunk', (data) => {
-      handleServerMessage({ type: 'multi_llm_chunk', ...data });
+      const frame = assembleFrame(data);
+      if (frame) handleServerMessage({ type: 'multi_llm_chunk', ...frame });
     });
 
     newSocket.on('multi_llm_complete', (data) => {
@@ -0,0 +1,69 @@
+/**
+ * Протокол стриминга ответа (согласуется при connect через auth.stream_protocol).
+ *
+ * v1 — каждый chat_chunk несёт полный accumulated;
+ * v2 — только дельты `{ delta, seq }`. Сборщик восстанавливает accumulated,
+ * а при пропуске seq просит сервер прислать полный текст (chat_resync).
+ */
+
+export const STREAM_PROTOCOL_VERSION = 2;
+
+type StreamState = { seq: number; content: string; thinking: string; waitingResync: boolean };
+
+export type AssembledFrame = {
+  chunk: string;
+  accumulated: string;
+  stream_role?: 'reasoning';
+};
+
+export class DeltaStreamAssembler {
+  private streams = new Map<string, StreamState>();
+
+  private state(key: string): StreamState {
+    let st = this.streams.get(key);
+    if (!st) {
+      st = { seq: 0, content: '', thinking: '', waitingResync: false };
+      this.streams.set(key, st);
+    }
+    return st;
+  }
+
+  /**
+   * Кадр v2 → legacy-вид `{ chunk, accumulated }`.
+   * null — кадр пропущен из-за разрыва seq; тогда onGap() должен запросить resync.
+   */
+  apply(key: string, frame: { delta?: unknown; seq?: unknown; stream_role?: unknown }, onGap: () => void): AssembledFrame | null {
+    const delta = typeof frame.delta === 'string' ? frame.delta : '';
+    const seq = typeof frame.seq === 'number' ? frame.seq : 0;
+    // seq === 1 — новый ответ (следующий запрос или перегенерация).
+    if (seq === 1) this.streams.delete(key);
+    const st = this.state(key);
+    if (st.waitingResync) return null;
+    if (seq !== st.seq + 1) {
+      st.waitingResync = true;
+      onGap();
+      return null;
+    }
+    st.seq = seq;
+    if (frame.stream_role === 'reasoning') {
+      st.thinking += delta;
+      return { chunk: delta, accumulated: st.thinking, stream_role: 'reasoning' };
+    }
+    st.content += delta;
+    return { chunk: delta, accumulated: st.content };
+  }
+
+  /** Ответ chat_resync: полный отправленный текст на момент кадра seq. */
+  resync(key: string, payload: { seq?: unknown; accumulated?: unknown; thinking?: unknown }): StreamState {
+    const st = this.state(key);
+    st.seq = typeof payload.seq === 'number' ? payload.seq : st.seq;
+    st.content = typeof payload.accumulated === 'string' ? payload.accumulated : st.content;
+    st.thinking = typeof payload.thinking === 'string' ? payload.thinking : st.thinking;
+    st.waitingResync = false;
+    return st;
+  }
+
+  reset(): void {
+    this.streams.clear();
+  }
+}
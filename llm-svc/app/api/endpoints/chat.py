@@ -1,18 +1,111 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+import asyncio
+import os
+from typing import AsyncGenerator, Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Request, Response, status
 from fastapi.responses import StreamingResponse
 from app.models.schemas import ChatRequest
 from app.services.base_llm_handler import BaseLLMHandler
 from app.api.dependencies import get_llama_service, require_api_key
+from app.exceptions import ServiceUnavailableError
+from app.services.sse_stream import sse_frame
 import logging
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
+# Как часто проверять, не ушёл ли клиент, пока запрос ждёт дорожку модели
+DISCONNECT_POLL_SEC = max(0.05, float(os.environ.get("LLM_DISCONNECT_POLL_SEC", "1")))
+# Нестандартный статус nginx «клиент закрыл соединение» — ответ всё равно никто не прочтёт
+_CLIENT_CLOSED_REQUEST = 499
+# Место в очереди модели на момент постановки (нет заголовка — дорожка была свободна)
+QUEUE_POSITION_HEADER = "X-LLM-Queue-Position"
+
+
+class _QueuePosition:
+    """on_position запроса: первое место — для заголовка, все изменения — для SSE-комментариев."""
+
+    def __init__(self):
+        self.first: Optional[int] = None
+        self.queued = asyncio.Event()
+        self.updates: asyncio.Queue = asyncio.Queue()
+
+    def __call__(self, position: int) -> None:
+        if self.first is None:
+            self.first = position
+            self.queued.set()
+        self.updates.put_nowait(position)
+
+
+async def _wait_while_connected(
+    http_request: Request,
+    task: asyncio.Future,
+    queued: Optional[asyncio.Event] = None,
+) -> bool:
+    """
+    Ждать task (или постановки в очередь, если задан queued), пока клиент на связи.
+
+    Starlette не отменяет обработчик при разрыве соединения, пока ответ не начат: брошенный
+    запрос дождался бы своей очереди и занял дорожку генерацией, которую никто не прочтёт.
+    False — клиент ушёл; вызывающий отменяет task, это снимает запрос из очереди (или
+    отдаёт дорожку, как только доработает поток llama.cpp).
+    """
+    waits = {task}
+    if queued is not None:
+        waits.add(asyncio.ensure_future(queued.wait()))
+    try:
+        while True:
+            done, _ = await asyncio.wait(waits, timeout=DISCONNECT_POLL_SEC, return_when=asyncio.FIRST_COMPLETED)
+            if done:
+                return True
+            if await http_request.is_disconnected():
+                logger.info("Chat request: client disconnected while waiting, request cancelled")
+                return False
+    finally:
+        for waiter in waits - {task}:
+            waiter.cancel()
+
+
+async def _queued_stream(task: asyncio.Future, position: _QueuePosition) -> AsyncGenerator[str, None]:
+    """
+    Стрим запроса, который ждёт в очереди: место в ней — комментариями SSE (OpenAI-клиенты
+    их пропускают), затем ответ модели. Отключение клиента закрывает стрим и отменяет ожидание.
+    """
+    try:
+        while not task.done():
+            update = asyncio.ensure_future(position.updates.get())
+            done, _ = await asyncio.wait({task, update}, return_when=asyncio.FIRST_COMPLETED)
+            if update in done:
+                yield f": queue position {update.result()}\n\n"
+            else:
+                update.cancel()
+        try:
+            generator = task.result()
+        except Exception as e:
+            # Статус 200 уже отправлен — дедлайн очереди / ошибка приходят кадром error
+            logger.warning(f"Queued stream failed: {e}")
+            error_type = "service_unavailable" if isinstance(e, ServiceUnavailableError) else "server_error"
+            yield sse_frame({"error": {"message": str(e), "type": error_type}})
+            yield "data: [DONE]\n\n"
+            return
+        try:
+            async for chunk in generator:
+                yield chunk
+        finally:
+            await generator.aclose()
+    finally:
+        if not task.done():
+            task.cancel()
+
+
 @router.post("/chat/completions")
 async def chat_completion(
     request: ChatRequest,
+    http_request: Request,
+    http_response: Response,
     llama_service: BaseLLMHandler = Depends(get_llama_service),
     api_key: bool = Depends(require_api_key),
+    x_llm_priority: Optional[str] = Header(None, alias="X-LLM-Priority"),
+    x_llm_queue_timeout: Optional[float] = Header(None, alias="X-LLM-Queue-Timeout", gt=0),
 ):
     """
     Эндпоинт совместимый с OpenAI API для обработки запросов чата.
@@ -22,6 +115,10 @@ async def chat_completion(
                 f"Messages: {len(request.messages)}, "
                 f"Temperature: {request.temperature}, "
                 f"Stream: {request.stream}")
+    # Приоритет в очереди: поле тела запроса, иначе заголовок X-LLM-Priority (бэкенд)
+    priority = request.priority or x_llm_priority
+    # Дедлайн очереди: поле тела, иначе X-LLM-Queue-Timeout — бэкенд ставит его меньше своего таймаута
+    queue_timeout = request.queue_timeout if request.queue_timeout is not None else x_llm_queue_timeout
     if not llama_service.is_model_id_loaded(request.model):
         loaded = getattr(llama_service, "get_loaded_model_ids", lambda: [])()
         logger.info(
@@ -36,37 +133,56 @@ async def chat_completion(
                 status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
                 detail=f"Model '{request.model}' is not loaded. Loaded: {loaded}",
             )
+    position = _QueuePosition()
+    task = asyncio.ensure_future(llama_service.generate_response(
+        messages=request.messages,
+        temperature=request.temperature,
+        max_tokens=request.max_tokens,
+        stream=request.stream,
+        chat_model_id=request.model,
+        enable_thinking=request.enable_thinking,
+        priority=priority,
+        queue_timeout=queue_timeout,
+        on_position=position,
+    ))
+    handed_off = False
     try:
+        # Стрим ждёт только постановки в очередь: дальше место сообщается внутри стрима
+        if not await _wait_while_connected(http_request, task, position.queued if request.stream else None):
+            return Response(status_code=_CLIENT_CLOSED_REQUEST)
+        headers = {QUEUE_POSITION_HEADER: str(position.first)} if position.first is not None else {}
         if request.stream:
             # Потоковый режим - возвращаем StreamingResponse
-            response_generator = await llama_service.generate_response(
-                messages=request.messages,
-                temperature=request.temperature,
-                max_tokens=request.max_tokens,
-                stream=True,
-                chat_model_id=request.model,
-                enable_thinking=request.enable_thinking,
-            )
+            if task.done():
+                body = task.result()
+            else:
+                body = _queued_stream(task, position)
+            handed_off = True
             return StreamingResponse(
-                response_generator,
-                media_type="text/event-stream"
+                body,
+                media_type="text/event-stream",
+                headers=headers,
             )
         else:
             # Обычный режим - возвращаем обычный ответ
-            response = await llama_service.generate_response(
-                messages=request.messages,
-                temperature=request.temperature,
-                max_tokens=request.max_tokens,
-                stream=False,
-                chat_model_id=request.model,
-                enable_thinking=request.enable_thinking,
-            )
+            response = task.result()
+            http_response.headers.update(headers)
             logger.info("Chat request: Response generated successfully")
             return response
+    except ServiceUnavailableError as e:
+        # Очередь модели переполнена / модель выгружается — клиент может повторить позже
+        logger.warning(f"Chat request rejected: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(e),
+        )
     except Exception as e:
         logger.error(f"Chat request Error: {str(e)}", exc_info=True)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error generating response: {str(e)}"
         )
+    finally:
+        if not handed_off and not task.done():
+            task.cancel()
 
@@ -2,6 +2,7 @@ import logging
 from fastapi import APIRouter, Depends
 from app.models.schemas import HealthResponse
 from app.services.llama_handler import LlamaHandler
+from app.services.models_service import LlamaService
 from app.api.dependencies import get_llm_handler_without_loaded_gate
 
 
@@ -18,6 +19,18 @@ async def health_check(
     loaded_models = None
     if hasattr(llama_service, "get_loaded_model_ids"):
         loaded_models = llama_service.get_loaded_model_ids() or None
+    scheduler = None
+    if hasattr(llama_service, "scheduler_stats"):
+        stats = llama_service.scheduler_stats()
+        scheduler = stats if isinstance(stats, dict) and stats else None
+    # Легаси-пул контекстов (LlamaService): очередь ожидания acquire(), если сервис уже создан
+    legacy = LlamaService._instance
+    if legacy is not None and legacy.is_loaded:
+        scheduler = {**(scheduler or {}), **legacy.scheduler_stats()}
+    prefix_cache = None
+    if hasattr(llama_service, "prefix_cache_stats"):
+        stats = llama_service.prefix_cache_stats()
+        prefix_cache = stats if isinstance(stats, dict) and stats else None
     if model_name:
         logger.info(f"Health check: Model '{model_name}' is {'loaded' if llama_service.is_loaded() else 'not loaded'}")
     return HealthResponse(
@@ -25,4 +38,6 @@ async def health_check(
         model_loaded=llama_service.is_loaded(),
         model_name=model_name,
         loaded_models=loaded_models,
+        scheduler=scheduler,
+        prefix_cache=prefix_cache,
     )
\ No newline at end of file
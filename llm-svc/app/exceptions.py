@@ -7,3 +7,6 @@ class ModelNotLoadedError(ServiceUnavailableError):
 class PoolExhaustedError(ServiceUnavailableError):
     """Пул моделей исчерпан"""
     pass
+class SchedulerQueueFullError(PoolExhaustedError):
+    """Очередь ожидания модели переполнена или истёк таймаут ожидания"""
+    pass
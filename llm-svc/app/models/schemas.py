@@ -108,6 +108,15 @@ class ChatCompletionRequest(BaseModel):
         None,
         description="Включить режим рассуждений (Qwen/DeepSeek и др.), если поддерживает бэкенд llama.cpp/vLLM",
     )
+    priority: Optional[str] = Field(
+        None,
+        description="Класс приоритета в очереди модели: interactive (по умолчанию) или background",
+    )
+    queue_timeout: Optional[float] = Field(
+        None,
+        gt=0,
+        description="Сколько секунд запрос готов ждать свободный контекст модели (по умолчанию LLM_SCHEDULER_QUEUE_TIMEOUT)",
+    )
 class ChatCompletionResponseChoice(BaseModel):
     index: int
     message: AssistantMessage  # В ответе всегда assistant!
@@ -145,6 +154,10 @@ class HealthResponse(BaseModel):
     model_loaded: bool
     model_name: Optional[str] = None
     loaded_models: Optional[List[str]] = None
+    # Планировщик llama.cpp по моделям: очередь, параллельные последовательности, время ожидания
+    scheduler: Optional[Dict[str, Dict[str, Any]]] = None
+    # Кэш префиксов KV по моделям: попадания/промахи, переиспользованные токены, байты
+    prefix_cache: Optional[Dict[str, Dict[str, Any]]] = None
 class ModelsListResponse(BaseModel):
     data: List[Dict[str, Any]]
     object: str = "list"
@@ -0,0 +1,245 @@
+# app/services/admission_queue.py
+import asyncio
+import heapq
+import itertools
+import os
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from app.exceptions import SchedulerQueueFullError
+import logging
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_INTERACTIVE = "interactive"
+PRIORITY_BACKGROUND = "background"
+# Фоновый запрос (суммаризация, LLM-judge, метрики) встаёт в очередь так, будто пришёл на
+# столько секунд позже: интерактивный чат обгоняет его, но бесконечно голодать он не будет.
+BACKGROUND_DELAY_SEC = max(0.0, float(os.environ.get("LLM_QUEUE_BACKGROUND_DELAY_SEC", "30")))
+# Глубина очереди и дедлайн ожидания по умолчанию (запрос может задать свой queue_timeout)
+QUEUE_MAX = max(0, int(os.environ.get("LLM_SCHEDULER_QUEUE_MAX", "64")))
+QUEUE_TIMEOUT = float(os.environ.get("LLM_SCHEDULER_QUEUE_TIMEOUT", "300"))
+
+
+def normalize_priority(priority: Optional[str]) -> str:
+    p = (priority or "").strip().lower()
+    return PRIORITY_BACKGROUND if p in (PRIORITY_BACKGROUND, "batch", "low") else PRIORITY_INTERACTIVE
+
+
+class _Waiter:
+    __slots__ = ("key", "seq", "future", "priority", "on_position", "position", "since")
+
+    def __init__(
+        self,
+        key: float,
+        seq: int,
+        future: asyncio.Future,
+        priority: str,
+        on_position: Optional[Callable[[int], None]] = None,
+    ):
+        self.key = key
+        self.seq = seq
+        self.future = future
+        self.priority = priority
+        self.on_position = on_position
+        self.position = 0
+        self.since = time.monotonic()
+
+    def __lt__(self, other: "_Waiter") -> bool:
+        return (self.key, self.seq) < (other.key, other.seq)
+
+
+class AdmissionQueue:
+    """
+    Очередь ожидания свободного ресурса (контекста модели) с классами приоритета.
+
+    Порядок выдачи — по «эффективному времени прихода»: для background к нему добавляется
+    BACKGROUND_DELAY_SEC, внутри класса строго FIFO. Глубина очереди ограничена
+    (max_depth), у каждого запроса свой дедлайн ожидания. Освободившийся ресурс владелец
+    отдаёт через hand_off(); если ожидающий успел уйти (отмена), ресурс возвращается
+    владельцу через on_return.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_depth: int,
+        default_timeout: Optional[float] = None,
+        on_return: Optional[Callable[[Any], None]] = None,
+    ):
+        self.name = name
+        self.max_depth = max(0, int(max_depth))
+        self.default_timeout = default_timeout if default_timeout and default_timeout > 0 else None
+        self._on_return = on_return
+        self._heap: List[_Waiter] = []
+        self._seq = itertools.count()
+        self._live = 0
+        # Ожидающие с on_position: только ради них пересчитываются места при выдаче/уходе
+        self._watchers = 0
+        # Метрики
+        self._peak = 0
+        self._queued = 0
+        self._rejected = 0
+        self._timeouts = 0
+        self._waited: Dict[str, int] = {}
+        self._wait_total: Dict[str, float] = {}
+        self._wait_max: Dict[str, float] = {}
+
+    @property
+    def depth(self) -> int:
+        return self._live
+
+    def depth_by_priority(self) -> Dict[str, int]:
+        counts = {PRIORITY_INTERACTIVE: 0, PRIORITY_BACKGROUND: 0}
+        for w in self._heap:
+            if not w.future.done():
+                counts[w.priority] += 1
+        return counts
+
+    def _position(self, waiter: _Waiter) -> int:
+        """Место в очереди (1 — следующий на выдачу)."""
+        return 1 + sum(1 for w in self._heap if not w.future.done() and w < waiter)
+
+    async def wait(
+        self,
+        priority: Optional[str] = None,
+        timeout: Optional[float] = None,
+        on_position: Optional[Callable[[int], None]] = None,
+    ) -> Any:
+        """Встать в очередь и дождаться ресурса от hand_off().
+
+        on_position(n) вызывается при постановке и каждый раз, когда место в очереди
+        меняется (n = 1 — следующий на выдачу).
+        """
+        priority = normalize_priority(priority)
+        if self._live >= self.max_depth:
+            self._rejected += 1
+            raise SchedulerQueueFullError(
+                f"Model '{self.name}' is busy: queue is full ({self._live}/{self.max_depth} waiting)"
+            )
+        now = time.monotonic()
+        key = now + (BACKGROUND_DELAY_SEC if priority == PRIORITY_BACKGROUND else 0.0)
+        waiter = _Waiter(key, next(self._seq), asyncio.get_running_loop().create_future(), priority, on_position)
+        heapq.heappush(self._heap, waiter)
+        self._live += 1
+        self._queued += 1
+        self._peak = max(self._peak, self._live)
+        position = self._position(waiter)
+        logger.info(f"[{self.name}] queued {priority} request at position {position} (waiting: {self._live})")
+        if on_position is not None:
+            self._watchers += 1
+            waiter.position = position
+
+        timeout = timeout if timeout and timeout > 0 else self.default_timeout
+        try:
+            if on_position is not None:
+                on_position(position)
+            # shield: отмена/дедлайн не трогают сам future — учёт очереди ведёт _forget
+            if timeout is None:
+                resource = await asyncio.shield(waiter.future)
+            else:
+                resource = await asyncio.wait_for(asyncio.shield(waiter.future), timeout)
+        except asyncio.TimeoutError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # Ресурс пришёл одновременно с дедлайном — не теряем его
+                resource = waiter.future.result()
+            else:
+                self._forget(waiter)
+                self._timeouts += 1
+                raise SchedulerQueueFullError(
+                    f"Model '{self.name}' is busy: no free slot within {timeout:g}s "
+                    f"(queue position was {position})"
+                )
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled() and waiter.future.exception() is None:
+                self._give_back(waiter.future.result())
+            else:
+                self._forget(waiter)
+            raise
+        except BaseException:
+            self._forget(waiter)
+            raise
+        finally:
+            if on_position is not None:
+                self._watchers -= 1
+
+        waited = time.monotonic() - now
+        self._waited[priority] = self._waited.get(priority, 0) + 1
+        self._wait_total[priority] = self._wait_total.get(priority, 0.0) + waited
+        self._wait_max[priority] = max(self._wait_max.get(priority, 0.0), waited)
+        if waited > 1.0:
+            logger.info(f"[{self.name}] {priority} request admitted after {waited:.2f}s in queue")
+        return resource
+
+    def _forget(self, waiter: _Waiter) -> None:
+        if not waiter.future.done():
+            waiter.future.cancel()
+            self._live -= 1
+            self._report_positions()
+        if len(self._heap) > 2 * self._live + 16:
+            # Ушедшие по дедлайну/отмене лежат в куче до выдачи — периодически выметаем
+            self._heap = [w for w in self._heap if not w.future.done()]
+            heapq.heapify(self._heap)
+
+    def _give_back(self, resource: Any) -> None:
+        if not self.hand_off(resource) and self._on_return is not None:
+            self._on_return(resource)
+
+    def hand_off(self, resource: Any) -> bool:
+        """Отдать ресурс первому живому ожидающему; False — очередь пуста."""
+        while self._heap:
+            waiter = heapq.heappop(self._heap)
+            if waiter.future.done():
+                continue
+            self._live -= 1
+            waiter.future.set_result(resource)
+            self._report_positions()
+            return True
+        return False
+
+    def _report_positions(self) -> None:
+        """Сообщить ожидающим с on_position их новое место (очередь короткая — полный проход)."""
+        if not self._watchers:
+            return
+        live = sorted(w for w in self._heap if not w.future.done())
+        for position, waiter in enumerate(live, 1):
+            if waiter.on_position is not None and waiter.position != position:
+                waiter.position = position
+                try:
+                    waiter.on_position(position)
+                except Exception as e:
+                    logger.debug(f"[{self.name}] on_position callback failed: {e}")
+
+    def fail_all(self, error: BaseException) -> None:
+        while self._heap:
+            waiter = heapq.heappop(self._heap)
+            if not waiter.future.done():
+                self._live -= 1
+                waiter.future.set_exception(error)
+
+    def stats(self) -> Dict[str, Any]:
+        waited = sum(self._waited.values())
+        total = sum(self._wait_total.values())
+        live = [w for w in self._heap if not w.future.done()]
+        head = min(live) if live else None
+        return {
+            "queue_depth": self._live,
+            "queue_depth_by_priority": self.depth_by_priority(),
+            # Сколько уже ждёт запрос на месте 1 (его место клиенты видят в стриме)
+            "queue_head_wait_ms": round((time.monotonic() - head.since) * 1000, 1) if head else 0.0,
+            "queue_peak": self._peak,
+            "max_queue": self.max_depth,
+            "queued_total": self._queued,
+            "rejected": self._rejected,
+            "queue_timeouts": self._timeouts,
+            "avg_queue_wait_ms": round(total / waited * 1000, 1) if waited else 0.0,
+            "max_queue_wait_ms": round(max(self._wait_max.values(), default=0.0) * 1000, 1),
+            "queue_wait_by_priority": {
+                p: {
+                    "admitted_from_queue": n,
+                    "avg_ms": round(self._wait_total[p] / n * 1000, 1),
+                    "max_ms": round(self._wait_max[p] * 1000, 1),
+                }
+                for p, n in self._waited.items()
+            },
+        }
@@ -1,5 +1,5 @@
 from abc import ABC, abstractmethod
-from typing import List, Dict, Any, Optional, Union, AsyncGenerator
+from typing import List, Dict, Any, Optional, Union, AsyncGenerator, Callable
 from app.models.schemas import ChatResponse, Message
 
 logger = None
@@ -33,8 +33,16 @@ class BaseLLMHandler(ABC):
         stream: bool = False,
         chat_model_id: Optional[str] = None,
         enable_thinking: Optional[bool] = None,
+        priority: Optional[str] = None,
+        queue_timeout: Optional[float] = None,
+        on_position: Optional[Callable[[int], None]] = None,
     ) -> Union[ChatResponse, AsyncGenerator[str, None]]:
-        """Универсальный метод для генерации ответа."""
+        """Универсальный метод для генерации ответа.
+
+        priority — класс в очереди модели (interactive / background),
+        queue_timeout — сколько секунд запрос готов ждать свободный контекст,
+        on_position — вызывается с местом в очереди, пока запрос ждёт контекст.
+        """
         pass
     
     @abstractmethod
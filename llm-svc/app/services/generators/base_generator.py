@@ -19,7 +19,9 @@ class BaseResponseGenerator(ABC):
             frequency_penalty: float,
             presence_penalty: float,
             tools: Optional[List[ToolDefinition]] = None,
-            session_id: str = None
+            session_id: str = None,
+            priority: Optional[str] = None,
+            queue_timeout: Optional[float] = None,
     ):
         """Абстрактный метод генерации"""
         pass
@@ -5,6 +5,7 @@ from app.models.schemas import (
     Message, ToolDefinition, ChatCompletionResponse,
     UsageInfo, MessageRole, ChatCompletionResponseChoice, AssistantMessage
 )
+from app.exceptions import ServiceUnavailableError
 from .base_generator import BaseResponseGenerator
 from app.services.generators.tool_call_processor import ToolCallProcessor # Добавлен импорт
 import logging
@@ -26,7 +27,9 @@ class NonStreamResponseGenerator(BaseResponseGenerator):
             frequency_penalty: float,
             presence_penalty: float,
             tools: Optional[List[ToolDefinition]] = None,
-            session_id: str = None
+            session_id: str = None,
+            priority: Optional[str] = None,
+            queue_timeout: Optional[float] = None,
     ) -> ChatCompletionResponse:
         """Генерация не-потокового ответа"""
         logger.info("Starting non-stream generation")
@@ -39,13 +42,16 @@ class NonStreamResponseGenerator(BaseResponseGenerator):
             )
             logger.info(f"Calling model completion for session {session_id}")
             # Убран ** так как models_service передает словарь параметров
-            response = await self._completion_caller(session_id, params)
+            response = await self._completion_caller(session_id, params, priority, queue_timeout)
             logger.info(f"Model response received, processing...")
             # Обрабатываем ответ
             processed_response = self._process_response(response, tools, response_id)
             processing_time = time.time() - start_time
             logger.info(f"Non-stream response generated in {processing_time:.2f}s")
             return processed_response
+        except ServiceUnavailableError:
+            # Переполнение очереди / дедлайн ожидания — наверх, чтобы клиент получил 503
+            raise
         except Exception as e:
             logger.error(f"Non-stream generation error: {str(e)}", exc_info=True)
             return self._create_error_response(response_id, str(e))
@@ -27,6 +27,8 @@ class StreamResponseGenerator(BaseResponseGenerator):
         presence_penalty: float,
         tools: Optional[List[ToolDefinition]] = None,
         session_id: str = None,
+        priority: Optional[str] = None,
+        queue_timeout: Optional[float] = None,
     ) -> AsyncGenerator[str, None]:
         logger.info(f"Streaming generation started [Session: {session_id}]")
         response_id = f"chatcmpl-{uuid.uuid4().hex}"
@@ -36,7 +38,7 @@ class StreamResponseGenerator(BaseResponseGenerator):
             params = self._prepare_generation_params(
                 messages, temperature, max_tokens, frequency_penalty, presence_penalty, tools
             )
-            async for chunk in self._completion_caller(session_id, params):
+            async for chunk in self._completion_caller(session_id, params, priority, queue_timeout):
                 delta = chunk.get('choices', [{}])[0].get('delta', {})
                 content = delta.get('content', '')
                 if not content:
@@ -1,30 +1,101 @@
 from llama_cpp import Llama
-from typing import List, Dict, Any, Optional, Callable, AsyncGenerator, Union
+from typing import List, Dict, Any, Optional, Callable, AsyncGenerator, Tuple, Union
 from collections import OrderedDict
 import inspect
 import os
-import json
 import asyncio
 import time
+import threading
+import weakref
 import logging
 
 from app.models.schemas import ChatResponse, ChatChoice, Message, AssistantMessage, UsageInfo, SystemMessage, UserMessage
-from app.utils import convert_to_dict_messages, format_messages_for_llama, estimate_tokens
+from app.utils import convert_to_dict_messages
 from app.core.config import settings
 from app.services.base_llm_handler import BaseLLMHandler
+from app.services.admission_queue import QUEUE_MAX, QUEUE_TIMEOUT
+from app.services.llama_scheduler import SequenceScheduler
+from app.services.prefix_cache import PrefixKVCache, attach_prefix_cache, new_prefix_cache
+from app.services.sse_stream import iter_sse_batches, pump_stream, sse_frame
+from app.services.token_budget import MessageTokenCounter, fit_messages
 from app.utils.gguf_paths import resolve_gguf_path
 
 logger = logging.getLogger(__name__)
 
 MODEL_LOAD_TIMEOUT = int(os.environ.get("LLM_MODEL_LOAD_TIMEOUT", "600"))
 MAX_LOADED_MODELS = max(1, int(os.environ.get("LLM_MAX_LOADED_MODELS", "4")))
+# Параллельные последовательности на модель: каждая — свой контекст llama.cpp (KV-кэш n_ctx),
+# веса на CPU общие через mmap; при gpu_layers > 0 слои на GPU дублируются.
+PARALLEL_SEQUENCES = max(1, int(os.environ.get("LLM_PARALLEL_SEQUENCES", "1")))
 
 
 class _Slot:
-    def __init__(self, llama: Llama, path: str):
+    def __init__(
+        self,
+        llama: Llama,
+        path: str,
+        lane_factory: Optional[Callable[[], Any]] = None,
+        prefix_cache: Optional[PrefixKVCache] = None,
+    ):
         self.llama = llama
         self.path = path
-        self.gen_lock = asyncio.Lock()
+        self.prefix_cache = prefix_cache
+        # Словарь у всех дорожек модели один — счётчик токенов тоже общий
+        self.token_counter = MessageTokenCounter(llama)
+        self.scheduler = SequenceScheduler(
+            os.path.splitext(os.path.basename(path))[0],
+            llama,
+            lane_factory,
+            max_parallel=PARALLEL_SEQUENCES,
+            max_queue=QUEUE_MAX,
+            queue_timeout=QUEUE_TIMEOUT,
+        )
+
+
+class _LaneLease:
+    """Занятая дорожка планировщика слота.
+
+    Возвращается ровно один раз и не раньше, чем доработает поток executor'а: при отмене
+    запроса await прерывается, а вызов llama.cpp в потоке — нет.
+    """
+
+    def __init__(self, slot: _Slot, llama: Llama):
+        self.slot = slot
+        self.llama = llama
+        self._pending: Optional[asyncio.Future] = None
+        self._released = False
+
+    async def run(self, func: Callable):
+        self._pending = asyncio.get_running_loop().run_in_executor(None, func)
+        return await asyncio.shield(self._pending)
+
+    def start_producer(self, func: Callable[[], None], name: str) -> None:
+        """Запустить func в отдельном потоке (стрим); дорожка вернётся после его завершения."""
+        loop = asyncio.get_running_loop()
+        finished = loop.create_future()
+        self._pending = finished
+
+        def target() -> None:
+            try:
+                func()
+            finally:
+                try:
+                    loop.call_soon_threadsafe(
+                        lambda: finished.done() or finished.set_result(None)
+                    )
+                except RuntimeError:
+                    pass  # event loop уже закрыт
+
+        threading.Thread(target=target, name=name, daemon=True).start()
+
+    def release(self) -> None:
+        if self._released:
+            return
+        self._released = True
+        if self._pending is not None and not self._pending.done():
+            self._pending.add_done_callback(lambda _f: self.slot.scheduler.release(self.llama))
+        else:
+            self.slot.scheduler.release(self.llama)
 
 
 class LlamaHandler(BaseLLMHandler):
@@ -123,7 +194,36 @@ class LlamaHandler(BaseLLMHandler):
         if slot_id in self._model_slots:
             self._model_slots.move_to_end(slot_id)
 
+    def _new_slot(self, llama: Llama, path: str) -> _Slot:
+        # Кэш префиксов общий для всех дорожек модели: следующий ход диалога продолжит
+        # с сохранённого KV, на какую бы дорожку он ни попал
+        prefix_cache = new_prefix_cache()
+        attach_prefix_cache(llama, prefix_cache)
+
+        async def lane_factory() -> Llama:
+            lane = await self._instantiate_llama(path)
+            attach_prefix_cache(lane, prefix_cache)
+            return lane
+
+        return _Slot(llama, path, lane_factory=lane_factory, prefix_cache=prefix_cache)
+
+    def scheduler_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Очередь и параллельные последовательности по загруженным моделям."""
+        return {slot_id: slot.scheduler.stats() for slot_id, slot in self._model_slots.items()}
+
+    def prefix_cache_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Попадания/промахи и заполненность кэша префиксов KV по загруженным моделям."""
+        return {
+            slot_id: slot.prefix_cache.stats()
+            for slot_id, slot in self._model_slots.items()
+            if slot.prefix_cache is not None
+        }
+
     async def _dispose_slot(self, slot: _Slot) -> None:
+        # Свободные дорожки освобождаются сразу, занятые — по окончании их генерации
+        slot.scheduler.close()
+        if slot.prefix_cache is not None:
+            slot.prefix_cache.clear()
         try:
             if slot.llama is not None:
                 del slot.llama
@@ -159,21 +259,14 @@ class LlamaHandler(BaseLLMHandler):
 
     def _clamp_max_tokens_for_request(
         self,
-        llama: Llama,
-        messages: List[Message],
+        n_ctx: int,
+        prompt_tokens: int,
         max_tokens: int,
         slot_id: str,
     ) -> int:
         """
         llama.cpp падает, если prompt_tokens + max_tokens > n_ctx
         """
-        n_ctx = self._get_llama_n_ctx(llama)
-        formatted = format_messages_for_llama(convert_to_dict_messages(messages))
-        try:
-            prompt_tokens = len(llama.tokenize(formatted.encode("utf-8"), add_bos=True))
-        except Exception as e:
-            logger.debug("tokenize for max_tokens clamp failed, using estimate: %s", e)
-            prompt_tokens = max(estimate_tokens(formatted), 1)
         reserved = 32
         room = n_ctx - prompt_tokens - reserved
         if room >= max_tokens:
@@ -190,14 +283,6 @@ class LlamaHandler(BaseLLMHandler):
             )
         return clamped
 
-    def _count_prompt_tokens(self, llama: Llama, dict_msgs: List[Dict[str, Any]]) -> int:
-        formatted = format_messages_for_llama(dict_msgs)
-        try:
-            return len(llama.tokenize(formatted.encode("utf-8"), add_bos=True))
-        except Exception as e:
-            logger.debug("tokenize failed: %s", e)
-            return max(estimate_tokens(formatted), 1)
-
     def _dict_to_message(self, d: Dict[str, Any]) -> Message:
         role = str(d.get("role") or "user")
         content = d.get("content", "")
@@ -209,55 +294,31 @@ class LlamaHandler(BaseLLMHandler):
 
     def _fit_messages_to_context(
         self,
-        llama: Llama,
+        counter: MessageTokenCounter,
+        n_ctx: int,
         messages: List[Message],
+        prompt_tokens: int,
         max_tokens: int,
         slot_id: str,
-    ) -> List[Message]:
+    ) -> Tuple[List[Message], int]:
         """Обрезает историю/контент, чтобы prompt + max_tokens поместились в n_ctx."""
-        n_ctx = self._get_llama_n_ctx(llama)
         reserved = 32
         min_gen = 64
         min_prompt = 512
         # Не резервировать под генерацию больше, чем позволяет окно (иначе budget промпта ~256 токенов)
         max_tokens = min(max_tokens, max(min_gen, n_ctx - min_prompt - reserved))
         budget = n_ctx - max_tokens - reserved
+        if prompt_tokens <= budget:
+            return messages, prompt_tokens
 
         dict_msgs = convert_to_dict_messages(messages)
-        original_tokens = self._count_prompt_tokens(llama, dict_msgs)
-        if original_tokens <= budget:
-            return messages
-
-        system = [m for m in dict_msgs if m.get("role") == "system"]
-        rest = [m for m in dict_msgs if m.get("role") != "system"]
-
-        while self._count_prompt_tokens(llama, system + rest) > budget and rest:
-            if len(rest) > 1:
-                rest.pop(0)
-                continue
-            m = dict(rest[0])
-            content = m.get("content", "")
-            if not isinstance(content, str):
-                content = str(content or "")
-            while content and self._count_prompt_tokens(
-                llama, system + [{**m, "content": content}]
-            ) > budget:
-                if len(content) <= 200:
-                    content = content[:100]
-                    break
-                content = content[: max(200, len(content) * 3 // 4)]
-            m["content"] = content
-            rest = [m]
-            break
-
-        trimmed = system + rest
-        new_tokens = self._count_prompt_tokens(llama, trimmed)
+        trimmed, new_tokens = fit_messages(counter, dict_msgs, budget)
         logger.warning(
             "Context trim slot=%s n_ctx=%s budget=%s tokens %s -> %s (messages %s -> %s)",
             slot_id,
             n_ctx,
             budget,
-            original_tokens,
+            prompt_tokens,
             new_tokens,
             len(dict_msgs),
             len(trimmed),
@@ -266,7 +327,37 @@ class LlamaHandler(BaseLLMHandler):
             raise ValueError(
                 f"Prompt too long for context window ({new_tokens} tokens, budget={budget}, n_ctx={n_ctx})"
             )
-        return [self._dict_to_message(d) for d in trimmed]
+        return [self._dict_to_message(d) for d in trimmed], new_tokens
+
+    def _prepare_prompt(
+        self,
+        slot: _Slot,
+        messages: List[Message],
+        max_tokens: int,
+        slot_id: str,
+    ) -> Tuple[List[Message], int]:
+        """Подгонка промпта и max_tokens под n_ctx (в потоке executor'а, не на event loop).
+
+        Токены считаются по сообщениям с кэшем слота, промпт целиком не перетокенизируется.
+        """
+        reserved = 32
+        min_gen = 64
+        n_ctx = self._get_llama_n_ctx(slot.llama)
+        prompt_tokens = slot.token_counter.count_prompt(convert_to_dict_messages(messages))
+        if prompt_tokens + max_tokens + reserved > n_ctx:
+            max_tokens = max(min_gen, n_ctx - prompt_tokens - reserved)
+            logger.warning(
+                "Clamping max_tokens for prompt fit (slot=%s n_ctx=%s ~prompt_tokens=%s -> max_tokens=%s)",
+                slot_id,
+                n_ctx,
+                prompt_tokens,
+                max_tokens,
+            )
+        messages, prompt_tokens = self._fit_messages_to_context(
+            slot.token_counter, n_ctx, messages, prompt_tokens, max_tokens, slot_id
+        )
+        max_tokens = self._clamp_max_tokens_for_request(n_ctx, prompt_tokens, max_tokens, slot_id)
+        return messages, max_tokens
 
     async def initialize(self):
         if self._model_slots:
@@ -294,6 +385,7 @@ class LlamaHandler(BaseLLMHandler):
         max_tokens: int,
         stream: bool,
         enable_thinking: Optional[bool] = None,
+        runner: Optional[Callable] = None,
     ) -> Union[Dict[str, Any], AsyncGenerator[Dict[str, Any], None]]:
 
         def create_completion(messages_formatter: Callable):
@@ -318,7 +410,8 @@ class LlamaHandler(BaseLLMHandler):
                     pass
             return llama.create_chat_completion(**kwargs)
 
-        return await self._run_in_executor(lambda: create_completion(convert_to_dict_messages))
+        run = runner or self._run_in_executor
+        return await run(lambda: create_completion(convert_to_dict_messages))
 
     async def _run_in_executor(self, func: Callable):
         loop = asyncio.get_event_loop()
@@ -335,6 +428,9 @@ class LlamaHandler(BaseLLMHandler):
         stream: bool = False,
         chat_model_id: Optional[str] = None,
         enable_thinking: Optional[bool] = None,
+        priority: Optional[str] = None,
+        queue_timeout: Optional[float] = None,
+        on_position: Optional[Callable[[int], None]] = None,
     ) -> Union[ChatResponse, AsyncGenerator[str, None]]:
         if not self.is_loaded():
             raise ValueError("Model not loaded")
@@ -343,47 +439,42 @@ class LlamaHandler(BaseLLMHandler):
         slot = self._model_slots[slot_id]
         temperature = temperature or settings.generation.default_temperature
         max_tokens = max_tokens or settings.generation.default_max_tokens
-        reserved = 32
-        min_gen = 64
-        n_ctx = self._get_llama_n_ctx(slot.llama)
-        prompt_tokens = self._count_prompt_tokens(
-            slot.llama, convert_to_dict_messages(messages)
-        )
-        if prompt_tokens + max_tokens + reserved > n_ctx:
-            max_tokens = max(min_gen, n_ctx - prompt_tokens - reserved)
-            logger.warning(
-                "Clamping max_tokens for prompt fit (slot=%s n_ctx=%s ~prompt_tokens=%s -> max_tokens=%s)",
-                slot_id,
-                n_ctx,
-                prompt_tokens,
-                max_tokens,
-            )
-        messages = self._fit_messages_to_context(slot.llama, messages, max_tokens, slot_id)
-        max_tokens = self._clamp_max_tokens_for_request(
-            slot.llama, messages, max_tokens, slot_id
+        messages, max_tokens = await self._run_in_executor(
+            lambda: self._prepare_prompt(slot, messages, max_tokens, slot_id)
         )
         start_time = time.time()
 
-        async with slot.gen_lock:
+        lease = _LaneLease(slot, await slot.scheduler.acquire(priority, queue_timeout, on_position))
+        handed_off = False
+        try:
             if stream:
                 stream_result = await self._try_create_completion(
-                    slot.llama,
+                    lease.llama,
                     messages,
                     temperature,
                     max_tokens,
                     stream=True,
                     enable_thinking=enable_thinking,
+                    runner=lease.run,
                 )
 
+                # Свой поток на стрим вместо хопа в executor на каждый токен
+                loop = asyncio.get_running_loop()
+                queue: asyncio.Queue = asyncio.Queue()
+                stop = threading.Event()
+
+                def abandon() -> None:
+                    stop.set()
+                    lease.release()
+
                 async def stream_generator():
+                    lease.start_producer(
+                        lambda: pump_stream(stream_result, loop, queue, stop),
+                        name=f"llm-stream-{slot_id}",
+                    )
                     try:
-                        while True:
-                            chunk = await self._run_in_executor(lambda: next(stream_result, None))
-                            if chunk is None:
-                                break
-                            yield f"data: {json.dumps(chunk)}\n\n"
-                    except StopIteration:
-                        pass
+                        async for batch in iter_sse_batches(queue):
+                            yield batch
                     except ValueError as e:
                         logger.error("Stream error [%s]: %s", slot_id, e)
                         err_payload = {
@@ -392,22 +483,32 @@ class LlamaHandler(BaseLLMHandler):
                                 "type": "context_length_exceeded",
                             }
                         }
-                        yield f"data: {json.dumps(err_payload)}\n\n"
+                        yield sse_frame(err_payload)
                     finally:
+                        abandon()
                         yield "data: [DONE]\n\n"
 
                 logger.info(f"Stream [{slot_id}] started in {time.time() - start_time:.2f}s")
-                return stream_generator()
+                generator = stream_generator()
+                # Стрим, который так и не начали читать (клиент ушёл сразу), тоже отдаёт дорожку
+                finalizer = weakref.finalize(generator, loop.call_soon_threadsafe, abandon)
+                finalizer.atexit = False
+                handed_off = True
+                return generator
             response = await self._try_create_completion(
-                slot.llama,
+                lease.llama,
                 messages,
                 temperature,
                 max_tokens,
                 stream=False,
                 enable_thinking=enable_thinking,
+                runner=lease.run,
             )
             logger.info(f"Response [{slot_id}] in {time.time() - start_time:.2f}s")
             return self._format_response(response, slot_id)
+        finally:
+            if not handed_off:
+                lease.release()
 
     def _format_response(self, raw_response: Dict[str, Any], response_model_id: str) -> ChatResponse:
         choice = raw_response["choices"][0]
@@ -458,7 +559,7 @@ class LlamaHandler(BaseLLMHandler):
         try:
             llama = await self._instantiate_llama(dpath)
             async with self._registry_lock:
-                self._model_slots[dname] = _Slot(llama, dpath)
+                self._model_slots[dname] = self._new_slot(llama, dpath)
                 self._model_slots.move_to_end(dname)
                 self._primary_model_id = dname
                 self.is_initialized = True
@@ -513,7 +614,7 @@ class LlamaHandler(BaseLLMHandler):
         async with self._model_switch_lock:
             async with self._registry_lock:
                 if model_id in self._model_slots:
-                    dispose_after.append(_Slot(new_llama, model_path))
+                    dispose_after.append(self._new_slot(new_llama, model_path))
                     self._model_slots.move_to_end(model_id)
                     if self._primary_model_id is None:
                         self._primary_model_id = model_id
@@ -525,7 +626,7 @@ class LlamaHandler(BaseLLMHandler):
                         dispose_after.append(vic2)
                         if self._primary_model_id == ev2:
                             self._primary_model_id = next(iter(self._model_slots.keys()), None)
-                    self._model_slots[model_id] = _Slot(new_llama, model_path)
+                    self._model_slots[model_id] = self._new_slot(new_llama, model_path)
                     self._model_slots.move_to_end(model_id)
                     if self._primary_model_id is None:
                         self._primary_model_id = model_id
@@ -559,7 +660,7 @@ class LlamaHandler(BaseLLMHandler):
                 try:
                     new_llama = await self._instantiate_llama(dpath)
                     async with self._registry_lock:
-                        self._model_slots[dname] = _Slot(new_llama, dpath)
+                        self._model_slots[dname] = self._new_slot(new_llama, dpath)
                         self._primary_model_id = dname
                         self._model_slots.move_to_end(dname)
                         self.is_initialized = True
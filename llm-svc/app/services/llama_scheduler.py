@@ -0,0 +1,135 @@
+# app/services/llama_scheduler.py
+import asyncio
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+from app.exceptions import ServiceUnavailableError
+from .admission_queue import AdmissionQueue
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class SequenceScheduler:
+    """
+    Планировщик параллельных последовательностей одной модели (GGUF).
+
+    Каждая «дорожка» — отдельный контекст llama.cpp над тем же файлом (веса через mmap
+    общие, KV-кэш у каждой свой), на дорожке в каждый момент идёт одна генерация.
+    Запрос занимает дорожку на всё время генерации, включая стрим, и освобождает её
+    через release(). Освободившаяся дорожка сразу отдаётся следующему в очереди
+    (continuous admission), при нехватке дорожек пул растёт до max_parallel в фоне.
+
+    Ожидание — в AdmissionQueue: ограниченная глубина, приоритеты, дедлайны.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        primary: Any,
+        lane_factory: Optional[Callable[[], Awaitable[Any]]] = None,
+        max_parallel: int = 1,
+        max_queue: int = 64,
+        queue_timeout: Optional[float] = None,
+    ):
+        self.name = name
+        self.max_parallel = max(1, int(max_parallel))
+        self._lane_factory = lane_factory
+        self._lanes: List[Any] = [primary]
+        self._idle: Deque[Any] = deque([primary])
+        self._queue = AdmissionQueue(name, max_queue, queue_timeout, on_return=self.release)
+        self._growing = False
+        self._closed = False
+        self._admitted = 0
+
+    @property
+    def max_queue(self) -> int:
+        return self._queue.max_depth
+
+    @property
+    def lanes(self) -> List[Any]:
+        return list(self._lanes)
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.depth
+
+    @property
+    def busy_count(self) -> int:
+        return len(self._lanes) - len(self._idle)
+
+    async def acquire(
+        self,
+        priority: Optional[str] = None,
+        timeout: Optional[float] = None,
+        on_position: Optional[Callable[[int], None]] = None,
+    ) -> Any:
+        """Занять дорожку (ждать в очереди, если все заняты)."""
+        if self._closed:
+            raise ServiceUnavailableError(f"Model '{self.name}' is being unloaded")
+        if self._idle and not self._queue.depth:
+            self._admitted += 1
+            return self._idle.popleft()
+        self._maybe_grow()
+        lane = await self._queue.wait(priority, timeout, on_position)
+        self._admitted += 1
+        return lane
+
+    def release(self, lane: Any) -> None:
+        """Вернуть дорожку: отдать следующему в очереди или положить в свободные."""
+        if self._closed:
+            self._drop_lane(lane)
+            return
+        if not self._queue.hand_off(lane):
+            self._idle.append(lane)
+
+    def _maybe_grow(self) -> None:
+        if self._growing or self._lane_factory is None or len(self._lanes) >= self.max_parallel:
+            return
+        self._growing = True
+        asyncio.get_running_loop().create_task(self._grow())
+
+    async def _grow(self) -> None:
+        try:
+            lane = await self._lane_factory()
+        except Exception as e:
+            # Памяти на ещё один контекст нет — дальше работаем на том, что есть
+            logger.warning(f"[{self.name}] cannot add parallel sequence ({len(self._lanes)} kept): {e}")
+            self.max_parallel = len(self._lanes)
+            return
+        finally:
+            self._growing = False
+        if self._closed:
+            return
+        self._lanes.append(lane)
+        logger.info(f"[{self.name}] parallel sequences: {len(self._lanes)}/{self.max_parallel}")
+        self.release(lane)
+        if self._queue.depth:
+            self._maybe_grow()
+
+    def close(self) -> List[Any]:
+        """Закрыть планировщик: ожидающим — ошибка; вернуть свободные дорожки для выгрузки.
+
+        Занятые дорожки выгружаются при release().
+        """
+        self._closed = True
+        self._queue.fail_all(ServiceUnavailableError(f"Model '{self.name}' was unloaded"))
+        idle = list(self._idle)
+        self._idle.clear()
+        for lane in idle:
+            self._lanes.remove(lane)
+        return idle
+
+    def _drop_lane(self, lane: Any) -> None:
+        # Последняя ссылка на контекст — память освобождается сборщиком, как в _dispose_slot
+        if lane in self._lanes:
+            self._lanes.remove(lane)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "parallel_sequences": len(self._lanes),
+            "max_parallel_sequences": self.max_parallel,
+            "running": self.busy_count,
+            "admitted": self._admitted,
+            **self._queue.stats(),
+        }
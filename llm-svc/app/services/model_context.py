@@ -8,14 +8,16 @@ except ImportError:
     Llama = None  
     Jinja2ChatFormatter = None 
 from app.core.config import settings
+from app.services.prefix_cache import PrefixKVCache, attach_prefix_cache
 import logging
 logger = logging.getLogger(__name__)
 class ModelContext:
     """Контекст управления моделью"""
-    def __init__(self, context_id: int):
+    def __init__(self, context_id: int, prefix_cache: Optional[PrefixKVCache] = None):
         self.context_id = context_id
         self._model: Optional[Llama] = None
         self._lock = asyncio.Lock()
+        self.prefix_cache = prefix_cache
     async def initialize(self) -> None:
         """Инициализация модели"""
         if Llama is None:
@@ -110,7 +112,9 @@ class ModelContext:
         if chat_handler:
             model_params["chat_handler"] = chat_handler
         logger.info(f"[Ctx-{self.context_id}] Creating model with params: { {k: v for k, v in model_params.items() if k != 'model_path'} }")
-        return Llama(**model_params)
+        model = Llama(**model_params)
+        attach_prefix_cache(model, self.prefix_cache)
+        return model
     async def _run_in_executor(self, func: Callable, *args, **kwargs) -> Any:
         """Запуск в executor'е"""
         loop = asyncio.get_event_loop()
@@ -1,8 +1,10 @@
 # app/services/model_pool.py
 import asyncio
-from typing import List
+from typing import Any, Dict, List, Optional
 from app.exceptions import ServiceUnavailableError, ModelNotLoadedError, PoolExhaustedError
 from .model_context import ModelContext
+from .prefix_cache import new_prefix_cache
+from .admission_queue import AdmissionQueue, QUEUE_MAX, QUEUE_TIMEOUT
 import logging
 logger = logging.getLogger(__name__)
 class ModelPool:
@@ -17,6 +19,10 @@ class ModelPool:
         self._initialization_failed = False
         self._active_requests = 0  # Счетчик активных запросов
         self._max_active_requests = pool_size  # Максимальное количество одновременных запросов
+        # Общий для контекстов пула кэш префиксов KV; None — KV сбрасывается после запроса
+        self.prefix_cache = new_prefix_cache()
+        # Запросы сверх числа контекстов ждут здесь (приоритеты, дедлайны), а не получают 503
+        self._queue = AdmissionQueue("pool", QUEUE_MAX, QUEUE_TIMEOUT, on_return=self._return_abandoned)
     async def initialize(self) -> None:
         async with self._lock:
             logger.info(f"Initializing model pool with {self.pool_size} instances")
@@ -26,7 +32,7 @@ class ModelPool:
                 # Синхронная инициализация всех контекстов
                 initialization_tasks = []
                 for i in range(self.pool_size):
-                    ctx = ModelContext(context_id=i)
+                    ctx = ModelContext(context_id=i, prefix_cache=self.prefix_cache)
                     self._contexts.append(ctx)
                     initialization_tasks.append(ctx.initialize())
                 # Ждем инициализации всех контекстов
@@ -54,25 +60,42 @@ class ModelPool:
                 self._initialization_failed = True
                 logger.error(f"Model pool initialization failed: {e}")
                 raise ServiceUnavailableError(f"Service initialization failed: {str(e)}")
-    async def acquire(self) -> ModelContext:
-        """Получение модели из пула с проверкой лимита одновременных запросов"""
+    async def acquire(
+        self,
+        priority: Optional[str] = None,
+        timeout: Optional[float] = None,
+    ) -> ModelContext:
+        """Получение модели из пула; при занятых контекстах — ожидание в очереди"""
         async with self._lock:
             if not self._initialized or self._initialization_failed:
                 raise ServiceUnavailableError("Service is not ready")
-            # Проверяем не превышен ли лимит одновременных запросов
-            if self._active_requests >= self._max_active_requests:
-                raise PoolExhaustedError(
-                    f"Service is busy. Maximum concurrent requests: {self._max_active_requests}, "
-                    f"Current active requests: {self._active_requests}, "
-                    f"Total instances: {self.total_count}"
-                )
-            if not self._available:
+            if self._max_active_requests <= 0:
                 raise PoolExhaustedError("No available models in pool")
-            context = self._available.pop()
+            if self._available and self._active_requests < self._max_active_requests and not self._queue.depth:
+                context = self._available.pop()
+                self._in_use.add(context)
+                self._active_requests += 1
+                logger.info(f"Acquired model context [Ctx-{context.context_id}]. Active requests: {self._active_requests}")
+                return context
+        # Ждём без _lock: контекст передаст release() через _put_back
+        context = await self._queue.wait(priority, timeout)
+        logger.info(f"Acquired model context [Ctx-{context.context_id}] from queue. Active requests: {self._active_requests}")
+        return context
+
+    def _put_back(self, context: ModelContext) -> None:
+        """Свободный контекст — первому в очереди (остаётся занятым), иначе в _available."""
+        if self._queue.hand_off(context):
             self._in_use.add(context)
             self._active_requests += 1
-            logger.info(f"Acquired model context [Ctx-{context.context_id}]. Active requests: {self._active_requests}")
-            return context
+        else:
+            self._available.append(context)
+
+    def _return_abandoned(self, context: ModelContext) -> None:
+        """Ожидающий ушёл (отмена) уже после передачи ему контекста, и очередь пуста."""
+        self._in_use.discard(context)
+        self._active_requests = max(0, self._active_requests - 1)
+        self._available.append(context)
+
     async def release(self, context: ModelContext) -> None:
         """Возврат модели в пул с гарантированным освобождением семафора"""
         async with self._lock:
@@ -82,8 +105,10 @@ class ModelPool:
                     self._active_requests = max(0, self._active_requests - 1)
                     # ВСЕГДА уменьшаем счетчик, даже если контекст не ready
                     if context.is_ready:
-                        await context.reset_cache()  # Добавляем await
-                        self._available.append(context)
+                        if self.prefix_cache is None:
+                            await context.reset_cache()  # Добавляем await
+                        # иначе KV остаётся: следующий запрос переиспользует общий префикс
+                        self._put_back(context)
                         logger.info(f"Context [Ctx-{context.context_id}] returned to pool")
                     else:
                         logger.warning(f"Context [Ctx-{context.context_id}] not ready, scheduling reinit")
@@ -105,7 +130,7 @@ class ModelPool:
             await context.initialize()
             async with self._lock:
                 if context not in self._in_use:
-                    self._available.append(context)
+                    self._put_back(context)
                     logger.info(f"Context [Ctx-{context.context_id}] reinitialized and returned to pool")
         except Exception as e:
             logger.error(f"Failed to reinitialize context [Ctx-{context.context_id}]: {e}")
@@ -113,10 +138,13 @@ class ModelPool:
     async def cleanup(self) -> None:
         """Очистка пула"""
         async with self._lock:
+            self._queue.fail_all(ServiceUnavailableError("Model pool is shutting down"))
             cleanup_tasks = [ctx.cleanup() for ctx in self._contexts]
             await asyncio.gather(*cleanup_tasks, return_exceptions=True)
             self._contexts.clear()
             self._available.clear()
+            if self.prefix_cache is not None:
+                self.prefix_cache.clear()
             self._in_use.clear()
             self._active_requests = 0
             self._initialized = False
@@ -137,6 +165,9 @@ class ModelPool:
     def active_requests_count(self) -> int:
         """Количество активных запросов"""
         return self._active_requests
+    def queue_stats(self) -> Dict[str, Any]:
+        """Очередь ожидания: глубина по приоритетам, отказы, время в очереди"""
+        return self._queue.stats()
     @property
     def max_concurrent_requests(self) -> int:
         """Максимальное количество одновременных запросов"""
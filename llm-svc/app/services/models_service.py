@@ -1,7 +1,7 @@
 import asyncio
 import uuid
 import os
-from typing import List, Optional, AsyncGenerator
+from typing import Any, Dict, List, Optional, AsyncGenerator
 from app.models.schemas import Message, ToolDefinition, ChatCompletionResponse
 from app.core.config import settings
 from app.exceptions import ServiceUnavailableError
@@ -54,20 +54,32 @@ class LlamaService:
             await self.model_pool.cleanup()
             self._initialized = False
             logger.info("LlamaService cleaned up")
-    async def _create_completion(self, session_id: str, kwargs) -> dict:
+    async def _create_completion(
+            self,
+            session_id: str,
+            kwargs,
+            priority: Optional[str] = None,
+            queue_timeout: Optional[float] = None,
+    ) -> dict:
         """Создание non-stream completion"""
-        context = await self.model_pool.acquire()
+        context = await self.model_pool.acquire(priority, queue_timeout)
         try:
             return await context.generate(**kwargs)
         finally:
             await self.model_pool.release(context)
-    async def _create_completion_stream(self, session_id: str, kwargs: dict = None) -> AsyncGenerator[dict, None]:
+    async def _create_completion_stream(
+            self,
+            session_id: str,
+            kwargs: dict = None,
+            priority: Optional[str] = None,
+            queue_timeout: Optional[float] = None,
+    ) -> AsyncGenerator[dict, None]:
         """Создание stream completion с неблокирующей итерацией."""
         if kwargs is None:
             kwargs = {}
         loop = asyncio.get_running_loop()
         queue = asyncio.Queue()
-        context = await self.model_pool.acquire()
+        context = await self.model_pool.acquire(priority, queue_timeout)
         def producer():
             """
             Запускается в отдельном потоке, итерируется по блокирующему
@@ -111,14 +123,17 @@ class LlamaService:
             frequency_penalty: float,
             presence_penalty: float,
             tools: Optional[List[ToolDefinition]] = None,
-            session_id: str = None
+            session_id: str = None,
+            priority: Optional[str] = None,
+            queue_timeout: Optional[float] = None,
     ) -> ChatCompletionResponse:
         """Не-потоковая генерация ответа"""
         if session_id is None:
             session_id = f"non_stream_{uuid.uuid4().hex}"
         try:
             return await self.non_stream_generator.generate(
-                messages, temperature, max_tokens, frequency_penalty, presence_penalty, tools, session_id
+                messages, temperature, max_tokens, frequency_penalty, presence_penalty, tools, session_id,
+                priority=priority, queue_timeout=queue_timeout,
             )
         except ServiceUnavailableError:
             raise
@@ -133,15 +148,21 @@ class LlamaService:
             frequency_penalty: float,
             presence_penalty: float,
             tools: Optional[List[ToolDefinition]] = None,
-            session_id: str = None
+            session_id: str = None,
+            priority: Optional[str] = None,
+            queue_timeout: Optional[float] = None,
     ) -> AsyncGenerator[str, None]:
         """Потоковая генерация ответа"""
         if session_id is None:
             session_id = f"stream_{uuid.uuid4().hex}"
         async for chunk in self.stream_generator.generate(
-                messages, temperature, max_tokens, frequency_penalty, presence_penalty, tools, session_id
+                messages, temperature, max_tokens, frequency_penalty, presence_penalty, tools, session_id,
+                priority=priority, queue_timeout=queue_timeout,
         ):
             yield chunk
+    def scheduler_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Очередь пула контекстов для /v1/health (в том же виде, что у LlamaHandler)"""
+        return {self.model_name: self.model_pool.queue_stats()}
     @property
     def is_loaded(self) -> bool:
         """Проверка загрузки модели"""
@@ -0,0 +1,113 @@
+# app/services/prefix_cache.py
+import os
+import threading
+from typing import Any, Dict, Optional, Sequence
+
+from llama_cpp import Llama, LlamaRAMCache
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Бюджет памяти на снимки KV одной модели; 0 — без кэша префиксов (KV сбрасывается как раньше)
+PREFIX_CACHE_MB = max(0, int(os.environ.get("LLM_PREFIX_CACHE_MB", "1024")))
+# Общий префикс короче N токенов — не попадание: каждый промпт начинается с BOS и заголовка
+# шаблона чата, и ради них восстанавливать снимок KV целиком невыгодно
+PREFIX_CACHE_MIN_TOKENS = max(1, int(os.environ.get("LLM_PREFIX_CACHE_MIN_TOKENS", "32")))
+
+
+class PrefixKVCache(LlamaRAMCache):
+    """
+    Снимки KV-состояния llama.cpp по токенам промпта (+ ответа).
+
+    Llama сама спрашивает кэш перед генерацией: берётся снимок с самым длинным общим
+    префиксом, и если он длиннее того, что уже лежит в контексте, — состояние
+    восстанавливается, а вычисляются только новые токены (следующий ход диалога
+    не прогоняет заново system prompt и историю). После генерации снимок сохраняется.
+
+    LlamaRAMCache отдаёт снимок с общим префиксом любой длины, то есть почти всегда (BOS
+    есть в каждом промпте). Здесь снимок с префиксом короче min_tokens не отдаётся:
+    иначе hit_rate был бы ≈1 при нулевой пользе, а Llama грузила бы состояние ради BOS.
+
+    Один кэш на модель, общий для всех её контекстов (дорожек планировщика), поэтому
+    обращения защищены блокировкой. Вытеснение — LRU по бюджету байт.
+    """
+
+    def __init__(self, capacity_bytes: int, min_tokens: int = PREFIX_CACHE_MIN_TOKENS):
+        super().__init__(capacity_bytes=capacity_bytes)
+        self._lock = threading.RLock()
+        self.min_tokens = max(1, int(min_tokens))
+        self.hits = 0
+        self.misses = 0
+        self.short_prefixes = 0
+        self.prompt_tokens = 0
+        self.reused_tokens = 0
+        self.stores = 0
+        self.evictions = 0
+
+    def __getitem__(self, key: Sequence[int]) -> Any:
+        key = tuple(key)
+        with self._lock:
+            self.prompt_tokens += len(key)
+            best = self._find_longest_prefix_key(key)
+            reused = Llama.longest_token_prefix(best, key) if best is not None else 0
+            if reused < self.min_tokens:
+                self.misses += 1
+                if best is not None:
+                    self.short_prefixes += 1
+                raise KeyError("no cached prefix long enough")
+            self.cache_state.move_to_end(best)
+            self.hits += 1
+            self.reused_tokens += reused
+            return self.cache_state[best]
+
+    def __contains__(self, key: Sequence[int]) -> bool:
+        key = tuple(key)
+        with self._lock:
+            best = self._find_longest_prefix_key(key)
+            return best is not None and Llama.longest_token_prefix(best, key) >= self.min_tokens
+
+    def __setitem__(self, key: Sequence[int], value: Any) -> None:
+        with self._lock:
+            expected = len(self.cache_state) + (0 if tuple(key) in self.cache_state else 1)
+            super().__setitem__(key, value)
+            self.stores += 1
+            self.evictions += max(0, expected - len(self.cache_state))
+
+    def clear(self) -> None:
+        with self._lock:
+            self.cache_state.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.cache_state),
+                "bytes": self.cache_size,
+                "capacity_bytes": self.capacity_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "short_prefix_misses": self.short_prefixes,
+                "min_prefix_tokens": self.min_tokens,
+                "prompt_tokens": self.prompt_tokens,
+                "reused_tokens": self.reused_tokens,
+                "reused_token_rate": round(self.reused_tokens / self.prompt_tokens, 3) if self.prompt_tokens else 0.0,
+                "stores": self.stores,
+                "evictions": self.evictions,
+            }
+
+
+def new_prefix_cache() -> Optional[PrefixKVCache]:
+    """Кэш префиксов для новой модели по LLM_PREFIX_CACHE_MB (None — выключен)."""
+    if not PREFIX_CACHE_MB:
+        return None
+    return PrefixKVCache(PREFIX_CACHE_MB * 1024 * 1024)
+
+
+def attach_prefix_cache(llama: Any, cache: Optional[PrefixKVCache]) -> None:
+    if cache is None or llama is None:
+        return
+    try:
+        llama.set_cache(cache)
+    except Exception as e:
+        logger.warning(f"prefix cache not attached: {e}")
@@ -0,0 +1,103 @@
+# app/services/sse_stream.py
+import asyncio
+import json
+import os
+import threading
+from typing import Any, AsyncIterator, Iterator
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Склейка SSE-кадров в одну запись: ждать ещё токены до N мс (0 — не ждать, отправлять
+# сразу всё, что уже накопилось) и не копить больше N байт
+STREAM_COALESCE_SEC = max(0.0, float(os.environ.get("LLM_STREAM_COALESCE_MS", "0"))) / 1000.0
+STREAM_COALESCE_BYTES = max(1, int(os.environ.get("LLM_STREAM_COALESCE_BYTES", "4096")))
+
+_STREAM_END = object()
+
+
+def sse_frame(payload: Any) -> str:
+    if orjson is not None:
+        return f"data: {orjson.dumps(payload).decode('utf-8')}\n\n"
+    return f"data: {json.dumps(payload, ensure_ascii=False, separators=(',', ':'))}\n\n"
+
+
+def pump_stream(
+    chunks: Iterator[Any],
+    loop: asyncio.AbstractEventLoop,
+    queue: asyncio.Queue,
+    stop: threading.Event,
+) -> None:
+    """Тело потока-производителя: итерирует блокирующий стрим llama.cpp и кладёт чанки в queue.
+
+    Ошибка передаётся в очередь как объект, конец стрима — маркером. При stop генерация
+    прерывается на следующем токене (клиент ушёл).
+    """
+    try:
+        for chunk in chunks:
+            if stop.is_set():
+                break
+            loop.call_soon_threadsafe(queue.put_nowait, chunk)
+    except Exception as e:
+        if not stop.is_set():
+            loop.call_soon_threadsafe(queue.put_nowait, e)
+    finally:
+        close = getattr(chunks, "close", None)
+        if close is not None:
+            try:
+                close()
+            except Exception as e:
+                logger.debug("stream close failed: %s", e)
+        try:
+            loop.call_soon_threadsafe(queue.put_nowait, _STREAM_END)
+        except RuntimeError:
+            pass  # event loop уже закрыт (остановка сервиса)
+
+
+async def iter_sse_batches(queue: asyncio.Queue) -> AsyncIterator[str]:
+    """SSE-кадры из очереди pump_stream, склеенные в записи по STREAM_COALESCE_*.
+
+    Каждый чанк остаётся отдельным событием `data:` — клиенту склейка не видна, меньше
+    только записей в сокет и пробуждений event loop.
+    """
+    loop = asyncio.get_running_loop()
+    done = False
+    while not done:
+        item = await queue.get()
+        frames = []
+        size = 0
+        deadline = None
+        while True:
+            if item is _STREAM_END:
+                done = True
+                break
+            if isinstance(item, Exception):
+                if frames:
+                    yield "".join(frames)
+                raise item
+            frame = sse_frame(item)
+            frames.append(frame)
+            size += len(frame)
+            if size >= STREAM_COALESCE_BYTES:
+                break
+            if not queue.empty():
+                item = queue.get_nowait()
+                continue
+            if STREAM_COALESCE_SEC <= 0:
+                break
+            if deadline is None:
+                deadline = loop.time() + STREAM_COALESCE_SEC
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(queue.get(), remaining)
+            except asyncio.TimeoutError:
+                break
+        if frames:
+            yield "".join(frames)
@@ -0,0 +1,116 @@
+# app/services/token_budget.py
+import bisect
+import hashlib
+import itertools
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Tuple
+
+from app.utils import estimate_tokens
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Сколько счётчиков токенов сообщений держать на модель (0 — без кэша)
+TOKEN_CACHE_ITEMS = max(0, int(os.environ.get("LLM_TOKEN_CACHE_ITEMS", "4096")))
+_PROMPT_SUFFIX = "assistant: "
+
+
+class MessageTokenCounter:
+    """
+    Токены промпта по сообщениям с кэшем по хэшу текста.
+
+    Промпт для оценки — как в format_messages_for_llama: «role: content\\n» на сообщение
+    и «assistant: » в конце, поэтому его длина — BOS + сумма длин сообщений + суффикс
+    (на стыках токенизация может разойтись на единицы токенов, это покрывает резерв).
+    Между ходами диалога история не меняется: заново токенизируются только новые
+    сообщения. Один счётчик на модель (словарь общий для всех её дорожек), вызывается
+    из потоков executor'а — кэш под блокировкой.
+    """
+
+    def __init__(self, llama: Any, max_items: int = TOKEN_CACHE_ITEMS):
+        self._llama = llama
+        self.max_items = max_items
+        self._cache: "OrderedDict[bytes, int]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _tokenize(self, text: str) -> int:
+        try:
+            return len(self._llama.tokenize(text.encode("utf-8"), add_bos=False))
+        except Exception as e:
+            logger.debug("tokenize failed, using estimate: %s", e)
+            return max(estimate_tokens(text), 1)
+
+    def count_text(self, text: str, remember: bool = True) -> int:
+        if not remember or not self.max_items:
+            return self._tokenize(text)
+        key = hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+        with self._lock:
+            n = self._cache.get(key)
+            if n is not None:
+                self._cache.move_to_end(key)
+                return n
+        n = self._tokenize(text)
+        with self._lock:
+            self._cache[key] = n
+            while len(self._cache) > self.max_items:
+                self._cache.popitem(last=False)
+        return n
+
+    def count_message(self, message: Dict[str, Any], remember: bool = True) -> int:
+        role = message.get("role", "user")
+        content = message.get("content", "") or ""
+        return self.count_text(f"{role}: {content}\n", remember)
+
+    def overhead(self) -> int:
+        return 1 + self.count_text(_PROMPT_SUFFIX)
+
+    def count_prompt(self, dict_msgs: List[Dict[str, Any]]) -> int:
+        return self.overhead() + sum(self.count_message(m) for m in dict_msgs)
+
+
+def fit_messages(
+    counter: MessageTokenCounter,
+    dict_msgs: List[Dict[str, Any]],
+    budget: int,
+) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    Уложить промпт в budget токенов: (сообщения, токены промпта).
+
+    System-сообщения сохраняются, из остальных отбрасываются самые старые — точка
+    отсечения ищется бинарным поиском по префиксным суммам. Если не помещается даже
+    последнее сообщение, от его текста оставляется самое длинное начало, которое
+    влезает (тоже бинарный поиск). Результат может превышать budget, если его
+    занимают одни system-сообщения — это проверяет вызывающий.
+    """
+    system = [m for m in dict_msgs if m.get("role") == "system"]
+    rest = [m for m in dict_msgs if m.get("role") != "system"]
+    fixed = counter.overhead() + sum(counter.count_message(m) for m in system)
+    prefix = list(itertools.accumulate((counter.count_message(m) for m in rest), initial=0))
+    total = fixed + prefix[-1]
+    if total <= budget:
+        return dict_msgs, total
+    if not rest:
+        return system, total
+
+    # Первый k, при котором fixed + sum(rest[k:]) <= budget; последнее сообщение не выбрасываем
+    k = bisect.bisect_left(prefix, total - budget)
+    if k < len(rest):
+        return system + rest[k:], total - prefix[k]
+
+    last = dict(rest[-1])
+    content = last.get("content", "")
+    if not isinstance(content, str):
+        content = str(content or "")
+    room = budget - fixed
+    lo, hi = 0, len(content)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        # Пробные обрезки в кэш не кладём — они больше не встретятся
+        if counter.count_message({**last, "content": content[:mid]}, remember=False) <= room:
+            lo = mid
+        else:
+            hi = mid - 1
+    last["content"] = content[:lo] if lo else content[:100]
+    return system + [last], fixed + counter.count_message(last, remember=False)
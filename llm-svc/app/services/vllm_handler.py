@@ -1,4 +1,4 @@
-from typing import List, Dict, Any, Optional, AsyncGenerator, Union
+from typing import List, Dict, Any, Optional, AsyncGenerator, Union, Callable
 import json
 import asyncio
 import time
@@ -170,10 +170,15 @@ class VLLMHandler(BaseLLMHandler):
         stream: bool = False,
         chat_model_id: Optional[str] = None,
         enable_thinking: Optional[bool] = None,
+        priority: Optional[str] = None,
+        queue_timeout: Optional[float] = None,
+        on_position: Optional[Callable[[int], None]] = None,
     ) -> Union[ChatResponse, AsyncGenerator[str, None]]:
         """Универсальный метод для генерации ответа через vLLM."""
         _ = chat_model_id
         _ = enable_thinking
+        # Очередь и приоритеты — у движка vLLM (continuous batching)
+        _ = priority, queue_timeout, on_position
         if not self.is_loaded():
             raise ValueError("Model not loaded")
 
@@ -0,0 +1,264 @@
+import asyncio
+
+import pytest
+
+from app.exceptions import SchedulerQueueFullError
+from app.services import admission_queue
+from app.services.admission_queue import AdmissionQueue
+
+
+@pytest.mark.asyncio
+async def test_interactive_overtakes_background():
+    queue = AdmissionQueue("m", max_depth=8)
+    order = []
+
+    async def waiter(tag, priority):
+        order.append((tag, await queue.wait(priority)))
+
+    tasks = [
+        asyncio.create_task(waiter("bg", "background")),
+        asyncio.create_task(waiter("chat", "interactive")),
+    ]
+    await asyncio.sleep(0)
+    assert queue.depth_by_priority() == {"interactive": 1, "background": 1}
+
+    assert queue.hand_off("r1")
+    assert queue.hand_off("r2")
+    await asyncio.gather(*tasks)
+
+    assert order == [("chat", "r1"), ("bg", "r2")]
+    assert set(queue.stats()["queue_wait_by_priority"]) == {"interactive", "background"}
+
+
+@pytest.mark.asyncio
+async def test_background_ages_ahead_of_late_interactive(monkeypatch):
+    monkeypatch.setattr(admission_queue, "BACKGROUND_DELAY_SEC", 0.01)
+    queue = AdmissionQueue("m", max_depth=8)
+
+    bg = asyncio.create_task(queue.wait("background"))
+    await asyncio.sleep(0.05)
+    chat = asyncio.create_task(queue.wait("interactive"))
+    await asyncio.sleep(0)
+
+    queue.hand_off("r1")
+    assert await bg == "r1"
+    assert not chat.done()
+    queue.hand_off("r2")
+    assert await chat == "r2"
+
+
+@pytest.mark.asyncio
+async def test_position_reported_and_deadline_per_request():
+    queue = AdmissionQueue("m", max_depth=8, default_timeout=10)
+    positions = []
+
+    first = asyncio.create_task(queue.wait(on_position=positions.append))
+    await asyncio.sleep(0)
+    with pytest.raises(SchedulerQueueFullError):
+        await queue.wait(timeout=0.05, on_position=positions.append)
+
+    assert positions == [1, 2]
+    assert queue.depth == 1
+    assert queue.stats()["queue_timeouts"] == 1
+    queue.hand_off("r")
+    assert await first == "r"
+
+
+@pytest.mark.asyncio
+async def test_cancelled_after_hand_off_returns_resource():
+    returned = []
+    queue = AdmissionQueue("m", max_depth=8, on_return=returned.append)
+
+    task = asyncio.create_task(queue.wait())
+    await asyncio.sleep(0)
+    queue.hand_off("r")
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+    assert returned == ["r"]
+    assert queue.depth == 0
+
+
+class _FakeContext:
+    async def generate(self, **kwargs):
+        return {"choices": [{"message": {"role": "assistant", "content": "ok"}, "finish_reason": "stop"}]}
+
+
+class _FakePool:
+    def __init__(self, error=None):
+        self.error = error
+        self.acquired = []
+        self.released = []
+
+    async def acquire(self, priority=None, timeout=None):
+        self.acquired.append((priority, timeout))
+        if self.error is not None:
+            raise self.error
+        return _FakeContext()
+
+    async def release(self, context):
+        self.released.append(context)
+
+    def queue_stats(self):
+        return {"queue_depth": 0}
+
+
+@pytest.mark.asyncio
+async def test_legacy_service_passes_priority_and_deadline_to_pool():
+    from app.models.schemas import UserMessage
+    from app.services.models_service import LlamaService
+
+    service = LlamaService()
+    service.model_pool = _FakePool()
+    messages = [UserMessage(role="user", content="hi")]
+
+    await service.generate_response_non_stream(
+        messages, 0.7, 16, 0.0, 0.0, priority="background", queue_timeout=2.5
+    )
+    assert service.model_pool.acquired == [("background", 2.5)]
+    assert len(service.model_pool.released) == 1
+    assert service.scheduler_stats() == {service.model_name: {"queue_depth": 0}}
+
+    service.model_pool = _FakePool(SchedulerQueueFullError("queue full"))
+    with pytest.raises(SchedulerQueueFullError):
+        await service.generate_response_non_stream(messages, 0.7, 16, 0.0, 0.0, queue_timeout=0.1)
+
+
+class _Client:
+    def __init__(self):
+        self.gone = False
+
+    async def is_disconnected(self):
+        return self.gone
+
+
+class _QueuedService:
+    """Обработчик, у которого единственная дорожка занята: запрос ждёт в AdmissionQueue."""
+
+    def __init__(self, queue):
+        self.queue = queue
+
+    def is_model_id_loaded(self, model_id):
+        return True
+
+    async def generate_response(self, stream=False, priority=None, queue_timeout=None, on_position=None, **kwargs):
+        await self.queue.wait(priority, queue_timeout, on_position)
+
+        async def chunks():
+            yield "data: {}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return chunks() if stream else {"ok": True}
+
+
+def _chat_request(stream):
+    from app.models.schemas import ChatRequest
+
+    return ChatRequest(model="m", messages=[{"role": "user", "content": "hi"}], stream=stream)
+
+
+async def _call_chat(service, client, stream):
+    from fastapi import Response
+    from app.api.endpoints import chat
+
+    http_response = Response()
+    result = await chat.chat_completion(
+        _chat_request(stream), client, http_response, service, True, None, None
+    )
+    return result, http_response
+
+
+@pytest.mark.asyncio
+async def test_positions_reported_as_queue_moves():
+    queue = AdmissionQueue("m", max_depth=8)
+    seen = {"a": [], "b": []}
+    a = asyncio.create_task(queue.wait(on_position=seen["a"].append))
+    b = asyncio.create_task(queue.wait(on_position=seen["b"].append))
+    await asyncio.sleep(0)
+    assert queue.stats()["queue_head_wait_ms"] >= 0.0
+
+    queue.hand_off("r1")
+    assert await a == "r1"
+    assert seen == {"a": [1], "b": [2, 1]}
+    queue.hand_off("r2")
+    assert await b == "r2"
+    assert queue.stats()["queue_head_wait_ms"] == 0.0
+
+
+@pytest.mark.asyncio
+async def test_disconnected_client_leaves_queue(monkeypatch):
+    from app.api.endpoints import chat
+
+    monkeypatch.setattr(chat, "DISCONNECT_POLL_SEC", 0.01)
+    queue = AdmissionQueue("m", max_depth=8)
+    client = _Client()
+
+    call = asyncio.create_task(_call_chat(_QueuedService(queue), client, stream=False))
+    await asyncio.sleep(0.03)
+    assert queue.depth == 1
+
+    client.gone = True
+    result, _ = await call
+    assert result.status_code == 499
+    await asyncio.sleep(0)
+    assert queue.depth == 0
+    # Освободившийся ресурс достаётся следующему, а не брошенному запросу
+    assert not queue.hand_off("r")
+
+
+@pytest.mark.asyncio
+async def test_non_stream_reports_queue_position_header(monkeypatch):
+    from app.api.endpoints import chat
+
+    monkeypatch.setattr(chat, "DISCONNECT_POLL_SEC", 0.01)
+    queue = AdmissionQueue("m", max_depth=8)
+    first = asyncio.create_task(queue.wait())
+    await asyncio.sleep(0)
+
+    call = asyncio.create_task(_call_chat(_QueuedService(queue), _Client(), stream=False))
+    await asyncio.sleep(0.03)
+    queue.hand_off("r1")
+    queue.hand_off("r2")
+    await first
+    result, http_response = await call
+    assert result == {"ok": True}
+    assert http_response.headers[chat.QUEUE_POSITION_HEADER] == "2"
+
+
+@pytest.mark.asyncio
+async def test_queued_stream_sends_position_comments(monkeypatch):
+    from app.api.endpoints import chat
+
+    monkeypatch.setattr(chat, "DISCONNECT_POLL_SEC", 0.01)
+    queue = AdmissionQueue("m", max_depth=8)
+    first = asyncio.create_task(queue.wait())
+    await asyncio.sleep(0)
+
+    response, _ = await _call_chat(_QueuedService(queue), _Client(), stream=True)
+    assert response.headers[chat.QUEUE_POSITION_HEADER] == "2"
+    body = response.body_iterator
+    assert await body.__anext__() == ": queue position 2\n\n"
+
+    queue.hand_off("r1")
+    assert await first == "r1"
+    assert await body.__anext__() == ": queue position 1\n\n"
+    queue.hand_off("r2")
+    assert [frame async for frame in body] == ["data: {}\n\n", "data: [DONE]\n\n"]
+
+
+@pytest.mark.asyncio
+async def test_queued_stream_deadline_becomes_error_frame(monkeypatch):
+    from app.api.endpoints import chat
+
+    monkeypatch.setattr(chat, "DISCONNECT_POLL_SEC", 0.01)
+    queue = AdmissionQueue("m", max_depth=8, default_timeout=0.05)
+    holder = asyncio.create_task(queue.wait(timeout=10))
+    await asyncio.sleep(0)
+
+    response, _ = await _call_chat(_QueuedService(queue), _Client(), stream=True)
+    frames = [frame async for frame in response.body_iterator]
+    assert frames[0] == ": queue position 2\n\n"
+    assert '"service_unavailable"' in frames[-2]
+    assert frames[-1] == "data: [DONE]\n\n"
+    holder.cancel()
@@ -0,0 +1,106 @@
+import asyncio
+
+import pytest
+
+from app.exceptions import SchedulerQueueFullError, ServiceUnavailableError
+from app.services.llama_scheduler import SequenceScheduler
+
+
+@pytest.mark.asyncio
+async def test_acquire_release_single_lane():
+    scheduler = SequenceScheduler("m", "lane-0")
+
+    lane = await scheduler.acquire()
+    assert lane == "lane-0"
+    assert scheduler.busy_count == 1
+
+    scheduler.release(lane)
+    assert scheduler.busy_count == 0
+    assert scheduler.stats()["admitted"] == 1
+
+
+@pytest.mark.asyncio
+async def test_queued_request_gets_released_lane_in_order():
+    scheduler = SequenceScheduler("m", "lane-0", max_queue=4)
+    lane = await scheduler.acquire()
+
+    order = []
+
+    async def waiter(tag):
+        got = await scheduler.acquire()
+        order.append(tag)
+        scheduler.release(got)
+
+    tasks = [asyncio.create_task(waiter(i)) for i in range(3)]
+    await asyncio.sleep(0)
+    assert scheduler.queue_depth == 3
+
+    scheduler.release(lane)
+    await asyncio.gather(*tasks)
+
+    assert order == [0, 1, 2]
+    stats = scheduler.stats()
+    assert stats["queue_depth"] == 0
+    assert stats["queued_total"] == 3
+    assert stats["queue_peak"] == 3
+
+
+@pytest.mark.asyncio
+async def test_queue_full_rejected():
+    scheduler = SequenceScheduler("m", "lane-0", max_queue=1)
+    await scheduler.acquire()
+    pending = asyncio.create_task(scheduler.acquire())
+    await asyncio.sleep(0)
+
+    with pytest.raises(SchedulerQueueFullError):
+        await scheduler.acquire()
+    assert scheduler.stats()["rejected"] == 1
+
+    pending.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await pending
+    assert scheduler.queue_depth == 0
+
+
+@pytest.mark.asyncio
+async def test_queue_timeout():
+    scheduler = SequenceScheduler("m", "lane-0", queue_timeout=0.05)
+    await scheduler.acquire()
+
+    with pytest.raises(SchedulerQueueFullError):
+        await scheduler.acquire()
+    assert scheduler.stats()["queue_timeouts"] == 1
+
+
+@pytest.mark.asyncio
+async def test_grows_parallel_lanes_on_demand():
+    built = []
+
+    async def factory():
+        built.append(len(built) + 1)
+        return f"lane-{len(built)}"
+
+    scheduler = SequenceScheduler("m", "lane-0", lane_factory=factory, max_parallel=2)
+    first = await scheduler.acquire()
+    second = await asyncio.wait_for(scheduler.acquire(), 1)
+
+    assert {first, second} == {"lane-0", "lane-1"}
+    assert scheduler.stats()["parallel_sequences"] == 2
+    assert built == [1]
+
+
+@pytest.mark.asyncio
+async def test_close_fails_waiters_and_drops_busy_lane_on_release():
+    scheduler = SequenceScheduler("m", "lane-0")
+    lane = await scheduler.acquire()
+    pending = asyncio.create_task(scheduler.acquire())
+    await asyncio.sleep(0)
+
+    assert scheduler.close() == []
+    with pytest.raises(ServiceUnavailableError):
+        await pending
+
+    scheduler.release(lane)
+    assert scheduler.lanes == []
+    with pytest.raises(ServiceUnavailableError):
+        await scheduler.acquire()
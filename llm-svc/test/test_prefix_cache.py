@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+from app.services.prefix_cache import PrefixKVCache
+
+
+class _State:
+    def __init__(self, tokens, size):
+        self.input_ids = np.array(tokens, dtype=np.intc)
+        self.llama_state_size = size
+
+
+def test_longest_prefix_hit_and_miss():
+    # Как у настоящих промптов: все начинаются с BOS (1) и заголовка шаблона (2, 3)
+    cache = PrefixKVCache(capacity_bytes=1000, min_tokens=4)
+    cache[[1, 2, 3, 10, 11, 12]] = _State([1, 2, 3, 10, 11, 12], 100)
+
+    state = cache[[1, 2, 3, 10, 11, 12, 13, 14]]
+    assert state.input_ids.tolist() == [1, 2, 3, 10, 11, 12]
+
+    # Общие только BOS и заголовок — это не попадание, снимок не отдаётся
+    with pytest.raises(KeyError):
+        cache[[1, 2, 3, 20, 21, 22]]
+    assert [1, 2, 3, 20] not in cache
+    assert [1, 2, 3, 10, 99] in cache
+
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["short_prefix_misses"] == 1
+    assert stats["reused_tokens"] == 6
+    assert stats["prompt_tokens"] == 14
+    assert stats["reused_token_rate"] == round(6 / 14, 3)
+    assert stats["hit_rate"] == 0.5
+
+
+def test_lru_eviction_by_byte_budget():
+    cache = PrefixKVCache(capacity_bytes=250, min_tokens=1)
+    cache[[1]] = _State([1], 100)
+    cache[[2]] = _State([2], 100)
+    cache[[1]]  # [1] становится самым свежим
+    cache[[3]] = _State([3], 100)
+
+    assert (1,) in cache.cache_state
+    assert (2,) not in cache.cache_state
+    stats = cache.stats()
+    assert stats["evictions"] == 1
+    assert stats["bytes"] == 200
+
+
+def test_empty_cache_is_truthy_for_llama():
+    # Llama проверяет `if self.cache:` — пустой кэш не должен отключаться
+    assert PrefixKVCache(capacity_bytes=10)
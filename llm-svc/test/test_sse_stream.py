@@ -0,0 +1,85 @@
+import asyncio
+import json
+import threading
+
+import pytest
+
+from app.services import sse_stream
+from app.services.sse_stream import iter_sse_batches, pump_stream, sse_frame
+
+
+async def _collect(chunks):
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    thread = threading.Thread(target=pump_stream, args=(iter(chunks), loop, queue, threading.Event()))
+    thread.start()
+    try:
+        return [batch async for batch in iter_sse_batches(queue)]
+    finally:
+        thread.join()
+
+
+def test_sse_frame_is_compact_utf8_json():
+    frame = sse_frame({"delta": "привет"})
+    assert frame.startswith("data: ") and frame.endswith("\n\n")
+    assert json.loads(frame[6:]) == {"delta": "привет"}
+    assert "\\u" not in frame
+
+
+@pytest.mark.asyncio
+async def test_batches_keep_every_chunk_as_own_event(monkeypatch):
+    monkeypatch.setattr(sse_stream, "STREAM_COALESCE_SEC", 0.05)
+    chunks = [{"i": i} for i in range(20)]
+
+    batches = await _collect(chunks)
+
+    events = [e for b in batches for e in b.split("\n\n") if e]
+    assert [json.loads(e[6:]) for e in events] == chunks
+    assert len(batches) < len(chunks)
+
+
+@pytest.mark.asyncio
+async def test_byte_limit_flushes(monkeypatch):
+    monkeypatch.setattr(sse_stream, "STREAM_COALESCE_SEC", 1.0)
+    monkeypatch.setattr(sse_stream, "STREAM_COALESCE_BYTES", 1)
+
+    batches = await _collect([{"i": 1}, {"i": 2}])
+
+    assert batches == [sse_frame({"i": 1}), sse_frame({"i": 2})]
+
+
+@pytest.mark.asyncio
+async def test_producer_error_is_raised_after_sent_chunks():
+    def chunks():
+        yield {"i": 1}
+        raise ValueError("context overflow")
+
+    queue = asyncio.Queue()
+    pump_stream(chunks(), asyncio.get_running_loop(), queue, threading.Event())
+    await asyncio.sleep(0)
+
+    got = []
+    with pytest.raises(ValueError):
+        async for batch in iter_sse_batches(queue):
+            got.append(batch)
+    assert got == [sse_frame({"i": 1})]
+
+
+@pytest.mark.asyncio
+async def test_stop_interrupts_generation():
+    produced = []
+    stop = threading.Event()
+
+    def chunks():
+        for i in range(100):
+            produced.append(i)
+            if i == 2:
+                stop.set()  # клиент ушёл
+            yield {"i": i}
+
+    queue = asyncio.Queue()
+    pump_stream(chunks(), asyncio.get_running_loop(), queue, stop)
+    await asyncio.sleep(0)
+
+    assert produced == [0, 1, 2]
+    assert [b async for b in iter_sse_batches(queue)] == [sse_frame({"i": 0}) + sse_frame({"i": 1})]
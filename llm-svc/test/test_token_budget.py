@@ -0,0 +1,56 @@
+from app.services.token_budget import MessageTokenCounter, fit_messages
+
+
+class _WordTokenizer:
+    """Токен = слово; считает вызовы tokenize."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def tokenize(self, text, add_bos=True):
+        self.calls += 1
+        return text.decode("utf-8").split() + (["<s>"] if add_bos else [])
+
+
+def _msg(role, words):
+    return {"role": role, "content": " ".join(["w"] * words)}
+
+
+def test_message_counts_are_cached_across_turns():
+    llama = _WordTokenizer()
+    counter = MessageTokenCounter(llama)
+    history = [_msg("system", 3), _msg("user", 5), _msg("assistant", 7)]
+
+    # role: + слова; BOS + «assistant:»
+    assert counter.count_prompt(history) == 2 + 4 + 6 + 8
+    calls = llama.calls
+    counter.count_prompt(history + [_msg("user", 2)])
+    assert llama.calls == calls + 1
+
+
+def test_fit_drops_oldest_messages_keeping_system():
+    counter = MessageTokenCounter(_WordTokenizer())
+    msgs = [_msg("system", 3), _msg("user", 10), _msg("assistant", 10), _msg("user", 10)]
+
+    trimmed, tokens = fit_messages(counter, msgs, budget=2 + 4 + 11 + 11)
+
+    assert trimmed == [msgs[0], msgs[2], msgs[3]]
+    assert tokens == 28
+
+
+def test_fit_truncates_last_message_content():
+    counter = MessageTokenCounter(_WordTokenizer())
+    msgs = [_msg("system", 3), _msg("user", 100)]
+
+    trimmed, tokens = fit_messages(counter, msgs, budget=2 + 4 + 21)
+
+    assert trimmed[0] == msgs[0]
+    assert trimmed[1]["content"].split() == ["w"] * 20
+    assert tokens == 27
+
+
+def test_fit_returns_input_when_it_fits():
+    counter = MessageTokenCounter(_WordTokenizer())
+    msgs = [_msg("user", 5)]
+
+    assert fit_messages(counter, msgs, budget=100) == (msgs, 8)